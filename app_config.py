@@ -0,0 +1,77 @@
+# app_config.py
+# Runtime configuration read from the environment (.env). Shared by main.py (one device)
+# and device_context.py (many devices per process), which overlays per-device settings.
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_REALTIME_MODEL_ID = os.getenv("OPENAI_REALTIME_MODEL_ID")
+APP_CONFIG = {
+    "OPENAI_API_KEY": OPENAI_API_KEY, # Added for openai_client sync summarizer
+    "RESEND_API_KEY": os.getenv("RESEND_API_KEY"),
+    "DEFAULT_FROM_EMAIL": os.getenv("DEFAULT_FROM_EMAIL"),
+    "RESEND_RECIPIENT_EMAILS": os.getenv("RESEND_RECIPIENT_EMAILS"),
+    "RESEND_RECIPIENT_EMAILS_BCC": os.getenv("RESEND_RECIPIENT_EMAILS_BCC"),
+    "TICKET_EMAIL": os.getenv("TICKET_EMAIL"),
+    "RESEND_API_URL": os.getenv("RESEND_API_URL", "https://api.resend.com/emails"),
+    "FASTAPI_DISPLAY_API_URL": os.getenv("FASTAPI_DISPLAY_API_URL"),
+    "OPENAI_VOICE": os.getenv("OPENAI_VOICE", "ash"),
+    "TSM_PLAYBACK_SPEED": os.getenv("TSM_PLAYBACK_SPEED", "1.0"),
+    "TSM_WINDOW_CHUNKS": os.getenv("TSM_WINDOW_CHUNKS", "8"),
+    "END_CONV_AUDIO_FINISH_DELAY_S": float(os.getenv("END_CONV_AUDIO_FINISH_DELAY_S", "2.0")),
+    "END_CONV_MODE": os.getenv("END_CONV_MODE", "event"), # "event" (timer + player drain signal) or "blocking" (old poll + sleep)
+    "END_CONV_DRAIN_TIMEOUT_S": float(os.getenv("END_CONV_DRAIN_TIMEOUT_S", "5.0")),
+    "TOOL_POOL_WORKERS": int(os.getenv("TOOL_POOL_WORKERS", "4")),
+    "HOST_TOOL_POOL_WORKERS": int(os.getenv("HOST_TOOL_POOL_WORKERS", "16")), # device_context.py: one pool shared by all devices
+    "DEFERRED_POOL_WORKERS": int(os.getenv("DEFERRED_POOL_WORKERS", "4")), # Deferred (slow) tools run here, never ahead of tool batches on TOOL_POOL_WORKERS
+    "HOST_DEFERRED_POOL_WORKERS": int(os.getenv("HOST_DEFERRED_POOL_WORKERS", "16")), # device_context.py: shared by all devices
+    "HOST_HTTP_POOL_SIZE": int(os.getenv("HOST_HTTP_POOL_SIZE", "32")),
+    "TOOL_BATCH_DEADLINE_S": float(os.getenv("TOOL_BATCH_DEADLINE_S", "10.0")), # Max wait for all calls of one response before answering with what's ready
+    "DEFERRED_TOOLS_ENABLED": os.getenv("DEFERRED_TOOLS_ENABLED", "true").lower() == "true", # Tools in DEFERRED_TOOL_NAMES ack at once and report back later
+    "CONVERSATION_PRUNING_ENABLED": os.getenv("CONVERSATION_PRUNING_ENABLED", "true").lower() == "true",
+    "CONVERSATION_TOKEN_BUDGET": int(os.getenv("CONVERSATION_TOKEN_BUDGET", "12000")), # Conversation share of input_tokens (minus instructions/tools) above which old items are summarized away
+    "CONVERSATION_KEEP_RECENT_ITEMS": int(os.getenv("CONVERSATION_KEEP_RECENT_ITEMS", "8")),
+    "TURN_DETECTION_MODE": os.getenv("TURN_DETECTION_MODE", "server_vad"), # "server_vad" or "client_vad" (local endpointing, see local_vad.py)
+    "CLIENT_VAD_MODE": int(os.getenv("CLIENT_VAD_MODE", "2")), # WebRTC VAD aggressiveness 0-3 for endpointing
+    "CLIENT_VAD_MIN_SPEECH_MS": int(os.getenv("CLIENT_VAD_MIN_SPEECH_MS", "150")),
+    "CLIENT_VAD_HANGOVER_MS": int(os.getenv("CLIENT_VAD_HANGOVER_MS", "500")), # Silence after speech that ends the turn
+    "UPLINK_GATING_ENABLED": os.getenv("UPLINK_GATING_ENABLED", "true").lower() == "true", # Don't stream silence upstream (local_vad.UplinkGate)
+    "UPLINK_LEAD_MS": int(os.getenv("UPLINK_LEAD_MS", "300")), # Silence kept and sent ahead of detected speech, so the onset isn't clipped
+    "UPLINK_TRAIL_MS": int(os.getenv("UPLINK_TRAIL_MS", "700")), # Silence sent after speech; must exceed server VAD silence_duration_ms (500) / CLIENT_VAD_HANGOVER_MS
+    "BARGE_IN_VAD_MODE": int(os.getenv("BARGE_IN_VAD_MODE", "0")), # Local barge-in VAD aggressiveness 0-3; tune with barge_in_simulator.py
+    "BARGE_IN_VAD_GAIN": float(os.getenv("BARGE_IN_VAD_GAIN", "0.20")), # Mic scaling before the barge-in VAD (keeps assistant echo below it)
+    "BARGE_IN_MIN_SPEECH_FRAMES": int(os.getenv("BARGE_IN_MIN_SPEECH_FRAMES", "12")), # Voiced 30 ms frames over the assistant that interrupt it
+    "BARGE_IN_SILENCE_RESET_FRAMES": int(os.getenv("BARGE_IN_SILENCE_RESET_FRAMES", "3")), # Unvoiced frames in a row that start the count over
+    "BARGE_IN_COOLDOWN_MS": int(os.getenv("BARGE_IN_COOLDOWN_MS", "2000")), # No second interrupt this soon after one
+    "BARGE_IN_ACTIVATION_MS": int(os.getenv("BARGE_IN_ACTIVATION_MS", "100")), # Assistant audio played before barge-in is armed
+    "FILLER_AUDIO_ENABLED": os.getenv("FILLER_AUDIO_ENABLED", "true").lower() == "true",
+    "FILLER_THRESHOLD_S": float(os.getenv("FILLER_THRESHOLD_S", "1.0")), # Play a cached filler phrase if a non-fast tool runs longer than this
+    "DEVICE_NAME": os.getenv("DEVICE_NAME", ""), # Owner of history turns and deferred results; device_context.py sets one per device
+    "USAGE_TAG": os.getenv("USAGE_TAG", ""), # Label stored with every response_usage row, e.g. to compare prompt variants in usage_report.py
+    "AUDIO_IO_PROCESS": os.getenv("AUDIO_IO_PROCESS", "false").lower() == "true", # main.py: mic, speaker and keyword detection in a child process (audio_io_process.py)
+    "AUDIO_IO_RING_S": float(os.getenv("AUDIO_IO_RING_S", "10.0")), # Speaker ring size in seconds of audio; play() blocks when it is full
+    "SATELLITE_HOST": os.getenv("SATELLITE_HOST", "127.0.0.1"), # satellite_server.py listen address; a LAN address (e.g. 0.0.0.0) requires SATELLITE_TOKEN
+    "SATELLITE_PORT": int(os.getenv("SATELLITE_PORT", "8770")),
+    "SATELLITE_TOKEN": os.getenv("SATELLITE_TOKEN", ""), # Shared secret satellites send in HELLO; required unless SATELLITE_HOST is loopback
+    "SATELLITE_JITTER_MS": int(os.getenv("SATELLITE_JITTER_MS", "60")), # Jitter buffer prefill, for the mic on the host and the speaker on the satellite
+    "SATELLITE_PLAYOUT_LEAD_MS": int(os.getenv("SATELLITE_PLAYOUT_LEAD_MS", "200")), # Assistant audio sent ahead of the satellite's playback (what a barge-in discards there)
+    "SESSION_POLICY": os.getenv("SESSION_POLICY", "always_on"), # always_on, on_demand (connect on the wake word) or speculative (connect as the wake score rises)
+    "SESSION_PRE_THRESHOLD": float(os.getenv("SESSION_PRE_THRESHOLD", "0.25")), # speculative: wake score that starts the connect (below the detection threshold)
+    "SESSION_SPECULATIVE_TIMEOUT_S": float(os.getenv("SESSION_SPECULATIVE_TIMEOUT_S", "4.0")), # speculative: drop the session if no wake word follows
+    "SESSION_RELEASE_AFTER_S": float(os.getenv("SESSION_RELEASE_AFTER_S", "30")), # on_demand / speculative: release this long after a conversation
+    "SESSION_HOLD_MAX_S": float(os.getenv("SESSION_HOLD_MAX_S", "10")), # Mic audio after the wake word kept while the session connects
+    "HANDLER_PROFILING_ENABLED": os.getenv("HANDLER_PROFILING_ENABLED", "true").lower() == "true",
+    "HANDLER_STALL_THRESHOLD_MS": float(os.getenv("HANDLER_STALL_THRESHOLD_MS", "100")), # on_message handler time that counts as a receive-thread stall
+    "OPENAI_RECONNECT_DELAY_S": int(os.getenv("OPENAI_RECONNECT_DELAY_S", 5)),
+    "OPENAI_PING_INTERVAL_S": int(os.getenv("OPENAI_PING_INTERVAL_S", 20)),
+    "OPENAI_PING_TIMEOUT_S": int(os.getenv("OPENAI_PING_TIMEOUT_S", 10)),
+    "LATENCY_METRICS_ENABLED": os.getenv("LATENCY_METRICS_ENABLED", "true").lower() == "true",
+    "SESSION_RECORDING_DIR": os.getenv("SESSION_RECORDING_DIR", ""), # Empty = recording disabled
+    "OPENAI_REALTIME_WS_URL": os.getenv("OPENAI_REALTIME_WS_URL", ""), # Empty = wss://api.openai.com/v1/realtime?model=...
+    # --- New Config for Phase 4 DB Monitor Thread ---
+    "DB_MONITOR_POLL_INTERVAL_S": int(os.getenv("DB_MONITOR_POLL_INTERVAL_S", 20)),
+    "FASTAPI_UI_STATUS_UPDATE_URL": os.getenv("FASTAPI_UI_STATUS_UPDATE_URL", "http://localhost:8001/api/ui_status_update"),
+    "FASTAPI_NOTIFY_CALL_UPDATE_URL": os.getenv("FASTAPI_NOTIFY_CALL_UPDATE_URL", "http://localhost:8001/api/notify_call_update_available"),
+    "SCHEDULED_CALLS_DB_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "scheduled_calls.db"),
+}
@@ -0,0 +1,127 @@
+# app_state_machine.py
+# The assistant's conversation state: listening for the wake word, or in a conversation
+# (streaming mic audio to the realtime session).
+#
+# Hot loops (the audio pipeline every 30 ms frame, the client on every audio delta) read the
+# state without taking a lock: the current state is one immutable snapshot that a transition
+# replaces in a single assignment. Transitions are serialized by a state lock that only covers
+# swapping the snapshot and queueing the change; the subscribers (clear the player, tell the audio
+# process, the session policy...) run after it is released, under a separate dispatch lock, so a
+# slow subscriber never holds up reads or the next state change. Changes are delivered one at a
+# time and in the order they happened, and transition() returns once its own change has been
+# delivered. Each transition logs how long it took, including subscribers.
+#
+# entry_count(state) counts how often a state has been entered. A consumer that must act once
+# per entry (the pipeline's response.create on the wake word) compares it against the count it
+# last handled, instead of clearing a shared "just changed" flag another thread may be setting.
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, List
+
+
+class AppState(str, Enum):
+    """str-valued, so it compares equal to (and serializes as) the state names used elsewhere."""
+    LISTENING_FOR_WAKEWORD = "LISTENING_FOR_WAKEWORD"
+    SENDING_TO_OPENAI = "SENDING_TO_OPENAI"
+
+    def __str__(self):
+        return self.value
+
+
+StateSnapshot = namedtuple("StateSnapshot", "state version entered_perf")
+
+SLOW_TRANSITION_MS = 5.0 # Transitions slower than this (usually a subscriber) are logged as warnings
+
+
+def _sm_log(message, level="INFO"):
+    print(f"[{level}] [APP_STATE] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class AppStateMachine:
+    """
+    Current AppState plus subscribers. get() / state / snapshot() never block; transition() is
+    atomic and returns False (no subscribers run) when the state is already the requested one.
+    Subscribers are called as callback(old_state, new_state) outside the state lock, one change at
+    a time and in order; the state may already have moved on when they run, so they act on
+    new_state rather than re-reading it. They must not transition themselves.
+    """
+
+    def __init__(self, initial_state: AppState, name: str = "", log_fn=None):
+        self.name = name
+        self.log = log_fn or _sm_log
+        self._snapshot = StateSnapshot(AppState(initial_state), 0, time.perf_counter())
+        self._entries: Dict[AppState, int] = {state: 0 for state in AppState}
+        self._subscribers: List[Callable[[AppState, AppState], None]] = []
+        self._transition_lock = threading.Lock()
+        self._dispatch_lock = threading.RLock()
+        self._pending = deque() # (old_state, new_state) changes not yet delivered to subscribers
+        self.transitions = 0
+        self.max_transition_ms = 0.0
+
+    # --- Lock-free reads ---
+    @property
+    def state(self) -> AppState:
+        return self._snapshot.state
+
+    def get(self) -> AppState:
+        """The current state (also the app_state_getter handed to OpenAISpeechClient)."""
+        return self._snapshot.state
+
+    def snapshot(self) -> StateSnapshot:
+        return self._snapshot
+
+    def entry_count(self, state: AppState) -> int:
+        return self._entries[state]
+
+    def time_in_state_s(self) -> float:
+        return time.perf_counter() - self._snapshot.entered_perf
+
+    # --- Transitions ---
+    def subscribe(self, callback: Callable[[AppState, AppState], None]):
+        with self._dispatch_lock:
+            self._subscribers.append(callback)
+
+    def transition(self, new_state: AppState, reason: str = "") -> bool:
+        requested = time.perf_counter()
+        new_state = AppState(new_state)
+        with self._transition_lock:
+            locked = time.perf_counter()
+            old = self._snapshot
+            if old.state == new_state:
+                return False
+            self._entries[new_state] += 1 # Before the snapshot: a reader that sees the new state sees its entry
+            self._snapshot = StateSnapshot(new_state, old.version + 1, locked)
+            self._pending.append((old.state, new_state))
+            self.transitions += 1
+        self._dispatch_pending()
+        transition_ms = (time.perf_counter() - requested) * 1000.0
+        self.max_transition_ms = max(self.max_transition_ms, transition_ms)
+        prefix = f"[{self.name}] " if self.name else ""
+        self.log(f"{prefix}App State changed: {old.state} -> {new_state}" + (f" ({reason})" if reason else "")
+                 + f" in {transition_ms:.2f} ms (lock wait {(locked - requested) * 1000.0:.2f} ms, "
+                 f"{len(self._subscribers)} subscriber(s), after {(locked - old.entered_perf):.1f} s in {old.state})",
+                 "WARNING" if transition_ms > SLOW_TRANSITION_MS else "INFO")
+        return True
+
+    def _dispatch_pending(self):
+        """
+        Delivers queued changes in order. Whichever transition holds the dispatch lock delivers
+        every change queued so far, so a caller that gets the lock after another finds its own
+        change already delivered.
+        """
+        with self._dispatch_lock:
+            while self._pending:
+                old_state, new_state = self._pending.popleft()
+                for callback in self._subscribers:
+                    try:
+                        callback(old_state, new_state)
+                    except Exception as e:
+                        self.log(f"State subscriber {getattr(callback, '__qualname__', callback)} failed on {old_state} -> {new_state}: {e}", "ERROR")
+
+    def stats(self) -> Dict:
+        return {"state": str(self.state), "version": self._snapshot.version, "transitions": self.transitions,
+                "max_transition_ms": round(self.max_transition_ms, 3),
+                "entries": {str(state): count for state, count in self._entries.items()}}
@@ -0,0 +1,845 @@
+# audio_io_process.py
+# Optional process split (AUDIO_IO_PROCESS=true): mic capture, playback and wake-word /
+# command-keyword detection run in a dedicated child process, away from the GIL of the
+# network/tool process (WebSocket client, JSON/base64, TSM, SQLite, tool handlers).
+#
+# PCM crosses the process boundary through two single-producer/single-consumer rings in
+# shared memory (mic -> network, network -> speaker); a local socket carries the small control
+# messages (app state, flush, stats) one way and events (keyword detected, playback drained,
+# stats) the other. The child is a fresh interpreter running this file ("child" command),
+# so it never re-imports main.py or inherits its threads and PyAudio instance. On the network
+# side RingMicStream stands in for the PyAudio input stream and RingPlayer for PCMPlayer, so
+# main.py's pipeline and the client are unchanged.
+#
+#   python audio_io_process.py bench [--seconds 20] [--load-threads 2] [--burst-ms 60] [--modes inproc,process]
+#
+# "bench" runs the same capture/playback loops against a synthetic sound card with a fixed
+# device buffer, once as threads inside a loaded process ("inproc", today's layout) and once
+# in the child ("process"), while load threads in the parent hold the GIL the way a slow
+# handler does. It reports device-cadence jitter and glitch counts (lost mic frames,
+# playback underruns) for both.
+import argparse
+import base64
+import json
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from local_vad import pcm16_to_vad_rate
+
+STATE_LISTENING_FOR_WAKEWORD = "LISTENING_FOR_WAKEWORD"
+STATE_SENDING_TO_OPENAI = "SENDING_TO_OPENAI"
+
+RING_HEADER_BYTES = 64
+_WRITE, _READ, _SKIP, _DROPPED = 0, 1, 2, 3 # uint64 slots in the ring header
+
+PA_INPUT_OVERFLOWED = -9981 # PortAudio error codes PyAudio raises with when asked to
+PA_OUTPUT_UNDERFLOWED = -9980
+WAKE_SCORE_EMIT_INTERVAL_S = 0.25 # A rising wake score is reported at most this often
+STATS_WINDOW = 6000 # Percentiles cover the latest this many samples (~3 min of 30 ms chunks); the child runs for days
+
+
+def _aio_log(message, level="INFO"):
+    print(f"[{level}] [AUDIO_IO] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class ShmRing:
+    """
+    Single-producer / single-consumer byte ring in shared memory. The header holds monotonically
+    increasing write / read byte counters; each side only stores its own counter, after copying
+    the data, so no lock is needed. skip_to_end() lets the producer discard unread audio
+    (barge-in) without touching the consumer's counter.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self._header = np.ndarray((RING_HEADER_BYTES // 8,), dtype=np.uint64, buffer=shm.buf[:RING_HEADER_BYTES])
+        self._data = shm.buf[RING_HEADER_BYTES:]
+        self.capacity = len(self._data)
+
+    @classmethod
+    def create(cls, capacity: int) -> "ShmRing":
+        ring = cls(shared_memory.SharedMemory(create=True, size=RING_HEADER_BYTES + capacity), owner=True)
+        ring._header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "ShmRing":
+        shm = shared_memory.SharedMemory(name=name)
+        # The creating process unlinks it; don't let this process's resource tracker do it too on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_index(self) -> int:
+        return int(self._header[_WRITE])
+
+    @property
+    def read_index(self) -> int:
+        return max(int(self._header[_READ]), int(self._header[_SKIP]))
+
+    @property
+    def dropped(self) -> int:
+        """Writes refused because the ring was full (the consumer fell behind)."""
+        return int(self._header[_DROPPED])
+
+    def available(self) -> int:
+        return self.write_index - self.read_index
+
+    def free(self) -> int:
+        return self.capacity - self.available()
+
+    def write(self, data: bytes) -> bool:
+        """Producer side. All or nothing: False (and dropped += 1) if it doesn't fit."""
+        size = len(data)
+        if size > self.free():
+            self._header[_DROPPED] += 1
+            return False
+        write_index = self.write_index
+        start = write_index % self.capacity
+        first = min(size, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        if first < size:
+            self._data[:size - first] = data[first:]
+        self._header[_WRITE] = write_index + size
+        return True
+
+    def read(self, max_bytes: int) -> bytes:
+        """Consumer side. Up to max_bytes of what is there, possibly b""."""
+        read_index = self.read_index
+        size = min(max_bytes, self.write_index - read_index)
+        if size <= 0:
+            return b""
+        start = read_index % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(self._data[start:start + first])
+        if first < size:
+            data += bytes(self._data[:size - first])
+        self._header[_READ] = read_index + size
+        return data
+
+    def skip_to_end(self):
+        """Producer side: everything written so far counts as read. A chunk the consumer is copying
+        at that moment may come out mixed with newer audio; it is being discarded anyway."""
+        self._header[_SKIP] = self._header[_WRITE]
+
+    def close(self):
+        del self._header
+        self._data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class _CadenceStats:
+    """Intervals between successive device reads or writes, against the nominal period (percentiles over the last STATS_WINDOW)."""
+
+    def __init__(self, period_s: float):
+        self.period_s = period_s
+        self.last = None
+        self.deviations_ms = deque(maxlen=STATS_WINDOW)
+        self.intervals = 0
+        self.max_ms = 0.0
+
+    def tick(self, now: float):
+        if self.last is not None:
+            deviation_ms = abs(now - self.last - self.period_s) * 1000.0
+            self.deviations_ms.append(deviation_ms)
+            self.intervals += 1
+            self.max_ms = max(self.max_ms, deviation_ms)
+        self.last = now
+
+    def restart(self):
+        self.last = None
+
+    def summary(self) -> Dict:
+        deviations = sorted(self.deviations_ms)
+        pick = lambda q: deviations[min(len(deviations) - 1, int(len(deviations) * q))] if deviations else 0.0
+        return {"intervals": self.intervals, "jitter_p50_ms": pick(0.5),
+                "jitter_p99_ms": pick(0.99), "jitter_max_ms": self.max_ms}
+
+
+class SyntheticInput:
+    """
+    Sound-card input model for the benchmark: a frame becomes available every period and the
+    device buffers buffer_periods of them. Reading later than that loses frames (an overrun).
+    """
+
+    def __init__(self, rate: int, chunk_ms: int, buffer_periods: int):
+        self.period_s = chunk_ms / 1000.0
+        self.buffer_periods = buffer_periods
+        self.frame = (np.random.default_rng(0).normal(0, 200, int(rate * chunk_ms / 1000))).astype(np.int16).tobytes()
+        self.next_frame = 0
+        self.started = None
+        self.lost_frames = 0
+
+    def read_frame(self) -> bytes:
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        due = self.started + (self.next_frame + 1) * self.period_s
+        if now < due:
+            time.sleep(due - now)
+        else:
+            behind = int((now - due) / self.period_s)
+            if behind >= self.buffer_periods: # The device ring wrapped; the oldest frames are gone
+                self.lost_frames += behind - self.buffer_periods + 1
+                self.next_frame += behind - self.buffer_periods + 1
+        self.next_frame += 1
+        return self.frame
+
+    def close(self):
+        pass
+
+
+class SyntheticOutput:
+    """Sound-card output model: plays one chunk per period from a queue of at most buffer_periods.
+    A write that arrives after the queue ran dry mid-playback is an underrun (audible gap)."""
+
+    def __init__(self, chunk_ms: int, buffer_periods: int):
+        self.period_s = chunk_ms / 1000.0
+        self.buffer_periods = buffer_periods
+        self.play_started = None
+        self.written = 0
+        self.underruns = 0
+
+    def write_frame(self, chunk: bytes):
+        now = time.perf_counter()
+        if self.play_started is None:
+            self.play_started, self.written = now, 0
+        queued = self.written - (now - self.play_started) / self.period_s
+        if queued < 0: # Played out everything we gave it, and more time passed: a gap
+            self.underruns += 1
+            self.play_started, self.written, queued = now, 0, 0
+        if queued > self.buffer_periods - 1: # Blocking write, like PyAudio's: wait for room for one chunk
+            time.sleep((queued - self.buffer_periods + 1) * self.period_s)
+        self.written += 1
+
+    def pause(self):
+        """Nothing to play (no response audio): the device idles, which isn't a glitch."""
+        self.play_started = None
+
+    def close(self):
+        pass
+
+
+class PyAudioInput:
+    def __init__(self, pyaudio_instance, rate: int, chunk_samples: int, input_device_index: Optional[int] = None):
+        import pyaudio
+        self.chunk_samples = chunk_samples
+        self.lost_frames = 0
+        self.stream = pyaudio_instance.open(format=pyaudio.paInt16, channels=1, rate=rate, input=True,
+                                            frames_per_buffer=chunk_samples, input_device_index=input_device_index)
+
+    def read_frame(self) -> bytes:
+        try:
+            return self.stream.read(self.chunk_samples, exception_on_overflow=True)
+        except IOError as e:
+            if getattr(e, "errno", None) != PA_INPUT_OVERFLOWED:
+                raise
+            self.lost_frames += 1
+            return self.stream.read(self.chunk_samples, exception_on_overflow=False)
+
+    def close(self):
+        self.stream.close()
+
+
+class PyAudioOutput:
+    def __init__(self, pyaudio_instance, rate: int, chunk_samples: int, output_device_index: Optional[int] = None):
+        import pyaudio
+        self.underruns = 0
+        self._playing = False
+        self.stream = pyaudio_instance.open(format=pyaudio.paInt16, channels=1, rate=rate, output=True,
+                                            frames_per_buffer=chunk_samples, output_device_index=output_device_index)
+
+    def write_frame(self, chunk: bytes):
+        try:
+            self.stream.write(chunk, exception_on_underflow=self._playing)
+        except IOError as e:
+            if getattr(e, "errno", None) != PA_OUTPUT_UNDERFLOWED:
+                raise
+            self.underruns += 1
+        self._playing = True
+
+    def pause(self):
+        self._playing = False
+
+    def close(self):
+        self.stream.close()
+
+
+class AudioIOWorker:
+    """
+    The audio side: a capture thread (device -> mic ring, plus keyword detection) and a playback
+    thread (speaker ring -> device). Runs in the child process (audio_io_main) or, for the
+    benchmark's in-process baseline, as plain threads. emit(event_tuple) reports to the network side.
+    """
+
+    def __init__(self, settings: Dict, mic_ring: ShmRing, play_ring: ShmRing, emit):
+        self.settings = settings
+        self.mic_ring, self.play_ring = mic_ring, play_ring
+        self.emit = emit
+        self.chunk_ms = settings["chunk_ms"]
+        self.input_rate, self.output_rate = settings["input_rate"], settings["output_rate"]
+        self.in_frame_bytes = int(self.input_rate * self.chunk_ms / 1000) * 2
+        self.out_chunk_bytes = int(self.output_rate * self.chunk_ms / 1000) * 2
+        self.state = settings.get("initial_state", STATE_LISTENING_FOR_WAKEWORD)
+        self.detector = None
+        self.command_keywords_active = False
+        self._last_wake_score_emit = 0.0
+        self._pyaudio = None
+        self._flushes: List = [] # (seq, play_ring write index at flush) not yet played out
+        self._flush_lock = threading.Lock()
+        self._running = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.input_device = self.output_device = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.capture_stats = _CadenceStats(self.chunk_ms / 1000.0)
+        self.playback_stats = _CadenceStats(self.chunk_ms / 1000.0)
+        self.detect_ms = deque(maxlen=STATS_WINDOW)
+        self.starved_chunks = 0
+        self._lost_base = getattr(self.input_device, "lost_frames", 0)
+        self._underrun_base = getattr(self.output_device, "underruns", 0)
+
+    def _open_devices(self):
+        buffer_periods = self.settings.get("buffer_periods", 3)
+        if self.settings.get("device", "pyaudio") == "synthetic":
+            self.input_device = SyntheticInput(self.input_rate, self.chunk_ms, buffer_periods)
+            self.output_device = SyntheticOutput(self.chunk_ms, buffer_periods)
+            return
+        import pyaudio
+        self._pyaudio = pyaudio.PyAudio()
+        self.input_device = PyAudioInput(self._pyaudio, self.input_rate, self.in_frame_bytes // 2, self.settings.get("input_device_index"))
+        self.output_device = PyAudioOutput(self._pyaudio, self.output_rate, self.out_chunk_bytes // 2, self.settings.get("output_device_index"))
+
+    def _load_detector(self):
+        from wake_word_detector import WakeWordDetector, COMMAND_ACTIONS
+        detector = WakeWordDetector(sample_rate=16000)
+        loaded = detector.available and detector.load()
+        if loaded:
+            for action in {settings["action"] for settings in detector.keywords.values()}:
+                detector.add_callback(action, lambda keyword, score, action=action: self.emit(("keyword", keyword, action, score)))
+            self.command_keywords_active = any(detector.has_action(action) for action in COMMAND_ACTIONS)
+            if self.settings.get("wake_score_threshold") is not None:
+                detector.add_score_callback(self._on_scores)
+            self.detector = detector
+        self.emit(("wake_word_loaded", {"loaded": bool(loaded), "load_ms": detector.load_ms, "model_type": detector.model_type,
+                                        "ready_after_start_s": detector.ready_after_start_s}))
+
+    def _on_scores(self, scores: Dict[str, float], wake_score: float):
+        """Reports a rising wake score (speculative session policy), at most every WAKE_SCORE_EMIT_INTERVAL_S."""
+        now = time.perf_counter()
+        if (self.state == STATE_LISTENING_FOR_WAKEWORD and wake_score >= self.settings["wake_score_threshold"]
+                and now - self._last_wake_score_emit >= WAKE_SCORE_EMIT_INTERVAL_S):
+            self._last_wake_score_emit = now
+            self.emit(("wake_score", wake_score))
+
+    def start(self):
+        self._open_devices()
+        self._running.set()
+        if self.settings.get("wake_word", True):
+            threading.Thread(target=self._load_detector, name="aio-ww-load", daemon=True).start()
+        for name, target in (("aio-capture", self._capture_loop), ("aio-playback", self._playback_loop)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running.clear()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        for device in (self.input_device, self.output_device):
+            if device:
+                device.close()
+        if self._pyaudio:
+            self._pyaudio.terminate()
+
+    def set_state(self, state: str):
+        if state != self.state and state == STATE_LISTENING_FOR_WAKEWORD and self.detector:
+            self.detector.reset()
+        self.state = state
+
+    def request_flush(self, seq: int, target_index: int):
+        with self._flush_lock:
+            self._flushes.append((seq, target_index))
+
+    def _detect(self, frame: bytes):
+        from wake_word_detector import ACTION_WAKE, COMMAND_ACTIONS
+        if self.state == STATE_LISTENING_FOR_WAKEWORD:
+            actions = (ACTION_WAKE,)
+        elif self.command_keywords_active:
+            actions = COMMAND_ACTIONS
+        else:
+            return
+        started = time.thread_time()
+        detections = self.detector.process_keywords(pcm16_to_vad_rate(frame, self.input_rate), actions=actions)
+        self.detect_ms.append((time.thread_time() - started) * 1000.0)
+        if detections and self.state == STATE_LISTENING_FOR_WAKEWORD:
+            # Don't fire again while the network side switches state; it echoes SENDING back
+            self.state = STATE_SENDING_TO_OPENAI
+            self.detector.reset()
+
+    def _capture_loop(self):
+        while self._running.is_set():
+            try:
+                frame = self.input_device.read_frame()
+            except Exception as e:
+                self.emit(("error", f"Mic read failed: {e}"))
+                break
+            self.capture_stats.tick(time.perf_counter())
+            if len(frame) != self.in_frame_bytes:
+                continue
+            self.mic_ring.write(frame) # Full ring (network side stalled): the frame is dropped and counted
+            if self.detector is not None:
+                try:
+                    self._detect(frame)
+                except Exception as e:
+                    self.emit(("error", f"Keyword detection failed: {e}"))
+
+    def _playback_loop(self):
+        silence_wait_s = self.chunk_ms / 1000.0 / 4
+        while self._running.is_set():
+            with self._flush_lock:
+                flushing = bool(self._flushes)
+            pending = self.play_ring.available()
+            if pending >= self.out_chunk_bytes or (flushing and pending > 0):
+                chunk = self.play_ring.read(self.out_chunk_bytes)
+                if len(chunk) < self.out_chunk_bytes: # Tail of a response
+                    chunk += b"\x00" * (self.out_chunk_bytes - len(chunk))
+                try:
+                    self.output_device.write_frame(chunk)
+                except Exception as e:
+                    self.emit(("error", f"Speaker write failed: {e}"))
+                    break
+                self.playback_stats.tick(time.perf_counter())
+            else:
+                if pending > 0: # Mid-response and the network side hasn't delivered the next chunk yet
+                    self.starved_chunks += 1
+                self.output_device.pause()
+                self.playback_stats.restart()
+                time.sleep(silence_wait_s)
+            self._report_drained()
+
+    def _report_drained(self):
+        read_index = self.play_ring.read_index
+        with self._flush_lock:
+            done = [seq for seq, target in self._flushes if read_index >= target]
+            self._flushes = [(seq, target) for seq, target in self._flushes if read_index < target]
+        for seq in done:
+            self.emit(("drained", seq))
+
+    def stats(self) -> Dict:
+        detect_ms = sorted(self.detect_ms)
+        capture = self.capture_stats.summary()
+        capture["glitches"] = getattr(self.input_device, "lost_frames", 0) - self._lost_base
+        playback = self.playback_stats.summary()
+        playback["glitches"] = getattr(self.output_device, "underruns", 0) - self._underrun_base
+        return {"capture": capture, "playback": playback, "starved_chunks": self.starved_chunks,
+                "mic_ring_dropped": self.mic_ring.dropped, "detector": self.detector is not None,
+                "detect_p50_ms": detect_ms[len(detect_ms) // 2] if detect_ms else None,
+                "detect_p95_ms": detect_ms[int(len(detect_ms) * 0.95)] if detect_ms else None}
+
+
+def audio_io_main(settings: Dict, mic_ring_name: str, play_ring_name: str, control_conn):
+    """Child process entry point: runs the worker and serves control messages until "stop"."""
+    mic_ring, play_ring = ShmRing.attach(mic_ring_name), ShmRing.attach(play_ring_name)
+    send_lock = threading.Lock()
+
+    def emit(event):
+        with send_lock:
+            try:
+                control_conn.send(event)
+            except (OSError, EOFError):
+                pass
+
+    worker = AudioIOWorker(settings, mic_ring, play_ring, emit)
+    try:
+        worker.start()
+    except Exception as e:
+        emit(("error", f"Could not open audio devices: {e}"))
+        return
+    emit(("ready", {"pid": os.getpid()}))
+    try:
+        while True:
+            try:
+                message = control_conn.recv()
+            except (EOFError, OSError): # Network process went away
+                break
+            kind = message[0]
+            if kind == "stop":
+                break
+            elif kind == "state":
+                worker.set_state(message[1])
+            elif kind == "flush":
+                worker.request_flush(message[1], message[2])
+            elif kind == "stats":
+                emit(("stats", worker.stats()))
+            elif kind == "reset_stats":
+                worker.reset_stats()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+        emit(("stats", worker.stats()))
+        mic_ring.close()
+        play_ring.close()
+
+
+class _RingFill:
+    """Stands in for PCMPlayer.buffer, of which the client only takes len()."""
+
+    def __init__(self, ring: ShmRing):
+        self.ring = ring
+
+    def __len__(self):
+        return self.ring.available()
+
+
+class RingPlayer:
+    """
+    PCMPlayer's interface over the speaker ring. play() only blocks when the ring is full (like
+    PCMPlayer's blocking device write); flush() asks the audio process to report when everything
+    written so far has been played, which is when the drain callbacks run.
+    """
+
+    def __init__(self, io_process: "AudioIOProcess", log_fn=None):
+        self.io = io_process
+        self.log = log_fn or _aio_log
+        self.chunk_bytes = io_process.out_chunk_bytes
+        self.buffer = _RingFill(io_process.play_ring)
+        self.lock = threading.RLock()
+        self._drain_callbacks = []
+        self._first_write_callbacks = []
+        self._flush_seq = 0
+
+    def play(self, pcm_bytes):
+        ring = self.io.play_ring
+        view = memoryview(pcm_bytes)
+        while len(view) and self.io.running:
+            size = min(len(view), ring.free())
+            if size and ring.write(view[:size]):
+                view = view[size:]
+                if self._first_write_callbacks:
+                    self._run_callbacks("first-write", self._take_first_write_callbacks())
+            else:
+                time.sleep(self.io.chunk_ms / 1000.0 / 2)
+
+    def flush(self):
+        with self.lock:
+            self._flush_seq += 1
+            self.io.send(("flush", self._flush_seq, self.io.play_ring.write_index))
+
+    def clear(self):
+        self.io.play_ring.skip_to_end()
+        with self.lock: self._first_write_callbacks = []
+        self.log("RingPlayer: Buffer cleared for barge-in.")
+
+    def add_drain_callback(self, callback):
+        """One-shot callback run once the audio process has played out the next flush()."""
+        with self.lock: self._drain_callbacks.append(callback)
+
+    def add_first_write_callback(self, callback):
+        """One-shot callback run once the next audio is in the speaker ring (dropped by clear())."""
+        with self.lock: self._first_write_callbacks.append(callback)
+
+    def _take_first_write_callbacks(self):
+        with self.lock:
+            callbacks, self._first_write_callbacks = self._first_write_callbacks, []
+        return callbacks
+
+    def _on_drained(self, seq):
+        with self.lock: callbacks, self._drain_callbacks = self._drain_callbacks, []
+        self._run_callbacks("drain", callbacks)
+
+    def _run_callbacks(self, kind, callbacks):
+        for callback in callbacks:
+            try: callback()
+            except Exception as e_cb: self.log(f"RingPlayer {kind} callback error: {e_cb}", "ERROR")
+
+    def close(self):
+        pass # The rings belong to AudioIOProcess
+
+
+class RingMicStream:
+    """The parts of a PyAudio input stream main.py's pipeline uses, fed from the mic ring."""
+
+    def __init__(self, io_process: "AudioIOProcess"):
+        self.io = io_process
+
+    def is_active(self) -> bool:
+        return self.io.running
+
+    def read(self, num_frames: int, exception_on_overflow: bool = False) -> bytes:
+        """Blocks like PyAudio's read until a whole frame is there; b"" after 0.5 s without one."""
+        frame_bytes = num_frames * 2
+        deadline = time.perf_counter() + 0.5
+        while self.io.mic_ring.available() < frame_bytes:
+            if time.perf_counter() > deadline or not self.io.running:
+                return b""
+            time.sleep(0.002)
+        return self.io.mic_ring.read(frame_bytes)
+
+    def close(self):
+        pass
+
+
+class AudioIOProcess:
+    """
+    Network-side handle of the audio process: owns the rings and the control pipe, starts the
+    child and dispatches its events (keyword detections, drained, stats) on a small thread.
+    """
+
+    def __init__(self, input_rate: int = 24000, output_rate: int = 24000, chunk_ms: int = 30, device: str = "pyaudio",
+                 wake_word: bool = True, initial_state: str = STATE_LISTENING_FOR_WAKEWORD, ring_s: float = 10.0,
+                 buffer_periods: int = 3, in_process: bool = False, wake_score_threshold: Optional[float] = None, log_fn=None):
+        """
+        in_process: run AudioIOWorker as threads here instead of in a child (the benchmark's baseline).
+        wake_score_threshold: report "wake_score" events while listening once the wake score reaches it.
+        """
+        self.log = log_fn or _aio_log
+        self.chunk_ms = chunk_ms
+        self.out_chunk_bytes = int(output_rate * chunk_ms / 1000) * 2
+        self.settings = {"input_rate": input_rate, "output_rate": output_rate, "chunk_ms": chunk_ms, "device": device,
+                         "wake_word": wake_word, "initial_state": initial_state, "buffer_periods": buffer_periods,
+                         "wake_score_threshold": wake_score_threshold}
+        self.in_process = in_process
+        self.mic_ring = ShmRing.create(int(input_rate * 2 * max(ring_s / 4, 1.0)))
+        self.play_ring = ShmRing.create(int(output_rate * 2 * ring_s))
+        self.player = RingPlayer(self, self.log)
+        self.running = False
+        self._callbacks: Dict[str, List] = {} # event kind or keyword action -> [fn]
+        self._send_lock = threading.Lock()
+        self._stats_event = threading.Event()
+        self._last_stats: Optional[Dict] = None
+        self._ready = threading.Event()
+        self._conn = self._process = self._worker = None
+        self._event_thread = None
+
+    def add_callback(self, event_or_action: str, callback):
+        """
+        "wake" / "cancel" / "stop": callback(keyword, action, score) on a detection.
+        "wake_word_loaded": callback(info) once the child has (or hasn't) loaded the model.
+        "wake_score": callback(score) while listening, when the wake score is at or above wake_score_threshold.
+        "error": callback(message).
+        """
+        self._callbacks.setdefault(event_or_action, []).append(callback)
+
+    def start(self, timeout_s: float = 10.0) -> bool:
+        if self.in_process:
+            self._worker = AudioIOWorker(self.settings, self.mic_ring, self.play_ring, self._dispatch)
+            self._worker.start()
+            self.running = True
+            return True
+        authkey = secrets.token_bytes(16)
+        listener = Listener(family="AF_UNIX", authkey=authkey)
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "child", "--settings", json.dumps(self.settings),
+             "--mic-ring", self.mic_ring.name, "--play-ring", self.play_ring.name, "--address", listener.address],
+            env={**os.environ, "AUDIO_IO_AUTHKEY": authkey.hex()})
+        accepted = []
+        accept_thread = threading.Thread(target=lambda: accepted.append(listener.accept()), daemon=True)
+        accept_thread.start()
+        accept_thread.join(timeout_s)
+        if accepted:
+            self._conn = accepted[0]
+            self._event_thread = threading.Thread(target=self._event_loop, name="audio-io-events", daemon=True)
+            self._event_thread.start()
+        listener.close()
+        if not accepted or not self._ready.wait(timeout_s):
+            self.log(f"Audio process did not come up within {timeout_s:.0f} s.", "ERROR")
+            self._process.kill()
+            return False
+        self.running = True
+        self.log(f"Audio process running (pid {self._process.pid}, device {self.settings['device']}, "
+                 f"rings {self.mic_ring.capacity // 1024} KiB mic / {self.play_ring.capacity // 1024} KiB speaker).")
+        return True
+
+    def send(self, message):
+        if self._worker is not None: # In-process: call the worker directly
+            if message[0] == "state": self._worker.set_state(message[1])
+            elif message[0] == "flush": self._worker.request_flush(message[1], message[2])
+            elif message[0] == "stats": self._dispatch(("stats", self._worker.stats()))
+            elif message[0] == "reset_stats": self._worker.reset_stats()
+            return
+        if self._conn is None:
+            return
+        with self._send_lock:
+            try:
+                self._conn.send(message)
+            except (OSError, EOFError) as e:
+                self.log(f"Control message {message[0]} not delivered: {e}", "WARNING")
+
+    def set_state(self, state: str):
+        self.send(("state", state))
+
+    def mic_stream(self) -> RingMicStream:
+        return RingMicStream(self)
+
+    def request_stats(self, timeout_s: float = 2.0) -> Optional[Dict]:
+        self._stats_event.clear()
+        self.send(("stats",))
+        return self._last_stats if self._stats_event.wait(timeout_s) else None
+
+    def _event_loop(self):
+        while True:
+            try:
+                event = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            self._dispatch(event)
+        self.running = False
+
+    def _dispatch(self, event):
+        kind = event[0]
+        if kind == "ready":
+            self._ready.set()
+            return
+        if kind == "drained":
+            self.player._on_drained(event[1])
+            return
+        if kind == "stats":
+            self._last_stats = event[1]
+            self._stats_event.set()
+            return
+        if kind == "error":
+            self.log(f"Audio process: {event[1]}", "ERROR")
+        key, args = (event[2], event[1:]) if kind == "keyword" else (kind, event[1:])
+        for callback in self._callbacks.get(key, []):
+            try:
+                callback(*args)
+            except Exception as e:
+                self.log(f"Callback for {key} failed: {e}", "ERROR")
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.stop()
+            self._dispatch(("stats", self._worker.stats()))
+        elif self._process is not None:
+            self.send(("stop",))
+            try:
+                self._process.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self._process.terminate()
+            if self._event_thread:
+                self._event_thread.join(timeout=1)
+            if self._conn:
+                self._conn.close()
+        self.running = False
+        self.mic_ring.close()
+        self.play_ring.close()
+
+
+# --- Benchmark: jitter / glitches under GIL load, in-process vs audio process ---
+def _calibrate_gil_burst(burst_ms: float) -> list:
+    """A payload whose json.dumps takes about burst_ms: one C call that holds the GIL throughout."""
+    payload = [{"id": i, "text": "x" * 40, "values": [1.5, 2.5, 3.5]} for i in range(1000)]
+    started = time.perf_counter()
+    json.dumps(payload)
+    per_item_ms = (time.perf_counter() - started) * 1000.0 / len(payload)
+    return payload * max(1, int(burst_ms / max(per_item_ms, 1e-6) / len(payload)))
+
+
+def _load_thread(stop: threading.Event, payload: list, pause_ms: float):
+    while not stop.is_set():
+        json.dumps(payload) # GIL held for the whole call, like a big tool result or a history summary
+        total = 0
+        for i in range(20000): # Plus ordinary Python bytecode, which does hand the GIL over every 5 ms
+            total += i * i
+        time.sleep(pause_ms / 1000.0)
+
+
+def _network_thread(stop: threading.Event, io: AudioIOProcess, chunk_ms: int, sent: list):
+    """What the network process does with audio: encode mic frames for input_audio_buffer.append
+    and keep ~0.5 s of "assistant" audio queued for playback, topped up in 150 ms deltas."""
+    stream = io.mic_stream()
+    frame_samples = int(io.settings["input_rate"] * chunk_ms / 1000)
+    tone = (np.sin(np.arange(int(io.settings["output_rate"] * 0.15)) * 2 * np.pi * 440 / io.settings["output_rate"]) * 3000).astype(np.int16).tobytes()
+    target_queued = int(io.settings["output_rate"] * 2 * 0.5)
+    while not stop.is_set():
+        frame = stream.read(frame_samples)
+        if frame:
+            json.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(frame).decode("utf-8")})
+            sent[0] += 1
+        if io.play_ring.available() < target_queued:
+            io.player.play(tone)
+
+
+def run_bench_mode(mode: str, seconds: float, load_threads: int, burst_ms: float, buffer_periods: int, wake_word: bool) -> Dict:
+    io = AudioIOProcess(device="synthetic", wake_word=wake_word, buffer_periods=buffer_periods, in_process=(mode == "inproc"))
+    if not io.start():
+        raise SystemExit("Audio process failed to start.")
+    time.sleep(1.0 if wake_word else 0.2) # Model load / device start settle
+    stop, sent = threading.Event(), [0]
+    payload = _calibrate_gil_burst(burst_ms)
+    threads = [threading.Thread(target=_network_thread, args=(stop, io, io.chunk_ms, sent), daemon=True)]
+    threads += [threading.Thread(target=_load_thread, args=(stop, payload, burst_ms), daemon=True) for _ in range(load_threads)]
+    io.send(("reset_stats",))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stats = io.request_stats() or {}
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=2)
+    io.close()
+    return {"mode": mode, "frames_sent": sent[0], **stats}
+
+
+def print_bench(rows: List[Dict], seconds: float, load_threads: int, burst_ms: float, buffer_periods: int):
+    print(f"\nAudio I/O under load: {seconds:.0f} s, {load_threads} load thread(s) holding the GIL ~{burst_ms:.0f} ms at a time, "
+          f"device buffer {buffer_periods} x 30 ms.")
+    print(f"  {'mode':<8} {'mic jit p99':>11} {'mic max':>8} {'lost':>5} {'spk jit p99':>11} {'spk max':>8} {'underruns':>9} "
+          f"{'starved':>8} {'detect p95':>10} {'sent':>6}")
+    for r in rows:
+        capture, playback = r.get("capture", {}), r.get("playback", {})
+        detect = f"{r['detect_p95_ms']:.2f}" if r.get("detect_p95_ms") is not None else "-"
+        print(f"  {r['mode']:<8} {capture.get('jitter_p99_ms', 0):>11.1f} {capture.get('jitter_max_ms', 0):>8.1f} {capture.get('glitches', 0):>5} "
+              f"{playback.get('jitter_p99_ms', 0):>11.1f} {playback.get('jitter_max_ms', 0):>8.1f} {playback.get('glitches', 0):>9} "
+              f"{r.get('starved_chunks', 0):>8} {detect:>10} {r['frames_sent']:>6}")
+    print("  jitter = |device read/write interval - 30 ms|; lost = mic frames dropped by the device; "
+          "starved = speaker ring empty mid-response (network side late).")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Audio I/O process split: jitter / glitch benchmark.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="Synthetic device, GIL load in the network process, inproc vs process.")
+    bench_parser.add_argument("--seconds", type=float, default=20.0)
+    bench_parser.add_argument("--load-threads", type=int, default=2)
+    bench_parser.add_argument("--burst-ms", type=float, default=60.0, help="How long each load burst holds the GIL.")
+    bench_parser.add_argument("--buffer-periods", type=int, default=3, help="Device buffer in 30 ms periods.")
+    bench_parser.add_argument("--modes", default="inproc,process")
+    bench_parser.add_argument("--wake-word", action="store_true", help="Also run the wake-word detector on every frame (needs the model store).")
+    child_parser = commands.add_parser("child", help="Audio process entry point, started by AudioIOProcess.")
+    child_parser.add_argument("--settings", required=True)
+    child_parser.add_argument("--mic-ring", required=True)
+    child_parser.add_argument("--play-ring", required=True)
+    child_parser.add_argument("--address", required=True)
+    cli_args = arg_parser.parse_args()
+
+    if cli_args.command == "child":
+        child_conn = Client(cli_args.address, family="AF_UNIX", authkey=bytes.fromhex(os.environ.pop("AUDIO_IO_AUTHKEY")))
+        audio_io_main(json.loads(cli_args.settings), cli_args.mic_ring, cli_args.play_ring, child_conn)
+
+    if cli_args.command == "bench":
+        bench_rows = [run_bench_mode(mode.strip(), cli_args.seconds, cli_args.load_threads, cli_args.burst_ms,
+                                     cli_args.buffer_periods, cli_args.wake_word)
+                      for mode in cli_args.modes.split(",") if mode.strip()]
+        print_bench(bench_rows, cli_args.seconds, cli_args.load_threads, cli_args.burst_ms, cli_args.buffer_periods)
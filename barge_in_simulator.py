@@ -0,0 +1,217 @@
+# barge_in_simulator.py
+# Offline tuning of the local barge-in (local_vad.BargeInVad + BargeInDetector) over recordings.
+#
+#   python barge_in_simulator.py corpus/ [--modes 0,1,2,3] [--gains 0.1,0.2,0.35,0.5,1.0]
+#          [--min-speech-frames 6,9,12,15] [--silence-reset-frames 1,3,5] [--workers 4] [--all] [--json out.json]
+#
+#   corpus/interrupt/*.wav         mic while the assistant is talking, and the user talks over it
+#   corpus/interrupt/labels.csv    "file,speech_start_s": when the user starts talking
+#   corpus/echo/*.wav              mic while the assistant is talking, no user speech (echo, room noise)
+#
+# Every file starts when assistant playback starts, so barge-in is armed from BARGE_IN_ACTIVATION_MS.
+# Each file is read as 16 kHz frames resampled one 30 ms frame at a time (wav_corpus.read_vad_frames,
+# as the live path resamples each mic frame) and classified by the VAD in one vectorized batch per
+# (mode, gain); the frame counters are then swept over those decisions with barge_in_decisions(),
+# the function the live pipeline's BargeInDetector steps through. One job per (file, VAD mode),
+# spread over worker processes. Per setting:
+#   - misses: interrupt files where the user was never detected
+#   - interrupt latency: first interrupt after speech_start_s, p50 / p95
+#   - false interrupts: interrupts on echo files plus those before speech_start_s, per hour of
+#     assistant audio, and the share of echo files whose reply would have been cut off
+import argparse
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app_config import APP_CONFIG
+from latency_metrics import _percentile
+from local_vad import BargeInVad, barge_in_decisions, VAD_SAMPLE_RATE
+from wav_corpus import (find_corpus_files as find_wav_files, read_vad_frames, fmt_optional, add_json_argument, write_json_report,
+                        FRAME_MS, FRAME_S)
+
+LABELS = ("interrupt", "echo")
+DEFAULT_MODES = "0,1,2,3"
+DEFAULT_GAINS = "0.1,0.2,0.35,0.5,1.0"
+DEFAULT_MIN_SPEECH_FRAMES = "6,9,12,15"
+DEFAULT_SILENCE_RESET_FRAMES = "1,3,5"
+
+
+def _sim_log(message, level="INFO"):
+    print(f"[{level}] [BARGE_IN_SIM] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def find_corpus_files(corpus_dir: str) -> List[Dict]:
+    speech_starts = load_speech_start_labels(corpus_dir)
+    files = []
+    for file_info in find_wav_files(corpus_dir, LABELS):
+        speech_start_s = speech_starts.get(os.path.basename(file_info["path"])) if file_info["label"] == "interrupt" else None
+        if file_info["label"] == "interrupt" and speech_start_s is None:
+            _sim_log(f"{file_info['path']} has no speech_start_s in interrupt/labels.csv; skipped.", "WARNING")
+            continue
+        files.append({**file_info, "speech_start_s": speech_start_s})
+    return files
+
+
+def load_speech_start_labels(corpus_dir: str) -> Dict[str, float]:
+    """interrupt/labels.csv: file name (as in interrupt/) -> when the user starts talking, in seconds."""
+    labels_path = os.path.join(corpus_dir, "interrupt", "labels.csv")
+    if not os.path.exists(labels_path):
+        return {}
+    with open(labels_path, newline="") as labels_file:
+        return {row["file"]: float(row["speech_start_s"]) for row in csv.DictReader(labels_file)}
+
+
+def read_wav_16k(path: str) -> np.ndarray:
+    """The whole file as 16 kHz mono int16 in whole 30 ms frames (what the barge-in VAD sees)."""
+    return np.frombuffer(b"".join(frame for frames in read_vad_frames(path, FRAME_MS) for frame in frames), dtype=np.int16)
+
+
+def simulate_file(job: Tuple[Dict, int, List[float], List[Tuple[int, int]], int, int]) -> Dict:
+    """
+    One file under one VAD mode: batch VAD per gain, then every (min_speech_frames, silence_reset_frames)
+    over those decisions. Returns interrupt times (frame ends, s) per (mode, gain, min, reset).
+    """
+    file_info, vad_mode, gains, counter_grid, cooldown_ms, activation_ms = job
+    samples = read_wav_16k(file_info["path"])
+    vad_cpu_s, fires = 0.0, {}
+    armed = None
+    for gain in gains:
+        vad = BargeInVad(frame_ms=FRAME_MS, input_rate=VAD_SAMPLE_RATE, vad_mode=vad_mode, gain=gain)
+        if not vad.available:
+            raise RuntimeError("webrtcvad is not installed; the simulator needs the same VAD as the live pipeline.")
+        started = time.process_time()
+        voiced = vad.batch(samples)
+        vad_cpu_s += time.process_time() - started
+        if armed is None:
+            armed = (np.arange(1, len(voiced) + 1) * FRAME_MS) > activation_ms # Assistant audio played long enough
+        for min_speech_frames, silence_reset_frames in counter_grid:
+            fired = barge_in_decisions(voiced, armed, min_speech_frames, silence_reset_frames, cooldown_ms // FRAME_MS)
+            fires[(vad_mode, gain, min_speech_frames, silence_reset_frames)] = [(index + 1) * FRAME_S for index in fired]
+    return {**file_info, "duration_s": len(samples) / VAD_SAMPLE_RATE, "vad_cpu_s": vad_cpu_s, "fires": fires}
+
+
+def summarize(results: List[Dict], settings: List[Tuple]) -> List[Dict]:
+    interrupts = [r for r in results if r["label"] == "interrupt"]
+    echoes = [r for r in results if r["label"] == "echo"]
+    # Assistant audio with no user speech: echo files, and interrupt files up to the user's onset
+    assistant_only_h = (sum(r["duration_s"] for r in echoes) + sum(r["speech_start_s"] for r in interrupts)) / 3600.0
+    rows = []
+    for setting in settings:
+        misses, early, latencies_ms = 0, 0, []
+        for r in interrupts:
+            fired = r["fires"][setting]
+            if fired and fired[0] < r["speech_start_s"]:
+                early += 1 # Cut the reply before the user said anything
+            elif fired:
+                latencies_ms.append((fired[0] - r["speech_start_s"]) * 1000.0)
+            else:
+                misses += 1
+        echo_interrupts = sum(len(r["fires"][setting]) for r in echoes)
+        latencies_ms.sort()
+        vad_mode, gain, min_speech_frames, silence_reset_frames = setting
+        rows.append({
+            "vad_mode": vad_mode, "gain": gain, "min_speech_frames": min_speech_frames, "silence_reset_frames": silence_reset_frames,
+            "miss_rate": misses / len(interrupts) if interrupts else None,
+            "latency_p50_ms": _percentile(latencies_ms, 50) if latencies_ms else None,
+            "latency_p95_ms": _percentile(latencies_ms, 95) if latencies_ms else None,
+            "false_interrupts": echo_interrupts + early, "false_before_onset": early,
+            "false_per_hour": (echo_interrupts + early) / assistant_only_h if assistant_only_h else None,
+            "echo_files_cut_pct": 100.0 * sum(bool(r["fires"][setting]) for r in echoes) / len(echoes) if echoes else None,
+        })
+    return rows
+
+
+def pareto_front(rows: List[Dict]) -> List[Dict]:
+    """Settings no other setting beats on false interrupts, misses and p50 latency at once."""
+    def key(row):
+        return (row["false_per_hour"] if row["false_per_hour"] is not None else 0.0,
+                row["miss_rate"] if row["miss_rate"] is not None else 0.0,
+                row["latency_p50_ms"] if row["latency_p50_ms"] is not None else float("inf"))
+    keys = [key(row) for row in rows]
+    return [row for row, k in zip(rows, keys)
+            if not any(all(o <= s for o, s in zip(other, k)) and other != k for other in keys)]
+
+
+def run_simulation(corpus_dir: str, modes: List[int], gains: List[float], min_speech_frames: List[int],
+                   silence_reset_frames: List[int], cooldown_ms: int, activation_ms: int, workers: int) -> Dict:
+    files = find_corpus_files(corpus_dir)
+    if not files:
+        raise SystemExit(f"No WAVs in {corpus_dir}/{{{','.join(LABELS)}}}/.")
+    counter_grid = list(itertools.product(min_speech_frames, silence_reset_frames))
+    settings = list(itertools.product(modes, gains, min_speech_frames, silence_reset_frames))
+    jobs = [(file_info, mode, gains, counter_grid, cooldown_ms, activation_ms) for file_info in files for mode in modes]
+    _sim_log(f"Simulating {len(settings)} settings over {len(files)} files ({len(jobs)} VAD jobs, {workers} worker process(es))...")
+    started = time.perf_counter()
+    by_path: Dict[str, Dict] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(simulate_file, jobs):
+            merged = by_path.setdefault(result["path"], {**result, "fires": {}, "vad_cpu_s": 0.0})
+            merged["fires"].update(result["fires"])
+            merged["vad_cpu_s"] += result["vad_cpu_s"]
+    results = list(by_path.values())
+    audio_s = sum(r["duration_s"] for r in results)
+    return {
+        "workers": workers, "wall_s": time.perf_counter() - started, "audio_s": audio_s,
+        "vad_cpu_s": sum(r["vad_cpu_s"] for r in results), "cooldown_ms": cooldown_ms, "activation_ms": activation_ms,
+        "files": {label: sum(r["label"] == label for r in results) for label in LABELS},
+        "audio_s_by_label": {label: sum(r["duration_s"] for r in results if r["label"] == label) for label in LABELS},
+        "rows": summarize(results, settings),
+    }
+
+
+def print_report(report: Dict, current: Tuple, show_all: bool):
+    files, audio = report["files"], report["audio_s_by_label"]
+    print(f"\nBarge-in: {files['interrupt']} interrupt files ({audio['interrupt'] / 60:.1f} min), "
+          f"{files['echo']} echo files ({audio['echo'] / 60:.1f} min)")
+    print(f"  {len(report['rows'])} settings over {report['audio_s'] / 3600:.2f} h of audio in {report['wall_s']:.1f} s wall "
+          f"with {report['workers']} workers; VAD {report['vad_cpu_s']:.1f} CPU-s")
+    current_row = next((row for row in report["rows"] if (row["vad_mode"], row["gain"], row["min_speech_frames"],
+                                                          row["silence_reset_frames"]) == current), None)
+    rows = report["rows"] if show_all else pareto_front(report["rows"])
+    if current_row is not None and current_row not in rows:
+        rows = rows + [current_row]
+    rows = sorted(rows, key=lambda row: (row["false_per_hour"] or 0.0, row["latency_p50_ms"] or 0.0))
+    print(f"\n  {'mode':>5} {'gain':>5} {'min fr':>6} {'reset':>5} {'miss %':>7} {'lat p50':>8} {'lat p95':>8} "
+          f"{'FI/hr':>7} {'FI early':>8} {'echo cut %':>10}")
+    for row in rows:
+        marker = "*" if row is current_row else " "
+        miss = fmt_optional(None if row["miss_rate"] is None else row["miss_rate"] * 100.0, ".1f")
+        print(f"  {marker}{row['vad_mode']:>4} {row['gain']:>5.2f} {row['min_speech_frames']:>6} {row['silence_reset_frames']:>5} "
+              f"{miss:>7} {fmt_optional(row['latency_p50_ms'], '.0f'):>8} {fmt_optional(row['latency_p95_ms'], '.0f'):>8} "
+              f"{fmt_optional(row['false_per_hour'], '.1f'):>7} {row['false_before_onset']:>8} {fmt_optional(row['echo_files_cut_pct'], '.1f'):>10}")
+    print("  (* = current BARGE_IN_* setting; latency from the user's onset to the interrupt"
+          + ("" if show_all else "; only settings no other beats on FI/hr, miss and p50 - --all for every one") + ")")
+
+
+def _csv_list(text: str, cast) -> List:
+    return sorted({cast(item) for item in text.split(",") if item.strip()})
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Barge-in interrupt latency and false-interrupt rate per VAD / counter setting.")
+    arg_parser.add_argument("corpus_dir", help="Directory with interrupt/ (plus labels.csv) and echo/ WAVs.")
+    arg_parser.add_argument("--modes", default=DEFAULT_MODES, help=f"WebRTC VAD modes (default {DEFAULT_MODES}).")
+    arg_parser.add_argument("--gains", default=DEFAULT_GAINS, help=f"Mic scaling before the VAD (default {DEFAULT_GAINS}).")
+    arg_parser.add_argument("--min-speech-frames", default=DEFAULT_MIN_SPEECH_FRAMES)
+    arg_parser.add_argument("--silence-reset-frames", default=DEFAULT_SILENCE_RESET_FRAMES)
+    arg_parser.add_argument("--cooldown-ms", type=int, default=APP_CONFIG["BARGE_IN_COOLDOWN_MS"])
+    arg_parser.add_argument("--activation-ms", type=int, default=APP_CONFIG["BARGE_IN_ACTIVATION_MS"])
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument("--all", action="store_true", help="Print every setting, not just the trade-off front.")
+    add_json_argument(arg_parser)
+    cli_args = arg_parser.parse_args()
+
+    sim_report = run_simulation(cli_args.corpus_dir, _csv_list(cli_args.modes, int), _csv_list(cli_args.gains, float),
+                                _csv_list(cli_args.min_speech_frames, int), _csv_list(cli_args.silence_reset_frames, int),
+                                cli_args.cooldown_ms, cli_args.activation_ms, max(1, cli_args.workers))
+    current_setting = (APP_CONFIG["BARGE_IN_VAD_MODE"], APP_CONFIG["BARGE_IN_VAD_GAIN"],
+                       APP_CONFIG["BARGE_IN_MIN_SPEECH_FRAMES"], APP_CONFIG["BARGE_IN_SILENCE_RESET_FRAMES"])
+    print_report(sim_report, current_setting, cli_args.all)
+    if cli_args.json_path:
+        write_json_report(cli_args.json_path, sim_report, _sim_log)
@@ -17,6 +17,7 @@ DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), CONVERSATION_
 # --- Database Initialization ---
 def init_db():
     """Initializes the conversation history database and creates tables if they don't exist."""
+    conn = None
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
@@ -39,7 +40,39 @@ def init_db():
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_session_timestamp ON conversation_turns (session_id, timestamp);
         """)
+
+        # Columns added after the initial schema. Older DB files get them via ALTER TABLE.
+        existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(conversation_turns);").fetchall()}
+        for column_name, column_type in (("item_id", "TEXT"), ("duration_ms", "INTEGER"), ("device", "TEXT")):
+            if column_name not in existing_columns:
+                cursor.execute(f"ALTER TABLE conversation_turns ADD COLUMN {column_name} {column_type};")
+                _ch_log(f"Migrated 'conversation_turns': added column '{column_name}'.", "INFO")
         
+        # Token usage of every response.done (see add_response_usage / usage_report.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS response_usage (
+                usage_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                response_id TEXT,
+                response_index INTEGER,
+                status TEXT,
+                timestamp TIMESTAMP NOT NULL,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                input_text_tokens INTEGER NOT NULL DEFAULT 0,
+                input_audio_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_text_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_audio_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                output_text_tokens INTEGER NOT NULL DEFAULT 0,
+                output_audio_tokens INTEGER NOT NULL DEFAULT 0,
+                instructions_chars INTEGER,
+                tag TEXT
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_session ON response_usage (session_id, timestamp);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_timestamp ON response_usage (timestamp);")
+
         conn.commit()
         _ch_log("Database initialized successfully and 'conversation_turns' table is ready.", "INFO")
     except sqlite3.Error as e:
@@ -140,25 +173,31 @@ def get_recent_turns(session_id: str = None, limit: int = 20) -> list[dict]:
     # if session_id is None, it fetches global recent turns.
     return get_filtered_turns(session_id=session_id, limit=limit)
 
-def add_turn(session_id: str, role: str, content: str):
+def add_turn(session_id: str, role: str, content: str, item_id: Optional[str] = None, duration_ms: Optional[int] = None,
+             device: Optional[str] = None):
     """Adds a new conversation turn to the database.
 
     Args:
         session_id: The ID of the current OpenAI session.
         role: The role of the entity in the turn (e.g., 'user', 'assistant', 'tool_call', 'tool_result').
         content: The textual content of the turn. Can be JSON string for tool calls/results.
+        item_id: Optional. The Realtime API conversation item this turn belongs to.
+        duration_ms: Optional. For user turns, the time from the first transcription event
+            of the item until its transcript was finalized.
+        device: Optional. The device (DEVICE_NAME) the session ran on, on a multi-device host.
     """
     if not session_id:
         _ch_log("Attempted to add turn with no session_id. Skipping.", "WARN")
         return
 
+    conn = None
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO conversation_turns (session_id, role, content, timestamp)
-            VALUES (?, ?, ?, ?)
-        """, (session_id, role, content, datetime.utcnow())) # Storing as UTC
+            INSERT INTO conversation_turns (session_id, role, content, timestamp, item_id, duration_ms, device)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (session_id, role, content, datetime.utcnow(), item_id, duration_ms, device)) # Storing as UTC
         conn.commit()
         _ch_log(f"Added turn for session '{session_id}'. Role: {role}, Content snippet: '{content[:70]}...'", "DEBUG")
     except sqlite3.Error as e:
@@ -167,12 +206,83 @@ def add_turn(session_id: str, role: str, content: str):
         if conn:
             conn.close()
 
-def get_recent_turns(session_id: str = None, limit: int = 20) -> list[dict]:
+def usage_row_from_response(usage: Optional[dict]) -> Dict[str, int]:
+    """Flattens the `usage` block of a response.done event into response_usage columns."""
+    usage = usage or {}
+    input_details = usage.get("input_token_details") or {}
+    cached_details = input_details.get("cached_tokens_details") or {}
+    output_details = usage.get("output_token_details") or {}
+    return {
+        "input_tokens": usage.get("input_tokens") or 0,
+        "input_text_tokens": input_details.get("text_tokens") or 0,
+        "input_audio_tokens": input_details.get("audio_tokens") or 0,
+        "cached_tokens": input_details.get("cached_tokens") or 0,
+        "cached_text_tokens": cached_details.get("text_tokens") or 0,
+        "cached_audio_tokens": cached_details.get("audio_tokens") or 0,
+        "output_tokens": usage.get("output_tokens") or 0,
+        "output_text_tokens": output_details.get("text_tokens") or 0,
+        "output_audio_tokens": output_details.get("audio_tokens") or 0,
+    }
+
+def add_response_usage(session_id: str, response_id: Optional[str], response_index: int, status: Optional[str],
+                       usage: Optional[dict], instructions_chars: Optional[int] = None, tag: Optional[str] = None):
+    """Stores the token usage of one response.done.
+
+    Args:
+        session_id: The ID of the current OpenAI session.
+        response_id: The response the usage belongs to.
+        response_index: 1-based position of the response in the session.
+        status: The response status ('completed', 'cancelled', ...).
+        usage: The `usage` block of the response.done event, as sent by the server.
+        instructions_chars: Optional. Length of the session instructions in effect.
+        tag: Optional. Free-form label (USAGE_TAG) to compare prompt / priming variants.
+    """
+    if not session_id:
+        return
+    row = usage_row_from_response(usage)
+    conn = None
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute(f"""
+            INSERT INTO response_usage (session_id, response_id, response_index, status, timestamp,
+                                        {', '.join(row)}, instructions_chars, tag)
+            VALUES (?, ?, ?, ?, ?, {', '.join('?' for _ in row)}, ?, ?)
+        """, (session_id, response_id, response_index, status, datetime.utcnow(), *row.values(), instructions_chars, tag))
+        conn.commit()
+    except sqlite3.Error as e:
+        _ch_log(f"Error adding response usage for session '{session_id}': {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+def get_response_usage(since: Optional[datetime] = None, session_id: Optional[str] = None) -> List[Dict]:
+    """Returns response_usage rows (oldest first), optionally since a UTC datetime and/or for one session."""
+    conn = None
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        query, params = "SELECT * FROM response_usage WHERE 1 = 1", []
+        if since:
+            query += " AND timestamp >= ?"
+            params.append(since.strftime('%Y-%m-%d %H:%M:%S'))
+        if session_id:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        return [dict(row) for row in conn.execute(query + " ORDER BY timestamp, usage_id", tuple(params)).fetchall()]
+    except sqlite3.Error as e:
+        _ch_log(f"Error reading response usage: {e}", "ERROR")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def get_recent_turns(session_id: str = None, limit: int = 20, device: Optional[str] = None) -> list[dict]:
     """Retrieves the most recent conversation turns.
 
     Args:
         session_id: Optional. If provided, retrieves turns only for this session.
         limit: The maximum number of recent turns to retrieve.
+        device: Optional. If provided (and no session_id), retrieves only this device's turns.
 
     Returns:
         A list of dictionaries, where each dictionary represents a conversation turn.
@@ -193,6 +303,15 @@ def get_recent_turns(session_id: str = None, limit: int = 20) -> list[dict]:
                 LIMIT ?
             """
             cursor.execute(query, (session_id, limit))
+        elif device:
+            query = """
+                SELECT turn_id, session_id, timestamp, role, content 
+                FROM conversation_turns 
+                WHERE device = ?
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            """
+            cursor.execute(query, (device, limit))
         else:
             query = """
                 SELECT turn_id, session_id, timestamp, role, content 
@@ -208,7 +327,7 @@ def get_recent_turns(session_id: str = None, limit: int = 20) -> list[dict]:
         
         # Reverse the order so the oldest of the recent turns is first (more natural for history summary)
         turns.reverse() 
-        _ch_log(f"Retrieved {len(turns)} recent turns (Session: {session_id if session_id else 'Any'}, Limit: {limit}).", "DEBUG")
+        _ch_log(f"Retrieved {len(turns)} recent turns (Session: {session_id if session_id else 'Any'}, Device: {device or 'Any'}, Limit: {limit}).", "DEBUG")
 
     except sqlite3.Error as e:
         _ch_log(f"Error retrieving recent turns: {e}", "ERROR")
@@ -217,8 +336,122 @@ def get_recent_turns(session_id: str = None, limit: int = 20) -> list[dict]:
             conn.close()
     return turns
 
+DELTA_FRAGMENT_WINDOW_S = 10.0 # Fragments logged further before the completed transcript are separate turns
+
+def _parse_turn_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def compact_transcription_delta_rows(dry_run: bool = False) -> int:
+    """One-off migration that removes user rows written from transcription deltas.
+
+    Older clients logged every `input_audio_transcription.delta` as its own 'user' turn and
+    then logged the `.completed` transcript again. Within a session, such a burst shows up as
+    a run of consecutive 'user' rows with no item_id, ending in the completed transcript (a
+    pause longer than DELTA_FRAGMENT_WINDOW_S between two rows also ends a run). An earlier
+    row of the run is a fragment, and gets deleted, only if it was logged at most
+    DELTA_FRAGMENT_WINDOW_S before the final row and its text, appended to the fragments
+    before it, is still a prefix of the final transcript (whitespace and case ignored). A
+    separate earlier turn ("yes" long before "yes please") is kept; the final row is kept.
+
+    Args:
+        dry_run: If True, only count the rows that would be deleted.
+
+    Returns:
+        The number of rows deleted (or that would be deleted when dry_run is True).
+    """
+    conn = None
+    fragment_ids = []
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT turn_id, session_id, timestamp, role, content, item_id
+            FROM conversation_turns
+            ORDER BY session_id, timestamp, turn_id
+        """)
+
+        current_session = None
+        current_run = []
+
+        def _squash(text):
+            return "".join(text.split()).lower()
+
+        def _collect_fragments(run):
+            if len(run) < 2:
+                return
+            final_text = _squash(run[-1]['content'])
+            final_ts = _parse_turn_timestamp(run[-1]['timestamp'])
+            if not final_text or final_ts is None:
+                return
+            accumulated = ""
+            for row in run[:-1]:
+                row_ts = _parse_turn_timestamp(row['timestamp'])
+                if row_ts is None or (final_ts - row_ts).total_seconds() > DELTA_FRAGMENT_WINDOW_S:
+                    accumulated = ""
+                    continue
+                fragment_text = _squash(row['content'])
+                if not fragment_text:
+                    continue
+                if final_text.startswith(accumulated + fragment_text): # Incremental delta
+                    accumulated += fragment_text
+                elif final_text.startswith(fragment_text): # Cumulative delta, or a new burst starting over
+                    accumulated = fragment_text
+                else:
+                    accumulated = ""
+                    continue
+                fragment_ids.append(row['turn_id'])
+
+        for row in cursor.fetchall():
+            if row['session_id'] != current_session:
+                _collect_fragments(current_run)
+                current_session, current_run = row['session_id'], []
+            if row['role'] == 'user' and row['item_id'] is None:
+                if current_run:
+                    previous_ts = _parse_turn_timestamp(current_run[-1]['timestamp'])
+                    row_ts = _parse_turn_timestamp(row['timestamp'])
+                    if previous_ts is None or row_ts is None or (row_ts - previous_ts).total_seconds() > DELTA_FRAGMENT_WINDOW_S:
+                        _collect_fragments(current_run) # A pause this long starts a new burst
+                        current_run = []
+                current_run.append(row)
+            else:
+                _collect_fragments(current_run)
+                current_run = []
+        _collect_fragments(current_run)
+
+        if dry_run:
+            _ch_log(f"Delta compaction (dry run): {len(fragment_ids)} fragment rows would be deleted.", "INFO")
+            return len(fragment_ids)
+
+        for start in range(0, len(fragment_ids), 500):
+            batch = fragment_ids[start:start + 500]
+            placeholders = ','.join('?' for _ in batch)
+            cursor.execute(f"DELETE FROM conversation_turns WHERE turn_id IN ({placeholders})", tuple(batch))
+        conn.commit()
+        if fragment_ids:
+            conn.execute("VACUUM")
+        _ch_log(f"Delta compaction: deleted {len(fragment_ids)} fragment rows.", "INFO")
+        return len(fragment_ids)
+    except sqlite3.Error as e:
+        _ch_log(f"Error compacting transcription delta rows: {e}", "ERROR")
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
 # --- Example Usage (for direct testing of this module) ---
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--compact-deltas":
+        init_db()
+        compact_transcription_delta_rows(dry_run="--dry-run" in sys.argv[2:])
+        sys.exit(0)
+
     _ch_log("Running conversation_history_db.py directly for testing...", "INFO")
     
     # Initialize DB (creates if not exists)
@@ -0,0 +1,195 @@
+# conversation_pruner.py
+# Keeps the server-side Realtime conversation bounded during long sessions.
+#
+# The server keeps every user, assistant and tool item, and each response.create pays
+# for all of them again. ConversationPruner mirrors the item list from the server events,
+# estimates what each item costs, and recalibrates the estimate against the real
+# input_tokens reported in response.done, minus the static part every response pays
+# for (instructions, tool schemas), which pruning cannot shrink. Past the budget,
+# plan_prune() picks the oldest items to replace with one summary item (inserted after
+# the pinned context item). The client sends the conversation.item.create /
+# conversation.item.delete events.
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def _cp_log(message, level="INFO"):
+    print(f"[{level}] [CONV_PRUNER] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """~4 characters per token for English text."""
+    return max(1, len(text or "") // 4)
+
+
+class PrunePlan:
+    def __init__(self, item_ids: List[str], transcript_lines: List[str], estimated_tokens: int, previous_summary: Optional[str],
+                 insert_after: Optional[str] = None):
+        self.item_ids = item_ids
+        self.transcript_lines = transcript_lines
+        self.estimated_tokens = estimated_tokens
+        self.previous_summary = previous_summary
+        self.insert_after = insert_after # previous_item_id for the summary item; None means the root
+
+
+class ConversationPruner:
+    """
+    Tracks conversation items by id with an approximate token cost.
+
+    Audio items are estimated from their transcript times audio_token_multiplier (audio
+    tokens are several times denser than the text saying the same thing). The first
+    response.done of a session fixes static_tokens: its input_tokens minus the estimate of the
+    items it saw. After each response.done the ratio between the conversation's share of
+    input_tokens (input_tokens - static_tokens) and the summed estimate becomes the calibration
+    factor, so the budget check uses real usage, not the raw estimate.
+    """
+
+    def __init__(self, token_budget: int = 12000, keep_recent_items: int = 8, target_ratio: float = 0.6,
+                 audio_token_multiplier: float = 5.0, log_fn=None):
+        self.token_budget = token_budget
+        self.keep_recent_items = keep_recent_items
+        self.target_ratio = target_ratio
+        self.audio_token_multiplier = audio_token_multiplier
+        self.log = log_fn or _cp_log
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all items (new session)."""
+        with self._lock:
+            self.items: "OrderedDict[str, Dict]" = OrderedDict()
+            self.summary_item_id: Optional[str] = None
+            self.summary_text: Optional[str] = None
+            self.pinned_item_ids = set()
+            self.calibration = 1.0
+            self.static_tokens: Optional[int] = None # Instructions and tool schemas, in every response's input_tokens
+            self.last_conversation_tokens = 0
+            self.prune_in_progress = False
+            self.pruned_item_count = 0
+
+    # --- Mirroring server events ---
+    def on_item_created(self, item: dict):
+        item_id = item.get("id")
+        if not item_id:
+            return
+        item_type = item.get("type")
+        text, is_audio = "", False
+        if item_type == "message":
+            for part in item.get("content") or []:
+                if part.get("type") in ("input_audio", "audio"):
+                    is_audio = True
+                text += part.get("text") or part.get("transcript") or ""
+        elif item_type == "function_call":
+            text = f"{item.get('name', '')}({item.get('arguments', '')})"
+        elif item_type == "function_call_output":
+            text = item.get("output", "")
+        with self._lock:
+            if item_id == self.summary_item_id:
+                return
+            self.items[item_id] = {"type": item_type, "role": item.get("role"), "call_id": item.get("call_id"),
+                                   "text": text, "is_audio": is_audio, "tokens": self._estimate(text, is_audio)}
+
+    def on_item_text(self, item_id: str, text: str):
+        """Transcript of an audio item became known (user transcription / assistant audio transcript)."""
+        with self._lock:
+            entry = self.items.get(item_id)
+            if entry is None or not text:
+                return
+            entry["text"] = text
+            entry["is_audio"] = True
+            entry["tokens"] = self._estimate(text, True)
+
+    def pin_item(self, item_id: str):
+        """Never prune this item (e.g. the session context item). Cleared by reset()."""
+        with self._lock:
+            self.pinned_item_ids.add(item_id)
+
+    def on_item_deleted(self, item_id: str):
+        with self._lock:
+            self.items.pop(item_id, None)
+
+    def on_response_done(self, usage: dict):
+        input_tokens = (usage or {}).get("input_tokens") or 0
+        if not input_tokens:
+            return
+        with self._lock:
+            raw_estimate = sum(entry["tokens"] for entry in self.items.values())
+            if self.static_tokens is None:
+                self.static_tokens = max(0, input_tokens - raw_estimate)
+            conversation_tokens = max(0, input_tokens - self.static_tokens)
+            self.last_conversation_tokens = conversation_tokens
+            if raw_estimate > 0 and conversation_tokens > 0:
+                self.calibration = max(0.2, min(5.0, conversation_tokens / raw_estimate))
+
+    def _estimate(self, text: str, is_audio: bool) -> int:
+        tokens = estimate_text_tokens(text) + 4 # per-item framing
+        return int(tokens * self.audio_token_multiplier) if is_audio else tokens
+
+    # --- Planning ---
+    def estimated_context_tokens(self) -> int:
+        with self._lock:
+            return int(sum(entry["tokens"] for entry in self.items.values()) * self.calibration)
+
+    def item_count(self) -> int:
+        with self._lock:
+            return len(self.items)
+
+    def plan_prune(self) -> Optional[PrunePlan]:
+        """
+        Returns the oldest items to replace with a summary, or None when the conversation's share of
+        the last input_tokens is under budget.
+        Keeps the newest keep_recent_items and pinned items, and never separates a function_call from its output.
+        """
+        with self._lock:
+            if self.prune_in_progress or self.last_conversation_tokens <= self.token_budget:
+                return None
+            candidates = [(item_id, entry) for item_id, entry in list(self.items.items())[:max(0, len(self.items) - self.keep_recent_items)]
+                          if item_id not in self.pinned_item_ids]
+            target_tokens = self.token_budget * self.target_ratio
+            current_tokens = self.last_conversation_tokens
+            selected, selected_call_ids, lines, removed_tokens = [], set(), [], 0
+            for item_id, entry in candidates:
+                if current_tokens - removed_tokens <= target_tokens:
+                    break
+                selected.append(item_id)
+                if entry["call_id"]:
+                    selected_call_ids.add(entry["call_id"])
+                removed_tokens += int(entry["tokens"] * self.calibration)
+                if item_id != self.summary_item_id and entry["text"]: # The old summary is folded in via previous_summary
+                    speaker = entry["role"] or entry["type"]
+                    lines.append(f"{speaker}: {entry['text']}")
+            # Outputs whose call was selected go too, wherever they are
+            for item_id, entry in self.items.items():
+                if entry["call_id"] in selected_call_ids and item_id not in selected:
+                    selected.append(item_id)
+            if not selected:
+                return None
+            self.prune_in_progress = True
+            pinned = [item_id for item_id in self.items if item_id in self.pinned_item_ids]
+            return PrunePlan(selected, lines, removed_tokens, self.summary_text, insert_after=pinned[-1] if pinned else None)
+
+    def finish_prune(self, plan: PrunePlan, summary_item_id: Optional[str], summary_text: Optional[str]):
+        with self._lock:
+            for item_id in plan.item_ids:
+                self.items.pop(item_id, None)
+            if summary_item_id:
+                self.summary_item_id, self.summary_text = summary_item_id, summary_text
+                summary_entry = {"type": "message", "role": "system", "call_id": None, "text": summary_text,
+                                 "is_audio": False, "tokens": self._estimate(summary_text, False)}
+                # Same position as on the server: right after plan.insert_after (or first)
+                self.items.pop(summary_item_id, None) # Its conversation.item.created may have come in first
+                reordered = OrderedDict() if plan.insert_after in self.items else OrderedDict([(summary_item_id, summary_entry)])
+                for item_id, entry in self.items.items():
+                    reordered[item_id] = entry
+                    if item_id == plan.insert_after:
+                        reordered[summary_item_id] = summary_entry
+                self.items = reordered
+            self.pruned_item_count += len(plan.item_ids)
+            self.last_conversation_tokens = max(0, self.last_conversation_tokens - plan.estimated_tokens) # Until the next response.done reports real usage
+            self.prune_in_progress = False
+
+    def abort_prune(self):
+        with self._lock:
+            self.prune_in_progress = False
@@ -0,0 +1,99 @@
+# db_writer.py
+# Small helper that moves SQLite writes off the realtime threads.
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+def _dbw_log(message, level="INFO"):
+    print(f"[{level}] [DB_WRITER] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class BackgroundDBWriter:
+    """
+    Executes write callables on a single daemon thread, in submission order.
+
+    The WebSocket receive thread and the audio pipeline should never wait on disk I/O.
+    They hand a function plus its arguments to submit() and return immediately; the
+    writer thread runs it. If the queue is full the job is dropped and False is returned,
+    which is preferable to stalling audio.
+    """
+
+    def __init__(self, name: str = "db-writer", max_queue: int = 10000):
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> bool:
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+            return True
+        except queue.Full:
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 100 == 0:
+                _dbw_log(f"'{self.name}' queue full. Dropped {self._dropped} write(s) so far.", "WARN")
+            return False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    _dbw_log(f"'{self.name}' write job {getattr(fn, '__name__', fn)} failed: {e}", "ERROR")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout_s: float = 2.0) -> bool:
+        """Wait until all queued jobs have run. Returns False if the timeout was hit."""
+        deadline = time.monotonic() + timeout_s
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout_s: float = 2.0):
+        self.flush(timeout_s)
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout_s)
+
+
+_shared_writer = None
+_shared_writer_lock = threading.Lock()
+
+
+def get_shared_writer() -> BackgroundDBWriter:
+    """Process-wide writer used by the metrics and history stores."""
+    global _shared_writer
+    with _shared_writer_lock:
+        if _shared_writer is None:
+            _shared_writer = BackgroundDBWriter(name="shared-db-writer")
+        return _shared_writer
+
+
+def close_shared_writer(timeout_s: float = 5.0):
+    """
+    Runs the queued writes and stops the shared writer. The thread is a daemon, so anything
+    still queued when the interpreter exits is lost; shutdown paths call this first.
+    A later get_shared_writer() starts a new writer.
+    """
+    global _shared_writer
+    with _shared_writer_lock:
+        writer, _shared_writer = _shared_writer, None
+    if writer is None:
+        return
+    pending = writer._queue.unfinished_tasks
+    if not writer.flush(timeout_s):
+        _dbw_log(f"'{writer.name}' did not finish {writer._queue.unfinished_tasks} of {pending} queued write(s) within {timeout_s:.0f} s.", "WARN")
+    writer.close(timeout_s)
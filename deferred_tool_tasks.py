@@ -0,0 +1,220 @@
+# deferred_tool_tasks.py
+# Bookkeeping for tools that run in the background ("deferred completion").
+# The model gets an immediate "accepted" output with a task id; the real result is
+# stored here when the handler finishes and is injected into the live session, or into
+# the next session if the connection was gone by then.
+#
+# Each task belongs to the device that started it (owner: DEVICE_NAME, NULL for the single-device
+# main.py), so on a multi-device host only that device's sessions pick it up. A session claims a
+# result before injecting it, so two sessions of one device never both speak it; the claim is
+# released when the session closes without a completed response having spoken it.
+#
+# Lives in the conversation history DB (table 'deferred_tool_tasks').
+import json
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import conversation_history_db
+
+TASK_STATUS_RUNNING = "running"
+TASK_STATUS_DONE = "done"
+TASK_STATUS_FAILED = "failed"
+CLAIM_STALE_S = 900.0 # A claim this old belongs to a session that died without releasing it
+
+
+def _dt_log(message, level="INFO"):
+    print(f"[{level}] [DEFERRED_TASKS] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def _connect():
+    # Resolved at call time so session_replay.py's scratch DB path is honoured
+    return sqlite3.connect(conversation_history_db.DB_PATH, timeout=5)
+
+
+def init_deferred_tasks_table():
+    """Creates the deferred_tool_tasks table if it doesn't exist."""
+    conn = None
+    try:
+        conn = _connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS deferred_tool_tasks (
+                task_id TEXT PRIMARY KEY,
+                session_id TEXT,
+                call_id TEXT,
+                tool_name TEXT NOT NULL,
+                arguments TEXT,
+                status TEXT NOT NULL CHECK(status IN ('running', 'done', 'failed')),
+                result TEXT,
+                created_at TIMESTAMP NOT NULL,
+                completed_at TIMESTAMP,
+                delivered_at TIMESTAMP,
+                delivered_session_id TEXT,
+                owner TEXT,
+                claimed_by TEXT,
+                claimed_at TIMESTAMP
+            );
+        """)
+        # Columns added after the initial schema. Older DB files get them via ALTER TABLE.
+        existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(deferred_tool_tasks);").fetchall()}
+        for column_name, column_type in (("owner", "TEXT"), ("claimed_by", "TEXT"), ("claimed_at", "TIMESTAMP")):
+            if column_name not in existing_columns:
+                conn.execute(f"ALTER TABLE deferred_tool_tasks ADD COLUMN {column_name} {column_type};")
+                _dt_log(f"Migrated 'deferred_tool_tasks': added column '{column_name}'.")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_deferred_undelivered ON deferred_tool_tasks (delivered_at, status);")
+        conn.commit()
+    except sqlite3.Error as e:
+        _dt_log(f"Error initializing deferred_tool_tasks table: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def new_task_id() -> str:
+    return f"task_{uuid.uuid4().hex[:12]}"
+
+
+def create_task(task_id: str, session_id: Optional[str], call_id: str, tool_name: str, arguments: dict,
+                owner: Optional[str] = None):
+    conn = None
+    try:
+        conn = _connect()
+        conn.execute("""
+            INSERT INTO deferred_tool_tasks (task_id, session_id, call_id, tool_name, arguments, status, created_at, owner)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (task_id, session_id, call_id, tool_name, json.dumps(arguments), TASK_STATUS_RUNNING, datetime.utcnow(), owner))
+        conn.commit()
+    except sqlite3.Error as e:
+        _dt_log(f"Error creating deferred task {task_id} ({tool_name}): {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def complete_task(task_id: str, result: str, failed: bool = False):
+    conn = None
+    try:
+        conn = _connect()
+        conn.execute("UPDATE deferred_tool_tasks SET status = ?, result = ?, completed_at = ? WHERE task_id = ?",
+                     (TASK_STATUS_FAILED if failed else TASK_STATUS_DONE, result, datetime.utcnow(), task_id))
+        conn.commit()
+    except sqlite3.Error as e:
+        _dt_log(f"Error completing deferred task {task_id}: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def mark_delivered(task_ids: List[str], session_id: Optional[str]):
+    if not task_ids:
+        return
+    conn = None
+    try:
+        conn = _connect()
+        now = datetime.utcnow()
+        conn.executemany("UPDATE deferred_tool_tasks SET delivered_at = ?, delivered_session_id = ? WHERE task_id = ?",
+                         [(now, session_id, task_id) for task_id in task_ids])
+        conn.commit()
+    except sqlite3.Error as e:
+        _dt_log(f"Error marking {len(task_ids)} deferred task(s) delivered: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def claim_task(task_id: str, session_id: Optional[str]) -> bool:
+    """
+    Atomically reserves an undelivered task for session_id before its result is injected. False if
+    another live session holds it (or it was delivered meanwhile); the caller must not inject it then.
+    """
+    conn = None
+    try:
+        conn = _connect()
+        now = datetime.utcnow()
+        cursor = conn.execute("""
+            UPDATE deferred_tool_tasks SET claimed_by = ?, claimed_at = ?
+            WHERE task_id = ? AND delivered_at IS NULL AND (claimed_by IS NULL OR claimed_by IS ? OR claimed_at < ?)
+        """, (session_id, now, task_id, session_id, now - timedelta(seconds=CLAIM_STALE_S)))
+        conn.commit()
+        return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        _dt_log(f"Error claiming deferred task {task_id}: {e}", "ERROR")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
+def release_claims(session_id: Optional[str]):
+    """Hands the results session_id claimed but never spoke back to the next session of their owner."""
+    if not session_id:
+        return
+    conn = None
+    try:
+        conn = _connect()
+        conn.execute("UPDATE deferred_tool_tasks SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ? AND delivered_at IS NULL",
+                     (session_id,))
+        conn.commit()
+    except sqlite3.Error as e:
+        _dt_log(f"Error releasing deferred task claims of session {session_id}: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_undelivered_results(owner: Optional[str] = None, limit: int = 10) -> List[Dict]:
+    """Finished (done or failed) tasks of owner whose result has not reached any session yet and no live session holds, oldest first."""
+    conn = None
+    try:
+        conn = _connect()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("""
+            SELECT task_id, session_id, call_id, tool_name, arguments, status, result, created_at, completed_at
+            FROM deferred_tool_tasks
+            WHERE delivered_at IS NULL AND status != 'running' AND owner IS ? AND (claimed_by IS NULL OR claimed_at < ?)
+            ORDER BY completed_at ASC
+            LIMIT ?
+        """, (owner, datetime.utcnow() - timedelta(seconds=CLAIM_STALE_S), limit)).fetchall()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        _dt_log(f"Error reading undelivered deferred tasks: {e}", "ERROR")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_tasks(limit: int = 20) -> List[Dict]:
+    conn = None
+    try:
+        conn = _connect()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM deferred_tool_tasks ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        _dt_log(f"Error reading deferred tasks: {e}", "ERROR")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+
+def format_result_for_session(task: Dict) -> str:
+    """Text of the system item that carries a finished task's result into the conversation."""
+    outcome = "finished" if task["status"] == TASK_STATUS_DONE else "failed"
+    return (f"[Background task {task['task_id']} {outcome}] Tool '{task['tool_name']}' result: {task['result']}\n"
+            f"Briefly let the user know about this result when appropriate.")
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="List deferred (background) tool tasks.")
+    arg_parser.add_argument("--limit", type=int, default=20)
+    cli_args = arg_parser.parse_args()
+    init_deferred_tasks_table()
+    for task in get_tasks(cli_args.limit):
+        delivered = task["delivered_at"] or "not delivered"
+        print(f"{task['task_id']}  {task['tool_name']:<40} {task['status']:<8} {task['owner'] or '-':<12} created {task['created_at']}  delivered: {delivered}")
+        if task["result"]:
+            print(f"    {task['result'][:150]}")
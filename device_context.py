@@ -0,0 +1,451 @@
+# device_context.py
+# Multi-device host: many rooms (mic + speaker + realtime session) served by one process.
+#
+# main.py runs exactly one device on module globals. Here everything that belongs to one
+# device lives on a DeviceContext: the LISTENING / SENDING state machine, the audio source
+# and player, the wake-word detector, the OpenAISpeechClient and the audio pipeline thread.
+# What does not need to be per device is created once in SharedResources and handed to
+# every device: the loaded wake-word ONNX sessions, one requests.Session, one synchronous
+# OpenAI client, the filler clip cache, the tool pool and the background DB writer.
+#
+# Run:  python device_context.py --devices devices.json [--replicate 20] [--report-s 10]
+# The periodic report shows CPU per device (thread CPU clocks of its pipeline and websocket
+# threads) and memory (process RSS, and the RSS growth measured while each device started).
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from app_config import APP_CONFIG, OPENAI_API_KEY, OPENAI_REALTIME_MODEL_ID
+from db_writer import close_shared_writer, get_shared_writer
+from openai_client import OpenAISpeechClient
+from wake_word_detector import WakeWordDetector, parse_keyword_spec, ACTION_WAKE, COMMAND_ACTIONS
+from app_state_machine import AppState, AppStateMachine
+from local_vad import (LocalEndpointer, UplinkGate, create_barge_in, pcm16_to_vad_rate, EVENT_SPEECH_STARTED, EVENT_SPEECH_STOPPED,
+                       BARGE_IN_ACTIVATION_MS)
+
+CHUNK_MS = 30
+INPUT_RATE = 24000
+OUTPUT_RATE = 24000
+WAKE_WORD_PROCESS_RATE = 16000
+FRAME_BYTES = int(INPUT_RATE * CHUNK_MS / 1000) * 2
+STATE_LISTENING_FOR_WAKEWORD = AppState.LISTENING_FOR_WAKEWORD
+STATE_SENDING_TO_OPENAI = AppState.SENDING_TO_OPENAI
+
+
+def _dev_log(message, level="INFO"):
+    print(f"[{level}] [DEVICE_HOST] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process (Linux /proc), or None where unavailable."""
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def thread_cpu_s(thread: Optional[threading.Thread]) -> float:
+    """CPU seconds used so far by one thread (POSIX per-thread clock); 0 if it can't be read."""
+    if thread is None or thread.ident is None or not hasattr(time, "pthread_getcpuclockid"):
+        return 0.0
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (OSError, ProcessLookupError):
+        return 0.0
+
+
+# --- Audio sources (one 30 ms, 24 kHz mono PCM16 frame per read_frame call) ---
+class WavFileSource:
+    """Plays a WAV file into the device as if it were the mic, paced in real time. Loops by default."""
+
+    def __init__(self, path: str, loop: bool = True, realtime: bool = True):
+        with wave.open(path, "rb") as wav_file:
+            channels, rate = wav_file.getnchannels(), wav_file.getframerate()
+            if wav_file.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit WAV is supported")
+            samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        if rate != INPUT_RATE:
+            target_len = int(len(samples) * INPUT_RATE / rate)
+            samples = np.interp(np.linspace(0, len(samples) - 1, target_len), np.arange(len(samples)), samples.astype(np.float32)).astype(np.int16)
+        self.pcm = samples.tobytes()
+        self.loop = loop
+        self.realtime = realtime
+        self._pos = 0
+        self._next_due = None
+
+    def read_frame(self) -> Optional[bytes]:
+        if self._pos + FRAME_BYTES > len(self.pcm):
+            if not self.loop or len(self.pcm) < FRAME_BYTES:
+                return None
+            self._pos = 0
+        frame = self.pcm[self._pos:self._pos + FRAME_BYTES]
+        self._pos += FRAME_BYTES
+        if self.realtime:
+            now = time.perf_counter()
+            self._next_due = (self._next_due or now) + CHUNK_MS / 1000.0
+            if self._next_due > now:
+                time.sleep(self._next_due - now)
+            else:
+                self._next_due = now # Fell behind (host overloaded): don't try to catch up in a burst
+        return frame
+
+    def close(self):
+        pass
+
+
+class SilenceSource(WavFileSource):
+    """Endless silence at real-time pace; a device that is up but nobody talks to."""
+
+    def __init__(self):
+        self.pcm = b"\x00" * FRAME_BYTES
+        self.loop, self.realtime, self._pos, self._next_due = True, True, 0, None
+
+
+class PyAudioSource:
+    """A real microphone (PyAudio input device)."""
+
+    def __init__(self, pyaudio_instance, input_device_index: Optional[int] = None):
+        import pyaudio
+        self.stream = pyaudio_instance.open(format=pyaudio.paInt16, channels=1, rate=INPUT_RATE, input=True,
+                                            frames_per_buffer=FRAME_BYTES // 2, input_device_index=input_device_index)
+
+    def read_frame(self) -> Optional[bytes]:
+        try:
+            frame = self.stream.read(FRAME_BYTES // 2, exception_on_overflow=False)
+        except IOError:
+            return None
+        return frame if len(frame) == FRAME_BYTES else b""
+
+    def close(self):
+        try:
+            self.stream.close()
+        except Exception:
+            pass
+
+
+class SharedResources:
+    """Everything the devices of one host share. Created once, closed after all devices stopped."""
+
+    def __init__(self, config: dict, log_fn=None):
+        self.config = config
+        self.log = log_fn or _dev_log
+        self.tool_pool = ThreadPoolExecutor(max_workers=int(config.get("HOST_TOOL_POOL_WORKERS", 16)), thread_name_prefix="tool")
+        self.deferred_pool = ThreadPoolExecutor(max_workers=int(config.get("HOST_DEFERRED_POOL_WORKERS", 16)), thread_name_prefix="deferred")
+        self.http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(config.get("HOST_HTTP_POOL_SIZE", 32)))
+        self.http_session.mount("http://", adapter)
+        self.http_session.mount("https://", adapter)
+        self.db_writer = get_shared_writer() # Process-wide; close() flushes and stops it once all devices stopped
+        self.sync_openai_client = None
+        if config.get("OPENAI_API_KEY"):
+            import openai
+            self.sync_openai_client = openai.OpenAI(api_key=config["OPENAI_API_KEY"])
+        self.filler_cache = None
+        if config.get("FILLER_AUDIO_ENABLED", True):
+            from filler_audio import FillerAudioCache
+            self.filler_cache = FillerAudioCache(voice=config.get("OPENAI_VOICE", "ash"), output_rate_hz=OUTPUT_RATE, log_fn=self.log)
+            threading.Thread(target=self.filler_cache.warm, args=(self.sync_openai_client,), name="filler-warm", daemon=True).start()
+        self._pyaudio = None
+        self._wake_word_templates: Dict[tuple, object] = {} # (model name, keywords, framework) -> loaded openWakeWord Model
+        self._lock = threading.Lock()
+
+    def pyaudio(self):
+        with self._lock:
+            if self._pyaudio is None:
+                import pyaudio
+                self._pyaudio = pyaudio.PyAudio()
+            return self._pyaudio
+
+    def wake_word_detector(self, model_name: Optional[str], threshold: Optional[float], keyword_spec: Optional[str] = None):
+        """
+        A detector for one device. The first device with a given ONNX model and keyword set loads it;
+        later ones get a clone that shares its inference sessions. keyword_spec is the device's
+        WAKE_WORD_KEYWORDS (None: the environment's). Returns None if wake word is unavailable.
+        """
+        framework = os.environ.get("WAKE_WORD_MODEL_TYPE", "onnx").lower()
+        model_name = model_name or os.environ.get("WAKE_WORD_MODEL", "hey_jarvis")
+        threshold = float(threshold if threshold is not None else os.environ.get("WAKE_WORD_THRESHOLD", "0.5"))
+        if keyword_spec is None:
+            keyword_spec = os.environ.get("WAKE_WORD_KEYWORDS", "")
+        keywords = parse_keyword_spec(keyword_spec, threshold) or {model_name: {"threshold": threshold, "action": ACTION_WAKE}}
+        key = (model_name, tuple(keywords), framework) # Thresholds and actions are per detector; the loaded models depend on the names only
+        with self._lock:
+            template = self._wake_word_templates.get(key) if framework == "onnx" else None
+            detector = WakeWordDetector(wake_word_model=model_name, threshold=threshold, sample_rate=WAKE_WORD_PROCESS_RATE,
+                                        shared_model=template, keywords=keywords)
+            if template is None:
+                if not detector.load(): # From the local model store, see wake_word_model_store.py
+                    return None
+                if framework == "onnx":
+                    self._wake_word_templates[key] = detector.model
+        return detector
+
+    def close(self):
+        self.tool_pool.shutdown(wait=False)
+        self.deferred_pool.shutdown(wait=False)
+        self.http_session.close()
+        close_shared_writer() # Latency spans, usage rows and deferred tool tasks still queued
+        if self._pyaudio:
+            self._pyaudio.terminate()
+
+
+class DeviceContext:
+    """
+    One device: state machine, audio source, player, wake-word detector, realtime client and
+    pipeline thread. The client talks to the device only through the callbacks it gets at
+    construction (set_app_state / get_app_state) and the player, as with main.py.
+    """
+
+    def __init__(self, name: str, shared: SharedResources, source, player, config: dict, log_fn=None):
+        self.name = name
+        self.shared = shared
+        self.source = source
+        self.player = player
+        self.config = config
+        self._host_log = log_fn or _dev_log
+        self.detector = shared.wake_word_detector(config.get("WAKE_WORD_MODEL"), config.get("WAKE_WORD_THRESHOLD"), config.get("WAKE_WORD_KEYWORDS"))
+        self.wake_word_active = self.detector is not None
+        self.app_state = AppStateMachine(STATE_LISTENING_FOR_WAKEWORD if self.wake_word_active else STATE_SENDING_TO_OPENAI,
+                                         name=name, log_fn=self._host_log)
+        ws_url = config.get("OPENAI_REALTIME_WS_URL") or f"wss://api.openai.com/v1/realtime?model={config.get('OPENAI_REALTIME_MODEL_ID')}"
+        headers = ["Authorization: Bearer " + (config.get("OPENAI_API_KEY") or ""), "OpenAI-Beta: realtime=v1"]
+        self.client = OpenAISpeechClient(
+            ws_url_param=ws_url, headers_param=headers, main_log_fn=self.log,
+            pcm_player=player, app_state_setter=self.set_app_state, app_state_getter=self.get_app_state,
+            input_rate_hz=INPUT_RATE, output_rate_hz=OUTPUT_RATE, is_ww_active=self.wake_word_active,
+            ww_detector_instance_ref=self.detector, app_config_dict={**config, "CHUNK_MS": CHUNK_MS, "USE_ULAW_FOR_OPENAI_INPUT": False, "DEVICE_NAME": name},
+            tool_pool=shared.tool_pool, deferred_pool=shared.deferred_pool, http_session=shared.http_session,
+            sync_openai_client=shared.sync_openai_client, filler_cache=shared.filler_cache)
+        self.app_state.subscribe(self._on_state_change)
+        self.command_keywords_active = self.wake_word_active and any(self.detector.has_action(action) for action in COMMAND_ACTIONS)
+        for command_action in (COMMAND_ACTIONS if self.command_keywords_active else ()):
+            self.detector.add_callback(command_action, lambda keyword, score, action=command_action: self.client.on_keyword_command(keyword, action))
+        self.client_thread: Optional[threading.Thread] = None
+        self.pipeline_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.frames_in = 0
+        self.wake_words = 0
+        self.rss_delta_mb: Optional[float] = None # Process RSS growth while this device was created and started
+        self._cpu_mark = (0.0, time.perf_counter())
+
+    def log(self, msg, level=logging.INFO, **kwargs):
+        level_name = level if isinstance(level, str) else logging.getLevelName(level)
+        self._host_log(f"[{self.name}] {msg}", level_name)
+
+    # --- State machine (app_state_machine.AppStateMachine, as in main.py) ---
+    def set_app_state(self, new_state, reason=""):
+        return self.app_state.transition(new_state, reason)
+
+    def get_app_state(self):
+        return self.app_state.state
+
+    def _on_state_change(self, old_state, new_state):
+        if new_state == STATE_LISTENING_FOR_WAKEWORD:
+            self.client._clear_audio_state()
+
+    # --- Lifecycle ---
+    def start(self):
+        self.client_thread = threading.Thread(target=self.client.run_client, name=f"{self.name}-ws", daemon=True)
+        self.client_thread.start()
+        self.pipeline_thread = threading.Thread(target=self._run_pipeline, name=f"{self.name}-audio", daemon=True)
+        self.pipeline_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.client.close_connection()
+        for thread in (self.pipeline_thread, self.client_thread):
+            if thread and thread.is_alive():
+                thread.join(timeout=3)
+        self.source.close()
+        if hasattr(self.player, "close"):
+            self.player.close()
+
+    def cpu_s(self) -> float:
+        return thread_cpu_s(self.pipeline_thread) + thread_cpu_s(self.client_thread)
+
+    def stats(self) -> dict:
+        cpu_now, now = self.cpu_s(), time.perf_counter()
+        cpu_before, wall_before = self._cpu_mark
+        self._cpu_mark = (cpu_now, now)
+        return {"name": self.name, "state": self.get_app_state(), "connected": self.client.connected,
+                "cpu_pct": 100.0 * (cpu_now - cpu_before) / max(1e-6, now - wall_before), "cpu_s": cpu_now,
+                "frames_in": self.frames_in, "wake_words": self.wake_words, "rss_delta_mb": self.rss_delta_mb}
+
+    # --- Audio pipeline (per device version of main.continuous_audio_pipeline) ---
+    def _run_pipeline(self):
+        client = self.client
+        endpointer = LocalEndpointer(frame_ms=CHUNK_MS, input_rate=INPUT_RATE, vad_mode=self.config.get("CLIENT_VAD_MODE", 2),
+                                     min_speech_ms=self.config.get("CLIENT_VAD_MIN_SPEECH_MS", 150),
+                                     hangover_ms=self.config.get("CLIENT_VAD_HANGOVER_MS", 500), log_fn=self.log)
+        uplink_gate = UplinkGate(frame_ms=CHUNK_MS, lead_ms=self.config.get("UPLINK_LEAD_MS", 300), trail_ms=self.config.get("UPLINK_TRAIL_MS", 700),
+                                 enabled=self.config.get("UPLINK_GATING_ENABLED", True) and endpointer.available)
+        client.uplink_gate = uplink_gate
+        barge_in_vad, barge_in = create_barge_in(self.config, frame_ms=CHUNK_MS, input_rate=INPUT_RATE, log_fn=self.log) # Same as main.py
+        barge_in_activation_ms = self.config.get("BARGE_IN_ACTIVATION_MS", BARGE_IN_ACTIVATION_MS)
+        response_created_for_entry = self.app_state.entry_count(STATE_SENDING_TO_OPENAI) # response.create once per wake word
+        while not self._stop.is_set():
+            if not client.connected:
+                if not client.keep_outer_loop_running:
+                    break
+                time.sleep(0.2)
+                continue
+            frame = self.source.read_frame()
+            if frame is None:
+                self.log("Audio source ended. Stopping pipeline.")
+                break
+            if not frame:
+                continue
+            self.frames_in += 1
+            state = self.get_app_state()
+
+            if state == STATE_SENDING_TO_OPENAI and self.command_keywords_active:
+                self.detector.process_keywords(pcm16_to_vad_rate(frame, INPUT_RATE), actions=COMMAND_ACTIONS) # Callbacks route to the client
+            if state == STATE_LISTENING_FOR_WAKEWORD and self.detector:
+                if self.detector.process_audio(pcm16_to_vad_rate(frame, INPUT_RATE)): # Same 24 -> 16 kHz resample the VAD uses
+                    self.wake_words += 1
+                    self.log(f"Wake word '{self.detector.last_detected_keyword}' detected.")
+                    self.set_app_state(STATE_SENDING_TO_OPENAI, f"wake word '{self.detector.last_detected_keyword}'")
+                    self.detector.reset()
+                uplink_gate.reset()
+                endpointer.reset()
+                continue
+            if state != STATE_SENDING_TO_OPENAI:
+                continue
+
+            voiced = endpointer.is_speech(frame) if endpointer.available else False
+            assistant_speaking = client.is_assistant_speaking()
+            barge_in_armed = (barge_in_vad.available and assistant_speaking
+                              and client.get_current_assistant_speech_duration_ms() > barge_in_activation_ms)
+            barge_in_voiced = barge_in_armed and not barge_in.cooling_down and barge_in_vad.is_speech(frame)
+            if barge_in.update(barge_in_voiced, barge_in_armed):
+                client.handle_local_user_speech_interrupt()
+
+            try:
+                for frame_to_send in uplink_gate.process(frame, voiced or endpointer.in_speech):
+                    client.send_event({"type": "input_audio_buffer.append", "audio": base64.b64encode(frame_to_send).decode("utf-8")})
+                sending_entry = self.app_state.entry_count(STATE_SENDING_TO_OPENAI)
+                if sending_entry != response_created_for_entry:
+                    response_created_for_entry = sending_entry
+                    client.send_event(client._response_create_payload())
+            except Exception as e_send:
+                self.log(f"Failed to send audio: {e_send}", "WARN")
+
+            if endpointer.available and not assistant_speaking:
+                event = endpointer.update(voiced)
+                if event == EVENT_SPEECH_STARTED: client.on_local_speech_started()
+                elif event == EVENT_SPEECH_STOPPED: client.on_local_speech_stopped(endpointer.last_speech_end_perf)
+            else:
+                endpointer.reset()
+
+
+# --- Host ---
+def build_source(spec: dict, shared: SharedResources):
+    source_type = (spec or {}).get("type", "silence")
+    if source_type == "wav":
+        return WavFileSource(spec["path"], loop=spec.get("loop", True), realtime=spec.get("realtime", True))
+    if source_type == "pyaudio":
+        return PyAudioSource(shared.pyaudio(), spec.get("input_device_index"))
+    return SilenceSource()
+
+
+def build_player(spec: dict, shared: SharedResources, log_fn):
+    if (spec or {}).get("type") == "pyaudio":
+        from pcm_player import PCMPlayer
+        return PCMPlayer(shared.pyaudio(), rate=OUTPUT_RATE, chunk_samples_player=int(OUTPUT_RATE * CHUNK_MS / 1000),
+                         output_device_index=spec.get("output_device_index"), log_fn=log_fn)
+    from session_replay import NullPlayer
+    return NullPlayer()
+
+
+def load_device_specs(path: str, replicate: Optional[int] = None):
+    """
+    devices.json: {"defaults": {config overrides}, "devices": [{"name", "source": {...}, "player": {...}, "config": {...}}]}
+    source: {"type": "wav", "path": ..., "loop": true} | {"type": "pyaudio", "input_device_index": 1} | {"type": "silence"}
+    player: {"type": "pyaudio", "output_device_index": 2} | {"type": "null"}
+    replicate=N repeats the device list until there are N devices (load tests).
+    Returns (defaults, devices); defaults also configure the shared resources.
+    """
+    with open(path) as devices_file:
+        spec = json.load(devices_file)
+    defaults = spec.get("defaults", {})
+    devices = [{**device, "config": {**defaults, **device.get("config", {})}} for device in spec.get("devices", [])]
+    if replicate and devices:
+        devices = [{**devices[i % len(devices)], "name": f"{devices[i % len(devices)].get('name', 'device')}-{i + 1}"} for i in range(replicate)]
+    return defaults, devices
+
+
+def print_host_report(devices: List[DeviceContext], log_fn=_dev_log):
+    rss = current_rss_mb()
+    rows = [device.stats() for device in devices]
+    lines = [f"{len(devices)} device(s), process RSS {rss:.0f} MB ({rss / max(1, len(devices)):.1f} MB per device)" if rss else f"{len(devices)} device(s)",
+             f"  {'device':<24} {'state':<24} {'conn':>5} {'cpu %':>7} {'cpu s':>8} {'frames':>8} {'wake':>5} {'+RSS MB':>8}"]
+    for row in rows:
+        rss_delta = f"{row['rss_delta_mb']:.1f}" if row["rss_delta_mb"] is not None else "-"
+        lines.append(f"  {row['name'][:24]:<24} {row['state']:<24} {'yes' if row['connected'] else 'no':>5} {row['cpu_pct']:>7.1f} "
+                     f"{row['cpu_s']:>8.1f} {row['frames_in']:>8} {row['wake_words']:>5} {rss_delta:>8}")
+    if rows:
+        lines.append(f"  mean cpu per device: {sum(r['cpu_pct'] for r in rows) / len(rows):.1f}% of one core "
+                     f"(shared tool pool / DB writer threads not attributed)")
+    log_fn("\n".join(lines))
+
+
+def run_host(devices_path: str, replicate: Optional[int] = None, report_s: float = 10.0, stagger_ms: int = 200):
+    if not OPENAI_API_KEY or not OPENAI_REALTIME_MODEL_ID:
+        _dev_log("OPENAI_API_KEY / OPENAI_REALTIME_MODEL_ID missing (any placeholder works against mock_realtime_server.py).", "WARN")
+    import conversation_history_db
+    conversation_history_db.init_db()
+    defaults, specs = load_device_specs(devices_path, replicate)
+    shared = SharedResources({**APP_CONFIG, **defaults})
+    devices: List[DeviceContext] = []
+    try:
+        for spec in specs:
+            rss_before = current_rss_mb()
+            config = {**APP_CONFIG, "OPENAI_REALTIME_MODEL_ID": OPENAI_REALTIME_MODEL_ID, **spec["config"]}
+            name = spec.get("name", f"device-{len(devices) + 1}")
+            player = build_player(spec.get("player"), shared, lambda m, level="INFO", name=name: _dev_log(f"[{name}] {m}", level))
+            device = DeviceContext(name, shared, build_source(spec.get("source"), shared), player, config)
+            device.start()
+            rss_after = current_rss_mb()
+            device.rss_delta_mb = (rss_after - rss_before) if rss_before is not None and rss_after is not None else None
+            devices.append(device)
+            _dev_log(f"Started {device.name} (wake word: {'on' if device.wake_word_active else 'off'}).")
+            time.sleep(stagger_ms / 1000.0)
+        while any(device.pipeline_thread.is_alive() for device in devices):
+            time.sleep(report_s)
+            print_host_report(devices)
+    except KeyboardInterrupt:
+        _dev_log("Ctrl+C. Stopping devices...")
+    finally:
+        if devices:
+            print_host_report(devices)
+        for device in devices:
+            device.stop()
+        shared.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Run many assistant devices in one process and report CPU / memory per device.")
+    arg_parser.add_argument("--devices", default="devices.json", help="Device list (see load_device_specs).")
+    arg_parser.add_argument("--replicate", type=int, default=None, help="Repeat the device list up to N devices.")
+    arg_parser.add_argument("--report-s", type=float, default=10.0, help="Seconds between host reports.")
+    arg_parser.add_argument("--stagger-ms", type=int, default=200, help="Delay between device starts.")
+    cli_args = arg_parser.parse_args()
+    run_host(cli_args.devices, cli_args.replicate, cli_args.report_s, cli_args.stagger_ms)
@@ -0,0 +1,122 @@
+# filler_audio.py
+# Short spoken filler phrases ("Let me check that for you.") played locally while a slow
+# tool runs, so the user doesn't sit in silence. Clips are rendered once with OpenAI TTS
+# (raw 24 kHz mono PCM16) and cached under static/fillers; later runs load them from disk
+# and make no API calls.
+import hashlib
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from tools_definition import TOOL_LATENCY_MEDIUM, TOOL_LATENCY_SLOW
+
+FILLER_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "fillers")
+TTS_PCM_RATE_HZ = 24000 # OpenAI TTS response_format="pcm" is 24 kHz, 16-bit, mono
+
+# Latency class -> phrases. Kept short and neutral so they fit before any answer.
+FILLER_PHRASES = {
+    TOOL_LATENCY_MEDIUM: [
+        "One moment.",
+        "Sure, just a second.",
+    ],
+    TOOL_LATENCY_SLOW: [
+        "Let me check that for you.",
+        "Give me a moment, I'm looking that up.",
+        "Okay, pulling that up now.",
+    ],
+}
+
+
+def _filler_log(message, level="INFO"):
+    print(f"[{level}] [FILLER_AUDIO] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def _clip_file_name(voice: str, text: str) -> str:
+    return f"{voice}_{hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]}.pcm"
+
+
+def _resample_pcm16(pcm_bytes: bytes, from_rate: int, to_rate: int) -> bytes:
+    if from_rate == to_rate or not pcm_bytes:
+        return pcm_bytes
+    samples = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32)
+    target_len = int(len(samples) * to_rate / from_rate)
+    resampled = np.interp(np.linspace(0, len(samples) - 1, target_len), np.arange(len(samples)), samples)
+    return resampled.astype(np.int16).tobytes()
+
+
+class FillerAudioCache:
+    """
+    Loads (and if needed renders) filler clips per latency class.
+    warm() does the disk/TTS work and is meant to run on a background thread at startup;
+    get_clip() is cheap and never touches the network.
+    """
+
+    def __init__(self, voice: str = "ash", output_rate_hz: int = TTS_PCM_RATE_HZ,
+                 cache_dir: str = FILLER_CACHE_DIR, log_fn=None):
+        self.voice = voice
+        self.output_rate_hz = output_rate_hz
+        self.cache_dir = cache_dir
+        self.log = log_fn or _filler_log
+        self._clips: Dict[str, List[bytes]] = {}
+        self._next_index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def warm(self, sync_openai_client=None):
+        """Loads every cached clip; renders missing ones with TTS if a client is given."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        loaded, rendered, missing = 0, 0, 0
+        for latency_class, phrases in FILLER_PHRASES.items():
+            clips = []
+            for text in phrases:
+                clip_path = os.path.join(self.cache_dir, _clip_file_name(self.voice, text))
+                pcm_bytes = None
+                if os.path.exists(clip_path):
+                    with open(clip_path, "rb") as clip_file:
+                        pcm_bytes = clip_file.read()
+                    loaded += 1
+                elif sync_openai_client is not None:
+                    pcm_bytes = self._render(sync_openai_client, text, clip_path)
+                    rendered += 1 if pcm_bytes else 0
+                if pcm_bytes:
+                    clips.append(_resample_pcm16(pcm_bytes, TTS_PCM_RATE_HZ, self.output_rate_hz))
+                else:
+                    missing += 1
+            with self._lock:
+                self._clips[latency_class] = clips
+                self._next_index.setdefault(latency_class, 0)
+        self.log(f"Filler clips ready (voice '{self.voice}'): {loaded} from cache, {rendered} rendered, {missing} unavailable.")
+
+    def _render(self, sync_openai_client, text: str, clip_path: str) -> Optional[bytes]:
+        try:
+            response = sync_openai_client.audio.speech.create(model="tts-1", voice=self.voice, input=text, response_format="pcm")
+            pcm_bytes = response.content
+            with open(clip_path, "wb") as clip_file:
+                clip_file.write(pcm_bytes)
+            return pcm_bytes
+        except Exception as e:
+            self.log(f"Could not render filler '{text}': {e}", "WARN")
+            return None
+
+    def get_clip(self, latency_class: str) -> Optional[bytes]:
+        """Next clip for the class (round robin), or None if none are loaded."""
+        with self._lock:
+            clips = self._clips.get(latency_class) or self._clips.get(TOOL_LATENCY_SLOW)
+            if not clips:
+                return None
+            index = self._next_index.get(latency_class, 0)
+            self._next_index[latency_class] = index + 1
+            return clips[index % len(clips)]
+
+
+if __name__ == "__main__":
+    import argparse
+    import openai
+    from dotenv import load_dotenv
+    load_dotenv()
+    arg_parser = argparse.ArgumentParser(description="Pre-render the filler phrase clips into static/fillers.")
+    arg_parser.add_argument("--voice", default=os.getenv("OPENAI_VOICE", "ash"))
+    cli_args = arg_parser.parse_args()
+    FillerAudioCache(voice=cli_args.voice).warm(openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
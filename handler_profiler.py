@@ -0,0 +1,180 @@
+# handler_profiler.py
+# Per-event-type timing for the realtime receive thread, plus a stall watchdog.
+#
+# Every server event is handled on the websocket-client thread, so one slow branch of
+# on_message (a SQLite write, a thread spawn, TSM on a big chunk, a sleep) holds back every
+# audio delta behind it. HandlerProfiler keeps a latency histogram per event type and a
+# watchdog thread that, when a handler runs past the stall threshold, captures the receive
+# thread's stack with sys._current_frames() while it is still stuck.
+#
+# dump() logs the slowest handlers and recent stalls. main.py calls it at shutdown and on
+# SIGUSR1; `python handler_profiler.py <pid>` sends that signal to a running assistant.
+import heapq
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Upper bucket edges in ms; the last bucket is open-ended
+HISTOGRAM_EDGES_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+def _hp_log(message, level="INFO"):
+    print(f"[{level}] [HANDLER_PROF] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class _EventTypeStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for index, edge in enumerate(HISTOGRAM_EDGES_MS):
+            if elapsed_ms <= edge:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile_ms(self, pct: float) -> float:
+        """Upper edge of the bucket holding the pct-th sample (max_ms for the open bucket)."""
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(HISTOGRAM_EDGES_MS[index], self.max_ms) if index < len(HISTOGRAM_EDGES_MS) else self.max_ms
+        return self.max_ms
+
+
+class HandlerProfiler:
+    """
+    Usage on the receive thread:  with profiler.profile(msg_type): handle(msg)
+
+    One handler is in flight at a time (websocket-client delivers messages serially); the
+    watchdog polls it every check_interval_ms and reports each stalled invocation once.
+    """
+
+    def __init__(self, stall_threshold_ms: float = 100.0, check_interval_ms: float = 20.0, top_n: int = 10,
+                 max_stalls_kept: int = 20, log_fn=None):
+        self.stall_threshold_ms = stall_threshold_ms
+        self.check_interval_s = check_interval_ms / 1000.0
+        self.top_n = top_n
+        self.log = log_fn or _hp_log
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _EventTypeStats] = {}
+        self._slowest: List = [] # min-heap of (elapsed_ms, seq, event_type, wall time)
+        self._seq = 0
+        self.stalls = deque(maxlen=max_stalls_kept)
+        self._current = None # (event_type, started_perf, thread_id, seq) of the handler in flight
+        self._flagged_seq = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    # --- Timing ---
+    @contextmanager
+    def profile(self, event_type: Optional[str]):
+        event_type = event_type or "unknown"
+        started = time.perf_counter()
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._current = (event_type, started, threading.get_ident(), seq)
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            with self._lock:
+                self._current = None
+                stats = self._stats.get(event_type)
+                if stats is None:
+                    stats = self._stats[event_type] = _EventTypeStats()
+                stats.add(elapsed_ms)
+                entry = (elapsed_ms, seq, event_type, datetime.now().strftime('%H:%M:%S'))
+                if len(self._slowest) < self.top_n:
+                    heapq.heappush(self._slowest, entry)
+                elif elapsed_ms > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+                flagged = self._flagged_seq == seq
+            if flagged:
+                self.log(f"Stalled '{event_type}' handler finished after {elapsed_ms:.0f} ms.", "WARN")
+
+    # --- Watchdog ---
+    def start_watchdog(self):
+        if self._watchdog and self._watchdog.is_alive():
+            return
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watchdog_loop, name="handler-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop_watchdog(self):
+        self._stop.set()
+
+    def _watchdog_loop(self):
+        while not self._stop.wait(self.check_interval_s):
+            with self._lock:
+                current = self._current
+                if current is None or self._flagged_seq == current[3]:
+                    continue
+                running_ms = (time.perf_counter() - current[1]) * 1000.0
+                if running_ms < self.stall_threshold_ms:
+                    continue
+                self._flagged_seq = current[3]
+            event_type, _, thread_id, _ = current
+            frame = sys._current_frames().get(thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(thread gone)\n"
+            self.stalls.append({"event_type": event_type, "running_ms": running_ms, "at": datetime.now().strftime('%H:%M:%S'), "stack": stack})
+            self.log(f"Receive thread stalled: '{event_type}' handler running for {running_ms:.0f} ms "
+                     f"(threshold {self.stall_threshold_ms:.0f} ms). Stack:\n{stack}", "WARN")
+
+    # --- Reporting ---
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {event_type: {"count": s.count, "total_ms": s.total_ms, "mean_ms": s.total_ms / s.count if s.count else 0.0,
+                                 "p50_ms": s.percentile_ms(50), "p95_ms": s.percentile_ms(95), "p99_ms": s.percentile_ms(99),
+                                 "max_ms": s.max_ms, "buckets": list(s.buckets)}
+                    for event_type, s in self._stats.items()}
+
+    def format_report(self) -> str:
+        snapshot = self.snapshot()
+        with self._lock:
+            slowest = sorted(self._slowest, reverse=True)
+        lines = ["Handler timings by event type (sorted by total time):",
+                 f"  {'event type':<52} {'count':>7} {'total ms':>10} {'mean':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>8}"]
+        for event_type, s in sorted(snapshot.items(), key=lambda kv: -kv[1]["total_ms"]):
+            lines.append(f"  {event_type:<52} {s['count']:>7} {s['total_ms']:>10.1f} {s['mean_ms']:>7.2f} "
+                         f"{s['p50_ms']:>7.1f} {s['p95_ms']:>7.1f} {s['p99_ms']:>7.1f} {s['max_ms']:>8.1f}")
+        lines.append(f"Slowest {len(slowest)} handler invocations:")
+        for elapsed_ms, _, event_type, at in slowest:
+            lines.append(f"  {at}  {elapsed_ms:>8.1f} ms  {event_type}")
+        lines.append(f"Stalls over {self.stall_threshold_ms:.0f} ms: {len(self.stalls)} kept")
+        for stall in list(self.stalls)[-3:]:
+            innermost = stall["stack"].strip().splitlines()[-2:] # File/line + source of the frame it was stuck in
+            lines.append(f"  {stall['at']}  {stall['event_type']} ({stall['running_ms']:.0f} ms) at: {' | '.join(l.strip() for l in innermost)}")
+        return "\n".join(lines)
+
+    def dump(self, reason: str = "on demand"):
+        self.log(f"Handler profile ({reason}):\n{self.format_report()}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+    arg_parser = argparse.ArgumentParser(description="Ask a running assistant (main.py) to log its handler profile (sends SIGUSR1).")
+    arg_parser.add_argument("pid", type=int)
+    cli_args = arg_parser.parse_args()
+    if not hasattr(signal, "SIGUSR1"):
+        sys.exit("SIGUSR1 is not available on this platform; the profile is dumped at shutdown instead.")
+    os.kill(cli_args.pid, signal.SIGUSR1)
+    print(f"Sent SIGUSR1 to {cli_args.pid}; the profile appears in that process's log.")
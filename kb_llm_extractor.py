@@ -1,6 +1,6 @@
 # kb_llm_extractor.py
 import os
-import openai
+import threading
 from datetime import datetime
 
 # --- Configuration ---
@@ -19,15 +19,26 @@ def _log_extractor(message):
 
 # --- OpenAI Client Initialization ---
 # This client is specifically for the KB extraction task.
-# It uses the OPENAI_API_KEY from the environment.
-try:
-    # Ensure your .env file has OPENAI_API_KEY set.
-    # For openai library v1.0.0+
-    _extractor_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    _log_extractor(f"OpenAI client initialized for KB extraction using model: {KB_EXTRACTION_MODEL}.")
-except Exception as e:
-    _log_extractor(f"CRITICAL_ERROR: Failed to initialize OpenAI client for KB extraction: {e}")
-    _extractor_client = None
+# It uses the OPENAI_API_KEY from the environment. Built on the first KB lookup rather than at
+# import, so importing the tool modules doesn't cost the openai SDK import at startup.
+_extractor_client = None
+_extractor_client_failed = False
+_extractor_client_lock = threading.Lock()
+
+def _get_extractor_client():
+    global _extractor_client, _extractor_client_failed
+    with _extractor_client_lock:
+        if _extractor_client is None and not _extractor_client_failed:
+            try:
+                # Ensure your .env file has OPENAI_API_KEY set.
+                # For openai library v1.0.0+
+                import openai
+                _extractor_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                _log_extractor(f"OpenAI client initialized for KB extraction using model: {KB_EXTRACTION_MODEL}.")
+            except Exception as e:
+                _log_extractor(f"CRITICAL_ERROR: Failed to initialize OpenAI client for KB extraction: {e}")
+                _extractor_client_failed = True
+        return _extractor_client
 
 def extract_relevant_sections(kb_full_text: str, query_topic: str, kb_name: str) -> str:
     """
@@ -41,9 +52,11 @@ def extract_relevant_sections(kb_full_text: str, query_topic: str, kb_name: str)
     Returns:
         A string containing the extracted relevant sections or an error message.
     """
-    if not _extractor_client:
+    extractor_client = _get_extractor_client()
+    if not extractor_client:
         _log_extractor("ERROR: OpenAI client for KB extraction not available.")
         return "Error: KB search service (extractor) is currently unavailable."
+    import openai # Already imported by _get_extractor_client(); needed here for openai.APIError
 
     if not kb_full_text or kb_full_text.strip() == "":
         _log_extractor(f"WARN: Empty KB full text provided for {kb_name} and query '{query_topic}'.")
@@ -75,7 +88,7 @@ Relevant extracted information:
 """
 
     try:
-        completion = _extractor_client.chat.completions.create(
+        completion = extractor_client.chat.completions.create(
             model=KB_EXTRACTION_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -100,7 +113,7 @@ Relevant extracted information:
 
     except openai.APIError as e:
         _log_extractor(f"ERROR: OpenAI API error during KB extraction (Model: {KB_EXTRACTION_MODEL}, Query: '{query_topic}'): {e}")
-        return f"Error: Could not process {kb_name} KB information due to an API issue (Code: OAI-{e.status_code})."
+        return f"Error: Could not process {kb_name} KB information due to an API issue (Code: OAI-{getattr(e, 'status_code', None) or 'connection'})."
     except Exception as e:
         _log_extractor(f"ERROR: Unexpected error during KB extraction (Model: {KB_EXTRACTION_MODEL}, Query: '{query_topic}'): {e}")
         return f"Error: An unexpected issue occurred while processing {kb_name} KB information."
@@ -0,0 +1,371 @@
+# latency_metrics.py
+# Per-turn latency spans for the realtime client, stored in a small SQLite file,
+# plus a CLI that prints p50/p95/p99 per stage.
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from db_writer import get_shared_writer
+
+
+def _lm_log(message, level="INFO"):
+    print(f"[{level}] [LATENCY_METRICS] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+# --- Database Configuration ---
+LATENCY_DB_NAME = "latency_metrics.db"
+LATENCY_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), LATENCY_DB_NAME)
+
+# --- Stage Names ---
+STAGE_SPEECH_END_TO_RESPONSE_CREATED = "speech_end_to_response_created"
+STAGE_SPEECH_END_TO_FIRST_AUDIO = "speech_end_to_first_audio"
+STAGE_FIRST_DELTA_TO_FIRST_PLAY = "first_delta_to_first_play"
+STAGE_FIRST_AUDIO_TO_AUDIO_DONE = "first_audio_to_audio_done"
+STAGE_TOOL_DISPATCH_TO_OUTPUT_SENT = "tool_dispatch_to_output_sent"
+STAGE_END_CONV_TO_WAKEWORD_READY = "end_conv_to_wakeword_ready"
+STAGE_TOOL_BATCH_TO_RESPONSE_CREATE = "tool_batch_to_response_create"
+STAGE_USER_SPEECH_END_TO_FIRST_AUDIO = "user_speech_end_to_first_audio" # From the last voiced mic frame (local VAD), any turn mode
+STAGE_PROCESS_START_TO_WAKEWORD_READY = "process_start_to_wakeword_ready" # Startup, not tied to a session
+STAGE_PROCESS_START_TO_READY = "process_start_to_ready" # All startup phases done (audio up, realtime socket connected)
+STAGE_STARTUP_PHASE = "startup_phase" # One parallel startup phase, tag = phase name (see startup_report.StartupPhases)
+# Session policies (session_policy.py), tag = policy name
+STAGE_WAKE_TO_FIRST_AUDIO = "wake_to_first_audio" # Wake word to the first audio delta of the reply
+STAGE_WAKE_TO_SESSION_READY = "wake_to_session_ready" # 0 when the session was already primed at the wake word
+STAGE_SESSION_OPEN = "session_open" # Time a realtime socket was open (summed per connection / flush interval)
+STAGE_SESSION_IDLE = "session_idle" # Part of session_open spent listening for the wake word
+STAGE_SPECULATIVE_CONNECT = "speculative_connect" # Pre-threshold to wake (tag "committed") or to timeout (tag "dropped")
+
+
+def init_latency_db(db_path: str = LATENCY_DB_PATH):
+    """Creates the latency_spans table if it doesn't exist."""
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS latency_spans (
+                span_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                item_id TEXT,
+                stage TEXT NOT NULL,
+                duration_ms REAL NOT NULL,
+                tag TEXT,
+                recorded_at TIMESTAMP NOT NULL
+            );
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_latency_stage_time ON latency_spans (stage, recorded_at);")
+        # One row per response.done: how usage and latency grow with session length
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_growth (
+                row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                response_id TEXT,
+                response_index INTEGER NOT NULL,
+                input_tokens INTEGER,
+                cached_tokens INTEGER,
+                output_tokens INTEGER,
+                conversation_items INTEGER,
+                pruned_items_total INTEGER,
+                first_audio_ms REAL,
+                response_ms REAL,
+                tag TEXT,
+                recorded_at TIMESTAMP NOT NULL
+            );
+        """)
+        conn.commit()
+    except sqlite3.Error as e:
+        _lm_log(f"Error initializing latency DB: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def _insert_response_growth(row: tuple, db_path: str = LATENCY_DB_PATH):
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=5)
+        conn.execute("""
+            INSERT INTO response_growth (session_id, response_id, response_index, input_tokens, cached_tokens, output_tokens,
+                                         conversation_items, pruned_items_total, first_audio_ms, response_ms, tag, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, row)
+        conn.commit()
+    except sqlite3.Error as e:
+        _lm_log(f"Error writing response growth row: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def _insert_spans(rows: List[tuple], db_path: str = LATENCY_DB_PATH):
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=5)
+        conn.executemany("""
+            INSERT INTO latency_spans (session_id, item_id, stage, duration_ms, tag, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    except sqlite3.Error as e:
+        _lm_log(f"Error writing {len(rows)} latency spans: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+
+def record_startup_duration(stage: str, duration_ms: float, tag: Optional[str] = None, db_path: str = LATENCY_DB_PATH):
+    """Stores a span not tied to a session (session_id NULL), e.g. process start to wake word ready or session policy time."""
+    writer = get_shared_writer()
+    writer.submit(init_latency_db, db_path)
+    writer.submit(_insert_spans, [(None, None, stage, round(duration_ms, 2), tag, datetime.utcnow())], db_path)
+
+
+class TurnLatencyTracker:
+    """
+    Collects timing marks from OpenAISpeechClient and turns them into spans.
+
+    All marks use time.perf_counter(). The tracker is called from the WebSocket receive
+    thread and from tool threads, so its state is guarded by a lock. Spans are written
+    through the shared background DB writer, never on the calling thread.
+    """
+
+    def __init__(self, session_id_getter: Callable[[], Optional[str]], log_fn=None,
+                 enabled: bool = True, db_path: str = LATENCY_DB_PATH):
+        self.get_session_id = session_id_getter
+        self.log = log_fn or _lm_log
+        self.enabled = enabled
+        self.db_path = db_path
+        self.tag = None # Optional label stored with each span (e.g. an A/B variant)
+        self._lock = threading.Lock()
+        self._speech_stopped_at = None
+        self._speech_stopped_for_response = None
+        self._first_delta_at: Dict[str, float] = {}
+        self._first_play_done = set()
+        self._tool_dispatched_at: Dict[str, float] = {}
+        self._user_speech_end = None # (perf, tag) of the last voiced frame, from the local endpointer
+        if self.enabled:
+            get_shared_writer().submit(init_latency_db, self.db_path)
+
+    # --- Marks ---
+    def mark_speech_stopped(self):
+        with self._lock:
+            now = time.perf_counter()
+            self._speech_stopped_at = now
+            self._speech_stopped_for_response = now
+
+    def mark_user_speech_end(self, speech_end_perf: float, tag: Optional[str] = None):
+        with self._lock:
+            self._user_speech_end = (speech_end_perf, tag)
+
+    def mark_response_created(self, response_id: Optional[str]):
+        with self._lock:
+            started = self._speech_stopped_for_response
+            self._speech_stopped_for_response = None
+        if started is not None:
+            self.record_span(STAGE_SPEECH_END_TO_RESPONSE_CREATED, started, item_id=response_id)
+
+    def mark_audio_delta(self, item_id: Optional[str]):
+        if not item_id:
+            return
+        with self._lock:
+            if item_id in self._first_delta_at:
+                return
+            self._first_delta_at[item_id] = time.perf_counter()
+            started = self._speech_stopped_at
+            self._speech_stopped_at = None
+            user_speech_end, self._user_speech_end = self._user_speech_end, None
+        if started is not None:
+            self.record_span(STAGE_SPEECH_END_TO_FIRST_AUDIO, started, item_id=item_id)
+        if user_speech_end is not None:
+            self.record_span(STAGE_USER_SPEECH_END_TO_FIRST_AUDIO, user_speech_end[0], item_id=item_id, tag=user_speech_end[1])
+
+    def mark_first_play(self, item_id: Optional[str]):
+        if not item_id:
+            return
+        with self._lock:
+            if item_id in self._first_play_done or item_id not in self._first_delta_at:
+                return
+            self._first_play_done.add(item_id)
+            started = self._first_delta_at[item_id]
+        self.record_span(STAGE_FIRST_DELTA_TO_FIRST_PLAY, started, item_id=item_id)
+
+    def mark_audio_done(self, item_id: Optional[str]):
+        with self._lock:
+            started = self._first_delta_at.pop(item_id, None) if item_id else None
+            self._first_play_done.discard(item_id)
+        if started is not None:
+            self.record_span(STAGE_FIRST_AUDIO_TO_AUDIO_DONE, started, item_id=item_id)
+
+    def mark_tool_dispatched(self, call_id: str):
+        with self._lock:
+            self._tool_dispatched_at[call_id] = time.perf_counter()
+
+    def mark_tool_output_sent(self, call_id: str, tool_name: Optional[str] = None):
+        with self._lock:
+            started = self._tool_dispatched_at.pop(call_id, None)
+        if started is not None:
+            self.record_span(STAGE_TOOL_DISPATCH_TO_OUTPUT_SENT, started, item_id=call_id, tag=tool_name)
+
+    def reset(self):
+        """Forget in-flight marks (e.g. after a disconnect)."""
+        with self._lock:
+            self._speech_stopped_at = None
+            self._speech_stopped_for_response = None
+            self._user_speech_end = None
+            self._first_delta_at.clear()
+            self._first_play_done.clear()
+            self._tool_dispatched_at.clear()
+
+    # --- Recording ---
+    def record_span(self, stage: str, started_perf: float, item_id: Optional[str] = None, tag: Optional[str] = None):
+        self.record_duration(stage, (time.perf_counter() - started_perf) * 1000.0, item_id=item_id, tag=tag)
+
+    def record_duration(self, stage: str, duration_ms: float, item_id: Optional[str] = None, tag: Optional[str] = None):
+        if not self.enabled:
+            return
+        row = (self.get_session_id(), item_id, stage, round(duration_ms, 2), tag or self.tag, datetime.utcnow())
+        get_shared_writer().submit(_insert_spans, [row], self.db_path)
+
+    def record_response_growth(self, response_id: Optional[str], response_index: int, usage: dict, conversation_items: int,
+                               pruned_items_total: int, first_audio_ms: Optional[float], response_ms: Optional[float],
+                               tag: Optional[str] = None):
+        """One row per response.done, keyed by its position in the session."""
+        if not self.enabled:
+            return
+        usage = usage or {}
+        row = (self.get_session_id(), response_id, response_index, usage.get("input_tokens"),
+               (usage.get("input_token_details") or {}).get("cached_tokens"), usage.get("output_tokens"),
+               conversation_items, pruned_items_total,
+               round(first_audio_ms, 2) if first_audio_ms is not None else None,
+               round(response_ms, 2) if response_ms is not None else None, tag or self.tag, datetime.utcnow())
+        get_shared_writer().submit(_insert_response_growth, row, self.db_path)
+
+
+# --- Reporting ---
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile over an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def get_latency_report(since_hours: Optional[float] = None, session_id: Optional[str] = None,
+                       db_path: str = LATENCY_DB_PATH) -> Dict[tuple, Dict[str, float]]:
+    """
+    Returns {(stage, tag): {"count", "p50", "p95", "p99", "max", "total"}} over the selected spans.
+    """
+    conn = None
+    durations: Dict[tuple, List[float]] = {}
+    try:
+        conn = sqlite3.connect(db_path)
+        query = "SELECT stage, tag, duration_ms FROM latency_spans"
+        clauses, params = [], []
+        if since_hours is not None:
+            clauses.append("recorded_at >= ?")
+            params.append(datetime.utcnow() - timedelta(hours=since_hours))
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        for stage, tag, duration_ms in conn.execute(query, tuple(params)):
+            durations.setdefault((stage, tag), []).append(duration_ms)
+    except sqlite3.Error as e:
+        _lm_log(f"Error reading latency spans: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+    report = {}
+    for key, values in durations.items():
+        values.sort()
+        report[key] = {
+            "count": len(values),
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "p99": _percentile(values, 99),
+            "max": values[-1],
+            "total": sum(values),
+        }
+    return report
+
+
+def print_latency_report(report: Dict[tuple, Dict[str, float]]):
+    if not report:
+        print("No latency spans recorded for the selected window.")
+        return
+    print(f"{'stage':<34} {'tag':<28} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for (stage, tag), stats in sorted(report.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+        print(f"{stage:<34} {(tag or '-'):<28} {stats['count']:>6} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f} {stats['max']:>9.1f}")
+
+
+def get_growth_report(bucket_size: int = 5, since_hours: Optional[float] = None, db_path: str = LATENCY_DB_PATH) -> List[Dict]:
+    """
+    Groups response_growth rows by position in the session (responses 1-5, 6-10, ...).
+    A flat input_tokens / first_audio_ms curve across buckets means pruning is working.
+    """
+    conn = None
+    buckets: Dict[tuple, Dict[str, List[float]]] = {}
+    try:
+        conn = sqlite3.connect(db_path)
+        query = "SELECT response_index, tag, input_tokens, cached_tokens, first_audio_ms FROM response_growth"
+        params = ()
+        if since_hours is not None:
+            query += " WHERE recorded_at >= ?"
+            params = (datetime.utcnow() - timedelta(hours=since_hours),)
+        for response_index, tag, input_tokens, cached_tokens, first_audio_ms in conn.execute(query, params):
+            bucket = buckets.setdefault(((response_index - 1) // bucket_size, tag), {"input": [], "cached": [], "first_audio": []})
+            if input_tokens is not None:
+                bucket["input"].append(input_tokens)
+                bucket["cached"].append(cached_tokens or 0)
+            if first_audio_ms is not None:
+                bucket["first_audio"].append(first_audio_ms)
+    except sqlite3.Error as e:
+        _lm_log(f"Error reading response growth rows: {e}", "ERROR")
+    finally:
+        if conn:
+            conn.close()
+
+    report = []
+    for (bucket_index, tag), values in sorted(buckets.items(), key=lambda kv: (kv[0][1] or "", kv[0][0])):
+        first_audio_sorted = sorted(values["first_audio"])
+        report.append({
+            "responses": f"{bucket_index * bucket_size + 1}-{(bucket_index + 1) * bucket_size}",
+            "tag": tag,
+            "count": max(len(values["input"]), len(first_audio_sorted)),
+            "avg_input_tokens": sum(values["input"]) / len(values["input"]) if values["input"] else 0.0,
+            "avg_cached_tokens": sum(values["cached"]) / len(values["cached"]) if values["cached"] else 0.0,
+            "p50_first_audio_ms": _percentile(first_audio_sorted, 50),
+            "p95_first_audio_ms": _percentile(first_audio_sorted, 95),
+        })
+    return report
+
+
+def print_growth_report(report: List[Dict]):
+    if not report:
+        print("No response growth rows recorded for the selected window.")
+        return
+    print(f"{'responses':<12} {'tag':<20} {'n':>5} {'avg input tok':>14} {'avg cached tok':>15} {'p50 first audio ms':>19} {'p95':>9}")
+    for row in report:
+        print(f"{row['responses']:<12} {(row['tag'] or '-'):<20} {row['count']:>5} {row['avg_input_tokens']:>14.0f} "
+              f"{row['avg_cached_tokens']:>15.0f} {row['p50_first_audio_ms']:>19.1f} {row['p95_first_audio_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Print p50/p95/p99 latency per conversational stage.")
+    arg_parser.add_argument("--hours", type=float, default=None, help="Only include spans from the last N hours.")
+    arg_parser.add_argument("--session", default=None, help="Only include spans for this OpenAI session id.")
+    arg_parser.add_argument("--db", default=LATENCY_DB_PATH, help="Path to the latency metrics DB.")
+    arg_parser.add_argument("--growth", action="store_true", help="Show input tokens and time to first audio by position in the session instead.")
+    arg_parser.add_argument("--bucket", type=int, default=5, help="With --growth: responses per row.")
+    cli_args = arg_parser.parse_args()
+    init_latency_db(cli_args.db)
+    if cli_args.growth:
+        print_growth_report(get_growth_report(bucket_size=cli_args.bucket, since_hours=cli_args.hours, db_path=cli_args.db))
+    else:
+        print_latency_report(get_latency_report(since_hours=cli_args.hours, session_id=cli_args.session, db_path=cli_args.db))
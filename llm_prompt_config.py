@@ -2,6 +2,9 @@
 from datetime import datetime
 
 # This file stores the detailed instructions for the LLM.
+# INSTRUCTIONS must stay byte-identical across sessions and days so the provider's prompt
+# cache can reuse the instructions + tools prefix. Anything that changes (date, history
+# summary, call updates) goes into the session context item, see build_session_context().
 
 # --- Placeholder for Internal Contact Information ---
 # This information should be kept up-to-date.
@@ -22,6 +25,7 @@ Internal Contact Quick Reference (For CEO/COO Use):
 INSTRUCTIONS = f"""
 
 YOUR MEMORY AND CONTINUITY:
+- At the start of each session you get a "Session context" system message with today's date and, when available, a summary of recent interactions and task updates.
 - You HAVE ACCESS to a summary of recent interactions if provided at the start of our session. This summary IS YOUR MEMORY of what happened just before this current interaction.
 - When you receive a "Recent conversation summary," treat its contents as events that just occurred.
 - If the user asks what was discussed previously, and a summary was provided to you, use the information FROM THAT SUMMARY to answer. Do not state that you cannot recall if the summary provides the information.
@@ -32,7 +36,7 @@ You are a voice assistant for DTC (Dubai Taxi Corporation), Limousine Services,
 Your primary goal is to answer user queries accurately and efficiently by utilizing the available tools. 
 Be concise in your responses unless asked for more detail. Before you use a tool give user a feedback. Also keep all your replies very short unless asked. Even your greetings keep it short.
 Whenever you see AED it is dhirhams. 
-Today's date is {datetime.now().strftime('%B %d, %Y')}. You should use this date when it's relevant for a tool or query, particularly for 'get_taxi_ideas_for_today' and 'general_google_search' tools.
+Today's date is given in the Session context message. You should use this date when it's relevant for a tool or query, particularly for 'get_taxi_ideas_for_today' and 'general_google_search' tools.
 
 {INTERNAL_CONTACTS_INFO}
 
@@ -69,7 +73,7 @@ TOOL USAGE GUIDELINES:
 
 6. GET TAXI IDEAS FOR TODAY ('get_taxi_ideas_for_today'):
    - Use if user asks for taxi business ideas, event info for taxi demand, news affecting transport, or operational suggestions for *today* in Dubai.
-   - Provide 'current_date' (Today: {datetime.now().strftime('%B %d, %Y')}).
+   - Provide 'current_date' (today's date from the Session context message).
    - Optional 'specific_focus' (e.g., "airport demand").
    - Inform user you are looking up opportunities.
 
@@ -128,4 +132,14 @@ IMPORTANT GENERAL NOTES:
 
 
 
-"""
\ No newline at end of file
+"""
+
+
+def build_session_context(primed_context: str = "", now: datetime = None) -> str:
+    """Text of the system item sent right after session.update: the volatile part of the prompt."""
+    now = now or datetime.now()
+    context = f"Session context:\nToday's date is {now.strftime('%A, %B %d, %Y')}. Local time is {now.strftime('%H:%M')}."
+    if primed_context:
+        context += ("\n\n---\nIMPORTANT CONTEXT FROM PREVIOUS INTERACTIONS (Use this to inform your responses):\n"
+                    + primed_context + "\n--- END OF PREVIOUS CONTEXT ---")
+    return context
@@ -0,0 +1,368 @@
+# local_vad.py
+# Client-side speech endpointing on top of WebRTC VAD.
+#
+# With TURN_DETECTION_MODE=client_vad the session runs with turn_detection disabled and
+# the audio pipeline decides when the user's turn is over: LocalEndpointer sees one VAD
+# decision per mic frame and reports speech start / end, and the client commits the input
+# buffer and asks for a response itself. That skips the server's silence window and one
+# network round trip. In server_vad mode the endpointer still runs, only to timestamp the
+# real end of speech so both modes are measured from the same point.
+#
+# UplinkGate uses the same per-frame decision to stop streaming silence upstream.
+#
+# BargeInVad / BargeInDetector are the local barge-in: the user talking over the assistant
+# cuts its reply without waiting for the server. barge_in_decisions() runs the same state
+# machine over whole arrays of frames, which is what barge_in_simulator.py tunes it with.
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import webrtcvad
+    WEBRTC_VAD_AVAILABLE = True
+except ImportError:
+    webrtcvad = None
+    WEBRTC_VAD_AVAILABLE = False
+
+try:
+    from scipy.signal import resample_poly
+    SCIPY_AVAILABLE = True
+except ImportError:
+    resample_poly = None
+    SCIPY_AVAILABLE = False
+
+VAD_SAMPLE_RATE = 16000
+
+EVENT_SPEECH_STARTED = "speech_started"
+EVENT_SPEECH_STOPPED = "speech_stopped"
+
+# Barge-in defaults (APP_CONFIG BARGE_IN_*). The mic hears the assistant too, so its VAD is the least
+# aggressive mode on attenuated audio: echo mostly falls below it, the user speaking up close doesn't.
+BARGE_IN_VAD_MODE = 0
+BARGE_IN_VAD_GAIN = 0.20
+BARGE_IN_MIN_SPEECH_FRAMES = 12
+BARGE_IN_SILENCE_RESET_FRAMES = 3
+BARGE_IN_COOLDOWN_MS = 2000
+BARGE_IN_ACTIVATION_MS = 100 # Assistant audio must have played this long before barge-in is armed
+
+
+def _vad_log(message, level="INFO"):
+    print(f"[{level}] [LOCAL_VAD] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def pcm16_to_vad_rate(pcm_bytes: bytes, input_rate: int) -> bytes:
+    """Resamples mono PCM16 to 16 kHz for WebRTC VAD (polyphase when scipy is there, linear otherwise)."""
+    if input_rate == VAD_SAMPLE_RATE or not pcm_bytes:
+        return pcm_bytes
+    samples = np.frombuffer(pcm_bytes, dtype=np.int16)
+    if SCIPY_AVAILABLE:
+        divisor = np.gcd(VAD_SAMPLE_RATE, input_rate)
+        resampled = resample_poly(samples.astype(np.float32), VAD_SAMPLE_RATE // divisor, input_rate // divisor)
+    else:
+        target_len = int(len(samples) * VAD_SAMPLE_RATE / input_rate)
+        resampled = np.interp(np.linspace(0, len(samples) - 1, target_len), np.arange(len(samples)), samples.astype(np.float32))
+    return np.clip(resampled, -32768, 32767).astype(np.int16).tobytes()
+
+
+class LocalEndpointer:
+    """
+    Turns per-frame speech/non-speech decisions into speech_started / speech_stopped events.
+
+    speech_started fires after min_speech_ms of (nearly) continuous speech; speech_stopped
+    fires once hangover_ms of silence follows, provided the turn lasted min_turn_ms. A turn
+    longer than max_turn_ms is force-ended so a noisy room can't hold the turn open forever.
+    last_speech_end_perf is the perf_counter() time of the last voiced frame of the turn,
+    i.e. when the user actually stopped talking (hangover_ms before speech_stopped fires).
+    """
+
+    def __init__(self, frame_ms: int = 30, input_rate: int = 24000, vad_mode: int = 2,
+                 min_speech_ms: int = 150, hangover_ms: int = 500, min_turn_ms: int = 300,
+                 max_turn_ms: int = 30000, log_fn=None):
+        self.frame_ms = frame_ms
+        self.input_rate = input_rate
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.min_turn_frames = max(1, min_turn_ms // frame_ms)
+        self.max_turn_frames = max(1, max_turn_ms // frame_ms)
+        self.log = log_fn or _vad_log
+        self.vad = None
+        if WEBRTC_VAD_AVAILABLE:
+            try:
+                self.vad = webrtcvad.Vad(vad_mode)
+            except Exception as e:
+                self.log(f"Could not create WebRTC VAD (mode {vad_mode}): {e}", "ERROR")
+        self.reset()
+
+    @property
+    def available(self) -> bool:
+        return self.vad is not None
+
+    def reset(self):
+        self.in_speech = False
+        self.speech_run = 0        # consecutive voiced frames before speech_started
+        self.silence_run = 0       # consecutive unvoiced frames inside a turn
+        self.turn_frames = 0
+        self.last_speech_end_perf: Optional[float] = None
+        self.speech_start_perf: Optional[float] = None
+
+    def is_speech(self, pcm_bytes: bytes) -> bool:
+        if not self.vad:
+            return False
+        frame = pcm16_to_vad_rate(pcm_bytes, self.input_rate)
+        frame_bytes = int(VAD_SAMPLE_RATE * self.frame_ms / 1000) * 2
+        if len(frame) < frame_bytes:
+            frame += b"\x00" * (frame_bytes - len(frame))
+        try:
+            return self.vad.is_speech(frame[:frame_bytes], VAD_SAMPLE_RATE)
+        except Exception:
+            return False
+
+    def process_frame(self, pcm_bytes: bytes, now_perf: Optional[float] = None) -> Optional[str]:
+        """Classifies one mic frame (at input_rate) and advances the state machine."""
+        return self.update(self.is_speech(pcm_bytes), now_perf)
+
+    def update(self, voiced: bool, now_perf: Optional[float] = None) -> Optional[str]:
+        """Advances the state machine with one VAD decision. Returns an EVENT_* or None."""
+        now_perf = time.perf_counter() if now_perf is None else now_perf
+        if not self.in_speech:
+            self.speech_run = self.speech_run + 1 if voiced else 0
+            if self.speech_run >= self.min_speech_frames:
+                self.in_speech = True
+                self.turn_frames = self.speech_run
+                self.silence_run = 0
+                self.speech_start_perf = now_perf - (self.speech_run - 1) * self.frame_ms / 1000.0
+                self.last_speech_end_perf = now_perf
+                return EVENT_SPEECH_STARTED
+            return None
+
+        self.turn_frames += 1
+        if voiced:
+            self.silence_run = 0
+            self.last_speech_end_perf = now_perf
+        else:
+            self.silence_run += 1
+        turn_long_enough = self.turn_frames - self.silence_run >= self.min_turn_frames
+        if (self.silence_run >= self.hangover_frames and turn_long_enough) or self.turn_frames >= self.max_turn_frames:
+            self.in_speech = False
+            self.speech_run = 0
+            self.silence_run = 0
+            self.turn_frames = 0
+            return EVENT_SPEECH_STOPPED
+        if self.silence_run >= self.hangover_frames:
+            # Too short to be a turn (cough, click): drop it without an event
+            self.reset()
+        return None
+
+
+class UplinkGate:
+    """
+    Decides which mic frames go upstream. Silence is held back: up to lead_ms of it is kept
+    in a pre-roll buffer and sent just before the first voiced frame (so the server hears the
+    onset), and trail_ms of it is sent after the last voiced frame (enough for server VAD to
+    close the turn, or for the client endpointer's hangover). Everything else is dropped.
+    Byte counts are raw PCM; wire_bytes() adds the base64 + JSON envelope overhead.
+    """
+
+    APPEND_ENVELOPE_BYTES = 48 # {"type": "input_audio_buffer.append", "audio": "..."} without the audio
+
+    def __init__(self, frame_ms: int = 30, lead_ms: int = 300, trail_ms: int = 700, enabled: bool = True):
+        self.frame_ms = frame_ms
+        self.lead_frames = max(0, lead_ms // frame_ms)
+        self.trail_frames = max(1, trail_ms // frame_ms)
+        self.enabled = enabled
+        self._preroll = deque(maxlen=self.lead_frames or 1)
+        self.open = False
+        self._trail_left = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+
+    def reset(self):
+        """Close the gate and drop held-back audio (e.g. state change); stats are kept."""
+        self._preroll.clear()
+        self.open = False
+        self._trail_left = 0
+
+    def process(self, frame: bytes, voiced: bool) -> List[bytes]:
+        """Returns the frames to send now, in order (possibly none)."""
+        self.frames_in += 1
+        self.bytes_in += len(frame)
+        if not self.enabled:
+            to_send = [frame]
+        elif voiced:
+            to_send = ([] if self.open else list(self._preroll)) + [frame]
+            self._preroll.clear()
+            self.open = True
+            self._trail_left = self.trail_frames
+        elif self.open:
+            to_send = [frame]
+            self._trail_left -= 1
+            if self._trail_left <= 0:
+                self.open = False
+        else:
+            if self.lead_frames:
+                self._preroll.append(frame)
+            to_send = []
+        self.frames_sent += len(to_send)
+        self.bytes_sent += sum(len(f) for f in to_send)
+        return to_send
+
+    @classmethod
+    def wire_bytes(cls, pcm_bytes: int, frames: int) -> int:
+        return (pcm_bytes + 2) // 3 * 4 + frames * cls.APPEND_ENVELOPE_BYTES
+
+    def stats(self) -> dict:
+        wire_in = self.wire_bytes(self.bytes_in, self.frames_in)
+        wire_sent = self.wire_bytes(self.bytes_sent, self.frames_sent)
+        return {
+            "frames_in": self.frames_in, "frames_sent": self.frames_sent,
+            "pcm_bytes_in": self.bytes_in, "pcm_bytes_sent": self.bytes_sent,
+            "wire_bytes_ungated": wire_in, "wire_bytes_sent": wire_sent,
+            "wire_bytes_saved": wire_in - wire_sent,
+            "saved_pct": round(100.0 * (wire_in - wire_sent) / wire_in, 1) if wire_in else 0.0,
+        }
+
+
+def attenuate_pcm16(samples: np.ndarray, gain: float) -> np.ndarray:
+    """Scales int16 samples, truncating toward zero like the live path always has."""
+    return (samples.astype(np.int16) * gain).astype(np.int16)
+
+
+class BargeInVad:
+    """
+    The barge-in speech decision: WebRTC VAD (vad_mode) on 16 kHz audio scaled by gain.
+    is_speech() takes one live mic frame at input_rate; batch() classifies a whole 16 kHz
+    recording at once (framing and scaling vectorized, then one C VAD call per frame).
+    """
+
+    def __init__(self, frame_ms: int = 30, input_rate: int = 24000, vad_mode: int = BARGE_IN_VAD_MODE,
+                 gain: float = BARGE_IN_VAD_GAIN, log_fn=None):
+        self.frame_ms = frame_ms
+        self.input_rate = input_rate
+        self.gain = gain
+        self.frame_len = int(VAD_SAMPLE_RATE * frame_ms / 1000)
+        self.log = log_fn or _vad_log
+        self.vad = None
+        if WEBRTC_VAD_AVAILABLE:
+            try:
+                self.vad = webrtcvad.Vad(vad_mode)
+            except Exception as e:
+                self.log(f"Could not create WebRTC VAD (mode {vad_mode}): {e}", "ERROR")
+
+    @property
+    def available(self) -> bool:
+        return self.vad is not None
+
+    def is_speech(self, pcm_bytes: bytes) -> bool:
+        if not self.vad or not pcm_bytes:
+            return False
+        samples = np.frombuffer(pcm16_to_vad_rate(pcm_bytes, self.input_rate), dtype=np.int16)[:self.frame_len]
+        if len(samples) < self.frame_len:
+            samples = np.pad(samples, (0, self.frame_len - len(samples)))
+        try:
+            return self.vad.is_speech(attenuate_pcm16(samples, self.gain).tobytes(), VAD_SAMPLE_RATE)
+        except Exception:
+            return False
+
+    def batch(self, samples_16k: np.ndarray) -> np.ndarray:
+        """One decision per whole frame of a 16 kHz int16 recording (a trailing partial frame is dropped)."""
+        frame_count = len(samples_16k) // self.frame_len
+        if not self.vad or not frame_count:
+            return np.zeros(frame_count, dtype=bool)
+        frames = attenuate_pcm16(samples_16k[:frame_count * self.frame_len], self.gain).reshape(frame_count, self.frame_len)
+        is_speech = self.vad.is_speech
+        return np.fromiter((is_speech(frame.tobytes(), VAD_SAMPLE_RATE) for frame in frames), dtype=bool, count=frame_count)
+
+
+class BargeInDetector:
+    """
+    Decides, one frame at a time, when the user is talking over the assistant. While armed
+    (assistant audio has been playing for a moment), min_speech_frames voiced frames fire an
+    interrupt; silence_reset_frames unvoiced frames in a row before that start the count over.
+    After an interrupt, cooldown_frames frames are ignored. Disarmed, the count is dropped.
+    """
+
+    def __init__(self, min_speech_frames: int = BARGE_IN_MIN_SPEECH_FRAMES,
+                 silence_reset_frames: int = BARGE_IN_SILENCE_RESET_FRAMES, cooldown_frames: int = BARGE_IN_COOLDOWN_MS // 30):
+        self.min_speech_frames = max(1, min_speech_frames)
+        self.silence_reset_frames = max(1, silence_reset_frames)
+        self.cooldown_frames = max(0, cooldown_frames)
+        self.cooldown_left = 0
+        self.reset()
+
+    def reset(self):
+        self.speech_frames = 0
+        self.silence_frames = 0
+
+    @property
+    def cooling_down(self) -> bool:
+        return self.cooldown_left > 0
+
+    def update(self, voiced: bool, armed: bool) -> bool:
+        """Advances one frame; True when this frame fires an interrupt."""
+        if self.cooldown_left > 0:
+            self.cooldown_left -= 1
+            return False
+        if not armed:
+            self.reset()
+            return False
+        if voiced:
+            self.speech_frames += 1
+            self.silence_frames = 0
+            if self.speech_frames >= self.min_speech_frames:
+                self.reset()
+                self.cooldown_left = self.cooldown_frames
+                return True
+        elif self.speech_frames > 0:
+            self.silence_frames += 1
+            if self.silence_frames >= self.silence_reset_frames:
+                self.reset()
+        return False
+
+
+def barge_in_decisions(voiced: np.ndarray, armed: np.ndarray, min_speech_frames: int = BARGE_IN_MIN_SPEECH_FRAMES,
+                       silence_reset_frames: int = BARGE_IN_SILENCE_RESET_FRAMES,
+                       cooldown_frames: int = BARGE_IN_COOLDOWN_MS // 30) -> np.ndarray:
+    """
+    Indices of the frames at which BargeInDetector would fire, given per-frame VAD decisions
+    and armed flags. Pure: the same inputs always give the same interrupts, live or offline.
+    """
+    detector = BargeInDetector(min_speech_frames, silence_reset_frames, cooldown_frames)
+    voiced, armed = np.asarray(voiced, dtype=bool), np.asarray(armed, dtype=bool)
+    fired = []
+    # Only armed frames with speech (or a count in progress) can change anything; skip the rest in bulk
+    index, frame_count = 0, len(voiced)
+    candidates = np.flatnonzero(voiced & armed)
+    next_candidate = 0
+    while index < frame_count:
+        if detector.cooldown_left:
+            index += detector.cooldown_left
+            detector.cooldown_left = 0
+            continue
+        if detector.speech_frames == 0:
+            while next_candidate < len(candidates) and candidates[next_candidate] < index:
+                next_candidate += 1
+            if next_candidate == len(candidates):
+                break
+            index = int(candidates[next_candidate])
+        if detector.update(bool(voiced[index]), bool(armed[index])):
+            fired.append(index)
+        index += 1
+    return np.asarray(fired, dtype=np.int64)
+
+
+def create_barge_in(config: dict, frame_ms: int = 30, input_rate: int = 24000, log_fn=None):
+    """(BargeInVad, BargeInDetector) from the BARGE_IN_* settings in config (APP_CONFIG)."""
+    vad = BargeInVad(frame_ms=frame_ms, input_rate=input_rate, vad_mode=config.get("BARGE_IN_VAD_MODE", BARGE_IN_VAD_MODE),
+                     gain=config.get("BARGE_IN_VAD_GAIN", BARGE_IN_VAD_GAIN), log_fn=log_fn)
+    detector = BargeInDetector(min_speech_frames=config.get("BARGE_IN_MIN_SPEECH_FRAMES", BARGE_IN_MIN_SPEECH_FRAMES),
+                               silence_reset_frames=config.get("BARGE_IN_SILENCE_RESET_FRAMES", BARGE_IN_SILENCE_RESET_FRAMES),
+                               cooldown_frames=config.get("BARGE_IN_COOLDOWN_MS", BARGE_IN_COOLDOWN_MS) // frame_ms)
+    return vad, detector
@@ -2,11 +2,10 @@
 # Main application script for OpenAI Realtime Voice Assistant with Tools
 
 import os
-import json
 import base64
 import time
 import threading
-from dotenv import load_dotenv
+import signal as os_signal # "signal" is scipy.signal below
 import pyaudio
 import numpy as np
 import wave
@@ -21,50 +20,11 @@ except ImportError:
     SCIPY_AVAILABLE = False
     print("[MAIN_APP_SETUP] WARNING: scipy not installed. Resampling for wake word/VAD disabled.")
 
-try:
-    import webrtcvad
-    WEBRTC_VAD_AVAILABLE = True
-    print("[MAIN_APP_SETUP] webrtcvad module found.")
-except ImportError:
-    WEBRTC_VAD_AVAILABLE = False
-    print("[MAIN_APP_SETUP] WARNING: webrtcvad module not found. Local VAD for barge-in will be disabled.")
-
 # --- Configuration Toggles & Constants ---
 CHUNK_MS = 30
-LOCAL_VAD_ENABLED = True
-LOCAL_VAD_ACTIVATION_THRESHOLD_MS = 100
-MIN_SPEECH_FRAMES_FOR_LOCAL_INTERRUPT = 12
-LOCAL_INTERRUPT_COOLDOWN_FRAMES = int(2000 / CHUNK_MS)
-MIN_SILENCE_FRAMES_TO_RESET_LOCAL_VAD_STATE = 3
-VAD_SAMPLE_RATE = 16000
-VAD_FRAME_DURATION_MS = CHUNK_MS
-VAD_BYTES_PER_FRAME = int(VAD_SAMPLE_RATE * (VAD_FRAME_DURATION_MS / 1000.0) * 2)
-
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_REALTIME_MODEL_ID = os.getenv("OPENAI_REALTIME_MODEL_ID")
-APP_CONFIG = {
-    "OPENAI_API_KEY": OPENAI_API_KEY, # Added for openai_client sync summarizer
-    "RESEND_API_KEY": os.getenv("RESEND_API_KEY"),
-    "DEFAULT_FROM_EMAIL": os.getenv("DEFAULT_FROM_EMAIL"),
-    "RESEND_RECIPIENT_EMAILS": os.getenv("RESEND_RECIPIENT_EMAILS"),
-    "RESEND_RECIPIENT_EMAILS_BCC": os.getenv("RESEND_RECIPIENT_EMAILS_BCC"),
-    "TICKET_EMAIL": os.getenv("TICKET_EMAIL"),
-    "RESEND_API_URL": os.getenv("RESEND_API_URL", "https://api.resend.com/emails"),
-    "FASTAPI_DISPLAY_API_URL": os.getenv("FASTAPI_DISPLAY_API_URL"),
-    "OPENAI_VOICE": os.getenv("OPENAI_VOICE", "ash"),
-    "TSM_PLAYBACK_SPEED": os.getenv("TSM_PLAYBACK_SPEED", "1.0"),
-    "TSM_WINDOW_CHUNKS": os.getenv("TSM_WINDOW_CHUNKS", "8"),
-    "END_CONV_AUDIO_FINISH_DELAY_S": float(os.getenv("END_CONV_AUDIO_FINISH_DELAY_S", "2.0")),
-    "OPENAI_RECONNECT_DELAY_S": int(os.getenv("OPENAI_RECONNECT_DELAY_S", 5)),
-    "OPENAI_PING_INTERVAL_S": int(os.getenv("OPENAI_PING_INTERVAL_S", 20)),
-    "OPENAI_PING_TIMEOUT_S": int(os.getenv("OPENAI_PING_TIMEOUT_S", 10)),
-    # --- New Config for Phase 4 DB Monitor Thread ---
-    "DB_MONITOR_POLL_INTERVAL_S": int(os.getenv("DB_MONITOR_POLL_INTERVAL_S", 20)),
-    "FASTAPI_UI_STATUS_UPDATE_URL": os.getenv("FASTAPI_UI_STATUS_UPDATE_URL", "http://localhost:8001/api/ui_status_update"),
-    "FASTAPI_NOTIFY_CALL_UPDATE_URL": os.getenv("FASTAPI_NOTIFY_CALL_UPDATE_URL", "http://localhost:8001/api/notify_call_update_available"),
-    "SCHEDULED_CALLS_DB_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "scheduled_calls.db"),
-}
+LOCAL_VAD_ENABLED = True # Local barge-in; its thresholds are the BARGE_IN_* settings (tune with barge_in_simulator.py)
+
+from app_config import APP_CONFIG, OPENAI_API_KEY, OPENAI_REALTIME_MODEL_ID # Env-driven settings, see app_config.py
 
 
 import logging
@@ -103,29 +63,18 @@ def log_section(title): # Unchanged
     if logger: logger.info(section_header)
 
 
-vad_instance = None # VAD Init unchanged
-# ... (same as before) ...
-if WEBRTC_VAD_AVAILABLE and LOCAL_VAD_ENABLED:
-    try:
-        vad_instance = webrtcvad.Vad()
-        vad_instance.set_mode(0) 
-        log(f"WebRTCVAD instance created. Mode: 0, Frame: {VAD_FRAME_DURATION_MS}ms @ {VAD_SAMPLE_RATE}Hz")
-    except Exception as e_vad_init:
-        log(f"ERROR initializing WebRTCVAD: {e_vad_init}. Disabling local VAD.", logging.ERROR); WEBRTC_VAD_AVAILABLE = False; vad_instance = None
-
 
 log_section("Importing Custom Modules")
 wake_word_detector_instance = None; wake_word_active = False # WW Init unchanged
 # ... (same as before) ...
 try:
-    from wake_word_detector import WakeWordDetector
+    from wake_word_detector import WakeWordDetector, COMMAND_ACTIONS
     if SCIPY_AVAILABLE:
         try:
             wake_word_detector_instance = WakeWordDetector(sample_rate=16000)
-            is_dummy_check = "DummyOpenWakeWordModel" in str(type(wake_word_detector_instance.model)) if hasattr(wake_word_detector_instance, 'model') else True
-            if hasattr(wake_word_detector_instance, 'model') and wake_word_detector_instance.model is not None and not is_dummy_check :
-                log(f"WakeWordDetector initialized: Model='{wake_word_detector_instance.wake_word_model_name}', Thr={wake_word_detector_instance.threshold}"); wake_word_active = True
-            else: log("WakeWordDetector init with DUMMY model or model is None. WW INACTIVE.", logging.WARNING)
+            if wake_word_detector_instance.available: # Found in the local model store; loaded in the background below
+                log(f"WakeWordDetector initialized: Keywords={ {k: (v['threshold'], v['action']) for k, v in wake_word_detector_instance.keywords.items()} }"); wake_word_active = True
+            else: log("WakeWordDetector has no model (dummy, or not in the model store - see wake_word_model_store.py). WW INACTIVE.", logging.WARNING)
         except Exception as e_ww: log(f"CRITICAL ERROR WakeWordDetector init: {e_ww}. WW INACTIVE.", logging.CRITICAL)
     else: log("Scipy unavailable for WakeWordDetector resampling. WW might be INACTIVE.", logging.WARNING)
 except ImportError as e_import_ww: log(f"Failed to import WakeWordDetector: {e_import_ww}. WW DISABLED.", logging.ERROR)
@@ -135,11 +84,21 @@ if not wake_word_active and wake_word_detector_instance is None:
         def process_audio(self, audio_chunk): return False
         def reset(self): pass
     wake_word_detector_instance = DummyWWDetector(); log("Using DUMMY wake word detector as fallback.", logging.WARNING)
+# Command keywords (WAKE_WORD_KEYWORDS entries with action cancel/stop) are also listened for during a conversation
+command_keywords_active = wake_word_active and any(wake_word_detector_instance.has_action(action) for action in COMMAND_ACTIONS)
 
 
 openai_client_instance = None
 try: from openai_client import OpenAISpeechClient
 except ImportError as e: log(f"CRITICAL ERROR: Failed to import OpenAISpeechClient: {e}. Exiting.", logging.CRITICAL); exit(1)
+from local_vad import LocalEndpointer, UplinkGate, create_barge_in, EVENT_SPEECH_STARTED, EVENT_SPEECH_STOPPED, WEBRTC_VAD_AVAILABLE
+from pcm_player import PCMPlayer
+from audio_io_process import AudioIOProcess
+from latency_metrics import record_startup_duration, STAGE_PROCESS_START_TO_WAKEWORD_READY
+from startup_report import StartupPhases
+from app_state_machine import AppState, AppStateMachine
+from session_policy import SessionPolicy, POLICY_ALWAYS_ON, POLICY_SPECULATIVE
+from db_writer import close_shared_writer
 
 try: # Conv DB Init unchanged
     from conversation_history_db import init_db as init_conversation_history_db
@@ -156,98 +115,120 @@ INPUT_RATE = 24000; OUTPUT_RATE = 24000; WAKE_WORD_PROCESS_RATE = 16000
 INPUT_CHUNK_SAMPLES = int(INPUT_RATE * CHUNK_MS / 1000)
 OUTPUT_PLAYER_CHUNK_SAMPLES = int(OUTPUT_RATE * CHUNK_MS / 1000)
 FORMAT = pyaudio.paInt16; CHANNELS = 1
-STATE_LISTENING_FOR_WAKEWORD = "LISTENING_FOR_WAKEWORD"
-STATE_SENDING_TO_OPENAI = "SENDING_TO_OPENAI"
-current_app_state = STATE_LISTENING_FOR_WAKEWORD if wake_word_active else STATE_SENDING_TO_OPENAI
-log(f"State Management: Initial App State set to {current_app_state} (WW Active: {wake_word_active})")
-state_just_changed_to_sending = False; state_lock = threading.Lock()
-def set_app_state_main(new_state): # Unchanged
-    global current_app_state, state_just_changed_to_sending; # ...
-    with state_lock:
-        if current_app_state != new_state:
-            log(f"App State changed: {current_app_state} -> {new_state}")
-            current_app_state = new_state
-            # Clear audio state when transitioning to wake word mode
-            if new_state == STATE_LISTENING_FOR_WAKEWORD and openai_client_instance:
-                openai_client_instance._clear_audio_state()
-            elif new_state == STATE_SENDING_TO_OPENAI:
-                state_just_changed_to_sending = True
-def get_app_state_main(): # Unchanged
-    with state_lock: return current_app_state
-
-p = pyaudio.PyAudio()
-player_instance = None # PCMPlayer class and get_input_stream unchanged
+STATE_LISTENING_FOR_WAKEWORD = AppState.LISTENING_FOR_WAKEWORD
+STATE_SENDING_TO_OPENAI = AppState.SENDING_TO_OPENAI
+# Subscribers (client audio reset, audio process, session policy) are added as those are created in __main__
+app_state = AppStateMachine(STATE_LISTENING_FOR_WAKEWORD if wake_word_active else STATE_SENDING_TO_OPENAI,
+                            log_fn=lambda m, level="INFO": log(m, getattr(logging, level, logging.INFO)))
+log(f"State Management: Initial App State set to {app_state.state} (WW Active: {wake_word_active})")
+def set_app_state_main(new_state, reason=""):
+    return app_state.transition(new_state, reason)
+def get_app_state_main(): # Lock-free; safe to call per frame
+    return app_state.state
+
+def on_listening_clear_client_audio(old_state, new_state):
+    if new_state == STATE_LISTENING_FOR_WAKEWORD and openai_client_instance:
+        openai_client_instance._clear_audio_state()
+
+def load_wake_word_model():
+    """Loads the wake-word model off the main thread (verified from the local store) and records time from process start to ready."""
+    on_wake_word_load_result({"loaded": wake_word_detector_instance.load(), "load_ms": wake_word_detector_instance.load_ms,
+                              "ready_after_start_s": wake_word_detector_instance.ready_after_start_s,
+                              "model_type": wake_word_detector_instance.model_type})
+
+def on_wake_word_load_result(info):
+    """Load outcome from load_wake_word_model() or, in AUDIO_IO_PROCESS mode, from the audio process."""
+    global wake_word_active
+    if info["loaded"]:
+        ready_ms = info["ready_after_start_s"] * 1000.0
+        log(f"Wake word ready {ready_ms:.0f} ms after process start (model load {info['load_ms']:.0f} ms).")
+        record_startup_duration(STAGE_PROCESS_START_TO_WAKEWORD_READY, ready_ms, tag=info["model_type"])
+        return
+    log("Wake word model failed to load (see WakeWordDetector output). WW INACTIVE, streaming mic audio instead.", logging.CRITICAL)
+    wake_word_active = False
+    if openai_client_instance: openai_client_instance.wake_word_active = False
+    set_app_state_main(STATE_SENDING_TO_OPENAI, "wake word model unavailable")
+
+def on_audio_process_wake(keyword, action, score):
+    """Wake keyword detected in the audio process (AUDIO_IO_PROCESS mode); it pauses detection until the state comes back."""
+    log_section(f"WAKE WORD DETECTED: '{keyword.upper()}'!")
+    set_app_state_main(STATE_SENDING_TO_OPENAI, f"wake word '{keyword}' in the audio process")
+    log(f"*** Wake word detected (score {score:.2f})! Sending audio to OpenAI... ***", logging.INFO)
+
+p = None # PyAudio host, created in the "audio_host" startup phase (open_audio_host)
+player_instance = None # PCMPlayer lives in pcm_player.py (shared with device_context.py)
+audio_io_instance = None # AudioIOProcess when AUDIO_IO_PROCESS is on: mic, speaker and keyword detection in a child process
+session_policy = None # SessionPolicy: when the realtime session is open (SESSION_POLICY)
 # ... (same as before) ...
-class PCMPlayer:
-    def __init__(self, rate=OUTPUT_RATE, channels=CHANNELS, format_player=FORMAT, chunk_samples_player=OUTPUT_PLAYER_CHUNK_SAMPLES):
-        log(f"PCMPlayer Init: Rate={rate}, ChunkSamples={chunk_samples_player}")
-        self.stream = None
-        try:
-            self.stream = p.open(format=format_player, channels=channels, rate=rate, output=True, frames_per_buffer=chunk_samples_player)
-        except Exception as e_pyaudio: log(f"CRITICAL ERROR initializing PyAudio output stream: {e_pyaudio}"); raise
-        self.buffer = b""; self.chunk_bytes = chunk_samples_player * pyaudio.get_sample_size(format_player) * channels
-    def play(self, pcm_bytes):
-        if not self.stream: return
-        self.buffer += pcm_bytes
-        while len(self.buffer) >= self.chunk_bytes:
-            try: self.stream.write(self.buffer[:self.chunk_bytes]); self.buffer = self.buffer[self.chunk_bytes:]
-            except IOError as e: log(f"PCMPlayer IOError during write: {e}. Stream might be closed."); self.close(); break
-    def flush(self):
-        if not self.stream or not self.buffer: return
-        try: self.stream.write(self.buffer)
-        except IOError as e: log(f"PCMPlayer IOError during flush: {e}."); self.close()
-        finally: self.buffer = b""
-    def clear(self): self.buffer = b""; log("PCMPlayer: Buffer cleared for barge-in.")
-    def close(self):
-        if self.stream:
-            try:
-                if self.stream.is_active(): self.stream.stop_stream()
-                while not self.stream.is_stopped(): time.sleep(0.01)
-                self.stream.close()
-            except Exception as e_close: log(f"PCMPlayer error during close: {e_close}")
-            finally: self.stream = None; log("PCMPlayer stream closed by main_app.")
+def open_audio_host():
+    """Startup phase: PortAudio init enumerates every device, which takes a noticeable while on some hosts."""
+    global p
+    p = pyaudio.PyAudio()
+    return p
+
+def create_player():
+    """Startup phase (after audio_host): the speaker stream."""
+    return PCMPlayer(p, rate=OUTPUT_RATE, channels=CHANNELS, format_player=FORMAT, chunk_samples_player=OUTPUT_PLAYER_CHUNK_SAMPLES,
+                     log_fn=lambda m, level="INFO": log(m, getattr(logging, level, logging.INFO)))
+
+def wait_for_realtime_connection(client, timeout_s=30.0):
+    """Startup phase: returns once the realtime socket is up (run_client connects on its own thread)."""
+    deadline = time.monotonic() + timeout_s
+    while not client.connected:
+        if time.monotonic() > deadline: raise TimeoutError(f"Realtime socket not connected after {timeout_s:.0f} s")
+        time.sleep(0.02)
+    return True
+
+def report_startup_when_done(phases):
+    """Logs and records the phase timings once every phase (including the realtime connect) has finished."""
+    phases.wait_all()
+    phases.report()
+    phases.shutdown()
+
 def get_input_stream():
     try: return p.open(format=FORMAT, channels=CHANNELS, rate=INPUT_RATE, input=True, frames_per_buffer=INPUT_CHUNK_SAMPLES)
     except Exception as e: log(f"CRITICAL ERROR PyAudio input stream: {e}", logging.CRITICAL); return None
 
-def is_speech_detected_by_webrtc_vad(audio_chunk_16khz_pcm16_bytes): # Unchanged
-    # ... (same as before) ...
-    global vad_instance
-    if not WEBRTC_VAD_AVAILABLE or not vad_instance or not audio_chunk_16khz_pcm16_bytes: return False
-    try:
-        if len(audio_chunk_16khz_pcm16_bytes) == VAD_BYTES_PER_FRAME:
-            return vad_instance.is_speech(audio_chunk_16khz_pcm16_bytes, VAD_SAMPLE_RATE)
-        return False
-    except Exception as e_vad: log(f"VAD error: {e_vad}", logging.WARNING); return False
-
-def continuous_audio_pipeline(openai_client_ref): # Unchanged
+def continuous_audio_pipeline(openai_client_ref, mic_stream=None): # mic_stream: opened by the "audio_input" startup phase
     # ... (same extensive logic as before) ...
-    global state_just_changed_to_sending; mic_stream = get_input_stream()
+    if mic_stream is None: mic_stream = audio_io_instance.mic_stream() if audio_io_instance else get_input_stream()
     if not mic_stream: log("CRITICAL: Mic stream failed. Pipeline cannot start.", logging.CRITICAL); return
     # ... (rest of the function as provided in the previous step, including VAD, WW, sending to OpenAI)
     # Ensure the while loop correctly checks openai_client_ref.keep_outer_loop_running
     log("Mic stream opened. Audio pipeline started.")
-    local_vad_speech_frames_count = 0; local_vad_silence_frames_after_speech = 0
-    local_interrupt_cooldown_frames_remaining = 0
+    # Local barge-in: the same VAD and frame counters barge_in_simulator.py replays recordings through
+    barge_in_vad, barge_in = create_barge_in(APP_CONFIG, frame_ms=CHUNK_MS, input_rate=INPUT_RATE,
+                                             log_fn=lambda m, level="INFO": log(f"LOCAL_VAD: {m}", getattr(logging, level, logging.INFO)))
     wf_raw = None; wf_processed = None
+    # Endpointing: ends the user's turn in client_vad mode, timestamps the real end of speech in both modes
+    endpointer = LocalEndpointer(frame_ms=CHUNK_MS, input_rate=INPUT_RATE, vad_mode=APP_CONFIG["CLIENT_VAD_MODE"],
+                                 min_speech_ms=APP_CONFIG["CLIENT_VAD_MIN_SPEECH_MS"], hangover_ms=APP_CONFIG["CLIENT_VAD_HANGOVER_MS"],
+                                 log_fn=lambda m, level="INFO": log(f"LOCAL_VAD: {m}"))
+    if APP_CONFIG["TURN_DETECTION_MODE"] == "client_vad" and not endpointer.available:
+        log("TURN_DETECTION_MODE=client_vad but webrtcvad is unavailable. Turns will never be committed.", logging.CRITICAL)
+    # Uplink gating: silence outside lead/trail windows around speech is not sent; the client reports the savings per session
+    uplink_gate = UplinkGate(frame_ms=CHUNK_MS, lead_ms=APP_CONFIG["UPLINK_LEAD_MS"], trail_ms=APP_CONFIG["UPLINK_TRAIL_MS"],
+                             enabled=APP_CONFIG["UPLINK_GATING_ENABLED"] and endpointer.available)
+    openai_client_ref.uplink_gate = uplink_gate
     
     # Audio sending counter
     audio_send_counter = 0
+    # Conversation entries already answered with response.create; a wake word entering SENDING bumps the machine's count
+    response_created_for_entry = app_state.entry_count(STATE_SENDING_TO_OPENAI)
     try:
-        wf_raw = wave.open("mic_capture_raw.wav", 'wb'); wf_raw.setnchannels(CHANNELS); wf_raw.setsampwidth(p.get_sample_size(FORMAT)); wf_raw.setframerate(INPUT_RATE)
-        wf_processed = wave.open("mic_capture_processed.wav", 'wb'); wf_processed.setnchannels(CHANNELS); wf_processed.setsampwidth(p.get_sample_size(FORMAT)); wf_processed.setframerate(INPUT_RATE)
+        wf_raw = wave.open("mic_capture_raw.wav", 'wb'); wf_raw.setnchannels(CHANNELS); wf_raw.setsampwidth(pyaudio.get_sample_size(FORMAT)); wf_raw.setframerate(INPUT_RATE)
+        wf_processed = wave.open("mic_capture_processed.wav", 'wb'); wf_processed.setnchannels(CHANNELS); wf_processed.setsampwidth(pyaudio.get_sample_size(FORMAT)); wf_processed.setframerate(INPUT_RATE)
     except Exception as e_wav_open: log(f"ERROR opening WAV files: {e_wav_open}", logging.ERROR); wf_raw=None; wf_processed=None
 
     try:
         while True:
-            if not openai_client_ref.connected:
-                time.sleep(0.2)
-                if not (hasattr(openai_client_ref, 'keep_outer_loop_running') and openai_client_ref.keep_outer_loop_running):
-                    log("OpenAI client's main loop seems stopped. Exiting audio pipeline.", logging.INFO); break
-                continue
+            if not openai_client_ref.keep_outer_loop_running:
+                log("OpenAI client's main loop seems stopped. Exiting audio pipeline.", logging.INFO); break
+            if not openai_client_ref.connected and not session_policy.lazy: # Lazy policies listen for the wake word disconnected
+                time.sleep(0.2); continue
             
-            # Get current state at beginning of loop iteration
-            current_pipeline_app_state_iter = get_app_state_main()
+            # Get current state at beginning of loop iteration (lock-free read)
+            current_pipeline_app_state_iter = app_state.state
             
             # --- Mic Read and VAD/WW/OpenAI Send Logic (as before) ---
             raw_audio_bytes_24k = b''
@@ -264,44 +245,19 @@ def continuous_audio_pipeline(openai_client_ref): # Unchanged
             if wf_processed: wf_processed.writeframes(raw_audio_bytes_24k) # Assuming raw for processed for now
 
             # --- Local VAD for Barge-in ---
-            if local_interrupt_cooldown_frames_remaining > 0:
-                local_interrupt_cooldown_frames_remaining -=1
-            elif LOCAL_VAD_ENABLED and WEBRTC_VAD_AVAILABLE and SCIPY_AVAILABLE and \
-                 current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI and openai_client_ref.is_assistant_speaking() and \
-                 openai_client_ref.get_current_assistant_speech_duration_ms() > LOCAL_VAD_ACTIVATION_THRESHOLD_MS:
-                try:
-                    audio_np_24k = np.frombuffer(raw_audio_bytes_24k, dtype=np.int16)
-                    num_samples_16k = int(len(audio_np_24k) * VAD_SAMPLE_RATE / INPUT_RATE)
-                    if num_samples_16k > 0:
-                        audio_np_16k_float = signal.resample(audio_np_24k.astype(np.float32), num_samples_16k)
-                        audio_np_16k_scaled = (audio_np_16k_float.astype(np.int16) * 0.20).astype(np.int16)  # VAD_VOLUME_REDUCTION_FACTOR = 0.20
-                        vad_chunk = audio_np_16k_scaled.tobytes()
-                        # Ensure vad_chunk is exactly VAD_BYTES_PER_FRAME
-                        if len(vad_chunk) > VAD_BYTES_PER_FRAME: vad_chunk = vad_chunk[:VAD_BYTES_PER_FRAME]
-                        elif len(vad_chunk) < VAD_BYTES_PER_FRAME and len(vad_chunk) > 0 : vad_chunk += b'\x00' * (VAD_BYTES_PER_FRAME - len(vad_chunk))
-                        
-                        if len(vad_chunk) == VAD_BYTES_PER_FRAME and is_speech_detected_by_webrtc_vad(vad_chunk):
-                            local_vad_speech_frames_count += 1
-                            local_vad_silence_frames_after_speech = 0
-                            log(f"LOCAL_VAD: Speech detected - Frame count: {local_vad_speech_frames_count}/{MIN_SPEECH_FRAMES_FOR_LOCAL_INTERRUPT}", logging.DEBUG)
-                            if local_vad_speech_frames_count >= MIN_SPEECH_FRAMES_FOR_LOCAL_INTERRUPT:
-                                log(f"LOCAL_VAD: User speech INTERRUPT detected.", logging.DEBUG)
-                                openai_client_ref.handle_local_user_speech_interrupt()
-                                local_interrupt_cooldown_frames_remaining = LOCAL_INTERRUPT_COOLDOWN_FRAMES
-                                local_vad_speech_frames_count = 0
-                        elif local_vad_speech_frames_count > 0: # Speech was detected, now silence
-                            local_vad_silence_frames_after_speech += 1
-                            log(f"LOCAL_VAD: Silence after speech - Count: {local_vad_silence_frames_after_speech}/{MIN_SILENCE_FRAMES_TO_RESET_LOCAL_VAD_STATE}", logging.DEBUG)
-                            if local_vad_silence_frames_after_speech >= MIN_SILENCE_FRAMES_TO_RESET_LOCAL_VAD_STATE:
-                                log("LOCAL_VAD: Reset due to silence threshold reached", logging.DEBUG)
-                                local_vad_speech_frames_count = 0
-                                local_vad_silence_frames_after_speech = 0
-                except Exception as e_vad_proc: log(f"Error in local VAD processing: {e_vad_proc}", logging.WARNING)
-            else: # Reset if not in VAD check conditions
-                local_vad_speech_frames_count = 0; local_vad_silence_frames_after_speech = 0
-
-            # --- Wake Word Detection ---
-            if current_pipeline_app_state_iter == STATE_LISTENING_FOR_WAKEWORD and wake_word_active:
+            barge_in_armed = LOCAL_VAD_ENABLED and barge_in_vad.available and current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI and \
+                             openai_client_ref.is_assistant_speaking() and \
+                             openai_client_ref.get_current_assistant_speech_duration_ms() > APP_CONFIG["BARGE_IN_ACTIVATION_MS"]
+            try:
+                barge_in_voiced = barge_in_armed and not barge_in.cooling_down and barge_in_vad.is_speech(raw_audio_bytes_24k)
+                if barge_in.update(barge_in_voiced, barge_in_armed):
+                    log(f"LOCAL_VAD: User speech INTERRUPT detected.", logging.DEBUG)
+                    openai_client_ref.handle_local_user_speech_interrupt()
+            except Exception as e_vad_proc: log(f"Error in local VAD processing: {e_vad_proc}", logging.WARNING)
+
+            # --- Wake Word Detection (and command keywords such as "stop" during a conversation) ---
+            if wake_word_active and not audio_io_instance and (current_pipeline_app_state_iter == STATE_LISTENING_FOR_WAKEWORD or
+                                     (current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI and command_keywords_active)):
                 audio_for_ww = b''
                 if SCIPY_AVAILABLE:
                     try:
@@ -314,35 +270,52 @@ def continuous_audio_pipeline(openai_client_ref): # Unchanged
                 elif INPUT_RATE == WAKE_WORD_PROCESS_RATE: # No resampling needed if rates match
                     audio_for_ww = raw_audio_bytes_24k
                 
-                if audio_for_ww and wake_word_detector_instance.process_audio(audio_for_ww):
-                    log_section(f"WAKE WORD DETECTED: '{wake_word_detector_instance.wake_word_model_name.upper()}'!")
-                    set_app_state_main(STATE_SENDING_TO_OPENAI)
+                if current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI:
+                    if audio_for_ww: wake_word_detector_instance.process_keywords(audio_for_ww, actions=COMMAND_ACTIONS) # Callbacks route to the client
+                elif audio_for_ww and wake_word_detector_instance.process_audio(audio_for_ww):
+                    log_section(f"WAKE WORD DETECTED: '{wake_word_detector_instance.last_detected_keyword.upper()}'!")
+                    set_app_state_main(STATE_SENDING_TO_OPENAI, f"wake word '{wake_word_detector_instance.last_detected_keyword}'")
                     if hasattr(wake_word_detector_instance, 'reset'): wake_word_detector_instance.reset()
                     log("*** Wake word detected! Sending audio to OpenAI... ***", logging.INFO)
 
+            # One VAD decision per frame in a conversation, shared by the uplink gate and the endpointer
+            frame_voiced = False
+            if current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI and endpointer.available:
+                frame_voiced = endpointer.is_speech(raw_audio_bytes_24k)
+
             if current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI and raw_audio_bytes_24k:
-                if openai_client_ref.connected: # Send only if connected
-                    # Increment counter and log periodically
-                    audio_send_counter += 1
-                    if audio_send_counter % 75 == 0:  # Log every 75th message
-                        log(f"🎤 AUDIO: Sent {audio_send_counter} chunks to OpenAI", logging.INFO)
-                        
-                    audio_b64_str = base64.b64encode(raw_audio_bytes_24k).decode('utf-8')
-                    audio_msg_to_send = {"type": "input_audio_buffer.append", "audio": audio_b64_str}
+                # Mid-turn (per the endpointer) the gate stays open, so a client_vad commit covers the whole turn
+                frames_to_send = uplink_gate.process(raw_audio_bytes_24k, frame_voiced or endpointer.in_speech)
+                if not session_policy.ready_for_audio(): session_policy.hold(frames_to_send) # Lazy policy still connecting: sent once primed
+                else: # Connected (always_on) or primed (lazy policies)
+                    frames_to_send = session_policy.take_held() + frames_to_send
                     try:
                         if hasattr(openai_client_ref.ws_app, 'send'):
-                            openai_client_ref.ws_app.send(json.dumps(audio_msg_to_send))
-                            if state_just_changed_to_sending:
+                            for frame_to_send in frames_to_send:
+                                # Increment counter and log periodically
+                                audio_send_counter += 1
+                                if audio_send_counter % 75 == 0:  # Log every 75th message
+                                    log(f"🎤 AUDIO: Sent {audio_send_counter} chunks to OpenAI", logging.INFO)
+                                audio_b64_str = base64.b64encode(frame_to_send).decode('utf-8')
+                                openai_client_ref.send_event({"type": "input_audio_buffer.append", "audio": audio_b64_str})
+                            sending_entry = app_state.entry_count(STATE_SENDING_TO_OPENAI)
+                            if sending_entry != response_created_for_entry: # Once per wake, even if another one lands meanwhile
+                                response_created_for_entry = sending_entry
                                 # Log initial response create message
                                 log("🎙️ CONVERSATION: Initiating new assistant response", logging.INFO)
-                                # Directly use the string without any get() calls
-                                voice_to_use = "ash"  # Hardcoded for now to bypass any potential issues
                                 response_create_payload = {"type": "response.create", "response": {"modalities": ["text", "audio"], "voice": APP_CONFIG.get("OPENAI_VOICE", "ash"), "output_audio_format": "pcm16"}}
-                                openai_client_ref.ws_app.send(json.dumps(response_create_payload))
-                                state_just_changed_to_sending = False
+                                openai_client_ref.send_event(response_create_payload)
                     except Exception as e_send_ws:
                         log(f"❌ ERROR: Failed to send audio: {e_send_ws}", logging.WARNING)
                         # Let client's run_client handle major disconnects
+            else: uplink_gate.reset() # Held-back pre-roll belongs to this conversation only
+
+            # --- Local endpointing (after the append, so a commit covers this frame) ---
+            if endpointer.available and current_pipeline_app_state_iter == STATE_SENDING_TO_OPENAI and not openai_client_ref.is_assistant_speaking():
+                endpoint_event = endpointer.update(frame_voiced)
+                if endpoint_event == EVENT_SPEECH_STARTED: openai_client_ref.on_local_speech_started()
+                elif endpoint_event == EVENT_SPEECH_STOPPED: openai_client_ref.on_local_speech_stopped(endpointer.last_speech_end_perf)
+            else: endpointer.reset() # Assistant audio (echo) or not in a conversation; barge-in is handled above
             # ... rest of VAD/WW logic ...
 
     except KeyboardInterrupt: log("KeyboardInterrupt in audio pipeline.", logging.INFO)
@@ -485,18 +458,33 @@ if __name__ == "__main__":
     log_section("APPLICATION STARTING")
     if not OPENAI_API_KEY or not OPENAI_REALTIME_MODEL_ID: log("CRITICAL: OpenAI API Key/Model ID missing. Exiting.", logging.CRITICAL); exit(1)
 
-    if CONV_DB_AVAILABLE: # DB Init unchanged
+    # Independent startup steps run concurrently; `python startup_report.py phases` shows their recorded durations
+    startup_phases = StartupPhases(log_fn=lambda m, level="INFO": log(f"STARTUP: {m}", getattr(logging, level, logging.INFO)))
+    if APP_CONFIG["AUDIO_IO_PROCESS"]: # Mic, speaker and keyword detection (and its model load) in their own process
+        audio_io_instance = AudioIOProcess(input_rate=INPUT_RATE, output_rate=OUTPUT_RATE, chunk_ms=CHUNK_MS, wake_word=wake_word_active,
+                                           initial_state=str(app_state.state), ring_s=APP_CONFIG["AUDIO_IO_RING_S"],
+                                           wake_score_threshold=APP_CONFIG["SESSION_PRE_THRESHOLD"] if APP_CONFIG["SESSION_POLICY"] == POLICY_SPECULATIVE else None,
+                                           log_fn=lambda m, level="INFO": log(f"AUDIO_IO: {m}", getattr(logging, level, logging.INFO)))
+        audio_io_instance.add_callback("wake_word_loaded", on_wake_word_load_result)
+        audio_io_instance.add_callback("wake", on_audio_process_wake)
+        app_state.subscribe(lambda old_state, new_state: audio_io_instance.set_state(str(new_state))) # Keyword detection runs there
+        startup_phases.start("audio_process", audio_io_instance.start)
+    else:
+        if wake_word_active: startup_phases.start("wake_word_model", load_wake_word_model) # Checksum + ONNX sessions
+        startup_phases.start("audio_host", open_audio_host)
+        startup_phases.start("audio_output", create_player, after=("audio_host",))
+        startup_phases.start("audio_input", get_input_stream, after=("audio_host",))
+
+    if CONV_DB_AVAILABLE:
         log("Initializing conversation history database...")
-        init_conversation_history_db()
+        startup_phases.start("conversation_db", init_conversation_history_db)
     else: log("Conversation history database module not available.", logging.WARNING)
 
-    try: player_instance = PCMPlayer()
-    except Exception as e_player_init: log(f"CRITICAL: PCMPlayer init failed: {e_player_init}. Exiting.", logging.CRITICAL); p and p.terminate(); exit(1)
-
-    log(f"Initial App State: {current_app_state} (WW Active: {wake_word_active})")
+    log(f"Initial App State: {app_state.state} (WW Active: {wake_word_active})")
     log(f"OpenAI Model: {OPENAI_REALTIME_MODEL_ID}")
     log(f"Audio Rates: MicIn={INPUT_RATE}Hz, PlayerOut={OUTPUT_RATE}Hz, WWProcess={WAKE_WORD_PROCESS_RATE}Hz")
-    log(f"Local VAD (WebRTC) Enabled: {LOCAL_VAD_ENABLED and WEBRTC_VAD_AVAILABLE and SCIPY_AVAILABLE}")
+    log(f"Local VAD (WebRTC) Enabled: {LOCAL_VAD_ENABLED and WEBRTC_VAD_AVAILABLE} (barge-in mode {APP_CONFIG['BARGE_IN_VAD_MODE']}, "
+        f"gain {APP_CONFIG['BARGE_IN_VAD_GAIN']}, {APP_CONFIG['BARGE_IN_MIN_SPEECH_FRAMES']} frames)")
     if wake_word_active and wake_word_detector_instance: log(f"WW ACTIVE: Model='{wake_word_detector_instance.wake_word_model_name}'.")
     else: log("WW INACTIVE or model/resampling issue.", logging.WARNING)
     log(f"Display API URL: {APP_CONFIG.get('FASTAPI_DISPLAY_API_URL', 'Not Set')}")
@@ -504,13 +492,34 @@ if __name__ == "__main__":
     log(f"Notify Call Update URL: {APP_CONFIG.get('FASTAPI_NOTIFY_CALL_UPDATE_URL', 'Not Set')}")
     log(f"TSM Playback Speed: {APP_CONFIG.get('TSM_PLAYBACK_SPEED', '1.0')} (1.0 = TSM disabled, direct play)")
 
-    ws_full_url = f"wss://api.openai.com/v1/realtime?model={OPENAI_REALTIME_MODEL_ID}"
+    # OPENAI_REALTIME_WS_URL points the client elsewhere, e.g. ws://localhost:8765/v1/realtime for mock_realtime_server.py
+    ws_full_url = APP_CONFIG.get("OPENAI_REALTIME_WS_URL") or f"wss://api.openai.com/v1/realtime?model={OPENAI_REALTIME_MODEL_ID}"
     auth_headers = ["Authorization: Bearer " + OPENAI_API_KEY, "OpenAI-Beta: realtime=v1"]
     # Make sure OPENAI_VOICE is a string, not a complex object
     APP_CONFIG["OPENAI_VOICE"] = APP_CONFIG.get("OPENAI_VOICE", "ash")
     # Match exactly the format in working openai_client.py
     client_config = {**APP_CONFIG, "CHUNK_MS": CHUNK_MS, "USE_ULAW_FOR_OPENAI_INPUT": False }
 
+    # The socket may deliver audio as soon as it opens, and on_open reads the conversation DB (summary, call
+    # updates): the player and the DB are ready before the client exists. The wake-word model keeps loading meanwhile.
+    mic_stream_instance = None
+    try:
+        if audio_io_instance:
+            if not startup_phases.result("audio_process"): raise RuntimeError("audio process failed to start")
+            player_instance = audio_io_instance.player # RingPlayer: same interface, plays in the audio process
+        else:
+            player_instance = startup_phases.result("audio_output")
+            mic_stream_instance = startup_phases.result("audio_input") # None: the pipeline retries and logs the error
+    except Exception as e_audio_init:
+        log(f"CRITICAL: Audio init failed: {e_audio_init}. Exiting.", logging.CRITICAL)
+        startup_phases.wait_all(timeout=5)
+        if audio_io_instance: audio_io_instance.close()
+        if p: p.terminate()
+        exit(1)
+    if CONV_DB_AVAILABLE:
+        try: startup_phases.result("conversation_db")
+        except Exception as e_db_init: log(f"ERROR: Conversation history DB init failed: {e_db_init}", logging.ERROR)
+
     try:
         openai_client_instance = OpenAISpeechClient(
             ws_url_param=ws_full_url, headers_param=auth_headers, main_log_fn=log,
@@ -520,14 +529,39 @@ if __name__ == "__main__":
         )
     except Exception as e_client_init:
         log(f"CRITICAL ERROR: OpenAISpeechClient init failed: {e_client_init}. Exiting.", logging.CRITICAL, exc_info=True)
-        if player_instance: player_instance.close();
-        if p: p.terminate(); exit(1)
+        startup_phases.wait_all()
+        if audio_io_instance: audio_io_instance.close()
+        if p: p.terminate()
+        exit(1)
+    app_state.subscribe(on_listening_clear_client_audio)
+
+    # always_on connects now; on_demand / speculative connect on the wake word (score). `python session_policy.py report` compares them
+    session_policy = SessionPolicy(openai_client_instance, APP_CONFIG["SESSION_POLICY"] if wake_word_active else POLICY_ALWAYS_ON,
+                                   get_app_state_main, pre_threshold=APP_CONFIG["SESSION_PRE_THRESHOLD"],
+                                   speculative_timeout_s=APP_CONFIG["SESSION_SPECULATIVE_TIMEOUT_S"],
+                                   release_after_s=APP_CONFIG["SESSION_RELEASE_AFTER_S"], hold_max_s=APP_CONFIG["SESSION_HOLD_MAX_S"],
+                                   frame_ms=CHUNK_MS, log_fn=lambda m, level="INFO": log(f"SESSION: {m}", getattr(logging, level, logging.INFO)))
+    session_policy.start()
+    app_state.subscribe(lambda old_state, new_state: session_policy.on_state(new_state))
+    if audio_io_instance: audio_io_instance.add_callback("wake_score", session_policy.on_wake_score)
+    elif wake_word_active: wake_word_detector_instance.add_score_callback(session_policy.on_scores)
 
     ws_client_thread = threading.Thread(target=openai_client_instance.run_client, daemon=True)
     ws_client_thread.start()
     log("OpenAI client thread started.")
+    if not session_policy.lazy: startup_phases.start("realtime_connect", wait_for_realtime_connection, openai_client_instance)
+
+    threading.Thread(target=report_startup_when_done, args=(startup_phases,), name="startup-report", daemon=True).start()
 
-    audio_pipeline_thread = threading.Thread(target=continuous_audio_pipeline, args=(openai_client_instance,), daemon=True)
+    for command_action in (COMMAND_ACTIONS if command_keywords_active else ()):
+        if audio_io_instance: audio_io_instance.add_callback(command_action, lambda keyword, action, score: openai_client_instance.on_keyword_command(keyword, action))
+        else: wake_word_detector_instance.add_callback(command_action, lambda keyword, score, action=command_action: openai_client_instance.on_keyword_command(keyword, action))
+
+    # kill -USR1 <pid> (or `python handler_profiler.py <pid>`) logs the handler profile; it is also logged at shutdown
+    if openai_client_instance.handler_profiler and hasattr(os_signal, "SIGUSR1"):
+        os_signal.signal(os_signal.SIGUSR1, lambda signum, frame: openai_client_instance.handler_profiler.dump(reason="SIGUSR1"))
+
+    audio_pipeline_thread = threading.Thread(target=continuous_audio_pipeline, args=(openai_client_instance, mic_stream_instance), daemon=True)
     audio_pipeline_thread.start()
     log("Audio pipeline thread started.")
 
@@ -558,6 +592,7 @@ if __name__ == "__main__":
         db_monitor_shutdown_event.set()
         # --- End of Phase 4 DB Monitor Thread Shutdown Signal ---
 
+        if session_policy: session_policy.close()
         if openai_client_instance and hasattr(openai_client_instance, 'close_connection'):
             log("Calling client's close_connection method...", logging.INFO)
             openai_client_instance.close_connection()
@@ -579,6 +614,9 @@ if __name__ == "__main__":
             if db_monitor_th.is_alive(): log("WARN: DB monitor thread did not join cleanly.", logging.WARNING)
         # --- End of Phase 4 DB Monitor Thread Join ---
 
+        close_shared_writer() # The writer thread is a daemon: run the queued DB writes before exiting
+
         if player_instance: player_instance.close()
+        if audio_io_instance: audio_io_instance.close()
         if p: p.terminate()
         log_section("APPLICATION FULLY ENDED")
\ No newline at end of file
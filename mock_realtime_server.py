@@ -0,0 +1,476 @@
+# mock_realtime_server.py
+# Local stand-in for the OpenAI Realtime API, for load and soak testing the client.
+#
+#   python mock_realtime_server.py --port 8765 --scenario default --latency-ms 300 --jitter-ms 150
+#
+# Point the assistant at it with OPENAI_REALTIME_WS_URL=ws://localhost:8765/v1/realtime
+# (OPENAI_API_KEY / OPENAI_REALTIME_MODEL_ID can be any placeholder value).
+#
+# Implements the subset of the protocol the client uses: session.created/update/updated,
+# input_audio_buffer.append/commit/clear with an energy-based server VAD, response.create/cancel,
+# audio and transcript deltas, function calls, conversation.item.create/truncate/delete,
+# and response.done with usage. Responses come from a scenario: a built-in name or a JSON file.
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+MOCK_SAMPLE_RATE = 24000
+
+# A scenario is a list of scripted responses, served in order (and looped if "loop" is true).
+# Each response either speaks ("text" + "audio_ms") or makes one or more "function_calls".
+BUILTIN_SCENARIOS = {
+    "default": {
+        "loop": True,
+        "responses": [
+            {"text": "Hello! How can I help you today?", "audio_ms": 1800},
+            {"text": "Sure, here is a short answer to that question.", "audio_ms": 2500},
+            {"function_calls": [{"name": "end_conversation_and_listen_for_wakeword", "arguments": {"reason": "User's query resolved"}}]},
+        ],
+    },
+    # Several calls in one response, to exercise parallel tool handling.
+    "tool_storm": {
+        "loop": True,
+        "responses": [
+            {"function_calls": [
+                {"name": "general_google_search", "arguments": {"search_query": "Dubai traffic today"}},
+                {"name": "get_dtc_knowledge_base_info", "arguments": {"query_topic": "fleet size"}},
+                {"name": "check_scheduled_call_status", "arguments": {}},
+            ]},
+            {"text": "I looked up all three things for you. Here is the summary.", "audio_ms": 3000},
+        ],
+    },
+    # Long answers so the client has time to barge in (local VAD or server VAD).
+    "barge_in": {
+        "loop": True,
+        "responses": [
+            {"text": "This is a deliberately long answer that keeps talking so you can interrupt it at any point.", "audio_ms": 12000},
+        ],
+    },
+    # Drops the socket periodically to soak-test the reconnect loop.
+    "reconnect": {
+        "loop": True,
+        "disconnect_after_s": 20,
+        "responses": [
+            {"text": "Connected. Talk to me until the server drops you.", "audio_ms": 2000},
+        ],
+    },
+}
+
+
+def _mock_log(message, level="INFO"):
+    print(f"[{level}] [MOCK_REALTIME] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:20]}"
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class MockServerOptions:
+    def __init__(self, scenario: dict, latency_ms: float = 250.0, jitter_ms: float = 100.0,
+                 audio_chunk_ms: int = 50, realtime_factor: float = 1.0,
+                 vad_rms_threshold: float = 500.0):
+        self.scenario = scenario
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.audio_chunk_ms = audio_chunk_ms
+        self.realtime_factor = realtime_factor # >1 streams audio faster than real time
+        self.vad_rms_threshold = vad_rms_threshold
+
+
+class MockServerStats:
+    def __init__(self):
+        self.connections = 0
+        self.responses = 0
+        self.cancelled = 0
+        self.truncations = 0
+        self.function_calls = 0
+        self.audio_in_bytes = 0
+        self.audio_out_bytes = 0
+        self.seen_prefix_hashes = set() # For simulated prompt caching across sessions
+
+    def summary(self) -> str:
+        return (f"connections={self.connections} responses={self.responses} cancelled={self.cancelled} "
+                f"truncations={self.truncations} function_calls={self.function_calls} "
+                f"audio_in={self.audio_in_bytes}B audio_out={self.audio_out_bytes}B")
+
+
+class MockRealtimeSession:
+    """State of one client connection."""
+
+    def __init__(self, websocket: WebSocket, options: MockServerOptions, stats: MockServerStats):
+        self.ws = websocket
+        self.options = options
+        self.stats = stats
+        self.session_id = _new_id("sess")
+        self.session = {
+            "id": self.session_id, "object": "realtime.session", "model": "mock-realtime",
+            "voice": "ash", "instructions": "", "tools": [],
+            "input_audio_format": "pcm16", "output_audio_format": "pcm16",
+            "turn_detection": {"type": "server_vad", "threshold": 0.5, "prefix_padding_ms": 300,
+                               "silence_duration_ms": 500, "create_response": True, "interrupt_response": True},
+            "expires_at": int(time.time()) + 1800,
+        }
+        self.send_lock = asyncio.Lock()
+        self.conversation_items = [] # ordered item dicts
+        self.scenario_index = 0
+        self.current_response_task: Optional[asyncio.Task] = None
+        self.current_response_id = None
+        self.current_audio_item_id = None
+        self.truncated_item_ids = set()
+        # Server VAD state
+        self.input_ms_total = 0
+        self.speech_active = False
+        self.speech_start_ms = 0
+        self.silence_ms = 0
+        self.user_item_counter = 0
+        self.cached_prefix_tokens = 0
+
+    # --- Helpers ---
+    async def send(self, event: dict):
+        event.setdefault("event_id", _new_id("event"))
+        async with self.send_lock:
+            await self.ws.send_text(json.dumps(event))
+
+    async def simulated_latency(self):
+        delay_ms = self.options.latency_ms + random.uniform(-self.options.jitter_ms, self.options.jitter_ms)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000.0)
+
+    def _conversation_tokens(self) -> int:
+        tokens = _estimate_tokens(self.session.get("instructions") or "") + _estimate_tokens(json.dumps(self.session.get("tools") or []))
+        for item in self.conversation_items:
+            tokens += item.get("_tokens", 0)
+        return tokens
+
+    def _update_prefix_cache(self):
+        """Prompt caching only pays off if instructions + tools are byte-identical to a previous session."""
+        prefix = (self.session.get("instructions") or "") + json.dumps(self.session.get("tools") or [], sort_keys=False)
+        prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        prefix_tokens = _estimate_tokens(prefix)
+        self.cached_prefix_tokens = (prefix_tokens // 64) * 64 if prefix_hash in self.stats.seen_prefix_hashes else 0
+        self.stats.seen_prefix_hashes.add(prefix_hash)
+
+    def _next_scripted_response(self) -> dict:
+        responses = self.options.scenario.get("responses") or [{"text": "OK.", "audio_ms": 800}]
+        if self.scenario_index >= len(responses):
+            if not self.options.scenario.get("loop", True):
+                return {"text": "The scripted scenario has ended.", "audio_ms": 1000}
+            self.scenario_index = 0
+        scripted = responses[self.scenario_index]
+        self.scenario_index += 1
+        return scripted
+
+    # --- Connection lifecycle ---
+    async def run(self):
+        self.stats.connections += 1
+        await self.send({"type": "session.created", "session": self.session})
+        disconnect_after_s = self.options.scenario.get("disconnect_after_s")
+        disconnect_task = asyncio.create_task(self._disconnect_later(disconnect_after_s)) if disconnect_after_s else None
+        try:
+            while True:
+                raw = await self.ws.receive_text()
+                try:
+                    event = json.loads(raw)
+                except json.JSONDecodeError:
+                    await self.send({"type": "error", "error": {"type": "invalid_request_error", "code": "invalid_json", "message": "Invalid JSON."}})
+                    continue
+                await self.handle_client_event(event)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if disconnect_task:
+                disconnect_task.cancel()
+            if self.current_response_task and not self.current_response_task.done():
+                self.current_response_task.cancel()
+
+    async def _disconnect_later(self, after_s: float):
+        await asyncio.sleep(after_s)
+        _mock_log(f"Scenario disconnect: closing {self.session_id} after {after_s}s.")
+        try:
+            await self.ws.close(code=1011)
+        except Exception:
+            pass
+
+    # --- Client events ---
+    async def handle_client_event(self, event: dict):
+        event_type = event.get("type")
+        if event_type == "session.update":
+            self.session.update({k: v for k, v in event.get("session", {}).items() if v is not None or k == "turn_detection"})
+            self._update_prefix_cache()
+            await self.send({"type": "session.updated", "session": self.session})
+        elif event_type == "input_audio_buffer.append":
+            await self._handle_audio_append(event.get("audio", ""))
+        elif event_type == "input_audio_buffer.commit":
+            await self._commit_user_audio()
+        elif event_type == "input_audio_buffer.clear":
+            self.speech_active = False
+            await self.send({"type": "input_audio_buffer.cleared"})
+        elif event_type == "response.create":
+            if self.current_response_task and not self.current_response_task.done():
+                await self.send({"type": "error", "error": {"type": "invalid_request_error", "code": "conversation_already_has_active_response",
+                                                            "message": f"Conversation already has an active response: {self.current_response_id}"}})
+            else:
+                await self._start_response()
+        elif event_type == "response.cancel":
+            await self._cancel_current_response()
+        elif event_type == "conversation.item.create":
+            item = dict(event.get("item", {}))
+            item.setdefault("id", _new_id("item"))
+            item["_tokens"] = _estimate_tokens(json.dumps(item))
+            self._insert_item(item, event.get("previous_item_id"))
+            await self.send({"type": "conversation.item.created", "previous_item_id": event.get("previous_item_id"),
+                             "item": {k: v for k, v in item.items() if not k.startswith("_")}})
+        elif event_type == "conversation.item.truncate":
+            item_id = event.get("item_id")
+            self.truncated_item_ids.add(item_id)
+            self.stats.truncations += 1
+            await self.send({"type": "conversation.item.truncated", "item_id": item_id,
+                             "content_index": event.get("content_index", 0), "audio_end_ms": event.get("audio_end_ms", 0)})
+        elif event_type == "conversation.item.delete":
+            item_id = event.get("item_id")
+            before = len(self.conversation_items)
+            self.conversation_items = [i for i in self.conversation_items if i.get("id") != item_id]
+            if len(self.conversation_items) == before:
+                await self.send({"type": "error", "error": {"type": "invalid_request_error", "code": "item_not_found", "message": f"Item {item_id} not found."}})
+            else:
+                await self.send({"type": "conversation.item.deleted", "item_id": item_id})
+        else:
+            await self.send({"type": "error", "error": {"type": "invalid_request_error", "code": "unknown_event",
+                                                        "message": f"Mock server does not implement '{event_type}'."}})
+
+    def _insert_item(self, item: dict, previous_item_id: Optional[str]):
+        if previous_item_id == "root":
+            self.conversation_items.insert(0, item)
+            return
+        if previous_item_id:
+            for index, existing in enumerate(self.conversation_items):
+                if existing.get("id") == previous_item_id:
+                    self.conversation_items.insert(index + 1, item)
+                    return
+        self.conversation_items.append(item)
+
+    async def _handle_audio_append(self, audio_b64: str):
+        try:
+            pcm = base64.b64decode(audio_b64)
+        except Exception:
+            return
+        self.stats.audio_in_bytes += len(pcm)
+        samples = np.frombuffer(pcm[: len(pcm) - (len(pcm) % 2)], dtype=np.int16)
+        if samples.size == 0:
+            return
+        chunk_ms = int(samples.size * 1000 / MOCK_SAMPLE_RATE)
+        self.input_ms_total += chunk_ms
+        turn_detection = self.session.get("turn_detection")
+        if not turn_detection:
+            return # Client-side turn detection: wait for an explicit commit
+        rms = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+        if rms >= self.options.vad_rms_threshold:
+            self.silence_ms = 0
+            if not self.speech_active:
+                self.speech_active = True
+                self.speech_start_ms = self.input_ms_total
+                self.user_item_counter += 1
+                await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": self.speech_start_ms,
+                                 "item_id": f"item_user_{self.user_item_counter}"})
+                if turn_detection.get("interrupt_response", True):
+                    await self._cancel_current_response()
+        elif self.speech_active:
+            self.silence_ms += chunk_ms
+            if self.silence_ms >= turn_detection.get("silence_duration_ms", 500):
+                self.speech_active = False
+                await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": self.input_ms_total,
+                                 "item_id": f"item_user_{self.user_item_counter}"})
+                await self._commit_user_audio()
+                if turn_detection.get("create_response", True):
+                    await self._start_response()
+
+    async def _commit_user_audio(self):
+        item_id = f"item_user_{self.user_item_counter}" if self.user_item_counter else _new_id("item")
+        previous_id = self.conversation_items[-1]["id"] if self.conversation_items else None
+        transcript = f"(mock transcript {self.user_item_counter})"
+        item = {"id": item_id, "object": "realtime.item", "type": "message", "role": "user", "status": "completed",
+                "content": [{"type": "input_audio", "transcript": None}], "_tokens": 50}
+        self.conversation_items.append(item)
+        await self.send({"type": "input_audio_buffer.committed", "previous_item_id": previous_id, "item_id": item_id})
+        await self.send({"type": "conversation.item.created", "previous_item_id": previous_id,
+                         "item": {k: v for k, v in item.items() if not k.startswith("_")}})
+        await self.send({"type": "conversation.item.input_audio_transcription.completed", "item_id": item_id,
+                         "content_index": 0, "transcript": transcript})
+
+    async def _cancel_current_response(self):
+        if self.current_response_task and not self.current_response_task.done():
+            self.current_response_task.cancel()
+            try:
+                await self.current_response_task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _start_response(self):
+        await self._cancel_current_response()
+        self.current_response_task = asyncio.create_task(self._run_response(self._next_scripted_response()))
+
+    # --- Response generation ---
+    async def _run_response(self, scripted: dict):
+        response_id = _new_id("resp")
+        self.current_response_id = response_id
+        output_items = []
+        status = "completed"
+        input_tokens = self._conversation_tokens()
+        output_tokens = 0
+        try:
+            await self.simulated_latency()
+            self.stats.responses += 1
+            await self.send({"type": "response.created", "response": {"id": response_id, "object": "realtime.response",
+                                                                      "status": "in_progress", "output": []}})
+            if scripted.get("function_calls"):
+                for output_index, call in enumerate(scripted["function_calls"]):
+                    item = await self._emit_function_call(response_id, output_index, call)
+                    output_items.append(item)
+                    output_tokens += item.get("_tokens", 0)
+            else:
+                item = await self._emit_audio_message(response_id, scripted)
+                output_items.append(item)
+                output_tokens += item.get("_tokens", 0)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            self.stats.cancelled += 1
+        finally:
+            self.current_audio_item_id = None
+            cached = min(self.cached_prefix_tokens, input_tokens)
+            usage = {
+                "total_tokens": input_tokens + output_tokens, "input_tokens": input_tokens, "output_tokens": output_tokens,
+                "input_token_details": {"cached_tokens": cached, "text_tokens": input_tokens // 2, "audio_tokens": input_tokens - input_tokens // 2,
+                                        "cached_tokens_details": {"text_tokens": cached, "audio_tokens": 0}},
+                "output_token_details": {"text_tokens": output_tokens // 4, "audio_tokens": output_tokens - output_tokens // 4},
+            }
+            done_event = {"type": "response.done", "response": {
+                "id": response_id, "object": "realtime.response", "status": status,
+                "output": [{k: v for k, v in i.items() if not k.startswith("_")} for i in output_items], "usage": usage}}
+            try:
+                await asyncio.shield(self.send(done_event))
+            except Exception:
+                pass
+
+    async def _emit_function_call(self, response_id: str, output_index: int, call: dict) -> dict:
+        item_id = _new_id("item")
+        call_id = _new_id("call")
+        arguments = json.dumps(call.get("arguments", {}))
+        item = {"id": item_id, "object": "realtime.item", "type": "function_call", "status": "in_progress",
+                "name": call["name"], "call_id": call_id, "arguments": "", "_tokens": _estimate_tokens(arguments) + 10}
+        self.conversation_items.append(item)
+        await self.send({"type": "response.output_item.added", "response_id": response_id, "output_index": output_index,
+                         "item": {k: v for k, v in item.items() if not k.startswith("_")}})
+        await self.send({"type": "conversation.item.created", "item": {k: v for k, v in item.items() if not k.startswith("_")}})
+        await self.send({"type": "response.function_call_arguments.delta", "response_id": response_id, "item_id": item_id,
+                         "output_index": output_index, "call_id": call_id, "delta": arguments})
+        await self.send({"type": "response.function_call_arguments.done", "response_id": response_id, "item_id": item_id,
+                         "output_index": output_index, "call_id": call_id, "name": call["name"], "arguments": arguments})
+        item["status"], item["arguments"] = "completed", arguments
+        await self.send({"type": "response.output_item.done", "response_id": response_id, "output_index": output_index,
+                         "item": {k: v for k, v in item.items() if not k.startswith("_")}})
+        self.stats.function_calls += 1
+        return item
+
+    async def _emit_audio_message(self, response_id: str, scripted: dict) -> dict:
+        item_id = _new_id("item")
+        text = scripted.get("text", "")
+        audio_ms = int(scripted.get("audio_ms", 1000))
+        item = {"id": item_id, "object": "realtime.item", "type": "message", "role": "assistant", "status": "in_progress",
+                "content": [], "_tokens": _estimate_tokens(text) + audio_ms // 50}
+        self.conversation_items.append(item)
+        self.current_audio_item_id = item_id
+        public_item = {k: v for k, v in item.items() if not k.startswith("_")}
+        await self.send({"type": "response.output_item.added", "response_id": response_id, "output_index": 0, "item": public_item})
+        await self.send({"type": "conversation.item.created", "item": public_item})
+
+        chunk_ms = self.options.audio_chunk_ms
+        samples_per_chunk = MOCK_SAMPLE_RATE * chunk_ms // 1000
+        words = text.split()
+        sent_ms = 0
+        chunk_index = 0
+        while sent_ms < audio_ms and item_id not in self.truncated_item_ids:
+            t = (np.arange(samples_per_chunk) + chunk_index * samples_per_chunk) / MOCK_SAMPLE_RATE
+            tone = (0.15 * 32767 * np.sin(2 * np.pi * 220.0 * t)).astype(np.int16).tobytes()
+            self.stats.audio_out_bytes += len(tone)
+            await self.send({"type": "response.audio.delta", "response_id": response_id, "item_id": item_id,
+                             "output_index": 0, "content_index": 0, "delta": base64.b64encode(tone).decode("ascii")})
+            if words and chunk_index < len(words):
+                await self.send({"type": "response.audio_transcript.delta", "response_id": response_id, "item_id": item_id,
+                                 "output_index": 0, "content_index": 0, "delta": words[chunk_index] + " "})
+            sent_ms += chunk_ms
+            chunk_index += 1
+            await asyncio.sleep(chunk_ms / 1000.0 / max(self.options.realtime_factor, 0.01))
+
+        await self.send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id, "output_index": 0, "content_index": 0})
+        await self.send({"type": "response.audio_transcript.done", "response_id": response_id, "item_id": item_id,
+                         "output_index": 0, "content_index": 0, "transcript": text})
+        item["status"] = "completed"
+        item["content"] = [{"type": "audio", "transcript": text}]
+        await self.send({"type": "response.output_item.done", "response_id": response_id, "output_index": 0,
+                         "item": {k: v for k, v in item.items() if not k.startswith("_")}})
+        return item
+
+
+def create_mock_app(options: MockServerOptions) -> FastAPI:
+    app = FastAPI()
+    stats = MockServerStats()
+    app.state.mock_stats = stats
+
+    @app.websocket("/v1/realtime")
+    async def realtime_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        session = MockRealtimeSession(websocket, options, stats)
+        _mock_log(f"Client connected: {websocket.client} -> {session.session_id}")
+        try:
+            await session.run()
+        except Exception as e:
+            _mock_log(f"Session {session.session_id} ended with error: {e}", "WARN")
+        _mock_log(f"Client disconnected: {session.session_id}. Totals: {stats.summary()}")
+
+    @app.get("/stats")
+    async def stats_endpoint():
+        return {"summary": stats.summary(), "connections": stats.connections, "responses": stats.responses,
+                "cancelled": stats.cancelled, "truncations": stats.truncations, "function_calls": stats.function_calls}
+
+    return app
+
+
+def load_scenario(name_or_path: str) -> dict:
+    if name_or_path in BUILTIN_SCENARIOS:
+        return BUILTIN_SCENARIOS[name_or_path]
+    with open(name_or_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Local mock of the OpenAI Realtime API for load and soak testing.")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--scenario", default="default", help=f"Built-in scenario ({', '.join(BUILTIN_SCENARIOS)}) or path to a JSON file.")
+    arg_parser.add_argument("--latency-ms", type=float, default=250.0, help="Mean delay before each response starts.")
+    arg_parser.add_argument("--jitter-ms", type=float, default=100.0, help="Uniform +/- jitter added to the latency.")
+    arg_parser.add_argument("--audio-chunk-ms", type=int, default=50, help="Duration of audio per response.audio.delta.")
+    arg_parser.add_argument("--realtime-factor", type=float, default=1.0, help="Stream audio this many times faster than real time.")
+    arg_parser.add_argument("--vad-rms-threshold", type=float, default=500.0, help="RMS level that counts as speech for the mock server VAD.")
+    cli_args = arg_parser.parse_args()
+
+    mock_options = MockServerOptions(scenario=load_scenario(cli_args.scenario), latency_ms=cli_args.latency_ms,
+                                     jitter_ms=cli_args.jitter_ms, audio_chunk_ms=cli_args.audio_chunk_ms,
+                                     realtime_factor=cli_args.realtime_factor, vad_rms_threshold=cli_args.vad_rms_threshold)
+    _mock_log(f"Starting mock Realtime API on ws://{cli_args.host}:{cli_args.port}/v1/realtime (scenario: {cli_args.scenario})")
+    uvicorn.run(create_mock_app(mock_options), host=cli_args.host, port=cli_args.port, log_level="warning")
@@ -3,30 +3,42 @@ import json
 import base64
 import time
 import threading
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from pytsmod import wsola
 import websocket
-import openai # For synchronous LLM call in on_open
 from datetime import datetime as dt, timezone # Alias for datetime, import timezone
 import os # For path joining
 import requests # For Phase 4 frontend notifications
 from typing import Optional # <<<<<<<<<<<<<<<<<<<<<<<<<<<< ADD THIS IMPORT (or add Optional to an existing typing import)
 # Imports from our other new modules
-from tools_definition import ALL_TOOLS, END_CONVERSATION_TOOL_NAME
+from tools_definition import ALL_TOOLS, END_CONVERSATION_TOOL_NAME, TOOL_LATENCY_CLASSES, TOOL_LATENCY_FAST, TOOL_LATENCY_MEDIUM, TOOL_LATENCY_SLOW, DEFERRED_TOOL_NAMES
 # tool_definition imports (assuming all necessary names are included in ALL_TOOLS)
 from tool_executor import TOOL_HANDLERS # Assuming this is kept up-to-date
-from llm_prompt_config import INSTRUCTIONS as LLM_DEFAULT_INSTRUCTIONS
+from llm_prompt_config import INSTRUCTIONS as LLM_DEFAULT_INSTRUCTIONS, build_session_context
 
 # --- Phase 2 & 3 Imports ---
 from conversation_history_db import add_turn as log_conversation_turn
 from conversation_history_db import get_recent_turns
+from conversation_history_db import add_response_usage, usage_row_from_response
 import sqlite3
+from latency_metrics import TurnLatencyTracker, STAGE_END_CONV_TO_WAKEWORD_READY, STAGE_TOOL_BATCH_TO_RESPONSE_CREATE
+from session_recorder import SessionRecorder
+from app_state_machine import AppState
+from filler_audio import FillerAudioCache
+from db_writer import get_shared_writer
+from handler_profiler import HandlerProfiler
+import deferred_tool_tasks
+from conversation_pruner import ConversationPruner
+import uuid
 
 # --- Constants for Phase 3 ---
 CONTEXT_HISTORY_LIMIT = 30  # Increased for better context retention
 BASE_DIR_CLIENT = os.path.dirname(os.path.abspath(__file__))
 SCHEDULED_CALLS_DB_PATH = os.path.join(BASE_DIR_CLIENT, "scheduled_calls.db")
 CONTEXT_SUMMARIZER_MODEL = os.getenv("CONTEXT_SUMMARIZER_MODEL", "gpt-4o-mini") # Use env var or fallback
+DEFERRED_SPOKEN = "spoken" # _deferred_session_items state of a result a completed response included
 
 
 class OpenAISpeechClient:
@@ -34,7 +46,10 @@ class OpenAISpeechClient:
                  app_state_setter, app_state_getter,
                  input_rate_hz, output_rate_hz,
                  is_ww_active, ww_detector_instance_ref,
-                 app_config_dict):
+                 app_config_dict, tool_pool=None, http_session=None, sync_openai_client=None, filler_cache=None,
+                 deferred_pool=None):
+        # tool_pool / deferred_pool / http_session / sync_openai_client / filler_cache: pass shared instances when several
+        # clients live in one process (device_context.py); by default each client creates its own.
         self.ws_url = ws_url_param
         self.headers = headers_param
         self.log = main_log_fn
@@ -55,37 +70,113 @@ class OpenAISpeechClient:
         self.current_assistant_item_played_ms = 0
         self.client_audio_chunk_duration_ms = self.config.get("CHUNK_MS", 30)
         self.client_initiated_truncated_item_ids = set()
+        # User transcription deltas buffered per item_id until the .completed event arrives
+        self.pending_user_transcripts = {}
         
         # Audio logging counters
         self.audio_received_counter = 0
         self.audio_sent_counter = 0
+        self._first_play_armed_item = None # Item whose first playback the player will report (see _arm_first_play)
 
         self.use_ulaw_for_openai = self.config.get("USE_ULAW_FOR_OPENAI_INPUT", False)
         self.desired_playback_speed = float(self.config.get("TSM_PLAYBACK_SPEED", 1.0))
         self.tsm_enabled = self.desired_playback_speed != 1.0
         self.openai_sample_rate = 24000
         self.tsm_channels = 1
-        if self.tsm_enabled: self.log(f"TSM enabled. Speed: {self.desired_playback_speed}")
+        self._wsola = None
+        if self.tsm_enabled:
+            from pytsmod import wsola # Only with TSM on: pytsmod pulls in scipy.interpolate (~0.6 s of import)
+            self._wsola = wsola
+            self.log(f"TSM enabled. Speed: {self.desired_playback_speed}")
         self.NUM_CHUNKS_FOR_TSM_WINDOW = int(self.config.get("TSM_WINDOW_CHUNKS", 8))
         self.BYTES_PER_OPENAI_CHUNK = (self.openai_sample_rate * self.client_audio_chunk_duration_ms // 1000) * (16 // 8) * self.tsm_channels
         self.TSM_PROCESSING_THRESHOLD_BYTES = self.BYTES_PER_OPENAI_CHUNK * self.NUM_CHUNKS_FOR_TSM_WINDOW
         self.openai_audio_buffer_raw_bytes = b''
 
+        # Per-turn latency spans (speech end -> first audio, tool dispatch -> output sent, ...)
+        self.latency = TurnLatencyTracker(session_id_getter=lambda: self.session_id, log_fn=self.log,
+                                          enabled=self.config.get("LATENCY_METRICS_ENABLED", True))
+
+        # End-of-conversation is a state-machine step driven by the player's drain signal plus a delay,
+        # so the receive thread never sleeps. END_CONV_MODE=blocking keeps the old poll+sleep path for comparison.
+        self.end_conv_mode = str(self.config.get("END_CONV_MODE", "event")).lower()
+        self.end_conv_delay_s = float(self.config.get("END_CONV_AUDIO_FINISH_DELAY_S", 2.0))
+        self.end_conv_drain_timeout_s = float(self.config.get("END_CONV_DRAIN_TIMEOUT_S", 5.0))
+        self.pending_end_conversation = None
+        self._end_conv_lock = threading.Lock()
+        self.assistant_audio_streaming = False # True between the first audio.delta and audio.done
+
+        # Opt-in record of every inbound/outbound realtime event (see session_recorder.py / session_replay.py)
+        self.recording_dir = self.config.get("SESSION_RECORDING_DIR")
+        self.recorder = None
+        self.tool_handlers = TOOL_HANDLERS # Replaced by session_replay.py with recorded outputs
+        # Function calls are grouped by the response that emitted them. Calls run concurrently on the pool,
+        # each output is sent as soon as it is ready, and one response.create goes out per batch.
+        self._owns_tool_pool = tool_pool is None
+        self.tool_pool = tool_pool or ThreadPoolExecutor(max_workers=int(self.config.get("TOOL_POOL_WORKERS", 4)), thread_name_prefix="tool")
+        self.http = http_session or requests # Frontend notifications; a shared requests.Session keeps connections alive
+        self.tool_batch_deadline_s = float(self.config.get("TOOL_BATCH_DEADLINE_S", 10.0))
+        self.tool_batches = {} # response_id -> {"calls": {call_id: name}, "done_calls": set, "response_done", "response_created", "started_at", "timer"}
+        self._tool_batch_lock = threading.RLock()
+        # Deferred tools answer at once with a task id; the real result is injected later (or next session)
+        self.deferred_tools_enabled = bool(self.config.get("DEFERRED_TOOLS_ENABLED", True))
+        # Owner of this client's history turns and deferred results (one per device on the multi-device host)
+        self.device_name = self.config.get("DEVICE_NAME") or None
+        # Deferred tools are the slow ones; their own pool keeps them from queueing tool batches and bookkeeping on tool_pool
+        self._owns_deferred_pool = deferred_pool is None
+        self.deferred_pool = deferred_pool or ThreadPoolExecutor(max_workers=int(self.config.get("DEFERRED_POOL_WORKERS", 4)), thread_name_prefix="deferred")
+        self.active_response_id = None
+        self.followup_response_pending = False # response.create owed after the active response (late tool outputs, deferred results)
+        # Deferred results injected into this session: task_id -> None (not in a response yet), the response_id
+        # that will speak it, or DEFERRED_SPOKEN. Marked delivered in the DB only once a response spoke them.
+        self._deferred_session_items = {}
+        self._deferred_lock = threading.Lock()
+        if self.deferred_tools_enabled:
+            deferred_tool_tasks.init_deferred_tasks_table() # Task rows are written synchronously (never dropped), so the table must exist first
+        # Mirror of the server-side conversation; old items get replaced by a summary past the token budget
+        self.conversation_pruning_enabled = bool(self.config.get("CONVERSATION_PRUNING_ENABLED", True))
+        self.conversation_pruner = ConversationPruner(token_budget=int(self.config.get("CONVERSATION_TOKEN_BUDGET", 12000)),
+                                                      keep_recent_items=int(self.config.get("CONVERSATION_KEEP_RECENT_ITEMS", 8)),
+                                                      log_fn=self.log)
+        self.response_index = 0 # Responses so far in this session
+        self.session_usage = {} # Summed response_usage columns for this session, logged on close
+        self.session_context_item_id = None # System item with the date / summary / call updates, sent after session.update
+        self.instructions_chars = None # Length of the instructions sent in the last session.update
+        self.usage_tag = self.config.get("USAGE_TAG") or None
+        # "server_vad" (server decides when the user is done) or "client_vad" (local_vad.LocalEndpointer in main.py does)
+        self.turn_detection_mode = str(self.config.get("TURN_DETECTION_MODE", "server_vad")).lower()
+        self._response_timing = {} # response_id -> {"created": perf, "first_audio": perf | None}
+        self.uplink_gate = None # local_vad.UplinkGate, attached by main.py's audio pipeline; reported per session in on_close
+        # Per-event-type handler timings and a stall watchdog for the receive thread (see handler_profiler.py)
+        self.handler_profiler = None
+        if self.config.get("HANDLER_PROFILING_ENABLED", True):
+            self.handler_profiler = HandlerProfiler(stall_threshold_ms=float(self.config.get("HANDLER_STALL_THRESHOLD_MS", 100)), log_fn=self.log)
+            self.handler_profiler.start_watchdog()
+
         self.keep_outer_loop_running = True
+        # run_client connects only while session_wanted is set (always, unless a session_policy.SessionPolicy
+        # opens the socket lazily); session_ready is set once session.update and the context item are sent
+        self.session_wanted = threading.Event()
+        self.session_wanted.set()
+        self.session_ready = threading.Event()
+        self.session_policy = None # session_policy.SessionPolicy, attached by main.py; told when the session is ready / first audio plays
         self.RECONNECT_DELAY_SECONDS = self.config.get("OPENAI_RECONNECT_DELAY_S", 5)
         
-        # Ensure OPENAI_API_KEY is available for the sync client
-        openai_api_key_for_sync = self.config.get("OPENAI_API_KEY")
-        if not openai_api_key_for_sync:
+        # Ensure OPENAI_API_KEY is available for the sync client (created on first use, see sync_openai_client)
+        self._sync_openai_client = sync_openai_client
+        self._sync_client_api_key = self.config.get("OPENAI_API_KEY")
+        self._sync_client_lock = threading.Lock()
+        if sync_openai_client is None and not self._sync_client_api_key:
             self.log("CRITICAL_ERROR: OPENAI_API_KEY not found in config for sync_openai_client. Context summarizer will fail.")
-            self.sync_openai_client = None
-        else:
-            try:
-                self.sync_openai_client = openai.OpenAI(api_key=openai_api_key_for_sync)
-                self.log("Synchronous OpenAI client for context summarizer initialized.")
-            except Exception as e_sync_client:
-                self.log(f"CRITICAL_ERROR: Failed to initialize synchronous OpenAI client: {e_sync_client}. Context summarizer will fail.")
-                self.sync_openai_client = None
+
+        # Filler speech: a cached local clip played when a tool batch runs past FILLER_THRESHOLD_S
+        self.filler_threshold_s = float(self.config.get("FILLER_THRESHOLD_S", 1.0))
+        self.filler_cache = filler_cache
+        if self.filler_cache is None and self.config.get("FILLER_AUDIO_ENABLED", True):
+            self.filler_cache = FillerAudioCache(voice=self.config.get("OPENAI_VOICE", "ash"), output_rate_hz=output_rate_hz, log_fn=self.log)
+            threading.Thread(target=lambda: self.filler_cache.warm(self.sync_openai_client), name="filler-warm", daemon=True).start()
+        self._filler_stop = None # Event of the filler being queued; set (and the player cleared) by the first real audio delta
+        self._filler_lock = threading.Lock()
             # --- Phase 4: UI Notification URL ---
         # Ensure this key exists in your .env or APP_CONFIG in main.py
         self.ui_status_update_url = self.config.get("FASTAPI_UI_STATUS_UPDATE_URL") 
@@ -95,13 +186,54 @@ class OpenAISpeechClient:
         
 
 
+
+    @property
+    def sync_openai_client(self):
+        """Synchronous SDK client (summaries, fillers, announcements), built on first use so the
+        openai import (~1 s) stays off the startup path; the filler warm-up thread usually builds it."""
+        if self._sync_openai_client is None and self._sync_client_api_key:
+            with self._sync_client_lock:
+                if self._sync_openai_client is None and self._sync_client_api_key:
+                    try:
+                        import openai
+                        self._sync_openai_client = openai.OpenAI(api_key=self._sync_client_api_key)
+                        self.log("Synchronous OpenAI client for context summarizer initialized.")
+                    except Exception as e_sync_client:
+                        self.log(f"CRITICAL_ERROR: Failed to initialize synchronous OpenAI client: {e_sync_client}. Context summarizer will fail.")
+                        self._sync_client_api_key = None # Don't retry on every call
+        return self._sync_openai_client
+
     def _log_section(self, title):
         self.log(f"\n===== [Client] {title} =====")
 
+    def send_event(self, event: dict):
+        """Serialize and send one realtime event. Raises like ws.send() if the socket is unusable."""
+        if self.recorder:
+            self.recorder.record("out", event)
+        self.ws_app.send(json.dumps(event))
+
+    def _start_recording(self):
+        if not self.recording_dir:
+            return
+        self._stop_recording()
+        try:
+            self.recorder = SessionRecorder(self.recording_dir)
+            self.recorder.record("meta", {"type": "connection.open", "url": self.ws_url, "turn_detection_mode": self.turn_detection_mode})
+        except Exception as e_rec:
+            self.log(f"WARN: Could not start session recording in '{self.recording_dir}': {e_rec}")
+            self.recorder = None
+
+    def _stop_recording(self, reason: str = ""):
+        if self.recorder:
+            self.recorder.record("meta", {"type": "connection.close", "reason": reason})
+            self.recorder.close()
+            self.recorder = None
+
 
 
     def _clear_audio_state(self):
         """Clear all audio-related state and buffers."""
+        if self._filler_stop is not None: self._stop_filler()
         if self.player:
             self.player.clear()
             self.player.flush()
@@ -109,18 +241,34 @@ class OpenAISpeechClient:
         self.last_assistant_item_id = None
         self.current_assistant_item_played_ms = 0
         self.audio_received_counter = 0
+        self._first_play_armed_item = None
 
-    def _process_and_play_audio(self, audio_data_bytes: bytes):
+    def _arm_first_play(self, item_id: Optional[str]) -> bool:
+        """
+        Has the player mark the item's first playback when it writes the item's first chunk.
+        Returns False if the player cannot report that, in which case the caller marks it after play().
+        """
+        if not item_id or not self.player or not hasattr(self.player, "add_first_write_callback"):
+            return False
+        if item_id != self._first_play_armed_item:
+            self._first_play_armed_item = item_id
+            self.player.add_first_write_callback(lambda: self.latency.mark_first_play(item_id))
+        return True
+
+    def _process_and_play_audio(self, audio_data_bytes: bytes, item_id: Optional[str] = None):
         """
         Buffers incoming audio, applies TSM with pytsmod.wsola if enabled, and sends to player.
+        item_id is only used to mark the first playback of an assistant item for latency spans.
         """
         # Don't process audio if we're transitioning states
-        if self.get_app_state() == "LISTENING_FOR_WAKEWORD":
+        if self.get_app_state() == AppState.LISTENING_FOR_WAKEWORD:
             return
 
+        first_play_armed = self._arm_first_play(item_id)
         if not self.tsm_enabled:
             if self.player:
                 self.player.play(audio_data_bytes)
+                if not first_play_armed: self.latency.mark_first_play(item_id)
             return
 
         self.openai_audio_buffer_raw_bytes += audio_data_bytes
@@ -145,7 +293,7 @@ class OpenAISpeechClient:
                 # alpha: ratio by which the length of the signal is changed ( > 1 for speedup)
                 # Fs: sample rate
                 self.log(f"Blocking call start ")
-                stretched_audio_float32 = wsola(
+                stretched_audio_float32 = self._wsola(
                     x=segment_np_float32, 
                     s=self.desired_playback_speed 
                     #Fs=self.openai_sample_rate
@@ -160,11 +308,13 @@ class OpenAISpeechClient:
 
                 if self.player and len(stretched_audio_bytes) > 0:
                     self.player.play(stretched_audio_bytes)
+                    if not first_play_armed: self.latency.mark_first_play(item_id)
 
             except Exception as e_tsm_proc:
                 self.log(f"ERROR during TSM processing with pytsmod.wsola: {e_tsm_proc}. Playing segment directly.")
                 if self.player: 
                     self.player.play(segment_to_process_bytes) 
+                    if not first_play_armed: self.latency.mark_first_play(item_id)
 
 
     # --- Phase 4: Frontend Notification Methods and TTS Announcement ---
@@ -175,7 +325,7 @@ class OpenAISpeechClient:
             return
         try:
             # Adding a small timeout to prevent blocking indefinitely
-            response = requests.post(self.ui_status_update_url, json=payload, timeout=2)
+            response = self.http.post(self.ui_status_update_url, json=payload, timeout=2)
             if response.status_code == 200:
                 self.log(f"Successfully notified frontend: Type '{payload.get('type')}', Status '{payload.get('status', {}).get('connection')}'")
             else:
@@ -304,16 +454,20 @@ class OpenAISpeechClient:
         finally:
             if conn: conn.close()
 
+    def _log_turn(self, session_id, role, content, **kwargs):
+        log_conversation_turn(session_id, role, content, device=self.device_name, **kwargs)
+
     def _get_conversation_summary(self, session_id_for_history: Optional[str]) -> str:
         if not self.sync_openai_client:
             self.log("WARN: Synchronous OpenAI client not available for conversation summarization.")
             return "Previous conversation context is unavailable at the moment.\n"
 
 
-        self.log(f"Fetching recent turns for summary. Target session_id: {session_id_for_history if session_id_for_history else 'Any (Global)'}")
-        recent_turns = get_recent_turns(session_id=session_id_for_history, limit=CONTEXT_HISTORY_LIMIT)
+        history_scope = session_id_for_history or (f"device '{self.device_name}'" if self.device_name else "Any (Global)")
+        self.log(f"Fetching recent turns for summary. Target: {history_scope}")
+        recent_turns = get_recent_turns(session_id=session_id_for_history, limit=CONTEXT_HISTORY_LIMIT, device=self.device_name)
         if not recent_turns:
-            self.log(f"No recent conversation turns found to summarize (Target session: {session_id_for_history if session_id_for_history else 'Any (Global)'}).")
+            self.log(f"No recent conversation turns found to summarize (Target: {history_scope}).")
             return ""
 
         formatted_history = []
@@ -390,7 +544,6 @@ class OpenAISpeechClient:
                 self.log("Summarizer: No specific context to resume from history.")
                 return ""
             self.log(f"Summarizer LLM response: {summary}")
-            print( f"Summarizer LLM response: {summary}")
             return f"Recent conversation summary: {summary}\n"
         except Exception as e:
             self.log(f"ERROR summarizing conversation history with LLM: {e}")
@@ -399,10 +552,15 @@ class OpenAISpeechClient:
 
 
     def on_open(self, ws):
+        if not self.session_wanted.is_set(): # Released (e.g. a speculative connect timed out) while the handshake was in flight
+            self.log("Client: Session was released while connecting. Closing.")
+            ws.close()
+            return
         self._log_section("WebSocket OPEN")
         self.log("Client: Connected to OpenAI Realtime API.")
         self.connected = True
         self.current_assistant_text_response = ""
+        self._start_recording()
 
         # --- Phase 4: self.notify_frontend_connect() would be called here ---
             # --- Phase 4: Notify frontend of connection ---
@@ -420,38 +578,44 @@ class OpenAISpeechClient:
         if call_updates_text:
             primed_context_parts.append(call_updates_text)
             
-        effective_instructions = LLM_DEFAULT_INSTRUCTIONS
-        if primed_context_parts:
-            full_primed_context = "\n".join(primed_context_parts)
+        # Instructions stay byte-identical between sessions (prompt cache); date, summary and call updates go in a system item after them
+        full_primed_context = "\n".join(primed_context_parts)
+        if full_primed_context:
             self.log(f"Priming LLM with context:\n{full_primed_context}")
-            effective_instructions += "\n\n---\nIMPORTANT CONTEXT FROM PREVIOUS INTERACTIONS (Use this to inform your responses):\n" + full_primed_context + "\n--- END OF PREVIOUS CONTEXT ---"
-            self.log(f" Effective instruciton: \n{ effective_instructions}")
         else:
             self.log("No additional context (history summary or call updates) to prime LLM with.")
+        self.session_context_item_id = f"ctx_{uuid.uuid4().hex[:12]}"
+        context_item = {"type": "conversation.item.create", "item": {"id": self.session_context_item_id, "type": "message", "role": "system",
+                        "content": [{"type": "input_text", "text": build_session_context(full_primed_context)}]}}
 
         input_format_to_use = "g711_ulaw" if self.use_ulaw_for_openai else "pcm16"
         session_config = {
             "type": "session.update",
             "session": {
                 "voice": self.config.get("OPENAI_VOICE", "ash"),
-                "turn_detection": {"type": "server_vad", "interrupt_response": True},
+                "turn_detection": None if self.turn_detection_mode == "client_vad" else {"type": "server_vad", "interrupt_response": True},
                 "input_audio_format": input_format_to_use, "output_audio_format": "pcm16",
                 "tools": ALL_TOOLS, "tool_choice": "auto",
-                "instructions": effective_instructions,
+                "instructions": LLM_DEFAULT_INSTRUCTIONS,
                 "input_audio_transcription": {"model": "whisper-1"}
             }
         }
         try:
-            self.ws_app.send(json.dumps(session_config))
-            self.log(f"Client: Session config sent. Instructions length: {len(effective_instructions)} chars.")
+            self.send_event(session_config)
+            self.instructions_chars = len(LLM_DEFAULT_INSTRUCTIONS)
+            self.log(f"Client: Session config sent. Instructions length: {len(LLM_DEFAULT_INSTRUCTIONS)} chars.")
+            self.send_event(context_item)
+            self.log(f"Client: Session context item sent ({len(context_item['item']['content'][0]['text'])} chars).")
+            self.session_ready.set()
+            if self.session_policy: self.session_policy.on_session_ready()
             if informed_job_ids:
                 self._mark_call_updates_as_informed(informed_job_ids)
         except Exception as e_send_session:
-            self.log(f"ERROR sending session.update or marking updates: {e_send_session}")
+            self.log(f"ERROR sending session.update / context item or marking updates: {e_send_session}")
             # If this fails, the connection might be unstable already. Reconnect loop will handle.
 
 
-    def _execute_tool_in_thread(self, handler_function, parsed_args, call_id, config, function_name):
+    def _execute_tool_in_thread(self, handler_function, parsed_args, call_id, config, function_name, batch_key=None):
         self.log(f"Client (Thread - {function_name}): Starting execution for Call_ID {call_id}. Args: {parsed_args}")
         tool_output_for_llm = ""
         try:
@@ -461,7 +625,7 @@ class OpenAISpeechClient:
             # Log tool result to conversation history
             if self.session_id:
                 try:
-                    log_conversation_turn(
+                    self._log_turn(
                         self.session_id,
                         "tool_result",
                         json.dumps({
@@ -477,18 +641,360 @@ class OpenAISpeechClient:
             tool_output_for_llm = json.dumps({"error": error_detail})
             self.log(f"Client (Thread - {function_name}): Sending error back to LLM: {tool_output_for_llm}")
 
-        tool_response_payload = {"type": "conversation.item.create", "item": {"type": "function_call_output", "call_id": call_id, "output": tool_output_for_llm}}
-        if self.ws_app and self.connected:
+        self._complete_tool_call(batch_key, call_id, function_name, tool_output_for_llm)
+
+    # --- Tool call batches ---
+    def _response_create_payload(self) -> dict:
+        return {"type": "response.create", "response": {"modalities": ["text", "audio"], "voice": self.config.get("OPENAI_VOICE", "ash"), "output_audio_format": "pcm16"}}
+
+    def _register_tool_call(self, response_id, call_id, function_name):
+        """Adds a call to its response's batch. Calls without a response_id form a batch of one."""
+        batch_key = response_id or f"call:{call_id}"
+        with self._tool_batch_lock:
+            batch = self.tool_batches.get(batch_key)
+            if batch is None:
+                batch = {"calls": {}, "done_calls": set(), "response_done": response_id is None,
+                         "response_created": False, "deadline_hit": False, "started_at": time.perf_counter(),
+                         "timer": None, "filler_timer": None, "latency_class": TOOL_LATENCY_FAST}
+                batch["timer"] = threading.Timer(self.tool_batch_deadline_s, self._on_tool_batch_deadline, args=(batch_key,))
+                batch["timer"].daemon = True
+                batch["timer"].start()
+                self.tool_batches[batch_key] = batch
+            batch["calls"][call_id] = function_name
+            latency_class = TOOL_LATENCY_CLASSES.get(function_name, TOOL_LATENCY_MEDIUM)
+            if latency_class == TOOL_LATENCY_SLOW or batch["latency_class"] == TOOL_LATENCY_FAST:
+                batch["latency_class"] = latency_class
+            if self.filler_cache and latency_class != TOOL_LATENCY_FAST and batch["filler_timer"] is None:
+                batch["filler_timer"] = threading.Timer(self.filler_threshold_s, self._on_filler_due, args=(batch_key,))
+                batch["filler_timer"].daemon = True
+                batch["filler_timer"].start()
+        return batch_key
+
+    def _complete_tool_call(self, batch_key, call_id, function_name, output: str):
+        """Sends one function_call_output, then response.create if that completed the batch."""
+        if not (self.ws_app and self.connected):
+            self.log(f"Client (Thread - {function_name}) ERROR: WebSocket not available/connected. Cannot send tool output for Call_ID='{call_id}'.")
+        else:
+            tool_response_payload = {"type": "conversation.item.create", "item": {"type": "function_call_output", "call_id": call_id, "output": output}}
             try:
-                self.ws_app.send(json.dumps(tool_response_payload))
+                self.send_event(tool_response_payload)
+                self.latency.mark_tool_output_sent(call_id, function_name)
                 self.log(f"Client (Thread - {function_name}): Sent tool output for Call_ID='{call_id}'.")
-                response_create_payload = {"type": "response.create", "response": {"modalities": ["text", "audio"], "voice": self.config.get("OPENAI_VOICE", "ash"), "output_audio_format": "pcm16"}}
-                self.ws_app.send(json.dumps(response_create_payload))
-                self.log(f"Client (Thread - {function_name}): Sent 'response.create' to trigger assistant after tool output for Call_ID='{call_id}'.")
             except Exception as e_send_thread:
-                self.log(f"Client (Thread - {function_name}) ERROR: Could not send tool output or response.create for Call_ID='{call_id}': {e_send_thread}")
-        else:
-            self.log(f"Client (Thread - {function_name}) ERROR: WebSocket not available/connected. Cannot send tool output for Call_ID='{call_id}'.")
+                self.log(f"Client (Thread - {function_name}) ERROR: Could not send tool output for Call_ID='{call_id}': {e_send_thread}")
+        # Done even if the output could not be sent, so the batch still completes
+        with self._tool_batch_lock:
+            batch = self.tool_batches.get(batch_key)
+            if batch is not None:
+                batch["done_calls"].add(call_id)
+        if batch is None:
+            # Batch already closed by its deadline (or unknown); the output is in the conversation, the next response picks it up
+            self.log(f"Client: Late tool output for Call_ID='{call_id}' after its batch closed. Folding it into the next response.")
+            self._request_followup_response(f"late output {call_id}")
+            return
+        self._maybe_finish_tool_batch(batch_key)
+
+    def _maybe_finish_tool_batch(self, batch_key):
+        """
+        Batch is finished once its response is done and every call has an output, or, past the deadline,
+        at least one has. response.create is never sent while the function-call response is still active.
+        """
+        with self._tool_batch_lock:
+            batch = self.tool_batches.get(batch_key)
+            if batch is None or batch["response_created"] or not batch["response_done"]:
+                return
+            all_done = len(batch["done_calls"]) == len(batch["calls"])
+            if not (all_done or (batch["deadline_hit"] and batch["done_calls"])):
+                return
+            batch["response_created"] = True
+            for timer_key in ("timer", "filler_timer"):
+                if batch[timer_key]:
+                    batch[timer_key].cancel()
+            del self.tool_batches[batch_key]
+            # The batch's response also speaks anything that was waiting for a follow-up response
+            self.followup_response_pending = False
+        pending_calls = [cid for cid in batch["calls"] if cid not in batch["done_calls"]]
+        if pending_calls:
+            self.log(f"Client: Tool batch {batch_key} deadline reached with {len(pending_calls)} call(s) still running: {pending_calls}")
+        self._send_response_create(f"batch {batch_key} ({len(batch['done_calls'])}/{len(batch['calls'])} outputs)")
+        self.latency.record_span(STAGE_TOOL_BATCH_TO_RESPONSE_CREATE, batch["started_at"], item_id=batch_key,
+                                 tag=f"{len(batch['calls'])}_calls" + ("_deadline" if pending_calls else ""))
+
+    def _on_tool_batch_deadline(self, batch_key):
+        with self._tool_batch_lock:
+            batch = self.tool_batches.get(batch_key)
+            if batch is None:
+                return
+            batch["deadline_hit"] = True
+            if not batch["done_calls"]:
+                # Nothing to answer with yet; the first output to arrive closes the batch
+                self.log(f"Client: Tool batch {batch_key} deadline reached with no outputs yet. Waiting for the first one.")
+                return
+            if not batch["response_done"]:
+                # The function-call response is still active; its response.done closes the batch
+                self.log(f"Client: Tool batch {batch_key} deadline reached before its response.done. Closing it on response.done.")
+                return
+        self._maybe_finish_tool_batch(batch_key)
+
+    def _request_followup_response(self, context: str):
+        """
+        response.create for conversation items added outside a tool batch (late tool outputs, deferred results).
+        If a response is active or a batch will send one, the request is folded into that: it is sent after the
+        next response.done unless a batch's response.create covers it first.
+        """
+        with self._tool_batch_lock:
+            if self.active_response_id or self.tool_batches:
+                self.followup_response_pending = True
+                return
+        self._send_response_create(context)
+
+    def _on_response_done_for_tool_batch(self, response_id):
+        with self._tool_batch_lock:
+            batch = self.tool_batches.get(response_id)
+            if batch is None:
+                return
+            batch["response_done"] = True
+        self._maybe_finish_tool_batch(response_id)
+
+    # --- Deferred tools ---
+    def _start_deferred_tool(self, handler_function, parsed_args, call_id, function_name, response_id):
+        """Acknowledges the call right away and runs the handler in the background."""
+        task_id = deferred_tool_tasks.new_task_id()
+        batch_key = self._register_tool_call(response_id, call_id, function_name)
+        self.deferred_pool.submit(self._execute_deferred_tool, handler_function, parsed_args, task_id, function_name, call_id, self.session_id)
+        ack_output = json.dumps({"status": "accepted", "task_id": task_id,
+                                 "message": "Started in the background. The result will be provided in this conversation when it is ready; tell the user it is being handled."})
+        self.log(f"Client: Deferred tool '{function_name}' accepted as {task_id} (Call_ID='{call_id}').")
+        self._complete_tool_call(batch_key, call_id, function_name, ack_output)
+
+    def _execute_deferred_tool(self, handler_function, parsed_args, task_id, function_name, call_id, session_id):
+        # Task rows are written here, synchronously: the shared DB writer drops jobs when its queue is full
+        deferred_tool_tasks.create_task(task_id, session_id, call_id, function_name, parsed_args, owner=self.device_name)
+        failed = False
+        try:
+            result = str(handler_function(**parsed_args, config=self.config))
+        except Exception as e_deferred:
+            self.log(f"Client (Deferred - {function_name}) ERROR: {e_deferred}")
+            result, failed = json.dumps({"error": f"An error occurred while executing the tool '{function_name}': {str(e_deferred)}"}), True
+        self.log(f"Client (Deferred - {function_name}): {task_id} {'failed' if failed else 'finished'}. Result snippet: '{result[:150]}...'")
+        if self.session_id:
+            try:
+                self._log_turn(self.session_id, "tool_result", json.dumps({"name": function_name, "task_id": task_id, "result": result}))
+            except Exception as e:
+                self.log(f"ERROR: Failed to log deferred tool result to conversation history: {e}", logging.ERROR)
+        deferred_tool_tasks.complete_task(task_id, result, failed)
+        task = {"task_id": task_id, "tool_name": function_name, "status": deferred_tool_tasks.TASK_STATUS_FAILED if failed else deferred_tool_tasks.TASK_STATUS_DONE, "result": result}
+        if self._inject_deferred_results([task]):
+            if self.get_app_state() == AppState.SENDING_TO_OPENAI:
+                # Let the model speak the result now, unless a response is in flight (then after its response.done)
+                self._request_followup_response(f"deferred result {task_id}")
+            else:
+                self.log(f"Client: Deferred result {task_id} is in the conversation; the next response speaks it.")
+        elif not self.connected:
+            self.log(f"Client: Not connected. Deferred result {task_id} queued for the next session.")
+
+    def _inject_deferred_results(self, tasks) -> bool:
+        """
+        Adds each finished task to the live conversation as a system item. Returns False if not connected.
+        Each task is claimed for this session first, so no other session of this device injects it too.
+        The tasks stay undelivered in the DB until a response that includes them completes
+        (_on_response_done_for_deferred); a session closed before that releases them to the next one.
+        """
+        if not tasks or not (self.ws_app and self.connected):
+            return False
+        injected = 0
+        for task in tasks:
+            with self._deferred_lock:
+                if task["task_id"] in self._deferred_session_items:
+                    continue # Already in this session (finished while the session.created replay was reading the DB)
+                self._deferred_session_items[task["task_id"]] = None
+            if not deferred_tool_tasks.claim_task(task["task_id"], self.session_id):
+                self.log(f"Client: Deferred result {task['task_id']} is held by another session; not injected here.")
+                with self._deferred_lock:
+                    self._deferred_session_items.pop(task["task_id"], None)
+                continue
+            item_payload = {"type": "conversation.item.create", "item": {"type": "message", "role": "system",
+                            "content": [{"type": "input_text", "text": deferred_tool_tasks.format_result_for_session(task)}]}}
+            try:
+                self.send_event(item_payload)
+                injected += 1
+            except Exception as e_inject:
+                self.log(f"Client ERROR: Could not inject deferred result {task['task_id']}: {e_inject}")
+                with self._deferred_lock:
+                    self._deferred_session_items.pop(task["task_id"], None)
+        return injected > 0
+
+    def _deliver_queued_deferred_results(self, previous_session_id=None):
+        """On a new session: hand over this device's results that finished while no session was connected (or were never spoken)."""
+        if previous_session_id and previous_session_id != self.session_id:
+            deferred_tool_tasks.release_claims(previous_session_id) # In case its close was never seen
+        queued = deferred_tool_tasks.get_undelivered_results(owner=self.device_name)
+        if queued and self._inject_deferred_results(queued):
+            self.log(f"Client: Injected {len(queued)} deferred result(s) from earlier sessions.")
+            if self.get_app_state() == AppState.SENDING_TO_OPENAI:
+                self._request_followup_response("deferred results from earlier sessions")
+
+    def _on_response_created_for_deferred(self, response_id):
+        """Results injected before this response was created are part of its input."""
+        with self._deferred_lock:
+            for task_id, state in self._deferred_session_items.items():
+                if state is None:
+                    self._deferred_session_items[task_id] = response_id
+
+    def _on_response_done_for_deferred(self, response_id, status):
+        with self._deferred_lock:
+            task_ids = [task_id for task_id, state in self._deferred_session_items.items() if state == response_id]
+            for task_id in task_ids:
+                # A cancelled or failed response did not get to speak them; the next one does
+                self._deferred_session_items[task_id] = DEFERRED_SPOKEN if status == "completed" else None
+        if task_ids and status == "completed":
+            self.tool_pool.submit(deferred_tool_tasks.mark_delivered, task_ids, self.session_id)
+
+    # --- Conversation pruning ---
+    def _prune_conversation_if_needed(self):
+        """Runs on the tool pool after response.done. Replaces the oldest items with one summary item after the pinned context."""
+        if self._conversation_busy():
+            return
+        plan = self.conversation_pruner.plan_prune()
+        if not plan:
+            return
+        summary_text = self._summarize_pruned_items(plan)
+        if self._conversation_busy():
+            # A response or tool batch started while summarizing; its items may refer to the ones we would delete
+            self.log("Client: Conversation pruning postponed, a response started while summarizing.")
+            self.conversation_pruner.abort_prune()
+            return
+        summary_item_id = f"summary_{uuid.uuid4().hex[:12]}"
+        summary_payload = {"type": "conversation.item.create", "previous_item_id": plan.insert_after or "root",
+                           "item": {"id": summary_item_id, "type": "message", "role": "system",
+                                    "content": [{"type": "input_text", "text": f"Summary of the earlier part of this conversation: {summary_text}"}]}}
+        try:
+            if not (self.ws_app and self.connected):
+                raise ConnectionError("WebSocket not connected")
+            self.send_event(summary_payload)
+            for item_id in plan.item_ids:
+                self.send_event({"type": "conversation.item.delete", "item_id": item_id})
+        except Exception as e_prune:
+            self.log(f"Client ERROR: Conversation pruning aborted: {e_prune}")
+            self.conversation_pruner.abort_prune()
+            return
+        self.conversation_pruner.finish_prune(plan, summary_item_id, summary_text)
+        self.log(f"Client: Pruned {len(plan.item_ids)} conversation item(s) (~{plan.estimated_tokens} tokens) into summary {summary_item_id}.")
+
+    def _conversation_busy(self) -> bool:
+        """Don't delete items a pending tool output or an in-flight response may refer to."""
+        with self._tool_batch_lock:
+            return bool(self.tool_batches or self.active_response_id)
+
+    def _summarize_pruned_items(self, plan) -> str:
+        transcript = "\n".join(plan.transcript_lines)
+        if self.sync_openai_client:
+            prompt = ("Condense the earlier part of a voice assistant conversation into a short factual summary the assistant can rely on. "
+                      "Keep names, numbers, decisions, open requests and tool results; drop small talk.\n\n"
+                      + (f"Existing summary of even earlier turns:\n{plan.previous_summary}\n\n" if plan.previous_summary else "")
+                      + f"Turns to fold in:\n{transcript}\n\nSummary:")
+            try:
+                response = self.sync_openai_client.chat.completions.create(
+                    model=CONTEXT_SUMMARIZER_MODEL, messages=[{"role": "user", "content": prompt}], temperature=0.1, max_tokens=250)
+                return response.choices[0].message.content.strip()
+            except Exception as e_sum:
+                self.log(f"WARN: Summarizer failed while pruning, using extractive fallback: {e_sum}")
+        # Extractive fallback: previous summary plus the tail of the pruned turns
+        fallback = ((plan.previous_summary + "\n") if plan.previous_summary else "") + transcript
+        return fallback[-1500:]
+
+    def _on_response_done_metrics(self, response_details: dict):
+        response_id = response_details.get("id")
+        usage = response_details.get("usage") or {}
+        self.conversation_pruner.on_response_done(usage)
+        self.response_index += 1
+        if self.session_id:
+            get_shared_writer().submit(add_response_usage, self.session_id, response_id, self.response_index,
+                                       response_details.get("status"), usage, self.instructions_chars, self.usage_tag)
+        for column, tokens in usage_row_from_response(usage).items():
+            self.session_usage[column] = self.session_usage.get(column, 0) + tokens
+        timing = self._response_timing.pop(response_id, None) or {}
+        now = time.perf_counter()
+        first_audio_ms = (timing["first_audio"] - timing["created"]) * 1000.0 if timing.get("first_audio") else None
+        response_ms = (now - timing["created"]) * 1000.0 if timing.get("created") else None
+        self.latency.record_response_growth(response_id, self.response_index, usage, self.conversation_pruner.item_count(),
+                                            self.conversation_pruner.pruned_item_count, first_audio_ms, response_ms,
+                                            tag="pruning_on" if self.conversation_pruning_enabled else "pruning_off")
+        if self.conversation_pruning_enabled:
+            self.tool_pool.submit(self._prune_conversation_if_needed)
+
+    def _send_response_create(self, context: str):
+        try:
+            if self.ws_app and self.connected:
+                self.send_event(self._response_create_payload())
+                self.log(f"Client: Sent 'response.create' ({context}).")
+        except Exception as e_send_rc:
+            self.log(f"Client ERROR: Could not send response.create ({context}): {e_send_rc}")
+
+    def _clear_tool_batches(self):
+        with self._tool_batch_lock:
+            batches, self.tool_batches = self.tool_batches, {}
+        for batch in batches.values():
+            for timer_key in ("timer", "filler_timer"):
+                if batch[timer_key]:
+                    batch[timer_key].cancel()
+
+    def _on_filler_due(self, batch_key):
+        """Tool batch is still running past the threshold: say something short locally instead of staying silent."""
+        with self._tool_batch_lock:
+            batch = self.tool_batches.get(batch_key)
+            if batch is None or batch["response_created"]:
+                return
+            latency_class = batch["latency_class"]
+        if not self.player or self._is_playback_active() or self.get_app_state() != AppState.SENDING_TO_OPENAI:
+            return # Assistant is already audible, or the user is not in a conversation
+        clip = self.filler_cache.get_clip(latency_class)
+        if not clip:
+            return
+        chunk_bytes = getattr(self.player, "chunk_bytes", 0)
+        if chunk_bytes and len(clip) % chunk_bytes:
+            clip += b"\x00" * (chunk_bytes - len(clip) % chunk_bytes) # Whole chunks, so no tail waits for the next flush
+        self.log(f"🔊 AUDIO: Tool batch {batch_key} still running after {self.filler_threshold_s:.1f}s. Playing '{latency_class}' filler.")
+        stop = threading.Event()
+        self._filler_stop = stop
+        # One chunk per play() call on this timer thread, so a real audio delta waits for at most one chunk write
+        step = chunk_bytes or len(clip)
+        for start in range(0, len(clip), step):
+            with self._filler_lock:
+                if stop.is_set():
+                    return
+                self.player.play(clip[start:start + step])
+
+    def _stop_filler(self):
+        """Real assistant audio (or the end of the conversation) replaces the filler: stop queueing it and drop what is buffered."""
+        stop = self._filler_stop
+        if stop is None:
+            return
+        stop.set()
+        with self._filler_lock:
+            self._filler_stop = None
+            if self.player:
+                self.player.clear()
+        self.log("🔊 AUDIO: Filler stopped for the assistant's response.")
+
+    def _finalize_user_transcript(self, item_id, completed_transcript: str):
+        """Persist one 'user' turn for item_id, built from the completed transcript or the buffered deltas."""
+        pending = self.pending_user_transcripts.pop(item_id, None)
+        transcript = (completed_transcript or "").strip()
+        if not transcript and pending:
+            transcript = "".join(pending["parts"]).strip()
+        if not transcript or not self.session_id:
+            return
+        duration_ms = int((time.time() - pending["started_at"]) * 1000) if pending else None
+        try:
+            self._log_turn(self.session_id, "user", transcript, item_id=item_id, duration_ms=duration_ms)
+        except Exception as e:
+            self.log(f"ERROR: Failed to log user transcript to conversation history: {e}", logging.ERROR)
+
+    def _flush_pending_user_transcripts(self):
+        """Persist whatever was buffered for items that never got a .completed event (e.g. on disconnect)."""
+        for item_id in list(self.pending_user_transcripts.keys()):
+            self._finalize_user_transcript(item_id, "")
 
     def is_assistant_speaking(self) -> bool: return self.last_assistant_item_id is not None
     def get_current_assistant_speech_duration_ms(self) -> int:
@@ -502,7 +1008,7 @@ class OpenAISpeechClient:
         truncate_payload = {"type": "conversation.item.truncate", "item_id": item_id_to_truncate, "content_index": 0, "audio_end_ms": timestamp_to_send_ms}
         try:
             if self.ws_app and self.connected:
-                self.ws_app.send(json.dumps(truncate_payload))
+                self.send_event(truncate_payload)
                 self.client_initiated_truncated_item_ids.add(item_id_to_truncate)
         except Exception as e_send_trunc: self.log(f"Client ERROR sending truncate: {e_send_trunc}")
         self.last_assistant_item_id = None; self.current_assistant_item_played_ms = 0
@@ -516,8 +1022,176 @@ class OpenAISpeechClient:
             time.sleep(0.1)  # Small sleep to prevent CPU spin
         return False  # Timeout reached
 
+    # --- End of conversation ---
+    def _request_end_conversation(self, reason: str):
+        """
+        Start the transition back to wake-word mode without blocking the receive thread.
+        Once playback has drained (or the drain timeout passes), a timer waits
+        END_CONV_AUDIO_FINISH_DELAY_S and then completes the transition.
+        """
+        with self._end_conv_lock:
+            if self.pending_end_conversation:
+                self.log("Client: End of conversation already pending. Ignoring duplicate request.")
+                return
+            pending = {"reason": reason, "requested_at": time.perf_counter(), "delay_timer": None,
+                       "deadline": time.monotonic() + self.end_conv_drain_timeout_s}
+            pending["timeout_timer"] = threading.Timer(self.end_conv_drain_timeout_s, self._on_end_conv_drain_timeout)
+            pending["timeout_timer"].daemon = True
+            self.pending_end_conversation = pending
+        pending["timeout_timer"].start()
+        if self._is_playback_active():
+            self.log("🔊 AUDIO: End of conversation requested. Waiting for playback to drain...")
+            if self.player and hasattr(self.player, "add_drain_callback"):
+                self.player.add_drain_callback(self._on_playback_drained)
+        else:
+            self._on_playback_drained()
+
+    def _is_playback_active(self) -> bool:
+        return self.assistant_audio_streaming or bool(self.player and len(self.player.buffer) > 0)
+
+    def _on_end_conv_drain_timeout(self):
+        self.log("⚠️ WARNING: Audio completion timeout reached")
+        self._on_playback_drained(force=True)
+
+    def _on_playback_drained(self, force: bool = False):
+        """Player drain signal (or timeout): arm the final delay before switching to wake-word mode."""
+        with self._end_conv_lock:
+            pending = self.pending_end_conversation
+            if not pending or pending["delay_timer"] is not None:
+                return
+            if not force and self.assistant_audio_streaming:
+                # More assistant audio started; wait for its drain instead (the callback is one-shot)
+                if self.player and hasattr(self.player, "add_drain_callback"):
+                    self.player.add_drain_callback(self._on_playback_drained)
+                return
+            if pending["timeout_timer"]:
+                pending["timeout_timer"].cancel()
+            pending["delay_timer"] = threading.Timer(self.end_conv_delay_s, self._complete_end_conversation)
+            pending["delay_timer"].daemon = True
+            pending["delay_timer"].start()
+
+    def _complete_end_conversation(self):
+        with self._end_conv_lock:
+            pending = self.pending_end_conversation
+            if not pending:
+                return
+            # Assistant audio that arrived during the delay gets to finish, up to the drain deadline
+            if self._is_playback_active() and time.monotonic() < pending["deadline"]:
+                pending["delay_timer"] = None
+                if self.player and hasattr(self.player, "add_drain_callback"):
+                    self.player.add_drain_callback(self._on_playback_drained)
+                return
+            self.pending_end_conversation = None
+        self._finish_end_conversation(pending["reason"], pending["requested_at"], mode="event")
+
+    def _cancel_pending_end_conversation(self):
+        with self._end_conv_lock:
+            pending, self.pending_end_conversation = self.pending_end_conversation, None
+        if pending:
+            for timer_key in ("timeout_timer", "delay_timer"):
+                if pending.get(timer_key):
+                    pending[timer_key].cancel()
+
+    def _end_conversation_blocking(self, reason: str):
+        """Original flow: poll for audio completion and sleep on the receive thread."""
+        requested_at = time.perf_counter()
+        self.log("🔊 AUDIO: Waiting for current audio to complete...")
+        if not self._wait_for_audio_completion(timeout_s=self.end_conv_drain_timeout_s):
+            self.log("⚠️ WARNING: Audio completion timeout reached")
+        time.sleep(self.end_conv_delay_s)
+        self._finish_end_conversation(reason, requested_at, mode="blocking")
+
+    def _finish_end_conversation(self, reason: str, requested_at: float, mode: str):
+        # Clear all audio buffers and reset audio state
+        if self.player:
+            self.player.clear()
+            self.player.flush()
+        self.openai_audio_buffer_raw_bytes = b''
+        self.last_assistant_item_id = None
+        self.current_assistant_item_played_ms = 0
+
+        self.log(f"Client: Executing '{END_CONVERSATION_TOOL_NAME}' for reason: '{reason}'.")
+        if self.wake_word_active:
+            self.set_app_state(AppState.LISTENING_FOR_WAKEWORD)
+            self.log(f"Client: Listening for wake word '{self.wake_word_detector_instance.wake_word_model_name}' again (reason: {reason}).")
+        else:
+            self.log(f"Client: Conversation turn ended by LLM (reason: {reason}). Ready for next query.")
+        self.latency.record_span(STAGE_END_CONV_TO_WAKEWORD_READY, requested_at, tag=mode)
+        self.log(f"⏱️ End of conversation ({mode}): wake-word ready {(time.perf_counter() - requested_at) * 1000:.0f} ms after the request.")
+
     def handle_local_user_speech_interrupt(self):
-        if self.get_app_state() == "SENDING_TO_OPENAI": self._perform_truncation(reason_prefix="Local VAD")
+        if self.get_app_state() == AppState.SENDING_TO_OPENAI:
+            self._perform_truncation(reason_prefix="Local VAD")
+            if self.turn_detection_mode == "client_vad": self._cancel_active_response("local barge-in") # No server VAD to cancel it for us
+
+    def on_keyword_command(self, keyword: str, action: str):
+        """A command keyword (wake_word_detector ACTION_CANCEL / ACTION_STOP) was heard during a conversation."""
+        if self.get_app_state() != AppState.SENDING_TO_OPENAI:
+            return
+        self.log(f"🗣️ KEYWORD: '{keyword}' -> {action}.")
+        self._perform_truncation(reason_prefix=f"Keyword '{keyword}'")
+        self._cancel_active_response(f"keyword '{keyword}'")
+        try:
+            if self.ws_app and self.connected:
+                self.send_event({"type": "input_audio_buffer.clear"}) # The command itself is not a user turn
+        except Exception as e_clear:
+            self.log(f"Client ERROR clearing input buffer: {e_clear}")
+        if action == "stop":
+            self._cancel_pending_end_conversation()
+            self._finish_end_conversation(f"stop keyword '{keyword}'", time.perf_counter(), mode="keyword")
+
+    # --- Client-side turn detection ---
+    def on_local_speech_started(self):
+        """Local endpointer heard the user start a turn."""
+        if self.turn_detection_mode == "client_vad" and self.active_response_id and not self.is_assistant_speaking():
+            # Response was requested but nothing is audible yet: the user wasn't done, so drop it
+            self._cancel_active_response("user resumed speaking")
+
+    def on_local_speech_stopped(self, speech_end_perf: Optional[float]):
+        """Local endpointer decided the user's turn is over. speech_end_perf is the last voiced frame."""
+        if speech_end_perf is not None:
+            self.latency.mark_user_speech_end(speech_end_perf, tag=self.turn_detection_mode)
+        if self.turn_detection_mode != "client_vad" or not (self.ws_app and self.connected):
+            return
+        self.log("🎤 SPEECH: Local endpoint detected. Committing input and requesting a response.")
+        self.latency.mark_speech_stopped()
+        try:
+            self.send_event({"type": "input_audio_buffer.commit"})
+            self.send_event(self._response_create_payload())
+        except Exception as e_commit:
+            self.log(f"Client ERROR: Could not commit input buffer / request response: {e_commit}")
+
+    def _report_uplink_usage(self):
+        """Logs how much mic audio the uplink gate held back this session (and adds it to the recording), then resets its counters."""
+        if not self.uplink_gate or not self.uplink_gate.frames_in:
+            return
+        stats = self.uplink_gate.stats()
+        self.uplink_gate.reset_stats()
+        self.log(f"📉 UPLINK: Sent {stats['frames_sent']}/{stats['frames_in']} mic frames, "
+                 f"{stats['wire_bytes_sent'] / 1024:.0f} KiB of {stats['wire_bytes_ungated'] / 1024:.0f} KiB "
+                 f"({stats['wire_bytes_saved'] / 1024:.0f} KiB / {stats['saved_pct']}% saved by gating).")
+        if self.recorder:
+            self.recorder.record("meta", {"type": "uplink.usage", **stats})
+
+    def _report_session_usage(self):
+        """Logs this session's summed token usage (per-response rows are in the response_usage table)."""
+        if not self.session_usage.get("input_tokens"):
+            return
+        usage = self.session_usage
+        self.session_usage = {}
+        cache_ratio = usage["cached_tokens"] / usage["input_tokens"]
+        self.log(f"📊 USAGE: Session {self.session_id}: {self.response_index} responses, {usage['input_tokens']} input tokens "
+                 f"({usage['input_audio_tokens']} audio, {usage['cached_tokens']} cached = {cache_ratio:.0%}), "
+                 f"{usage['output_tokens']} output tokens ({usage['output_audio_tokens']} audio).")
+
+    def _cancel_active_response(self, reason: str):
+        if not (self.active_response_id and self.ws_app and self.connected):
+            return
+        try:
+            self.send_event({"type": "response.cancel"})
+            self.log(f"Client: Sent response.cancel for {self.active_response_id} ({reason}).")
+        except Exception as e_cancel:
+            self.log(f"Client ERROR sending response.cancel: {e_cancel}")
 
  
     def _format_message(self, msg, msg_type):
@@ -555,16 +1229,6 @@ class OpenAISpeechClient:
         # Transcription events
         elif msg_type == "conversation.item.input_audio_transcription.completed":
             transcript = msg.get("transcript", "")
-            # Log completed user transcription
-            if self.session_id and transcript:
-                try:
-                    log_conversation_turn(
-                        self.session_id,
-                        "user",
-                        transcript
-                    )
-                except Exception as e:
-                    self.log(f"ERROR: Failed to log user transcript to conversation history: {e}", logging.ERROR)
             return f"------ CONVERSATION ------\n👤 USER SAID: \"{transcript}\"\n---------------------------"
             
         elif msg_type == "response.audio_transcript.done":
@@ -572,7 +1236,7 @@ class OpenAISpeechClient:
             # Log completed assistant response
             if self.session_id and transcript:
                 try:
-                    log_conversation_turn(
+                    self._log_turn(
                         self.session_id,
                         "assistant",
                         transcript
@@ -626,7 +1290,16 @@ class OpenAISpeechClient:
 
     def on_message(self, ws, message_str):
         msg = json.loads(message_str)
+        if not self.handler_profiler:
+            self._handle_message(msg)
+            return
+        with self.handler_profiler.profile(msg.get("type")):
+            self._handle_message(msg)
+
+    def _handle_message(self, msg: dict):
         msg_type = msg.get("type")
+        if self.recorder:
+            self.recorder.record("in", msg)
 
         # For audio delta messages, use a counter instead of logging each one
         if msg_type == "response.audio.delta":
@@ -638,12 +1311,6 @@ class OpenAISpeechClient:
             transcript = msg.get("delta", "")
             if transcript and transcript.strip():  # Only log if there's actual content
                 self.log(f"------ CONVERSATION ------\n👤 USER SAYING: \"{transcript.strip()}\"\n---------------------------")
-                # Log user's speech to conversation history
-                if self.session_id:
-                    try:
-                        log_conversation_turn(self.session_id, "user", transcript.strip())
-                    except Exception as e:
-                        self.log(f"ERROR: Failed to log user transcript to conversation history: {e}", logging.ERROR)
         # For other high-frequency events that we want to minimize in logs
         elif msg_type in ["response.audio_transcript.delta", "response.output.delta", "response.function_call_arguments.delta"]:
             pass  # Skip logging these entirely
@@ -657,8 +1324,27 @@ class OpenAISpeechClient:
             formatted_message = self._format_message(msg, msg_type)
             self.log(formatted_message)
 
-        if msg_type == "conversation.item.created":
+        if msg_type == "conversation.item.input_audio_transcription.delta":
+            item_id = msg.get("item_id")
+            pending = self.pending_user_transcripts.setdefault(item_id, {"parts": [], "started_at": time.time()})
+            pending["parts"].append(msg.get("delta", ""))
+
+        elif msg_type == "conversation.item.input_audio_transcription.completed":
+            self._finalize_user_transcript(msg.get("item_id"), msg.get("transcript", ""))
+            self.conversation_pruner.on_item_text(msg.get("item_id"), msg.get("transcript", ""))
+
+        elif msg_type == "response.audio_transcript.done":
+            self.conversation_pruner.on_item_text(msg.get("item_id"), msg.get("transcript", ""))
+
+        elif msg_type == "conversation.item.deleted":
+            self.conversation_pruner.on_item_deleted(msg.get("item_id"))
+
+        elif msg_type == "conversation.item.input_audio_transcription.failed":
+            self.pending_user_transcripts.pop(msg.get("item_id"), None)
+
+        elif msg_type == "conversation.item.created":
             item = msg.get("item", {})
+            self.conversation_pruner.on_item_created(item)
             item_id, item_role, item_type, item_status = item.get("id"), item.get("role"), item.get("type"), item.get("status")
             if item_role == "assistant" and item_type == "message" and item_status == "in_progress":
                 if self.last_assistant_item_id != item_id:
@@ -668,7 +1354,7 @@ class OpenAISpeechClient:
                     # Log assistant's response start
                     if self.session_id:
                         try:
-                            log_conversation_turn(self.session_id, "assistant", "Starting new response...")
+                            self._log_turn(self.session_id, "assistant", "Starting new response...")
                         except Exception as e:
                             self.log(f"ERROR: Failed to log assistant response start to conversation history: {e}", logging.ERROR)
         
@@ -687,6 +1373,7 @@ class OpenAISpeechClient:
 
         elif msg_type == "response.function_call_arguments.done":
             call_id = msg.get("call_id")
+            response_id = msg.get("response_id")
             function_to_execute_name = msg.get("name") 
             final_args_str_from_event = msg.get("arguments", "{}")
             final_accumulated_args = self.accumulated_tool_args.pop(call_id, "{}") 
@@ -699,7 +1386,7 @@ class OpenAISpeechClient:
             self.log(f"Client: Function Call Finalized by LLM: Name='{function_to_execute_name}', Call_ID='{call_id}', Args='{final_args_to_use}'")
             # Log tool call to conversation history
             if self.session_id:
-                log_conversation_turn(
+                self._log_turn(
                     self.session_id,
                     "tool_call",
                     json.dumps({
@@ -714,65 +1401,49 @@ class OpenAISpeechClient:
                 self.log(f"Client WARN: Could not decode JSON arguments for {function_to_execute_name}: '{final_args_to_use}'. Error: {e}")
                 error_detail_for_llm = f"Invalid JSON arguments for tool {function_to_execute_name}. Error: {str(e)}"
                 error_output_for_llm = json.dumps({"error": error_detail_for_llm })
-                error_result_payload = {"type": "conversation.item.create", "item": {"type": "function_call_output", "call_id": call_id, "output": error_output_for_llm }}
-                try:
-                    if self.ws_app and self.connected:
-                        ws.send(json.dumps(error_result_payload))
-                        ws.send(json.dumps({"type": "response.create", "response": {"modalities": ["text", "audio"], "voice": self.config.get("OPENAI_VOICE", "ash")}}))
-                except Exception as e_send_err: self.log(f"Client ERROR sending arg parsing error: {e_send_err}")
+                batch_key = self._register_tool_call(response_id, call_id, function_to_execute_name)
+                self._complete_tool_call(batch_key, call_id, function_to_execute_name, error_output_for_llm)
                 return 
 
             if function_to_execute_name == END_CONVERSATION_TOOL_NAME:
                 reason = parsed_args.get("reason", "No reason specified by LLM.")
                 self.log(f"Client: LLM requests '{END_CONVERSATION_TOOL_NAME}'. Reason: '{reason}'.")
-                
-                # 1. Wait for any current audio to finish
-                self.log("🔊 AUDIO: Waiting for current audio to complete...")
-                audio_finished = self._wait_for_audio_completion()
-                if not audio_finished:
-                    self.log("⚠️ WARNING: Audio completion timeout reached")
-                
-                # 2. Add a small delay to ensure last message was heard
-                end_conv_delay_s = self.config.get("END_CONV_AUDIO_FINISH_DELAY_S", 2.0)
-                time.sleep(end_conv_delay_s)
-                
-                # 3. Clear all audio buffers
-                if self.player:
-                    self.player.clear()
-                    self.player.flush()
-                self.openai_audio_buffer_raw_bytes = b''
-                
-                # 4. Reset audio state
-                self.last_assistant_item_id = None
-                self.current_assistant_item_played_ms = 0
-                
-                # 5. Transition to wake word mode
-                self.log(f"Client: Executing '{END_CONVERSATION_TOOL_NAME}' for reason: '{reason}'.")
-                if self.wake_word_active:
-                    self.set_app_state("LISTENING_FOR_WAKEWORD")
-                    print(f"\n*** Assistant listening for wake word: '{self.wake_word_detector_instance.wake_word_model_name}' (Reason: {reason}) ***\n")
+                if self.end_conv_mode == "blocking":
+                    self._end_conversation_blocking(reason)
                 else:
-                    print(f"\n*** Conversation turn ended by LLM (Reason: {reason}). Ready for next query. ***\n")
+                    self._request_end_conversation(reason)
+                return
+
+            elif self.deferred_tools_enabled and function_to_execute_name in DEFERRED_TOOL_NAMES and function_to_execute_name in self.tool_handlers:
+                self._start_deferred_tool(self.tool_handlers[function_to_execute_name], parsed_args, call_id, function_to_execute_name, response_id)
                 return
 
-            elif function_to_execute_name in TOOL_HANDLERS:
-                handler_function = TOOL_HANDLERS[function_to_execute_name]
-                tool_thread = threading.Thread(target=self._execute_tool_in_thread, args=(handler_function, parsed_args, call_id, self.config, function_to_execute_name), daemon=True)
-                tool_thread.start()
+            elif function_to_execute_name in self.tool_handlers:
+                handler_function = self.tool_handlers[function_to_execute_name]
+                self.latency.mark_tool_dispatched(call_id)
+                batch_key = self._register_tool_call(response_id, call_id, function_to_execute_name)
+                self.tool_pool.submit(self._execute_tool_in_thread, handler_function, parsed_args, call_id, self.config, function_to_execute_name, batch_key)
                 return 
             else: 
                 self.log(f"Client WARN: No handler for function '{function_to_execute_name}'. Call_ID='{call_id}'.")
                 unhandled_error_out = json.dumps({"error": f"Tool '{function_to_execute_name}' not implemented by client."})
-                error_payload = {"type": "conversation.item.create", "item": {"type": "function_call_output", "call_id": call_id, "output": unhandled_error_out}}
-                try:
-                    if self.ws_app and self.connected:
-                        ws.send(json.dumps(error_payload))
-                        ws.send(json.dumps({"type": "response.create", "response": {"modalities": ["text", "audio"], "voice": self.config.get("OPENAI_VOICE", "ash")}}))
-                except Exception as e_send_unhandled: self.log(f"Client ERROR sending unhandled tool error: {e_send_unhandled}")
+                batch_key = self._register_tool_call(response_id, call_id, function_to_execute_name)
+                self._complete_tool_call(batch_key, call_id, function_to_execute_name, unhandled_error_out)
                 return
 
         elif msg_type == "session.created":
+            previous_session_id = self.session_id
             self.session_id = msg.get('session', {}).get('id')
+            self.conversation_pruner.reset()
+            if self.session_context_item_id:
+                self.conversation_pruner.pin_item(self.session_context_item_id) # Date and priming must survive pruning
+            self.response_index = 0
+            self.session_usage = {}
+            self._response_timing.clear()
+            with self._deferred_lock:
+                self._deferred_session_items = {} # Items of the previous session are gone with it
+            if self.deferred_tools_enabled:
+                self.tool_pool.submit(self._deliver_queued_deferred_results, previous_session_id)
             expires_at_ts = msg.get('session', {}).get('expires_at', 0)
             self.log(f"Client: OpenAI Session created: {self.session_id}, Expires At (Unix): {expires_at_ts}")
             if expires_at_ts > 0:
@@ -780,7 +1451,7 @@ class OpenAISpeechClient:
                 except: self.log("Client: Could not parse session expiry to datetime.")
             turn_detection_settings = msg.get('session', {}).get('turn_detection', {})
             self.log(f"Client: Server turn_detection settings: {json.dumps(turn_detection_settings)}")
-            if self.get_app_state() == "LISTENING_FOR_WAKEWORD" and self.wake_word_active:
+            if self.get_app_state() == AppState.LISTENING_FOR_WAKEWORD and self.wake_word_active:
                  print(f"\n*** CLIENT: Listening for wake word: '{self.wake_word_detector_instance.wake_word_model_name}' ***\n")
             else:
                  print(f"\n*** CLIENT: Speak now to interact with OpenAI (WW inactive or sending mode). ***\n")
@@ -794,8 +1465,15 @@ class OpenAISpeechClient:
             if item_id_of_delta and item_id_of_delta in self.client_initiated_truncated_item_ids:
                 pass
             elif audio_data_b64:
+                self.latency.mark_audio_delta(item_id_of_delta)
+                response_timing = self._response_timing.get(msg.get("response_id"))
+                if response_timing and response_timing["first_audio"] is None:
+                    response_timing["first_audio"] = time.perf_counter()
+                    if self.session_policy: self.session_policy.on_first_audio()
                 audio_data_bytes = base64.b64decode(audio_data_b64)
-                self._process_and_play_audio(audio_data_bytes)
+                if self._filler_stop is not None: self._stop_filler()
+                self.assistant_audio_streaming = True
+                self._process_and_play_audio(audio_data_bytes, item_id=item_id_of_delta)
                 if self.last_assistant_item_id and self.last_assistant_item_id == item_id_of_delta:
                     self.current_assistant_item_played_ms += self.client_audio_chunk_duration_ms
         
@@ -804,6 +1482,7 @@ class OpenAISpeechClient:
             self.log(f"🔊 AUDIO COMPLETE: Received {self.audio_received_counter} total chunks")
             # Reset counter for next conversation turn
             self.audio_received_counter = 0
+            self.latency.mark_audio_done(msg.get("item_id"))
             
             if self.tsm_enabled:
                 if len(self.openai_audio_buffer_raw_bytes) > 0:
@@ -815,7 +1494,7 @@ class OpenAISpeechClient:
                         segment_np_int16 = np.frombuffer(final_segment_bytes, dtype=np.int16)
                         segment_np_float32 = segment_np_int16.astype(np.float32) / 32768.0
                         if segment_np_float32.size > 0:
-                            stretched_audio_float32 = wsola(segment_np_float32, s=self.desired_playback_speed)
+                            stretched_audio_float32 = self._wsola(segment_np_float32, s=self.desired_playback_speed)
                             clipped_stretched_audio = np.clip(stretched_audio_float32, -1.0, 1.0)
                             stretched_audio_int16 = (clipped_stretched_audio * 32767.0).astype(np.int16)
                             stretched_audio_bytes = stretched_audio_int16.tobytes()
@@ -829,9 +1508,10 @@ class OpenAISpeechClient:
                 if len(self.openai_audio_buffer_raw_bytes) > 0 and self.player:
                     self.player.play(self.openai_audio_buffer_raw_bytes)
                     self.openai_audio_buffer_raw_bytes = b''
-            if self.player: self.player.flush()
+            self.assistant_audio_streaming = False
+            if self.player: self.player.flush() # Fires drain callbacks (pending end of conversation)
             self.log(f"⚙️ STATE: Audio complete, app state: {self.get_app_state()}")
-            if not (self.get_app_state() == "LISTENING_FOR_WAKEWORD" and self.wake_word_active):
+            if not (self.get_app_state() == AppState.LISTENING_FOR_WAKEWORD and self.wake_word_active):
                 print(f"\n*** Assistant has finished speaking. Ready for your next query. (Ctrl+C to exit) ***\n")
 
         elif msg_type == "response.output_item.done":
@@ -847,6 +1527,17 @@ class OpenAISpeechClient:
         
         elif msg_type == "response.done": 
             response_details = msg.get("response", {})
+            self.active_response_id = None
+            self._on_response_done_for_tool_batch(response_details.get("id"))
+            self._on_response_done_for_deferred(response_details.get("id"), response_details.get("status"))
+            with self._tool_batch_lock:
+                # A late tool output or deferred result arrived mid-response; speak it now unless a tool batch's response.create will cover it
+                followup_due = self.followup_response_pending and not self.tool_batches
+                if followup_due:
+                    self.followup_response_pending = False
+            self._on_response_done_metrics(response_details)
+            if followup_due and self.get_app_state() == AppState.SENDING_TO_OPENAI:
+                self._send_response_create("follow-up after response.done")
             if response_details.get("status") == "cancelled":
                 self.log(f"Client: response.done with status 'cancelled'. Cleaning up.")
                 for item_in_cancelled in response_details.get("output", []):
@@ -858,9 +1549,15 @@ class OpenAISpeechClient:
                                 self.last_assistant_item_id = None; self.current_assistant_item_played_ms = 0
         elif msg_type == "input_audio_buffer.speech_started":
             self.log(f"🎤 SPEECH: User started speaking | State: {self.get_app_state()}")
-            if self.get_app_state() == "SENDING_TO_OPENAI": self._perform_truncation(reason_prefix="Server VAD")
+            if self.get_app_state() == AppState.SENDING_TO_OPENAI: self._perform_truncation(reason_prefix="Server VAD")
         elif msg_type == "input_audio_buffer.speech_stopped":
             self.log("🎤 SPEECH: User stopped speaking")
+            self.latency.mark_speech_stopped()
+        elif msg_type == "response.created":
+            self.active_response_id = msg.get("response", {}).get("id")
+            self._response_timing[self.active_response_id] = {"created": time.perf_counter(), "first_audio": None}
+            self.latency.mark_response_created(self.active_response_id)
+            self._on_response_created_for_deferred(self.active_response_id)
         elif msg_type == "error":
             error_message = msg.get('error', {}).get('message', 'Unknown error from OpenAI.')
             error_code = msg.get('error', {}).get('code', 'unknown')
@@ -878,13 +1575,18 @@ class OpenAISpeechClient:
         self.current_assistant_item_played_ms = 0
         self.accumulated_tool_args.clear()
         self.client_initiated_truncated_item_ids.clear()
+        self._flush_pending_user_transcripts()
+        self._clear_tool_batches()
+        self.active_response_id = None
+        self.assistant_audio_streaming = False # A pending end of conversation still completes via its timers
+        self.latency.reset()
         
         # Only attempt to log the error if we have a session ID
         if self.session_id:
             try:
                 # Convert error to a simple string to avoid serialization issues
                 error_str = str(error) if error is not None else "Unknown WebSocket error"
-                log_conversation_turn(
+                self._log_turn(
                     self.session_id,
                     "system_event",
                     json.dumps({"event": "websocket_error", "details": error_str})
@@ -895,6 +1597,11 @@ class OpenAISpeechClient:
         self._log_section("WebSocket CLOSE")
         self.log(f"Client WS Closed: {close_status_code} {close_msg}")
         self.connected = False
+        self._flush_pending_user_transcripts()
+        self._clear_tool_batches()
+        self.active_response_id = None
+        if self.deferred_tools_enabled:
+            deferred_tool_tasks.release_claims(self.session_id) # Results this session never spoke go to the next one
         
         # Log connection close to conversation history if we have a session
         if self.session_id:
@@ -903,7 +1610,7 @@ class OpenAISpeechClient:
                 code_str = str(close_status_code) if close_status_code is not None else "null"
                 reason_str = str(close_msg) if close_msg is not None else "null"
                 
-                log_conversation_turn(
+                self._log_turn(
                     self.session_id,
                     "system_event",
                     json.dumps({
@@ -914,7 +1621,11 @@ class OpenAISpeechClient:
                 )
             except Exception as e_log:
                 self.log(f"ERROR: Failed to log WebSocket close to conversation history: {e_log}")
+        self._report_uplink_usage()
+        self._report_session_usage()
         
+        self._stop_recording(reason=f"closed ({close_status_code})")
+
         # Create a safe status code string for the frontend notification
         status_code_str = str(close_status_code) if close_status_code is not None else "unknown"
         self._notify_frontend_disconnect(reason=f"Connection closed (Code: {status_code_str})")
@@ -926,6 +1637,8 @@ class OpenAISpeechClient:
         preserved_session_id_for_reconnect = self.session_id 
 
         while self.keep_outer_loop_running:
+            if not self.session_wanted.wait(0.5): # Released by the session policy; idle until request_session()
+                continue
             self.log(f"Client: Attempting WebSocket connection (session_id for history: {preserved_session_id_for_reconnect}).")
             self.connected = False
             self.current_assistant_text_response = ""
@@ -937,6 +1650,7 @@ class OpenAISpeechClient:
             except Exception as e: self.log(f"Client: Exception in run_forever: {e}")
             finally:
                 self.connected = False
+                self.session_ready.clear()
                 # --- Phase 4: Fallback frontend disconnect notification ---
                 # If the loop is still supposed to run (not a graceful shutdown)
                 # and the WebSocket appears to be truly dead (e.g., no sock or not connected),
@@ -959,6 +1673,9 @@ class OpenAISpeechClient:
                     pass # Relying on on_close for now to avoid duplicate notifications
                 preserved_session_id_for_reconnect = self.session_id # Update with potentially new session_id from last run
                 if not self.keep_outer_loop_running: break
+                if not self.session_wanted.is_set():
+                    self.log("Client: Session released. Reconnecting when requested.")
+                    continue
                 self.log(f"Client: Disconnected. Waiting {self.RECONNECT_DELAY_SECONDS}s.")
                 for _ in range(self.RECONNECT_DELAY_SECONDS):
                     if not self.keep_outer_loop_running: break
@@ -966,11 +1683,46 @@ class OpenAISpeechClient:
                 if not self.keep_outer_loop_running: break
         self.log("Client: Exited run_client loop.")
 
+    def request_session(self):
+        """Lets run_client connect (and prime) the realtime session; no-op if it is already wanted."""
+        if not self.session_wanted.is_set():
+            self.log("Client: Session requested.")
+            self.session_wanted.set()
+
+    def release_session(self, reason: str = ""):
+        """Closes the realtime socket without stopping run_client, which waits for the next request_session()."""
+        if not self.session_wanted.is_set():
+            return
+        self.log(f"Client: Releasing session ({reason or 'no reason given'}).")
+        self.session_wanted.clear()
+        self.session_ready.clear()
+        ws_app = self.ws_app
+        if ws_app and ws_app.sock and ws_app.sock.sock:
+            # Not ws_app.close(): from another thread that leaves run_forever in select() until the ping
+            # timeout, and a request_session() in the meantime would wait for it. Shutting the socket
+            # down wakes the dispatcher at once and run_forever returns through on_close.
+            ws_app.keep_running = False
+            try:
+                ws_app.sock.send_close()
+                ws_app.sock.sock.shutdown(socket.SHUT_RDWR)
+            except Exception as e_close: self.log(f"Client: Error closing released session: {e_close}")
+
     def close_connection(self):
         self.log("Client: close_connection() called.")
         self.keep_outer_loop_running = False
+        self.session_wanted.set() # Wakes run_client if it is idling between sessions, so it can exit
         if self.ws_app:
             try:
                 if hasattr(self.ws_app, 'close') and callable(self.ws_app.close): self.ws_app.close()
             except: pass # Simplified
-        self.connected = False
\ No newline at end of file
+        self.connected = False
+        self._cancel_pending_end_conversation()
+        self._clear_tool_batches()
+        if self._owns_tool_pool:
+            self.tool_pool.shutdown(wait=False)
+        if self._owns_deferred_pool:
+            self.deferred_pool.shutdown(wait=False)
+        if self.handler_profiler:
+            self.handler_profiler.stop_watchdog()
+            self.handler_profiler.dump(reason="shutdown")
+        self._stop_recording(reason="close_connection")
\ No newline at end of file
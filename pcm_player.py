@@ -0,0 +1,79 @@
+# pcm_player.py
+# PyAudio output player used by main.py and by device_context.py for devices with a real speaker.
+import threading
+import time
+from datetime import datetime
+
+import pyaudio
+
+
+def _player_log(message, level="INFO"):
+    print(f"[{level}] [PCM_PLAYER] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class PCMPlayer:
+    """Buffers PCM16 and writes whole chunks to a PyAudio output stream (blocking, so it paces playback)."""
+    def __init__(self, pyaudio_instance, rate=24000, channels=1, format_player=None, chunk_samples_player=720,
+                 output_device_index=None, log_fn=None):
+        self.log = log_fn or _player_log
+        format_player = format_player if format_player is not None else pyaudio.paInt16
+        self.log(f"PCMPlayer Init: Rate={rate}, ChunkSamples={chunk_samples_player}, Device={output_device_index if output_device_index is not None else 'default'}")
+        self.stream = None
+        try:
+            self.stream = pyaudio_instance.open(format=format_player, channels=channels, rate=rate, output=True,
+                                                frames_per_buffer=chunk_samples_player, output_device_index=output_device_index)
+        except Exception as e_pyaudio: self.log(f"CRITICAL ERROR initializing PyAudio output stream: {e_pyaudio}", "CRITICAL"); raise
+        self.buffer = b""; self.chunk_bytes = chunk_samples_player * pyaudio.get_sample_size(format_player) * channels
+        # self.lock guards buffer mutations only, so clear() never waits on the device.
+        # _write_lock serializes device writes (receive thread and filler playback both call play()).
+        self.lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._drain_callbacks = []
+        self._first_write_callbacks = []
+    def play(self, pcm_bytes):
+        if not self.stream: return
+        with self.lock: self.buffer += pcm_bytes
+        while True:
+            with self._write_lock:
+                with self.lock:
+                    if len(self.buffer) < self.chunk_bytes: break
+                    chunk = self.buffer[:self.chunk_bytes]; self.buffer = self.buffer[self.chunk_bytes:]
+                try: self.stream.write(chunk)
+                except (IOError, AttributeError) as e: self.log(f"PCMPlayer IOError during write: {e}. Stream might be closed."); self.close(); break
+            if self._first_write_callbacks: self._fire_first_write_callbacks()
+    def flush(self):
+        with self._write_lock:
+            with self.lock: remaining = self.buffer; self.buffer = b""
+            if self.stream and remaining:
+                try: self.stream.write(remaining)
+                except (IOError, AttributeError) as e: self.log(f"PCMPlayer IOError during flush: {e}."); self.close()
+                else:
+                    if self._first_write_callbacks: self._fire_first_write_callbacks()
+        self._fire_drain_callbacks()
+    def clear(self):
+        with self.lock: self.buffer = b""; self._first_write_callbacks = []
+        self.log("PCMPlayer: Buffer cleared for barge-in.")
+    def add_drain_callback(self, callback):
+        """One-shot callback run after the next flush() has written out everything buffered."""
+        with self.lock: self._drain_callbacks.append(callback)
+    def add_first_write_callback(self, callback):
+        """One-shot callback run once the next chunk has been written to the device (dropped by clear())."""
+        with self.lock: self._first_write_callbacks.append(callback)
+    def _fire_first_write_callbacks(self):
+        with self.lock: callbacks, self._first_write_callbacks = self._first_write_callbacks, []
+        for callback in callbacks:
+            try: callback()
+            except Exception as e_cb: self.log(f"PCMPlayer first-write callback error: {e_cb}", "ERROR")
+    def _fire_drain_callbacks(self):
+        with self.lock: callbacks, self._drain_callbacks = self._drain_callbacks, []
+        for callback in callbacks:
+            try: callback()
+            except Exception as e_cb: self.log(f"PCMPlayer drain callback error: {e_cb}", "ERROR")
+    def close(self):
+        if self.stream:
+            try:
+                if self.stream.is_active(): self.stream.stop_stream()
+                while not self.stream.is_stopped(): time.sleep(0.01)
+                self.stream.close()
+            except Exception as e_close: self.log(f"PCMPlayer error during close: {e_close}")
+            finally: self.stream = None; self.log("PCMPlayer stream closed.")
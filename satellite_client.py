@@ -0,0 +1,337 @@
+# satellite_client.py
+# Reference satellite: streams a mic (or a WAV file, for testing) to satellite_server.py and plays
+# the assistant audio it gets back (to the speaker, or into a WAV file aligned with the input).
+#
+#   python satellite_client.py --server 192.168.1.10:8770 --name kitchen --wav hey_jarvis.wav [--out reply.wav]
+#   python satellite_client.py --server 192.168.1.10:8770 --name kitchen --pyaudio
+#
+# Needs only numpy and satellite_protocol.py (plus pyaudio for --pyaudio); none of the assistant's
+# dependencies. --send-jitter-ms and --loss impair the uplink on purpose, to see how the host's
+# jitter buffer copes. At the end it prints what was sent, received and played.
+import argparse
+import queue
+import random
+import threading
+import time
+import wave
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+from satellite_protocol import (SatelliteConnection, JitterBuffer, ProtocolError, parse_json, decode_audio, monotonic_us,
+                                MSG_HELLO, MSG_WELCOME, MSG_AUDIO, MSG_CONTROL, CODECS, DEFAULT_SATELLITE_PORT)
+
+RATE = 24000
+FRAME_MS = 30
+FRAME_BYTES = int(RATE * FRAME_MS / 1000) * 2
+STATS_INTERVAL_S = 5.0
+
+
+def _sat_client_log(message, level="INFO"):
+    print(f"[{level}] [SAT_CLIENT] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class _Pacer:
+    """Sleeps until the next frame period; falls back to now instead of catching up in a burst."""
+
+    def __init__(self):
+        self._next_due = None
+
+    def wait(self):
+        now = time.perf_counter()
+        self._next_due = (self._next_due or now) + FRAME_MS / 1000.0
+        if self._next_due > now:
+            time.sleep(self._next_due - now)
+        else:
+            self._next_due = now
+
+
+# --- Mic and speaker ---
+class WavMic:
+    """A WAV file as the mic, converted to 24 kHz mono and read in real time. None at the end unless looping."""
+
+    def __init__(self, path: str, loop: bool = False):
+        with wave.open(path, "rb") as wav_file:
+            channels, rate = wav_file.getnchannels(), wav_file.getframerate()
+            if wav_file.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit WAV is supported")
+            samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        if rate != RATE:
+            target_len = int(len(samples) * RATE / rate)
+            samples = np.interp(np.linspace(0, len(samples) - 1, target_len), np.arange(len(samples)), samples.astype(np.float32)).astype(np.int16)
+        self.pcm = samples.tobytes()
+        self.loop = loop
+        self._pos = 0
+        self._pacer = _Pacer()
+
+    def read_frame(self) -> Optional[bytes]:
+        if self._pos + FRAME_BYTES > len(self.pcm):
+            if not self.loop or len(self.pcm) < FRAME_BYTES:
+                return None
+            self._pos = 0
+        frame = self.pcm[self._pos:self._pos + FRAME_BYTES]
+        self._pos += FRAME_BYTES
+        self._pacer.wait()
+        return frame
+
+    def close(self):
+        pass
+
+
+class WavSpeaker:
+    """Writes everything the speaker would play, silence included, so the output lines up with the input."""
+
+    def __init__(self, path: Optional[str]):
+        self._pacer = _Pacer()
+        self._wav = None
+        if path:
+            self._wav = wave.open(path, "wb")
+            self._wav.setnchannels(1); self._wav.setsampwidth(2); self._wav.setframerate(RATE)
+
+    def write_frame(self, pcm: bytes):
+        if self._wav:
+            self._wav.writeframes(pcm)
+        self._pacer.wait()
+
+    def close(self):
+        if self._wav:
+            self._wav.close()
+
+
+class PyAudioDevices:
+    """The default mic and speaker. The blocking reads / writes pace both directions."""
+
+    def __init__(self):
+        import pyaudio
+        self._pyaudio = pyaudio.PyAudio()
+        self._in = self._pyaudio.open(format=pyaudio.paInt16, channels=1, rate=RATE, input=True, frames_per_buffer=FRAME_BYTES // 2)
+        self._out = self._pyaudio.open(format=pyaudio.paInt16, channels=1, rate=RATE, output=True, frames_per_buffer=FRAME_BYTES // 2)
+
+    def read_frame(self) -> Optional[bytes]:
+        try:
+            return self._in.read(FRAME_BYTES // 2, exception_on_overflow=False)
+        except IOError:
+            return None
+
+    def write_frame(self, pcm: bytes):
+        self._out.write(pcm)
+
+    def close(self):
+        for stream in (self._in, self._out):
+            try: stream.close()
+            except Exception: pass
+        self._pyaudio.terminate()
+
+
+# --- Client ---
+class SatelliteClient:
+    """
+    Threads: capture (mic -> frames with sequence numbers), transmit (optionally impaired),
+    receive (speaker frames into the playout jitter buffer, controls) and playout (one frame
+    per period to the speaker, reports flushes as drained once played).
+    """
+
+    def __init__(self, host: str, port: int, name: str, mic, speaker, codec: str = "ulaw", token: str = "",
+                 config: Optional[Dict] = None, send_jitter_ms: float = 0.0, loss: float = 0.0, log_fn=None):
+        self.host, self.port, self.name = host, port, name
+        self.mic, self.speaker = mic, speaker
+        self.codec_name, self.codec = codec, CODECS[codec]
+        self.token = token
+        self.config = config or {}
+        self.send_jitter_ms = send_jitter_ms
+        self.loss = loss
+        self.log = log_fn or _sat_client_log
+        self.connection: Optional[SatelliteConnection] = None
+        self.playout: Optional[JitterBuffer] = None
+        self._outgoing = queue.Queue()
+        self._flushes = [] # (flush seq, last audio seq it covers), reported drained once played
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.mic_done = threading.Event()
+        self.server_closed = threading.Event()
+        self.frames_captured = self.frames_dropped = self.clears = self.drained = 0
+        self.state = None
+        self._threads = []
+
+    def connect(self) -> Dict:
+        self.connection = SatelliteConnection.connect(self.host, self.port)
+        self.connection.send_json(MSG_HELLO, {"name": self.name, "token": self.token, "codec": self.codec_name,
+                                              "rate": RATE, "frame_ms": FRAME_MS, "config": self.config})
+        message = self.connection.recv()
+        if message is None or message.type != MSG_WELCOME:
+            raise ProtocolError("no WELCOME from the server")
+        welcome = parse_json(message)
+        if not welcome.get("ok"):
+            raise ProtocolError(f"server refused: {welcome.get('error')}")
+        self.playout = JitterBuffer(FRAME_MS, FRAME_BYTES, target_ms=welcome.get("jitter_ms", 60), max_ms=2000)
+        self.log(f"Connected to {self.host}:{self.port} as {self.name} ({self.codec_name}).")
+        return welcome
+
+    def start(self):
+        for target, name in ((self._capture_loop, "sat-capture"), (self._transmit_loop, "sat-tx"),
+                             (self._receive_loop, "sat-rx"), (self._playout_loop, "sat-playout")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _capture_loop(self):
+        seq = 0
+        while not self._stop.is_set():
+            frame = self.mic.read_frame()
+            if frame is None:
+                break
+            captured_us = monotonic_us()
+            self.frames_captured += 1
+            if self.loss and random.random() < self.loss:
+                self.frames_dropped += 1 # Leaves a gap in the sequence, as a lost datagram would
+            else:
+                delay_s = random.uniform(0, self.send_jitter_ms) / 1000.0 if self.send_jitter_ms else 0.0
+                self._outgoing.put((time.perf_counter() + delay_s, seq, captured_us, frame))
+            seq += 1
+        self.mic_done.set()
+
+    def _transmit_loop(self):
+        while not self._stop.is_set():
+            try:
+                due, seq, captured_us, frame = self._outgoing.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            wait_s = due - time.perf_counter()
+            if wait_s > 0:
+                time.sleep(wait_s) # Held back frames delay the ones behind them too, like a congested link
+            try:
+                self.connection.send_audio(seq, self.codec, frame, sent_us=captured_us)
+            except OSError:
+                break
+
+    def _receive_loop(self):
+        try:
+            while True:
+                message = self.connection.recv()
+                if message is None:
+                    break
+                if message.type == MSG_AUDIO:
+                    self.playout.put(message.seq, decode_audio(message.codec, message.payload), message.sent_us)
+                elif message.type == MSG_CONTROL:
+                    control = parse_json(message)
+                    op = control.get("op")
+                    if op == "clear":
+                        self.clears += 1
+                        self.playout.clear()
+                    elif op == "flush":
+                        self.playout.play_out()
+                        with self._lock: self._flushes.append((control["seq"], control["after"]))
+                    elif op == "state":
+                        self.state = control.get("state")
+                        self.log(f"Host state: {self.state}")
+        except ProtocolError as e_protocol:
+            self.log(f"{e_protocol}. Disconnecting.", "WARN")
+        self.server_closed.set()
+
+    def _playout_loop(self):
+        silence = b"\x00" * FRAME_BYTES
+        last_stats = time.monotonic()
+        while not self._stop.is_set():
+            frame = self.playout.pop()
+            self.speaker.write_frame(frame or silence)
+            self._report_drained()
+            if time.monotonic() - last_stats >= STATS_INTERVAL_S:
+                last_stats = time.monotonic()
+                try:
+                    self.connection.send_control("stats", **self.playout.stats())
+                except OSError:
+                    pass
+
+    def _report_drained(self):
+        next_seq = self.playout.next_seq
+        with self._lock:
+            done = [flush for flush in self._flushes if next_seq is None or next_seq > flush[1] or self.playout.is_empty()]
+            self._flushes = [flush for flush in self._flushes if flush not in done]
+        for flush_seq, _ in done:
+            self.drained += 1
+            try:
+                self.connection.send_control("drained", seq=flush_seq)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self.connection and not self.connection.closed:
+            try:
+                self.connection.send_control("bye")
+            except OSError:
+                pass
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        if self.connection:
+            self.connection.close()
+        self.mic.close()
+        if self.speaker is not self.mic:
+            self.speaker.close()
+
+    def stats(self) -> Dict:
+        return {"captured": self.frames_captured, "dropped_on_purpose": self.frames_dropped,
+                "kb_sent": self.connection.bytes_sent / 1000.0 if self.connection else 0.0,
+                "kb_received": self.connection.bytes_received / 1000.0 if self.connection else 0.0,
+                "clears": self.clears, "drained": self.drained, "playout": self.playout.stats() if self.playout else {}}
+
+
+def print_client_stats(stats: Dict, elapsed_s: float):
+    playout = stats["playout"]
+    print(f"\nSatellite session: {elapsed_s:.1f} s")
+    print(f"  mic frames captured {stats['captured']} (dropped on purpose {stats['dropped_on_purpose']}), "
+          f"sent {stats['kb_sent']:.0f} kB ({stats['kb_sent'] * 8 / max(1e-6, elapsed_s):.0f} kbps)")
+    print(f"  speaker frames received {playout.get('received', 0)}, played {playout.get('played', 0)}, "
+          f"lost {playout.get('lost', 0)}, late {playout.get('late', 0)}, underruns {playout.get('underruns', 0)}, "
+          f"jitter {playout.get('jitter_ms', 0.0):.1f} ms ({stats['kb_received']:.0f} kB)")
+    print(f"  barge-in clears {stats['clears']}, playbacks drained {stats['drained']}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Reference satellite: stream a WAV file or the mic to satellite_server.py.")
+    arg_parser.add_argument("--server", default=f"127.0.0.1:{DEFAULT_SATELLITE_PORT}", help="host:port of satellite_server.py")
+    arg_parser.add_argument("--name", default="satellite")
+    arg_parser.add_argument("--token", default="", help="SATELLITE_TOKEN of the server, if it sets one.")
+    arg_parser.add_argument("--codec", choices=sorted(CODECS), default="ulaw")
+    source_group = arg_parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--wav", help="16-bit WAV file used as the mic.")
+    source_group.add_argument("--pyaudio", action="store_true", help="Use the default mic and speaker.")
+    arg_parser.add_argument("--loop", action="store_true", help="Repeat the WAV file until --seconds.")
+    arg_parser.add_argument("--out", help="With --wav: write the played speaker audio to this WAV file.")
+    arg_parser.add_argument("--seconds", type=float, default=None, help="Stop after this long.")
+    arg_parser.add_argument("--tail-s", type=float, default=10.0, help="With --wav: keep listening this long after the file ends.")
+    arg_parser.add_argument("--send-jitter-ms", type=float, default=0.0, help="Delay each mic frame by up to this much before sending.")
+    arg_parser.add_argument("--loss", type=float, default=0.0, help="Fraction of mic frames to drop before sending.")
+    arg_parser.add_argument("--wake-word-model", help="Ask the host for this wake-word model.")
+    cli_args = arg_parser.parse_args()
+
+    server_host, _, server_port = cli_args.server.rpartition(":")
+    if cli_args.pyaudio:
+        mic = speaker = PyAudioDevices()
+    else:
+        mic, speaker = WavMic(cli_args.wav, loop=cli_args.loop), WavSpeaker(cli_args.out)
+    client = SatelliteClient(server_host or "127.0.0.1", int(server_port), cli_args.name, mic, speaker, codec=cli_args.codec,
+                             token=cli_args.token, config={"WAKE_WORD_MODEL": cli_args.wake_word_model} if cli_args.wake_word_model else {},
+                             send_jitter_ms=cli_args.send_jitter_ms, loss=cli_args.loss)
+    started = time.monotonic()
+    try:
+        client.connect()
+        client.start()
+        deadline = started + cli_args.seconds if cli_args.seconds else None
+        tail_deadline = None
+        while not client.server_closed.is_set() and (deadline is None or time.monotonic() < deadline):
+            if client.mic_done.is_set():
+                tail_deadline = tail_deadline or time.monotonic() + cli_args.tail_s
+                if time.monotonic() >= tail_deadline:
+                    break
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        _sat_client_log("Ctrl+C. Disconnecting...")
+    except (ProtocolError, OSError) as e_connect:
+        _sat_client_log(f"Connection failed: {e_connect}", "ERROR")
+    finally:
+        client.stop()
+        print_client_stats(client.stats(), time.monotonic() - started)
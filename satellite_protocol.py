@@ -0,0 +1,290 @@
+# satellite_protocol.py
+# Wire format shared by satellite_server.py (central host) and satellite_client.py (thin room device).
+#
+# A satellite is a mic + speaker that only captures, encodes and plays audio. Wake word, VAD,
+# barge-in and the realtime session run on the host, one DeviceContext per satellite.
+#
+# Transport is one TCP connection per satellite. Every message is a fixed header followed by a payload:
+#
+#   magic "SA" | version u8 | type u8 | codec u8 | flags u8 | seq u32 | sent_us u64 | length u32 | payload
+#
+#   HELLO    satellite -> host, JSON: {"name", "token", "codec", "rate", "frame_ms", "config": {...}}
+#   WELCOME  host -> satellite, JSON: {"ok", "error", "codec", "rate", "frame_ms", "jitter_ms"}
+#   AUDIO    both ways, one frame_ms frame of encoded mono audio. seq counts frames per direction
+#            (a lost frame leaves a gap); sent_us is the sender's monotonic clock at capture/send.
+#   CONTROL  both ways, JSON {"op": ...}:
+#            host -> satellite: "clear" (barge-in, drop queued speaker audio), "flush" {"seq"}
+#            (report when everything up to here has played), "state" {"state"}
+#            satellite -> host: "drained" {"seq"}, "stats" {...playout counters}, "bye"
+#
+# Only this module and numpy are needed on a satellite.
+import json
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Optional
+
+import numpy as np
+
+PROTOCOL_MAGIC = b"SA"
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("!2sBBBBIQI")
+MAX_PAYLOAD_BYTES = 1 << 20
+
+MSG_HELLO = 1
+MSG_WELCOME = 2
+MSG_AUDIO = 3
+MSG_CONTROL = 4
+
+CODEC_PCM16 = 0
+CODEC_ULAW = 1 # G.711 mu-law: 8 bits per sample, half the bandwidth of PCM16, no native codec needed
+CODECS = {"pcm16": CODEC_PCM16, "ulaw": CODEC_ULAW}
+CODEC_NAMES = {code: name for name, code in CODECS.items()}
+
+DEFAULT_SATELLITE_PORT = 8770
+
+Message = namedtuple("Message", "type codec seq sent_us payload")
+
+
+def monotonic_us() -> int:
+    return time.monotonic_ns() // 1000
+
+
+# --- Codecs (PCM16 little-endian in, PCM16 little-endian out) ---
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159 # In the 14-bit domain G.711 works in
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+
+
+def _build_ulaw_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent, mantissa = (codes >> 4) & 0x07, codes & 0x0F
+    magnitude = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+_ULAW_DECODE = _build_ulaw_decode_table()
+
+
+def ulaw_encode(pcm: bytes) -> bytes:
+    """G.711 mu-law, bit-exact with the reference encoder (and the old stdlib audioop.lin2ulaw)."""
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.int32) >> 2
+    negative = samples < 0
+    magnitude = np.minimum(np.where(negative, -samples, samples), _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, magnitude)
+    code = np.where(segment > 7, 0x7F, (np.minimum(segment, 7) << 4) | ((magnitude >> (np.minimum(segment, 7) + 1)) & 0x0F))
+    return (code ^ np.where(negative, 0x7F, 0xFF)).astype(np.uint8).tobytes()
+
+
+def ulaw_decode(payload: bytes) -> bytes:
+    return _ULAW_DECODE[np.frombuffer(payload, dtype=np.uint8)].astype("<i2").tobytes()
+
+
+def encode_audio(codec: int, pcm: bytes) -> bytes:
+    return ulaw_encode(pcm) if codec == CODEC_ULAW else pcm
+
+
+def decode_audio(codec: int, payload: bytes) -> bytes:
+    return ulaw_decode(payload) if codec == CODEC_ULAW else payload
+
+
+# --- Framing ---
+class ProtocolError(Exception):
+    pass
+
+
+class SatelliteConnection:
+    """One framed TCP connection. send_* may be called from several threads; recv() from one."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # 30 ms frames must not wait for Nagle
+        self.peer = "%s:%s" % sock.getpeername()[:2]
+        self._send_lock = threading.Lock()
+        self.closed = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @classmethod
+    def connect(cls, host: str, port: int, timeout_s: float = 10.0) -> "SatelliteConnection":
+        sock = socket.create_connection((host, port), timeout=timeout_s)
+        sock.settimeout(None)
+        return cls(sock)
+
+    def send(self, msg_type: int, payload: bytes, codec: int = 0, seq: int = 0, sent_us: Optional[int] = None):
+        header = HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, msg_type, codec, 0, seq & 0xFFFFFFFF,
+                             monotonic_us() if sent_us is None else sent_us, len(payload))
+        with self._send_lock:
+            self.sock.sendall(header + payload)
+            self.bytes_sent += len(header) + len(payload)
+
+    def send_json(self, msg_type: int, body: Dict):
+        self.send(msg_type, json.dumps(body).encode("utf-8"))
+
+    def send_control(self, op: str, **fields):
+        self.send_json(MSG_CONTROL, {"op": op, **fields})
+
+    def send_audio(self, seq: int, codec: int, pcm: bytes, sent_us: Optional[int] = None):
+        self.send(MSG_AUDIO, encode_audio(codec, pcm), codec=codec, seq=seq, sent_us=sent_us)
+
+    def _recv_exact(self, size: int) -> Optional[bytes]:
+        chunks, remaining = [], size
+        while remaining:
+            chunk = self.sock.recv(remaining)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        self.bytes_received += size
+        return b"".join(chunks)
+
+    def recv(self) -> Optional[Message]:
+        """Next message, or None once the peer has closed the connection."""
+        try:
+            header = self._recv_exact(HEADER.size)
+            if header is None:
+                return None
+            magic, version, msg_type, codec, _flags, seq, sent_us, length = HEADER.unpack(header)
+            if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION:
+                raise ProtocolError(f"bad header from {self.peer} (magic {magic!r}, version {version})")
+            if length > MAX_PAYLOAD_BYTES:
+                raise ProtocolError(f"{length} byte payload from {self.peer} exceeds {MAX_PAYLOAD_BYTES}")
+            payload = self._recv_exact(length) if length else b""
+        except OSError:
+            return None # Closed locally (close()) or reset by the peer
+        if payload is None:
+            return None
+        return Message(msg_type, codec, seq, sent_us, payload)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def parse_json(message: Message) -> Dict:
+    try:
+        return json.loads(message.payload.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e_json:
+        raise ProtocolError(f"bad JSON in message type {message.type}: {e_json}")
+
+
+# --- Jitter buffer ---
+class JitterBuffer:
+    """
+    Frames arrive in bursts and gaps; pop() is called once per frame period by a paced reader.
+    Playout starts once target_ms is buffered. A missing frame is skipped once later frames
+    have arrived (counted lost, replaced by silence). When the buffer runs dry it refills to
+    target_ms again (an underrun). Above max_ms the oldest frames are dropped, which bounds
+    latency when the sender's clock runs faster than ours. Frames older than the playout
+    position are discarded as late. play_out() marks the end of a burst (e.g. a response):
+    what is queued plays at once, and running dry afterwards is not an underrun.
+    """
+
+    def __init__(self, frame_ms: int, frame_bytes: int, target_ms: int = 60, max_ms: int = 500):
+        self.frame_ms = frame_ms
+        self.frame_bytes = frame_bytes
+        self.target_frames = max(1, int(round(target_ms / frame_ms)))
+        self.max_frames = max(self.target_frames + 1, int(round(max_ms / frame_ms)))
+        self._frames: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self._next_seq: Optional[int] = None
+        self._highest_seq: Optional[int] = None
+        self._playing = False
+        self._ending = False
+        self._last_transit_us: Optional[int] = None
+        self.jitter_ms = 0.0 # RFC 3550 interarrival jitter estimate
+        self.received = self.played = self.lost = self.late = self.duplicates = self.overflow_dropped = self.underruns = 0
+
+    def put(self, seq: int, payload: bytes, sent_us: Optional[int] = None):
+        arrival_us = monotonic_us()
+        with self._lock:
+            if sent_us is not None: # Sender and receiver clocks differ by a constant; only the variation matters
+                transit_us = arrival_us - sent_us
+                if self._last_transit_us is not None:
+                    self.jitter_ms += (abs(transit_us - self._last_transit_us) / 1000.0 - self.jitter_ms) / 16.0
+                self._last_transit_us = transit_us
+            if self._next_seq is None:
+                self._next_seq = seq
+            if seq < self._next_seq:
+                self.late += 1
+                return
+            if seq in self._frames:
+                self.duplicates += 1
+                return
+            self._frames[seq] = payload
+            self.received += 1
+            self._highest_seq = seq if self._highest_seq is None else max(self._highest_seq, seq)
+            if self._span() > self.max_frames: # Drop oldest until back at target depth
+                while self._span() > self.target_frames:
+                    self._advance(drop=True)
+
+    def _span(self) -> int:
+        """Frames between the playout position and the newest arrival, gaps included."""
+        if self._highest_seq is None or self._next_seq is None or self._highest_seq < self._next_seq:
+            return 0
+        return self._highest_seq - self._next_seq + 1
+
+    def _advance(self, drop: bool = False) -> Optional[bytes]:
+        frame = self._frames.pop(self._next_seq, None)
+        if drop and frame is not None:
+            self.overflow_dropped += 1
+        self._next_seq += 1
+        return frame
+
+    def pop(self) -> Optional[bytes]:
+        """The next frame to play, a silence frame for a lost one, or None while (re)buffering."""
+        with self._lock:
+            if self._next_seq is None:
+                return None
+            if not self._playing:
+                if self._span() < self.target_frames:
+                    return None
+                self._playing = True
+            if self._span() == 0:
+                if not self._ending:
+                    self.underruns += 1
+                self._playing = self._ending = False
+                return None
+            frame = self._advance()
+            if frame is None:
+                self.lost += 1
+                return b"\x00" * self.frame_bytes
+            self.played += 1
+            return frame
+
+    def play_out(self):
+        with self._lock:
+            if self._span():
+                self._playing = self._ending = True
+
+    def clear(self):
+        """Drops everything queued; playout restarts from the next frame that arrives."""
+        with self._lock:
+            self._frames.clear()
+            self._next_seq = self._highest_seq = None
+            self._playing = self._ending = False
+
+    @property
+    def next_seq(self) -> Optional[int]:
+        return self._next_seq
+
+    def depth_ms(self) -> float:
+        with self._lock:
+            return len(self._frames) * self.frame_ms
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._frames
+
+    def stats(self) -> Dict:
+        return {"received": self.received, "played": self.played, "lost": self.lost, "late": self.late,
+                "duplicates": self.duplicates, "overflow_dropped": self.overflow_dropped, "underruns": self.underruns,
+                "jitter_ms": round(self.jitter_ms, 2), "depth_ms": self.depth_ms()}
@@ -0,0 +1,410 @@
+# satellite_server.py
+# Central host for thin satellites: each room device streams its mic over TCP (satellite_protocol.py)
+# and plays what comes back. Everything else runs here, one DeviceContext per connected satellite:
+# wake word, local VAD / barge-in / endpointing, uplink gating and the realtime session.
+#
+# Run:  python satellite_server.py [--host 127.0.0.1] [--port 8770] [--report-s 10]
+#       (listening on a LAN address, e.g. --host 0.0.0.0, requires SATELLITE_TOKEN)
+# Test: python satellite_client.py --server 127.0.0.1:8770 --name kitchen --wav hey_jarvis.wav --out reply.wav
+#
+# A satellite's mic frames go through a jitter buffer (SATELLITE_JITTER_MS of prefill) and are read
+# out at the frame cadence, as DeviceContext expects from a sound card. Assistant audio is paced out
+# to the satellite in real time, at most SATELLITE_PLAYOUT_LEAD_MS ahead of its playback, so a
+# barge-in only has that much queued on the device to discard. The periodic report adds per
+# satellite network counters (loss, late frames, jitter, underruns on both sides) to the
+# device_context host report (CPU per device, process RSS).
+import argparse
+import hmac
+import ipaddress
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from app_config import APP_CONFIG, OPENAI_API_KEY, OPENAI_REALTIME_MODEL_ID
+from device_context import DeviceContext, SharedResources, print_host_report, CHUNK_MS, INPUT_RATE, OUTPUT_RATE, FRAME_BYTES
+from satellite_protocol import (SatelliteConnection, JitterBuffer, ProtocolError, parse_json, decode_audio,
+                                MSG_HELLO, MSG_WELCOME, MSG_AUDIO, MSG_CONTROL, CODECS, CODEC_NAMES)
+
+# Per-device settings a satellite may choose in its HELLO; everything else comes from the host's APP_CONFIG
+SATELLITE_CONFIG_KEYS = ("WAKE_WORD_MODEL", "WAKE_WORD_THRESHOLD", "OPENAI_VOICE", "USAGE_TAG")
+HANDSHAKE_TIMEOUT_S = 5.0
+
+
+def _sat_srv_log(message, level="INFO"):
+    print(f"[{level}] [SAT_SERVER] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def _is_loopback_host(host: str) -> bool:
+    """True if every address host resolves to is a loopback address ("" / 0.0.0.0 listen on all interfaces)."""
+    if not host:
+        return False
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        pass
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    return bool(infos) and all(ipaddress.ip_address(info[4][0].split("%")[0]).is_loopback for info in infos)
+
+
+class NetworkSource:
+    """DeviceContext audio source: the satellite's mic frames, read out of a jitter buffer at the frame cadence."""
+
+    def __init__(self, jitter_ms: int, max_ms: int):
+        self.jitter = JitterBuffer(CHUNK_MS, FRAME_BYTES, target_ms=jitter_ms, max_ms=max_ms)
+        self._closed = threading.Event()
+        self._next_due = None
+
+    def put(self, seq: int, pcm: bytes, sent_us: int):
+        self.jitter.put(seq, pcm, sent_us)
+
+    def read_frame(self) -> Optional[bytes]:
+        if self._closed.is_set():
+            return None
+        now = time.perf_counter()
+        self._next_due = (self._next_due or now) + CHUNK_MS / 1000.0
+        if self._next_due > now:
+            self._closed.wait(self._next_due - now)
+        else:
+            self._next_due = now # Pipeline fell behind: don't catch up in a burst, the jitter buffer absorbs it
+        frame = self.jitter.pop()
+        return frame if frame is not None else b"" # b"": still buffering, no frame this period
+
+    def close(self):
+        self._closed.set()
+
+
+class _Unplayed:
+    """Stands in for PCMPlayer.buffer (the client only takes len()): audio held here plus audio sent but not yet played."""
+
+    def __init__(self, player: "NetworkPlayer"):
+        self.player = player
+
+    def __len__(self):
+        return self.player.unplayed_bytes()
+
+
+class NetworkPlayer:
+    """
+    PCMPlayer's interface for a satellite's speaker. Audio is held here and sent frame by frame,
+    paced so the satellite never has more than lead_ms queued. flush() is forwarded once the held
+    audio is sent; the drain callbacks run when the satellite reports it has played it out.
+    """
+
+    def __init__(self, connection: SatelliteConnection, codec: int, lead_ms: int, log_fn=None):
+        self.connection = connection
+        self.codec = codec
+        self.lead_s = lead_ms / 1000.0
+        self.log = log_fn or _sat_srv_log
+        self.chunk_bytes = int(OUTPUT_RATE * CHUNK_MS / 1000) * 2
+        self.buffer = _Unplayed(self)
+        self.lock = threading.RLock()
+        self._wakeup = threading.Condition(self.lock)
+        self._held = bytearray()
+        self._seq = 0
+        self._playout_until = 0.0 # perf_counter time at which the satellite will have played everything sent
+        self._flush_seq = 0
+        self._flush_pending = False
+        self._drain_callbacks = []
+        self._first_write_callbacks = []
+        self._running = True
+        self.frames_sent = 0
+        self.clears = 0
+        self._sender = threading.Thread(target=self._send_loop, name="sat-playout", daemon=True)
+        self._sender.start()
+
+    def unplayed_bytes(self) -> int:
+        with self.lock:
+            in_flight_s = max(0.0, self._playout_until - time.perf_counter())
+            return len(self._held) + int(in_flight_s * OUTPUT_RATE) * 2
+
+    def play(self, pcm_bytes):
+        with self._wakeup:
+            self._held += pcm_bytes
+            self._wakeup.notify()
+
+    def flush(self):
+        with self._wakeup:
+            self._flush_seq += 1
+            self._flush_pending = True
+            self._wakeup.notify()
+
+    def clear(self):
+        with self.lock:
+            self._held.clear()
+            self._playout_until = 0.0
+            self._first_write_callbacks = []
+            self.clears += 1
+        self._send_control("clear")
+        self.log("NetworkPlayer: Buffer cleared for barge-in.")
+
+    def add_drain_callback(self, callback):
+        """One-shot callback run once the satellite has played out the next flush()."""
+        with self.lock: self._drain_callbacks.append(callback)
+
+    def add_first_write_callback(self, callback):
+        """One-shot callback run once the next audio frame has been sent to the satellite (dropped by clear())."""
+        with self.lock: self._first_write_callbacks.append(callback)
+
+    def on_drained(self, seq: int):
+        with self.lock:
+            if seq != self._flush_seq:
+                return # An older flush; the callbacks wait for the latest one
+            callbacks, self._drain_callbacks = self._drain_callbacks, []
+        self._run_callbacks(callbacks)
+
+    def _run_callbacks(self, callbacks):
+        for callback in callbacks:
+            try: callback()
+            except Exception as e_cb: self.log(f"NetworkPlayer drain callback error: {e_cb}", "ERROR")
+
+    def _send_control(self, op: str, **fields):
+        try:
+            self.connection.send_control(op, **fields)
+        except OSError:
+            pass # Disconnected; the session is torn down by its receive loop
+
+    def _send_loop(self):
+        frame_s = CHUNK_MS / 1000.0
+        while self._running:
+            chunk, flush_seq = None, None
+            with self._wakeup:
+                now = time.perf_counter()
+                ahead_s = self._playout_until - now
+                whole_chunk = len(self._held) >= self.chunk_bytes
+                if self._held and (whole_chunk or self._flush_pending) and ahead_s < self.lead_s:
+                    chunk = bytes(self._held[:self.chunk_bytes])
+                    del self._held[:self.chunk_bytes]
+                    self._playout_until = max(self._playout_until, now) + len(chunk) / 2 / OUTPUT_RATE
+                    seq, self._seq = self._seq, self._seq + 1
+                elif not self._held and self._flush_pending:
+                    flush_seq, self._flush_pending = self._flush_seq, False
+                elif self._held and ahead_s >= self.lead_s:
+                    self._wakeup.wait(min(frame_s, ahead_s - self.lead_s + 0.001))
+                    continue
+                else:
+                    self._wakeup.wait(frame_s)
+                    continue
+            try:
+                if chunk is not None:
+                    self.connection.send_audio(seq, self.codec, chunk)
+                    self.frames_sent += 1
+                    if self._first_write_callbacks:
+                        with self.lock:
+                            callbacks, self._first_write_callbacks = self._first_write_callbacks, []
+                        self._run_callbacks(callbacks)
+                else:
+                    self.connection.send_control("flush", seq=flush_seq, after=self._seq - 1)
+            except OSError:
+                self._running = False
+
+    def close(self):
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify()
+            callbacks, self._drain_callbacks = self._drain_callbacks, []
+        self._run_callbacks(callbacks) # Nobody will report these played out any more
+
+
+class SatelliteDevice(DeviceContext):
+    """A DeviceContext that also tells its satellite about state changes (e.g. for a listening LED)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.app_state.subscribe(lambda old_state, new_state: self.player._send_control("state", state=str(new_state)))
+
+
+class SatelliteSession:
+    """One connected satellite: its connection, jitter-buffered mic source, network player and device."""
+
+    def __init__(self, name: str, connection: SatelliteConnection, codec: int, shared: SharedResources, config: dict):
+        self.name = name
+        self.connection = connection
+        self.codec = codec
+        self.connected_at = time.time()
+        self.source = NetworkSource(config["SATELLITE_JITTER_MS"], max_ms=max(500, 4 * config["SATELLITE_JITTER_MS"]))
+        device_log = lambda m, level="INFO": _sat_srv_log(f"[{name}] {m}", level)
+        self.player = NetworkPlayer(connection, codec, config["SATELLITE_PLAYOUT_LEAD_MS"], log_fn=device_log)
+        self.device = SatelliteDevice(name, shared, self.source, self.player, config)
+        self.remote_stats: Dict = {} # Latest "stats" control from the satellite (its playout buffer)
+        self.mic_frames = 0
+
+    def run(self):
+        """Starts the device and handles the satellite's messages until it disconnects."""
+        self.device.start()
+        try:
+            while True:
+                message = self.connection.recv()
+                if message is None:
+                    break
+                if message.type == MSG_AUDIO:
+                    self.mic_frames += 1
+                    self.source.put(message.seq, decode_audio(message.codec, message.payload), message.sent_us)
+                elif message.type == MSG_CONTROL:
+                    control = parse_json(message)
+                    if control.get("op") == "drained":
+                        self.player.on_drained(control.get("seq"))
+                    elif control.get("op") == "stats":
+                        self.remote_stats = control
+                    elif control.get("op") == "bye":
+                        break
+        except ProtocolError as e_protocol:
+            _sat_srv_log(f"[{self.name}] {e_protocol}. Dropping the connection.", "WARN")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.connection.close()
+        self.device.stop() # Closes the source (ends the pipeline) and the player
+
+    def network_stats(self) -> Dict:
+        mic = self.source.jitter.stats()
+        online_s = max(1e-6, time.time() - self.connected_at)
+        return {"name": self.name, "peer": self.connection.peer, "mic": mic, "speaker": self.remote_stats,
+                "kbps_in": self.connection.bytes_received * 8 / 1000.0 / online_s,
+                "kbps_out": self.connection.bytes_sent * 8 / 1000.0 / online_s, "clears": self.player.clears}
+
+
+class SatelliteServer:
+    """Accepts satellites and runs a SatelliteSession for each; a reconnecting satellite replaces its old session."""
+
+    def __init__(self, host: str, port: int, config: dict, log_fn=None):
+        self.host, self.port = host, port
+        self.config = config
+        self.log = log_fn or _sat_srv_log
+        self.shared = SharedResources(config)
+        self.sessions: Dict[str, SatelliteSession] = {}
+        self._lock = threading.Lock()
+        self._listener: Optional[socket.socket] = None
+        self._running = False
+
+    def start(self):
+        if not self.config.get("SATELLITE_TOKEN") and not _is_loopback_host(self.host):
+            raise ValueError(f"Refusing to listen on {self.host!r} without SATELLITE_TOKEN: any machine that can reach it "
+                             f"could open a realtime session on this host's API key. Set SATELLITE_TOKEN or listen on 127.0.0.1.")
+        self._listener = socket.create_server((self.host, self.port), reuse_port=False)
+        self.port = self._listener.getsockname()[1]
+        self._running = True
+        threading.Thread(target=self._accept_loop, name="sat-accept", daemon=True).start()
+        self.log(f"Listening for satellites on {self.host}:{self.port} (token {'required' if self.config.get('SATELLITE_TOKEN') else 'not set'}).")
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(sock,), name="sat-conn", daemon=True).start()
+
+    def _handshake(self, connection: SatelliteConnection):
+        """Returns (name, codec, config overrides) or raises ProtocolError after telling the satellite why."""
+        connection.sock.settimeout(HANDSHAKE_TIMEOUT_S)
+        message = connection.recv()
+        connection.sock.settimeout(None)
+        if message is None or message.type != MSG_HELLO:
+            raise ProtocolError(f"{connection.peer} did not start with HELLO")
+        hello = parse_json(message)
+        error = None
+        token = self.config.get("SATELLITE_TOKEN")
+        if token and not hmac.compare_digest(str(hello.get("token") or "").encode(), str(token).encode()):
+            error = "bad token"
+        elif hello.get("codec") not in CODECS:
+            error = f"unsupported codec {hello.get('codec')!r} (supported: {', '.join(CODECS)})"
+        elif hello.get("rate") != INPUT_RATE or hello.get("frame_ms") != CHUNK_MS:
+            error = f"audio must be {INPUT_RATE} Hz mono PCM16 in {CHUNK_MS} ms frames"
+        elif not hello.get("name"):
+            error = "name missing"
+        if error:
+            connection.send_json(MSG_WELCOME, {"ok": False, "error": error})
+            raise ProtocolError(f"{connection.peer} rejected: {error}")
+        overrides = {key: value for key, value in (hello.get("config") or {}).items() if key in SATELLITE_CONFIG_KEYS}
+        return str(hello["name"]), CODECS[hello["codec"]], overrides
+
+    def _handle(self, sock: socket.socket):
+        connection = SatelliteConnection(sock)
+        try:
+            name, codec, overrides = self._handshake(connection)
+        except (ProtocolError, OSError) as e_handshake:
+            self.log(f"Handshake failed: {e_handshake}", "WARN")
+            connection.close()
+            return
+        config = {**self.config, "OPENAI_REALTIME_MODEL_ID": OPENAI_REALTIME_MODEL_ID, **overrides}
+        with self._lock:
+            previous = self.sessions.pop(name, None)
+        if previous:
+            self.log(f"{name} reconnected from {connection.peer}; closing its previous session.")
+            previous.stop()
+        session = SatelliteSession(name, connection, codec, self.shared, config)
+        connection.send_json(MSG_WELCOME, {"ok": True, "codec": CODEC_NAMES[codec], "rate": OUTPUT_RATE, "frame_ms": CHUNK_MS,
+                                           "jitter_ms": config["SATELLITE_JITTER_MS"]})
+        with self._lock:
+            self.sessions[name] = session
+        self.log(f"Satellite {name} connected from {connection.peer} (codec {CODEC_NAMES[codec]}, "
+                 f"wake word: {'on' if session.device.wake_word_active else 'off'}).")
+        session.run()
+        with self._lock:
+            if self.sessions.get(name) is session:
+                del self.sessions[name]
+        self.log(f"Satellite {name} disconnected.")
+
+    def report(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+        if not sessions:
+            self.log("No satellites connected.")
+            return
+        print_host_report([session.device for session in sessions], log_fn=self.log)
+        lines = [f"  {'satellite':<20} {'peer':<21} {'kbps in':>8} {'kbps out':>8} {'mic lost':>8} {'late':>5} "
+                 f"{'jit ms':>7} {'under':>6} {'spk under':>9} {'spk jit':>8} {'clears':>6}"]
+        for session in sessions:
+            row = session.network_stats()
+            mic, speaker = row["mic"], row["speaker"]
+            lines.append(f"  {row['name'][:20]:<20} {row['peer']:<21} {row['kbps_in']:>8.1f} {row['kbps_out']:>8.1f} "
+                         f"{mic['lost']:>8} {mic['late']:>5} {mic['jitter_ms']:>7.1f} {mic['underruns']:>6} "
+                         f"{speaker.get('underruns', '-'):>9} {speaker.get('jitter_ms', '-'):>8} {row['clears']:>6}")
+        self.log("Satellite network:\n" + "\n".join(lines))
+
+    def close(self):
+        self._running = False
+        if self._listener:
+            self._listener.close()
+        with self._lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.stop()
+        self.shared.close()
+
+
+def run_server(host: str, port: int, report_s: float = 10.0):
+    if not OPENAI_API_KEY or not OPENAI_REALTIME_MODEL_ID:
+        _sat_srv_log("OPENAI_API_KEY / OPENAI_REALTIME_MODEL_ID missing (any placeholder works against mock_realtime_server.py).", "WARN")
+    import conversation_history_db
+    conversation_history_db.init_db()
+    server = SatelliteServer(host, port, dict(APP_CONFIG))
+    try:
+        server.start()
+    except ValueError as e:
+        _sat_srv_log(str(e), "ERROR")
+        server.close()
+        return
+    try:
+        while True:
+            time.sleep(report_s)
+            server.report()
+    except KeyboardInterrupt:
+        _sat_srv_log("Ctrl+C. Disconnecting satellites...")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Central host for thin satellites streaming mic audio over TCP.")
+    arg_parser.add_argument("--host", default=APP_CONFIG["SATELLITE_HOST"])
+    arg_parser.add_argument("--port", type=int, default=APP_CONFIG["SATELLITE_PORT"])
+    arg_parser.add_argument("--report-s", type=float, default=10.0, help="Seconds between host / network reports.")
+    cli_args = arg_parser.parse_args()
+    run_server(cli_args.host, cli_args.port, cli_args.report_s)
@@ -0,0 +1,278 @@
+# session_policy.py
+# When the realtime socket is open. An open session costs money all day; opening it only after the
+# wake word puts TLS, the handshake and priming (history summary, session.update) in front of the
+# first reply. SESSION_POLICY picks the trade-off:
+#
+#   always_on    connect at startup and stay connected (the previous behaviour)
+#   on_demand    connect on the wake word, release SESSION_RELEASE_AFTER_S after the conversation ends
+#   speculative  start connecting when the wake-word score rises past SESSION_PRE_THRESHOLD (below the
+#                detection threshold); the wake word commits it, otherwise it is dropped after
+#                SESSION_SPECULATIVE_TIMEOUT_S. Released after conversations like on_demand.
+#
+# With the lazy policies, audio the user speaks after the wake word but before the session is primed
+# is held (up to SESSION_HOLD_MAX_S) and sent first once it is, so the request is not lost.
+#
+# Each policy records wake -> first reply audio, wake -> session ready, open and idle (listening)
+# session time and speculative connects committed / dropped in latency_metrics.db.
+#   python session_policy.py report [--hours 24]
+# compares whatever policies have been run.
+import argparse
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app_state_machine import AppState
+from latency_metrics import (record_startup_duration, get_latency_report, init_latency_db,
+                             STAGE_WAKE_TO_FIRST_AUDIO, STAGE_WAKE_TO_SESSION_READY, STAGE_SESSION_OPEN,
+                             STAGE_SESSION_IDLE, STAGE_SPECULATIVE_CONNECT)
+
+POLICY_ALWAYS_ON = "always_on"
+POLICY_ON_DEMAND = "on_demand"
+POLICY_SPECULATIVE = "speculative"
+POLICIES = (POLICY_ALWAYS_ON, POLICY_ON_DEMAND, POLICY_SPECULATIVE)
+
+STATE_LISTENING_FOR_WAKEWORD = AppState.LISTENING_FOR_WAKEWORD
+STATE_SENDING_TO_OPENAI = AppState.SENDING_TO_OPENAI
+TICK_S = 0.1
+USAGE_FLUSH_S = 600.0 # A long-lived session's open / idle time is recorded in slices of this size
+
+
+def _sp_log(message, level="INFO"):
+    print(f"[{level}] [SESSION_POLICY] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class SessionPolicy:
+    """
+    Opens and releases the OpenAISpeechClient's realtime session (request_session / release_session)
+    according to the policy. Fed by the wake-word score stream (on_scores), app state changes
+    (on_state) and the client (on_session_ready / on_first_audio); a small thread handles timeouts
+    and accounts open / idle session time.
+    """
+
+    def __init__(self, client, policy: str, app_state_getter, pre_threshold: float = 0.25,
+                 speculative_timeout_s: float = 4.0, release_after_s: float = 30.0, hold_max_s: float = 10.0,
+                 frame_ms: int = 30, log_fn=None, record: bool = True):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown session policy {policy!r} (expected one of {', '.join(POLICIES)})")
+        self.client = client
+        self.policy = policy
+        self.get_app_state = app_state_getter
+        self.pre_threshold = pre_threshold
+        self.speculative_timeout_s = speculative_timeout_s
+        self.release_after_s = release_after_s
+        self.log = log_fn or _sp_log
+        self.record = record
+        self.frame_ms = frame_ms
+        self._held = deque(maxlen=max(1, int(hold_max_s * 1000 / frame_ms))) # Mic frames from the wake word until the session is ready
+        self._lock = threading.Lock()
+        self._wake_at: Optional[float] = None # Wake word waiting for its first reply audio
+        self._wake_waiting_ready = False
+        self._speculative_since: Optional[float] = None
+        self._release_at: Optional[float] = None
+        self._open_s = self._idle_s = 0.0
+        self._usage_since = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"wakes": 0, "speculative_started": 0, "speculative_committed": 0, "speculative_dropped": 0,
+                      "held_frames_sent": 0, "held_frames_dropped": 0, "releases": 0}
+        client.session_policy = self
+
+    @property
+    def lazy(self) -> bool:
+        return self.policy != POLICY_ALWAYS_ON
+
+    def start(self):
+        """Call before starting client.run_client: lazy policies keep it from connecting until a wake (score)."""
+        if self.lazy:
+            self.client.session_wanted.clear()
+        self.log(f"Session policy: {self.policy}" + (f" (pre-threshold {self.pre_threshold}, speculative timeout {self.speculative_timeout_s:.1f} s)"
+                                                    if self.policy == POLICY_SPECULATIVE else ""))
+        self._thread = threading.Thread(target=self._tick_loop, name="session-policy", daemon=True)
+        self._thread.start()
+
+    def _record(self, stage: str, duration_ms: float, tag: Optional[str] = None):
+        if self.record:
+            record_startup_duration(stage, duration_ms, tag=tag or self.policy)
+
+    # --- Inputs ---
+    def on_scores(self, scores: Dict[str, float], wake_score: float):
+        """WakeWordDetector score callback (audio thread): a rising wake score opens the session speculatively."""
+        if self.policy == POLICY_SPECULATIVE and wake_score >= self.pre_threshold:
+            self.on_wake_score(wake_score)
+
+    def on_wake_score(self, wake_score: float):
+        listening = self.get_app_state() == STATE_LISTENING_FOR_WAKEWORD
+        with self._lock:
+            if self.client.session_wanted.is_set() or not listening:
+                return # Already open or connecting, or mid-conversation
+            self._speculative_since = time.perf_counter()
+            self.stats["speculative_started"] += 1
+        self.log(f"Wake score {wake_score:.2f} >= {self.pre_threshold}: connecting speculatively.")
+        self.client.request_session()
+
+    def on_state(self, new_state: str):
+        """AppStateMachine subscriber (called in transition order). Entering a conversation is the wake (commit); leaving it starts the release timer."""
+        now = time.perf_counter()
+        if new_state == STATE_SENDING_TO_OPENAI:
+            with self._lock:
+                self.stats["wakes"] += 1
+                self._wake_at = now
+                self._release_at = None
+                self._wake_waiting_ready = True
+                if self._speculative_since is not None:
+                    self.stats["speculative_committed"] += 1
+                    self._record(STAGE_SPECULATIVE_CONNECT, (now - self._speculative_since) * 1000.0, tag="committed")
+                    self._speculative_since = None
+            if self.client.session_ready.is_set():
+                self._session_ready_at(now)
+            elif self.lazy:
+                self.client.request_session()
+        elif new_state == STATE_LISTENING_FOR_WAKEWORD:
+            with self._lock:
+                self._held.clear()
+                self._wake_at = None
+                self._wake_waiting_ready = False
+                if self.lazy:
+                    self._release_at = now + self.release_after_s
+
+    def on_session_ready(self):
+        """Client: session.update and the context item are sent (receive thread)."""
+        self._session_ready_at(time.perf_counter())
+
+    def _session_ready_at(self, now: float):
+        with self._lock:
+            if not self._wake_waiting_ready or self._wake_at is None:
+                return
+            self._wake_waiting_ready = False
+            ready_ms = max(0.0, (now - self._wake_at) * 1000.0)
+        self._record(STAGE_WAKE_TO_SESSION_READY, ready_ms)
+
+    def on_first_audio(self):
+        """Client: first audio delta of a response (receive thread)."""
+        with self._lock:
+            wake_at, self._wake_at = self._wake_at, None
+        if wake_at is not None:
+            ttfa_ms = (time.perf_counter() - wake_at) * 1000.0
+            self._record(STAGE_WAKE_TO_FIRST_AUDIO, ttfa_ms)
+            self.log(f"Wake word to first reply audio: {ttfa_ms:.0f} ms ({self.policy}).")
+
+    # --- Uplink ---
+    def ready_for_audio(self) -> bool:
+        return self.client.session_ready.is_set() if self.lazy else self.client.connected
+
+    def hold(self, frames: List[bytes]):
+        """Keeps mic frames spoken before the session was ready (lazy policies); the oldest go beyond SESSION_HOLD_MAX_S."""
+        if not self.lazy:
+            return
+        with self._lock:
+            overflow = max(0, len(self._held) + len(frames) - self._held.maxlen)
+            self.stats["held_frames_dropped"] += overflow
+            self._held.extend(frames)
+
+    def take_held(self) -> List[bytes]:
+        with self._lock:
+            if not self._held:
+                return []
+            held = list(self._held)
+            self._held.clear()
+            self.stats["held_frames_sent"] += len(held)
+        self.log(f"Session ready: sending {len(held) * self.frame_ms / 1000.0:.1f} s of audio held since the wake word.")
+        return held
+
+    # --- Timeouts and accounting ---
+    def _tick_loop(self):
+        last = time.perf_counter()
+        while not self._stop.wait(TICK_S):
+            now = time.perf_counter()
+            self._account(now - last)
+            last = now
+            release_reason = None
+            with self._lock:
+                if self._speculative_since is not None and now - self._speculative_since > self.speculative_timeout_s:
+                    self.stats["speculative_dropped"] += 1
+                    self._record(STAGE_SPECULATIVE_CONNECT, (now - self._speculative_since) * 1000.0, tag="dropped")
+                    self._speculative_since = None
+                    release_reason = "speculative connect not followed by a wake word"
+                elif self._release_at is not None and now >= self._release_at:
+                    self._release_at = None
+                    release_reason = f"{self.release_after_s:.0f} s after the conversation"
+            if release_reason and self.get_app_state() == STATE_LISTENING_FOR_WAKEWORD:
+                self.stats["releases"] += 1
+                self.client.release_session(release_reason)
+
+    def _account(self, dt: float):
+        connected = self.client.connected
+        if connected:
+            self._open_s += dt
+            if self.get_app_state() == STATE_LISTENING_FOR_WAKEWORD:
+                self._idle_s += dt
+        if self._open_s and (not connected or time.perf_counter() - self._usage_since >= USAGE_FLUSH_S):
+            self._flush_usage()
+
+    def _flush_usage(self):
+        if self._open_s:
+            self._record(STAGE_SESSION_OPEN, self._open_s * 1000.0)
+            self._record(STAGE_SESSION_IDLE, self._idle_s * 1000.0)
+        self._open_s = self._idle_s = 0.0
+        self._usage_since = time.perf_counter()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self._flush_usage()
+        self.log(f"Session policy {self.policy}: {self.stats}")
+
+
+# --- Report ---
+def get_policy_report(since_hours: Optional[float] = None) -> Dict[str, Dict]:
+    """{policy: {"wakes", "ttfa_p50", "ttfa_p95", "ready_p50", "ready_p95", "open_min", "idle_min"}} plus speculative outcomes."""
+    latency = get_latency_report(since_hours=since_hours)
+    report = {}
+    for policy in POLICIES:
+        ttfa = latency.get((STAGE_WAKE_TO_FIRST_AUDIO, policy))
+        ready = latency.get((STAGE_WAKE_TO_SESSION_READY, policy))
+        opened = latency.get((STAGE_SESSION_OPEN, policy))
+        idle = latency.get((STAGE_SESSION_IDLE, policy))
+        if not (ttfa or opened):
+            continue
+        report[policy] = {"wakes": ttfa["count"] if ttfa else 0,
+                          "ttfa_p50": ttfa["p50"] if ttfa else None, "ttfa_p95": ttfa["p95"] if ttfa else None,
+                          "ready_p50": ready["p50"] if ready else None, "ready_p95": ready["p95"] if ready else None,
+                          "open_min": opened["total"] / 60000.0 if opened else 0.0, "idle_min": idle["total"] / 60000.0 if idle else 0.0}
+    speculative = {outcome: latency.get((STAGE_SPECULATIVE_CONNECT, outcome), {}).get("count", 0) for outcome in ("committed", "dropped")}
+    if any(speculative.values()) and POLICY_SPECULATIVE in report:
+        report[POLICY_SPECULATIVE].update({f"speculative_{outcome}": count for outcome, count in speculative.items()})
+    return report
+
+
+def print_policy_report(report: Dict[str, Dict]):
+    if not report:
+        print("No session policy data recorded (set SESSION_POLICY and run main.py).")
+        return
+    fmt = lambda value: f"{value:>9.0f}" if value is not None else f"{'-':>9}"
+    print(f"{'policy':<12} {'wakes':>6} {'TTFA p50':>9} {'TTFA p95':>9} {'ready p50':>9} {'ready p95':>9} "
+          f"{'open min':>9} {'idle min':>9} {'idle/wake':>9}")
+    for policy, row in report.items():
+        idle_per_wake = row["idle_min"] / row["wakes"] if row["wakes"] else None
+        print(f"{policy:<12} {row['wakes']:>6} {fmt(row['ttfa_p50'])} {fmt(row['ttfa_p95'])} {fmt(row['ready_p50'])} {fmt(row['ready_p95'])} "
+              f"{row['open_min']:>9.1f} {row['idle_min']:>9.1f} " + (f"{idle_per_wake:>9.2f}" if idle_per_wake is not None else f"{'-':>9}"))
+    speculative = report.get(POLICY_SPECULATIVE, {})
+    if "speculative_committed" in speculative:
+        total = speculative["speculative_committed"] + speculative["speculative_dropped"]
+        print(f"\nspeculative connects: {total}, committed {speculative['speculative_committed']}, "
+              f"dropped {speculative['speculative_dropped']} ({100.0 * speculative['speculative_dropped'] / max(1, total):.0f}% wasted)")
+    print("\nTTFA / ready in ms from the wake word; open / idle in session-minutes (idle = open while listening for the wake word).")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare realtime session policies (always_on / on_demand / speculative).")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="Time to first audio and session minutes per policy, from latency_metrics.db.")
+    report_parser.add_argument("--hours", type=float, default=None)
+    cli_args = arg_parser.parse_args()
+    if cli_args.command == "report":
+        init_latency_db()
+        print_policy_report(get_policy_report(cli_args.hours))
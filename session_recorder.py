@@ -0,0 +1,110 @@
+# session_recorder.py
+# Opt-in recorder for realtime WebSocket sessions.
+#
+# Layout of one recording (one WebSocket connection):
+#   <SESSION_RECORDING_DIR>/<YYYYmmdd_HHMMSS_micro>/events.jsonl
+#   <SESSION_RECORDING_DIR>/<YYYYmmdd_HHMMSS_micro>/audio.bin
+#
+# Each events.jsonl line is {"t": <seconds since recording start, monotonic>,
+# "d": "in" | "out" | "meta", "e": <event dict>} and, for audio-carrying events,
+# "a": [offset, length] pointing into audio.bin. The base64 audio field is removed
+# from the event ("delta" for response.audio.delta, "audio" for input_audio_buffer.append),
+# which keeps the JSONL small and greppable.
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, Optional
+
+EVENTS_FILE_NAME = "events.jsonl"
+AUDIO_FILE_NAME = "audio.bin"
+
+# event type -> field holding base64 audio
+AUDIO_FIELDS_BY_EVENT_TYPE = {
+    "response.audio.delta": "delta",
+    "input_audio_buffer.append": "audio",
+}
+
+
+def _rec_log(message, level="INFO"):
+    print(f"[{level}] [SESSION_RECORDER] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class SessionRecorder:
+    """Writes every inbound and outbound realtime event of one connection to disk."""
+
+    def __init__(self, base_dir: str):
+        self.path = os.path.join(base_dir, datetime.now().strftime("%Y%m%d_%H%M%S_%f"))
+        os.makedirs(self.path, exist_ok=True)
+        self._events_file = open(os.path.join(self.path, EVENTS_FILE_NAME), "w", encoding="utf-8")
+        self._audio_file = open(os.path.join(self.path, AUDIO_FILE_NAME), "wb")
+        self._audio_offset = 0
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        self.closed = False
+        _rec_log(f"Recording realtime session to {self.path}")
+
+    def record(self, direction: str, event: dict):
+        """direction is 'in' (server -> client), 'out' (client -> server) or 'meta'."""
+        if self.closed or not isinstance(event, dict):
+            return
+        t = round(time.monotonic() - self._t0, 6)
+        audio_bytes = None
+        audio_field = AUDIO_FIELDS_BY_EVENT_TYPE.get(event.get("type"))
+        if audio_field and event.get(audio_field):
+            try:
+                audio_bytes = base64.b64decode(event[audio_field])
+                event = {k: v for k, v in event.items() if k != audio_field}
+            except Exception:
+                audio_bytes = None
+        with self._lock:
+            if self.closed:
+                return
+            record = {"t": t, "d": direction, "e": event}
+            if audio_bytes is not None:
+                record["a"] = [self._audio_offset, len(audio_bytes)]
+                self._audio_file.write(audio_bytes)
+                self._audio_offset += len(audio_bytes)
+            self._events_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self._events_file.close()
+                self._audio_file.close()
+            except Exception as e:
+                _rec_log(f"Error closing recording files in {self.path}: {e}", "WARN")
+        _rec_log(f"Recording closed: {self.path} ({self._audio_offset} audio bytes stored out of line)")
+
+
+def iter_recording(recording_dir: str, restore_audio: bool = True) -> Iterator[dict]:
+    """
+    Yields the records of a recording in order. With restore_audio, the base64 audio field
+    is put back into the event so it looks exactly like what went over the wire.
+    """
+    audio_file: Optional[object] = None
+    audio_path = os.path.join(recording_dir, AUDIO_FILE_NAME)
+    if restore_audio and os.path.exists(audio_path):
+        audio_file = open(audio_path, "rb")
+    try:
+        with open(os.path.join(recording_dir, EVENTS_FILE_NAME), "r", encoding="utf-8") as events_file:
+            for line in events_file:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if audio_file is not None and "a" in record:
+                    offset, length = record["a"]
+                    audio_file.seek(offset)
+                    audio_field = AUDIO_FIELDS_BY_EVENT_TYPE.get(record["e"].get("type"))
+                    if audio_field:
+                        record["e"][audio_field] = base64.b64encode(audio_file.read(length)).decode("ascii")
+                yield record
+    finally:
+        if audio_file is not None:
+            audio_file.close()
@@ -0,0 +1,277 @@
+# session_replay.py
+# Drives OpenAISpeechClient.on_message from a recording made by session_recorder.py,
+# against a null audio player and a fake socket. No network, no audio device.
+#
+#   python session_replay.py recordings/20250101_120000_000000 --speed 0
+#
+# --speed 1 replays in real time, --speed 4 four times faster, --speed 0 as fast as possible.
+# Tool calls are answered with the outputs that were recorded, so tool dispatch is exercised
+# without calling email, KB or Gemini services. Conversation turns go to a scratch DB.
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+
+from session_recorder import iter_recording
+from local_vad import LocalEndpointer, EVENT_SPEECH_STOPPED
+from latency_metrics import _percentile
+
+# Events the audio pipeline in main.py sends directly; they are not produced by on_message.
+PIPELINE_EVENT_TYPES = {"input_audio_buffer.append", "input_audio_buffer.commit"}
+
+
+def _replay_log(message, level="INFO"):
+    print(f"[{level}] [SESSION_REPLAY] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class NullPlayer:
+    """Stands in for PCMPlayer: accepts audio and counts it, plays nothing."""
+
+    def __init__(self):
+        self.buffer = b""
+        self.bytes_played = 0
+        self.play_calls = 0
+        self.clear_calls = 0
+        self._drain_callbacks = []
+        self._first_write_callbacks = []
+
+    def play(self, pcm_bytes):
+        self.play_calls += 1
+        self.bytes_played += len(pcm_bytes)
+        callbacks, self._first_write_callbacks = self._first_write_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def flush(self):
+        self.buffer = b""
+        callbacks, self._drain_callbacks = self._drain_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_drain_callback(self, callback):
+        self._drain_callbacks.append(callback)
+
+    def add_first_write_callback(self, callback):
+        self._first_write_callbacks.append(callback)
+
+    def clear(self):
+        self.clear_calls += 1
+        self.buffer = b""
+        self._first_write_callbacks = []
+
+    def close(self):
+        pass
+
+
+class ReplayWebSocket:
+    """Collects what the client sends instead of putting it on the wire."""
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+        self.sock = True
+
+    def send(self, data):
+        with self._lock:
+            self.sent.append(json.loads(data))
+
+    def close(self):
+        self.sock = None
+
+
+def _build_recorded_tool_handlers(records):
+    """Per tool name, a FIFO of the outputs the live client sent back for that tool."""
+    outputs_by_call_id = {}
+    call_names_in_order = []
+    for record in records:
+        event = record["e"]
+        if record["d"] == "out" and event.get("type") == "conversation.item.create":
+            item = event.get("item", {})
+            if item.get("type") == "function_call_output":
+                outputs_by_call_id[item.get("call_id")] = item.get("output", "")
+        elif record["d"] == "in" and event.get("type") == "response.function_call_arguments.done":
+            call_names_in_order.append((event.get("name"), event.get("call_id")))
+
+    queues = defaultdict(deque)
+    for name, call_id in call_names_in_order:
+        queues[name].append(outputs_by_call_id.get(call_id, json.dumps({"error": "No output recorded for this call."})))
+
+    def _make_handler(name):
+        def _recorded_handler(config=None, **kwargs):
+            return queues[name].popleft() if queues[name] else json.dumps({"error": f"No more recorded outputs for '{name}'."})
+        return _recorded_handler
+
+    return {name: _make_handler(name) for name in queues}
+
+
+def compute_turn_latencies(records, frame_ms: int = 30, input_rate: int = 24000) -> list:
+    """
+    Per user turn: ms from the last voiced mic frame to the first audio delta that followed.
+    Runs the local endpointer over the recorded input_audio_buffer.append audio, so server_vad
+    and client_vad recordings are measured from the same point (the user actually going quiet).
+    """
+    endpointer = LocalEndpointer(frame_ms=frame_ms, input_rate=input_rate)
+    if not endpointer.available:
+        return []
+    frame_bytes = int(input_rate * frame_ms / 1000) * 2
+    latencies, pending_speech_end, leftover = [], None, b""
+    for record in records:
+        event = record["e"]
+        if record["d"] == "out" and event.get("type") == "input_audio_buffer.append" and event.get("audio"):
+            leftover += base64.b64decode(event["audio"])
+            frame_t = record["t"]
+            while len(leftover) >= frame_bytes:
+                frame, leftover = leftover[:frame_bytes], leftover[frame_bytes:]
+                if endpointer.process_frame(frame, now_perf=frame_t) == EVENT_SPEECH_STOPPED:
+                    pending_speech_end = endpointer.last_speech_end_perf
+                frame_t += frame_ms / 1000.0
+        elif record["d"] == "in" and event.get("type") == "response.audio.delta" and pending_speech_end is not None:
+            latencies.append((record["t"] - pending_speech_end) * 1000.0)
+            pending_speech_end = None
+    return latencies
+
+
+def replay_session(recording_dir: str, speed: float = 0.0, config_overrides: dict = None, verbose: bool = False) -> dict:
+    """
+    Replays one recording. Returns a result dict with per-event-type handler timings,
+    recorded vs replayed outbound event counts, and the null player's totals.
+    """
+    import conversation_history_db
+    scratch_db_dir = tempfile.mkdtemp(prefix="va_replay_")
+    conversation_history_db.DB_PATH = os.path.join(scratch_db_dir, "conversation_history.db")
+    conversation_history_db.init_db()
+
+    from openai_client import OpenAISpeechClient
+
+    records = list(iter_recording(recording_dir))
+    inbound = [r for r in records if r["d"] == "in"]
+    turn_detection_mode = next((r["e"].get("turn_detection_mode") for r in records
+                                if r["d"] == "meta" and r["e"].get("type") == "connection.open"), None) or "server_vad"
+    recorded_out_counts = Counter(r["e"].get("type") for r in records
+                                  if r["d"] == "out" and r["e"].get("type") not in PIPELINE_EVENT_TYPES)
+
+    state = {"value": "SENDING_TO_OPENAI"}
+    def _set_state(new_state): state["value"] = new_state
+    def _get_state(): return state["value"]
+
+    config = {"CHUNK_MS": 30, "TSM_PLAYBACK_SPEED": "1.0", "LATENCY_METRICS_ENABLED": False,
+              "END_CONV_AUDIO_FINISH_DELAY_S": 0.0, "OPENAI_API_KEY": None,
+              "FILLER_AUDIO_ENABLED": False}
+    config.update(config_overrides or {})
+
+    player = NullPlayer()
+    fake_ws = ReplayWebSocket()
+    client = OpenAISpeechClient(
+        ws_url_param="replay://" + recording_dir, headers_param=[],
+        main_log_fn=(lambda msg, *a, **k: print(msg)) if verbose else (lambda msg, *a, **k: None),
+        pcm_player=player, app_state_setter=_set_state, app_state_getter=_get_state,
+        input_rate_hz=24000, output_rate_hz=24000, is_ww_active=False, ww_detector_instance_ref=None,
+        app_config_dict=config)
+    client.ws_app = fake_ws
+    client.connected = True
+    client.tool_handlers = _build_recorded_tool_handlers(records)
+
+    handler_times = defaultdict(list)
+    threads_before = threading.active_count()
+    replay_started = time.perf_counter()
+    first_t = inbound[0]["t"] if inbound else 0.0
+    for record in inbound:
+        if speed > 0:
+            due = replay_started + (record["t"] - first_t) / speed
+            wait_s = due - time.perf_counter()
+            if wait_s > 0:
+                time.sleep(wait_s)
+        message_str = json.dumps(record["e"])
+        t_start = time.perf_counter()
+        try:
+            client.on_message(fake_ws, message_str)
+        except Exception as e:
+            _replay_log(f"on_message raised for '{record['e'].get('type')}': {e}", "ERROR")
+        handler_times[record["e"].get("type")].append((time.perf_counter() - t_start) * 1000.0)
+
+    # Let tool calls finish sending their outputs
+    client.tool_pool.shutdown(wait=True)
+    deadline = time.monotonic() + 5.0
+    while threading.active_count() > threads_before and time.monotonic() < deadline:
+        time.sleep(0.02)
+    wall_s = time.perf_counter() - replay_started
+    stalls = []
+    if client.handler_profiler:
+        client.handler_profiler.stop_watchdog()
+        stalls = list(client.handler_profiler.stalls)
+
+    replayed_out_counts = Counter(e.get("type") for e in fake_ws.sent if e.get("type") not in PIPELINE_EVENT_TYPES)
+    return {
+        "recording": recording_dir,
+        "inbound_events": len(inbound),
+        "recorded_duration_s": (inbound[-1]["t"] - first_t) if inbound else 0.0,
+        "replay_wall_s": wall_s,
+        "handler_times_ms": dict(handler_times),
+        "handler_stalls": stalls,
+        "recorded_out_counts": dict(recorded_out_counts),
+        "replayed_out_counts": dict(replayed_out_counts),
+        "bytes_played": player.bytes_played,
+        "player_clears": player.clear_calls,
+        "final_state": state["value"],
+        "turn_detection_mode": turn_detection_mode,
+        "turn_latencies_ms": compute_turn_latencies(records, frame_ms=config["CHUNK_MS"]),
+    }
+
+
+def print_turn_mode_comparison(results: list):
+    """A/B table over several recordings: speech end -> first audio, grouped by turn detection mode."""
+    by_mode = defaultdict(list)
+    for result in results:
+        by_mode[result["turn_detection_mode"]].extend(result["turn_latencies_ms"])
+    print(f"\n  {'turn detection':<16} {'turns':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, values in sorted(by_mode.items()):
+        values.sort()
+        print(f"  {mode:<16} {len(values):>6} {_percentile(values, 50):>8.0f} {_percentile(values, 95):>8.0f}")
+
+
+def print_replay_result(result: dict):
+    print(f"\nReplay of {result['recording']}")
+    print(f"  inbound events: {result['inbound_events']}, recorded span: {result['recorded_duration_s']:.2f}s, replay wall time: {result['replay_wall_s']:.2f}s")
+    print(f"  audio bytes to player: {result['bytes_played']}, player clears: {result['player_clears']}, final state: {result['final_state']}")
+    turn_latencies = sorted(result["turn_latencies_ms"])
+    if turn_latencies:
+        print(f"  turn detection: {result['turn_detection_mode']}, user speech end -> first audio over {len(turn_latencies)} turn(s): "
+              f"p50 {_percentile(turn_latencies, 50):.0f} ms, p95 {_percentile(turn_latencies, 95):.0f} ms (as recorded, live network included)")
+    print(f"\n  {'event type':<56} {'n':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}")
+    for event_type, times in sorted(result["handler_times_ms"].items(), key=lambda kv: -sum(kv[1])):
+        print(f"  {event_type:<56} {len(times):>6} {sum(times):>10.2f} {sum(times) / len(times):>9.3f} {max(times):>9.3f}")
+    for stall in result["handler_stalls"]:
+        where = " | ".join(line.strip() for line in stall["stack"].strip().splitlines()[-2:])
+        print(f"  STALL {stall['event_type']} ({stall['running_ms']:.0f} ms) at: {where}")
+    print(f"\n  {'outbound event type':<56} {'recorded':>9} {'replayed':>9}")
+    all_types = set(result["recorded_out_counts"]) | set(result["replayed_out_counts"])
+    for event_type in sorted(all_types):
+        recorded, replayed = result["recorded_out_counts"].get(event_type, 0), result["replayed_out_counts"].get(event_type, 0)
+        marker = "" if recorded == replayed else "  <-- differs"
+        print(f"  {event_type:<56} {recorded:>9} {replayed:>9}{marker}")
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Replay a recorded realtime session through OpenAISpeechClient.on_message.")
+    arg_parser.add_argument("recording_dirs", nargs="+", help="Directories written by SessionRecorder (contain events.jsonl). Several = A/B table by turn detection mode.")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor. 0 = as fast as possible.")
+    arg_parser.add_argument("--tsm-speed", default="1.0", help="TSM_PLAYBACK_SPEED to use for the replay.")
+    arg_parser.add_argument("--verbose", action="store_true", help="Print the client's own log lines.")
+    cli_args = arg_parser.parse_args()
+    for recording_dir in cli_args.recording_dirs:
+        if not os.path.exists(os.path.join(recording_dir, "events.jsonl")):
+            _replay_log(f"No events.jsonl in {recording_dir}", "ERROR")
+            sys.exit(1)
+    replay_results = []
+    for recording_dir in cli_args.recording_dirs:
+        replay_results.append(replay_session(recording_dir, speed=cli_args.speed,
+                                             config_overrides={"TSM_PLAYBACK_SPEED": cli_args.tsm_speed}, verbose=cli_args.verbose))
+        print_replay_result(replay_results[-1])
+    if len(replay_results) > 1:
+        print_turn_mode_comparison(replay_results)
@@ -0,0 +1,185 @@
+# startup_report.py
+# Cold-start cost of the assistant: what the imports cost and how long each startup phase took.
+#
+#   python startup_report.py imports [--module main] [--top 15] [--ref HEAD~1]
+#   python startup_report.py phases [--hours 24]
+#
+# "imports" runs `python -X importtime -c "import <module>"` in a fresh interpreter and reports
+# the total, the slowest top-level imports and the heaviest packages. With --ref it does the
+# same for that git revision (exported to a temp dir) and shows before / after side by side.
+# "phases" prints the startup phase durations main.py records on every start (StartupPhases
+# below), from latency_metrics.db.
+#
+# StartupPhases runs main.py's independent startup steps (wake-word model load, audio devices,
+# DB init, realtime connect) concurrently and records how long each took.
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from latency_metrics import (record_startup_duration, get_latency_report, init_latency_db, LATENCY_DB_PATH,
+                             STAGE_STARTUP_PHASE, STAGE_PROCESS_START_TO_READY)
+from wake_word_model_store import seconds_since_process_start
+
+
+def _sr_log(message, level="INFO"):
+    print(f"[{level}] [STARTUP] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+class StartupPhases:
+    """
+    Runs named startup steps on a small pool. A phase may name others it needs (after=...);
+    it then waits for them first. result(name) re-raises the phase's exception.
+    """
+
+    def __init__(self, max_workers: int = 6, log_fn=None):
+        self.log = log_fn or _sr_log
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self._futures: Dict[str, Future] = {}
+        self._timings: Dict[str, Tuple[float, float]] = {} # name -> (started s after process start, duration ms)
+        self._lock = threading.Lock()
+
+    def start(self, name: str, fn, *args, after: Tuple[str, ...] = ()) -> Future:
+        dependencies = [self._futures[dependency] for dependency in after]
+
+        def run():
+            for dependency in dependencies:
+                dependency.result() # A failed dependency fails this phase too
+            started_s, started = seconds_since_process_start(), time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._timings[name] = (started_s, (time.perf_counter() - started) * 1000.0)
+
+        self._futures[name] = self._pool.submit(run)
+        return self._futures[name]
+
+    def result(self, name: str, timeout: Optional[float] = None):
+        return self._futures[name].result(timeout)
+
+    def wait_all(self, timeout: Optional[float] = None):
+        for future in list(self._futures.values()):
+            try:
+                future.result(timeout)
+            except Exception:
+                pass # Reported by whoever needs the result; the timing is recorded either way
+
+    def report(self, record: bool = True) -> List[Tuple[str, float, float]]:
+        """Logs [(phase, started s after process start, duration ms)] and, with record, stores the durations."""
+        ready_s = seconds_since_process_start()
+        with self._lock:
+            rows = sorted(((name, started_s, duration_ms) for name, (started_s, duration_ms) in self._timings.items()), key=lambda row: row[1])
+        summary = ", ".join(f"{name} {duration_ms:.0f} ms @{started_s:.2f}s" for name, started_s, duration_ms in rows)
+        self.log(f"Startup ready {ready_s:.2f} s after process start. Phases: {summary}")
+        if record:
+            for name, _, duration_ms in rows:
+                record_startup_duration(STAGE_STARTUP_PHASE, duration_ms, tag=name)
+            record_startup_duration(STAGE_PROCESS_START_TO_READY, ready_s * 1000.0)
+        return rows
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+# --- Import-time report ---
+def measure_imports(module: str, cwd: str) -> Dict:
+    """One cold `import module` under -X importtime. Returns totals, top-level imports and per-package self time."""
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd,
+                               capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"})
+    wall_s = time.perf_counter() - started
+    top_level, packages = [], {}
+    other_stderr = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            other_stderr.append(line)
+            continue
+        _, self_us, cumulative_us, name = [part for part in line.replace("import time:", "|", 1).split("|")]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        name = name.strip()
+        packages[name.split(".")[0]] = packages.get(name.split(".")[0], 0) + int(self_us)
+        if depth == 0:
+            top_level.append((name, int(cumulative_us)))
+    return {"module": module, "ok": completed.returncode == 0, "wall_s": wall_s,
+            "import_s": sum(us for _, us in top_level) / 1e6, "top_level": sorted(top_level, key=lambda t: -t[1]),
+            "packages": sorted(packages.items(), key=lambda p: -p[1]), "error": "\n".join(other_stderr[-5:])}
+
+
+def export_git_ref(ref: str) -> str:
+    """Exports the tracked files at ref into a temp dir (no worktree bookkeeping)."""
+    export_dir = tempfile.mkdtemp(prefix="startup_ref_")
+    archive = subprocess.run(["git", "archive", ref], capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", export_dir], input=archive.stdout, check=True)
+    for local_file in (".env",): # Same configuration as the working tree
+        if os.path.exists(local_file):
+            shutil.copy(local_file, export_dir)
+    return export_dir
+
+
+def print_import_report(results: List[Tuple[str, Dict]], top: int):
+    for label, result in results:
+        status = ""
+        if not result["ok"]:
+            last_error_line = result["error"].strip().splitlines()[-1] if result["error"].strip() else "see stderr"
+            status = f"  (import FAILED: {last_error_line})"
+        print(f"\n[{label}] import {result['module']}: {result['import_s']:.2f} s of imports, "
+              f"{result['wall_s']:.2f} s wall incl. interpreter start{status}")
+        print(f"  {'slowest top-level imports':<40} {'ms':>8}")
+        for name, us in result["top_level"][:top]:
+            print(f"  {name:<40} {us / 1000:>8.1f}")
+    if len(results) < 2:
+        return
+    (before_label, before), (after_label, after) = results
+    before_packages, after_packages = dict(before["packages"]), dict(after["packages"])
+    print(f"\nBefore ({before_label}) vs after ({after_label}): imports {before['import_s']:.2f} s -> {after['import_s']:.2f} s, "
+          f"wall {before['wall_s']:.2f} s -> {after['wall_s']:.2f} s")
+    names = sorted(set(before_packages) | set(after_packages), key=lambda n: -max(before_packages.get(n, 0), after_packages.get(n, 0)))
+    print(f"  {'package (self time)':<30} {'before ms':>10} {'after ms':>10}")
+    for name in names[:top]:
+        print(f"  {name:<30} {before_packages.get(name, 0) / 1000:>10.1f} {after_packages.get(name, 0) / 1000:>10.1f}")
+
+
+def print_phase_report(since_hours: Optional[float], db_path: str = LATENCY_DB_PATH):
+    report = {key: stats for key, stats in get_latency_report(since_hours=since_hours, db_path=db_path).items()
+              if key[0] == STAGE_STARTUP_PHASE or key[0].startswith("process_start_to_")}
+    if not report:
+        print("No startup phases recorded (main.py records them on every start).")
+        return
+    print(f"{'stage':<34} {'phase':<20} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for (stage, tag), stats in sorted(report.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+        print(f"{stage:<34} {(tag or '-'):<20} {stats['count']:>5} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['max']:>9.1f}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Startup cost: import times and startup phases.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    imports_parser = commands.add_parser("imports", help="-X importtime report for one module, optionally against a git ref.")
+    imports_parser.add_argument("--module", default="main")
+    imports_parser.add_argument("--top", type=int, default=15)
+    imports_parser.add_argument("--ref", help="Also measure this git revision (e.g. HEAD~1) as the 'before'.")
+    phases_parser = commands.add_parser("phases", help="Recorded startup phase durations (latency_metrics.db).")
+    phases_parser.add_argument("--hours", type=float, default=None)
+    cli_args = arg_parser.parse_args()
+
+    if cli_args.command == "imports":
+        here = os.path.dirname(os.path.abspath(__file__))
+        import_results = []
+        if cli_args.ref:
+            ref_dir = export_git_ref(cli_args.ref)
+            try:
+                import_results.append((cli_args.ref, measure_imports(cli_args.module, ref_dir)))
+            finally:
+                shutil.rmtree(ref_dir, ignore_errors=True)
+        import_results.append(("working tree", measure_imports(cli_args.module, here)))
+        print_import_report(import_results, cli_args.top)
+    elif cli_args.command == "phases":
+        init_latency_db()
+        print_phase_report(cli_args.hours)
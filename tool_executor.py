@@ -31,7 +31,6 @@ from tools_definition import (
 
 # Import the new KB extraction function from kb_llm_extractor.py
 from kb_llm_extractor import extract_relevant_sections
-import openai # <<< ADD THIS AT THE TOP
 from dotenv import load_dotenv # <<< ADD THIS AT THE TOP
 load_dotenv() # Ensure .env is loaded when this module is imported
 
@@ -40,15 +39,23 @@ load_dotenv() # Ensure .env is loaded when this module is imported
 CONTEXT_SUMMARIZER_MODEL_FOR_TOOL = os.getenv("CONTEXT_SUMMARIZER_MODEL", "gpt-4o-mini")
 OPENAI_API_KEY_FOR_TOOL_SUMMARIZER = os.getenv("OPENAI_API_KEY") # Get key directly
 
-# Import the new Google services module
-try:
-    from google_llm_services import get_gemini_response, GOOGLE_API_KEY
-    GOOGLE_SERVICES_AVAILABLE = bool(GOOGLE_API_KEY)
-except ImportError:
-    print("[TOOL_EXECUTOR] WARNING: google_llm_services.py not found or GOOGLE_API_KEY missing. Google-based tools will not function.")
-    GOOGLE_SERVICES_AVAILABLE = False
-    def get_gemini_response(user_prompt_text: str, system_instruction_text: str, use_google_search_tool: bool = False, model_name: str = "") -> str:
+# Google services module (google.generativeai) is imported on the first Google-based tool call,
+# not at startup: only two rarely used tools need it.
+GOOGLE_SERVICES_AVAILABLE = bool(os.getenv("GOOGLE_API_KEY"))
+if not GOOGLE_SERVICES_AVAILABLE:
+    print("[TOOL_EXECUTOR] WARNING: GOOGLE_API_KEY missing. Google-based tools will not function.")
+
+def get_gemini_response(user_prompt_text: str, system_instruction_text: str, use_google_search_tool: bool = False, model_name: str = "") -> str:
+    global GOOGLE_SERVICES_AVAILABLE
+    try:
+        from google_llm_services import get_gemini_response as google_get_gemini_response
+    except ImportError as e_import:
+        print(f"[TOOL_EXECUTOR] WARNING: google_llm_services could not be imported ({e_import}). Google-based tools will not function.")
+        GOOGLE_SERVICES_AVAILABLE = False
         return "Error: Google AI services are not available (module load failure)."
+    kwargs = {"model_name": model_name} if model_name else {}
+    return google_get_gemini_response(user_prompt_text=user_prompt_text, system_instruction_text=system_instruction_text,
+                                      use_google_search_tool=use_google_search_tool, **kwargs)
 
 # --- Knowledge Base File Paths & DB Path ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -487,6 +494,7 @@ def handle_get_conversation_history_summary(
         return "Error: History summarization service is not configured (missing API key)."
 
     try:
+        import openai # Deferred: only this tool needs the SDK here
         sync_llm_client = openai.OpenAI(api_key=OPENAI_API_KEY_FOR_TOOL_SUMMARIZER)
         _tool_log(f"Initialized OpenAI client for history summarizer tool (model: {CONTEXT_SUMMARIZER_MODEL_FOR_TOOL}).")
     except Exception as e_client_init:
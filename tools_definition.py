@@ -349,4 +349,36 @@ ALL_TOOLS = [
     TOOL_CHECK_SCHEDULED_CALL_STATUS,
     TOOL_GET_CONVERSATION_HISTORY_SUMMARY
 
-]
\ No newline at end of file
+]
+
+# --- Tool Latency Classes ---
+# Expected execution time of each tool's handler. openai_client.py plays a short cached
+# filler phrase when a non-fast tool is still running after FILLER_THRESHOLD_S.
+TOOL_LATENCY_FAST = "fast"     # Local work / single DB query, well under a second
+TOOL_LATENCY_MEDIUM = "medium" # One external HTTP call (email, scheduling), ~1-2 s
+TOOL_LATENCY_SLOW = "slow"     # LLM-backed KB extraction, Gemini search, history summarization, 2-6 s
+
+TOOL_LATENCY_CLASSES = {
+    END_CONVERSATION_TOOL_NAME: TOOL_LATENCY_FAST,
+    SEND_EMAIL_SUMMARY_TOOL_NAME: TOOL_LATENCY_MEDIUM,
+    RAISE_TICKET_TOOL_NAME: TOOL_LATENCY_MEDIUM,
+    GET_BOLT_KB_TOOL_NAME: TOOL_LATENCY_SLOW,
+    GET_DTC_KB_TOOL_NAME: TOOL_LATENCY_SLOW,
+    DISPLAY_ON_INTERFACE_TOOL_NAME: TOOL_LATENCY_FAST,
+    GET_TAXI_IDEAS_FOR_TODAY_TOOL_NAME: TOOL_LATENCY_SLOW,
+    GENERAL_GOOGLE_SEARCH_TOOL_NAME: TOOL_LATENCY_SLOW,
+    SCHEDULE_OUTBOUND_CALL_TOOL_NAME: TOOL_LATENCY_MEDIUM,
+    CHECK_SCHEDULED_CALL_STATUS_TOOL_NAME: TOOL_LATENCY_FAST,
+    GET_CONVERSATION_HISTORY_SUMMARY_TOOL_NAME: TOOL_LATENCY_SLOW,
+}
+
+# Tools whose handlers run in the background: the model gets an immediate "accepted"
+# output with a task id and the real result is injected into the conversation later
+# (see deferred_tool_tasks.py). Only tools whose result the user doesn't need to wait on.
+DEFERRED_TOOL_NAMES = {
+    SCHEDULE_OUTBOUND_CALL_TOOL_NAME,
+    SEND_EMAIL_SUMMARY_TOOL_NAME,
+    RAISE_TICKET_TOOL_NAME,
+    GET_TAXI_IDEAS_FOR_TODAY_TOOL_NAME,
+    GENERAL_GOOGLE_SEARCH_TOOL_NAME,
+}
@@ -0,0 +1,114 @@
+# usage_report.py
+# Token usage and cost report over the response_usage table (conversation history DB).
+#
+# The client stores the usage block of every response.done. This report shows tokens per
+# turn and the cached-input ratio per USAGE_TAG (to compare instruction / priming variants),
+# the same per session, and a daily cost trend. Prices are USD per 1M tokens and can be
+# overridden with the REALTIME_PRICE_* environment variables.
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import conversation_history_db
+
+# Defaults are gpt-4o-realtime-preview list prices
+PRICE_ENV_DEFAULTS = OrderedDict([
+    ("text_in", ("REALTIME_PRICE_TEXT_IN_PER_M", 5.00)),
+    ("cached_text_in", ("REALTIME_PRICE_CACHED_TEXT_IN_PER_M", 2.50)),
+    ("audio_in", ("REALTIME_PRICE_AUDIO_IN_PER_M", 40.00)),
+    ("cached_audio_in", ("REALTIME_PRICE_CACHED_AUDIO_IN_PER_M", 2.50)),
+    ("text_out", ("REALTIME_PRICE_TEXT_OUT_PER_M", 20.00)),
+    ("audio_out", ("REALTIME_PRICE_AUDIO_OUT_PER_M", 80.00)),
+])
+
+
+def load_prices() -> Dict[str, float]:
+    return {kind: float(os.getenv(env_name, default)) for kind, (env_name, default) in PRICE_ENV_DEFAULTS.items()}
+
+
+def response_cost_usd(row: Dict, prices: Dict[str, float]) -> float:
+    """
+    Cost of one response_usage row. Cached tokens are billed at the cached rate, the rest at the full rate.
+    Without cached_tokens_details, cached_tokens is split between text and audio in proportion to the input.
+    """
+    input_text = row["input_text_tokens"]
+    input_audio = row["input_audio_tokens"]
+    if not input_text and not input_audio:
+        input_text = row["input_tokens"] # No per-modality breakdown reported: bill it all as text
+    cached_text, cached_audio = row["cached_text_tokens"], row["cached_audio_tokens"]
+    if row["cached_tokens"] and not cached_text and not cached_audio:
+        cached_audio = round(row["cached_tokens"] * input_audio / (input_text + input_audio)) if input_text + input_audio else 0
+        cached_text = row["cached_tokens"] - cached_audio
+    uncached_text = max(0, input_text - cached_text)
+    uncached_audio = max(0, input_audio - cached_audio)
+    output_text = row["output_text_tokens"]
+    if not output_text and not row["output_audio_tokens"]:
+        output_text = row["output_tokens"]
+    return (uncached_text * prices["text_in"] + cached_text * prices["cached_text_in"]
+            + uncached_audio * prices["audio_in"] + cached_audio * prices["cached_audio_in"]
+            + output_text * prices["text_out"] + row["output_audio_tokens"] * prices["audio_out"]) / 1_000_000
+
+
+def summarize(rows: List[Dict], key_fn, prices: Dict[str, float]) -> "OrderedDict[str, Dict]":
+    """Groups usage rows by key_fn(row) (in first-seen order) and sums tokens and cost per group."""
+    groups: "OrderedDict[str, Dict]" = OrderedDict()
+    for row in rows:
+        group = groups.setdefault(key_fn(row), {"responses": 0, "sessions": set(), "input": 0, "cached": 0, "output": 0,
+                                                "instructions_chars": [], "cost_usd": 0.0})
+        group["responses"] += 1
+        group["sessions"].add(row["session_id"])
+        group["input"] += row["input_tokens"]
+        group["cached"] += row["cached_tokens"]
+        group["output"] += row["output_tokens"]
+        if row["instructions_chars"]:
+            group["instructions_chars"].append(row["instructions_chars"])
+        group["cost_usd"] += response_cost_usd(row, prices)
+    for group in groups.values():
+        group["sessions"] = len(group["sessions"])
+        group["cache_ratio"] = group["cached"] / group["input"] if group["input"] else 0.0
+        chars = group.pop("instructions_chars")
+        group["avg_instructions_chars"] = sum(chars) / len(chars) if chars else None
+    return groups
+
+
+def _print_table(title: str, label: str, groups: "OrderedDict[str, Dict]"):
+    print(f"\n{title}")
+    if not groups:
+        print("  No usage recorded.")
+        return
+    print(f"  {label:<34} {'sess':>5} {'resp':>6} {'in/turn':>8} {'out/turn':>9} {'cached':>7} {'instr chars':>12} {'cost $':>9} {'$/turn':>8}")
+    for key, g in groups.items():
+        n = g["responses"]
+        instr = f"{g['avg_instructions_chars']:.0f}" if g["avg_instructions_chars"] else "-"
+        print(f"  {str(key)[:34]:<34} {g['sessions']:>5} {n:>6} {g['input'] / n:>8.0f} {g['output'] / n:>9.0f} "
+              f"{g['cache_ratio']:>7.0%} {instr:>12} {g['cost_usd']:>9.3f} {g['cost_usd'] / n:>8.4f}")
+
+
+def print_usage_report(days: Optional[float] = 7, session_id: Optional[str] = None, by_session: bool = False):
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    rows = conversation_history_db.get_response_usage(since=since, session_id=session_id)
+    prices = load_prices()
+    window = f"last {days:g} day(s)" if days else "all time"
+    print(f"Realtime usage, {window}: {len(rows)} responses. Prices per 1M tokens: "
+          + ", ".join(f"{kind} ${price:g}" for kind, price in prices.items()))
+    _print_table("Per turn by USAGE_TAG:", "tag", summarize(rows, lambda r: r["tag"] or "(untagged)", prices))
+    _print_table("By day (UTC):", "day", summarize(rows, lambda r: str(r["timestamp"])[:10], prices))
+    if by_session:
+        _print_table("By session:", "session", summarize(rows, lambda r: r["session_id"], prices))
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+    arg_parser = argparse.ArgumentParser(description="Tokens per turn, cached-input ratio and daily cost from response_usage.")
+    arg_parser.add_argument("--days", type=float, default=7, help="Only include the last N days (0 = all).")
+    arg_parser.add_argument("--session", default=None, help="Only include this OpenAI session id.")
+    arg_parser.add_argument("--sessions", action="store_true", help="Also print one row per session.")
+    arg_parser.add_argument("--db", default=None, help="Path to the conversation history DB.")
+    cli_args = arg_parser.parse_args()
+    if cli_args.db:
+        conversation_history_db.DB_PATH = cli_args.db
+    conversation_history_db.init_db()
+    print_usage_report(days=cli_args.days, session_id=cli_args.session, by_session=cli_args.sessions)
@@ -0,0 +1,214 @@
+# wake_word_bench.py
+# CPU cost of wake-word detection, measured offline on a clip (no mic, no network).
+#
+#   python wake_word_bench.py keywords hey_jarvis alexa hey_mycroft [--wav clip.wav] [--seconds 60] [--separate]
+#
+# "keywords" loads 1, 2, ... N keyword heads into one detector (one shared melspectrogram /
+# embedding pass per frame) and reports CPU as a % of one core, plus per-frame latency, as
+# keywords are added. --separate also runs one detector per keyword for comparison, which
+# is what N independent detectors would cost. Models come from the local model store
+# (python wake_word_model_store.py prefetch ...).
+#
+#   python wake_word_bench.py compare clips/ --config fp32:1:1:all --config int8:1:1:all --config fp32:0:0:all
+#
+# "compare" runs a labeled clip set (clips/positive/*.wav should fire, clips/negative/*.wav
+# should not) through each runtime config, variant:intra_op_threads:inter_op_threads:graph_opt
+# (int8 variants come from wake_word_model_store.py quantize). It reports per-frame latency,
+# CPU, recall / false accepts, and detection parity against the first (baseline) config.
+import glob
+import os
+import time
+import wave
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from wake_word_detector import WakeWordDetector, ACTION_WAKE, ORT_GRAPH_OPT_LEVELS
+
+PROCESS_RATE = 16000
+FRAME_MS = 30 # main.py feeds the detector 30 ms frames
+WARMUP_S = 1.0
+
+
+def load_audio_16k(path: Optional[str], seconds: float) -> np.ndarray:
+    """Mono int16 at 16 kHz, looped or trimmed to `seconds`. Without a path: low-level noise (nothing should fire)."""
+    if path:
+        with wave.open(path, "rb") as wav_file:
+            channels, rate = wav_file.getnchannels(), wav_file.getframerate()
+            samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        if rate != PROCESS_RATE:
+            target_len = int(len(samples) * PROCESS_RATE / rate)
+            samples = np.interp(np.linspace(0, len(samples) - 1, target_len), np.arange(len(samples)), samples.astype(np.float32)).astype(np.int16)
+    else:
+        samples = (np.random.default_rng(0).normal(0, 300, int(PROCESS_RATE * seconds))).astype(np.int16)
+    needed = int(PROCESS_RATE * seconds)
+    if len(samples) < needed:
+        samples = np.tile(samples, needed // max(1, len(samples)) + 1)
+    return samples[:needed]
+
+
+def _make_detector(names: List[str], model_variant: Optional[str] = None, onnx_options: Optional[Dict] = None,
+                   threshold: float = 0.5) -> WakeWordDetector:
+    detector = WakeWordDetector(sample_rate=PROCESS_RATE, keywords={name: {"threshold": threshold, "action": ACTION_WAKE} for name in names},
+                                model_variant=model_variant, onnx_options=onnx_options)
+    if not detector.load():
+        raise SystemExit(f"Could not load {', '.join(names)} from the model store (see wake_word_model_store.py).")
+    return detector
+
+
+def run_detectors(detectors: List[WakeWordDetector], audio: np.ndarray, frame_ms: int = FRAME_MS) -> Dict[str, float]:
+    """Feeds every frame to every detector. CPU is process CPU time over audio time (100 = one full core)."""
+    frame_len = int(PROCESS_RATE * frame_ms / 1000)
+    frames = [audio[i:i + frame_len].tobytes() for i in range(0, len(audio) - frame_len + 1, frame_len)]
+    warmup = int(WARMUP_S * 1000 / frame_ms)
+    for frame in frames[:warmup]:
+        for detector in detectors:
+            detector.process_keywords(frame)
+    for detector in detectors:
+        detector.reset()
+    latencies_ms, detections = [], 0
+    cpu_start = time.process_time()
+    for frame in frames:
+        started = time.perf_counter()
+        for detector in detectors:
+            detections += len(detector.process_keywords(frame))
+        latencies_ms.append((time.perf_counter() - started) * 1000.0)
+    cpu_s = time.process_time() - cpu_start
+    audio_s = len(frames) * frame_ms / 1000.0
+    latencies_ms.sort()
+    return {"cpu_pct": 100.0 * cpu_s / audio_s, "p50_ms": latencies_ms[len(latencies_ms) // 2],
+            "p95_ms": latencies_ms[int(len(latencies_ms) * 0.95)], "max_ms": latencies_ms[-1], "detections": detections}
+
+
+def bench_keywords(names: List[str], audio: np.ndarray, separate: bool = False, frame_ms: int = FRAME_MS) -> List[Dict]:
+    rows = []
+    for count in range(1, len(names) + 1):
+        subset = names[:count]
+        rows.append({"keywords": count, "mode": "shared", **run_detectors([_make_detector(subset)], audio, frame_ms)})
+        if separate and count > 1:
+            rows.append({"keywords": count, "mode": "separate", **run_detectors([_make_detector([n]) for n in subset], audio, frame_ms)})
+    return rows
+
+
+def print_keyword_rows(names: List[str], rows: List[Dict], audio_s: float):
+    print(f"\nWake-word CPU vs keyword count ({audio_s:.0f} s of audio, {FRAME_MS} ms frames). Keywords in order: {', '.join(names)}")
+    print(f"  {'keywords':>8} {'mode':<9} {'cpu % core':>11} {'+ vs prev':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'fired':>6}")
+    previous = {}
+    for row in rows:
+        delta = row["cpu_pct"] - previous[row["mode"]] if row["mode"] in previous else None
+        previous[row["mode"]] = row["cpu_pct"]
+        if row["keywords"] == 1:
+            previous["separate"] = row["cpu_pct"] # One keyword is the same single detector either way
+        delta_text = f"{delta:+.2f}" if delta is not None else "-"
+        print(f"  {row['keywords']:>8} {row['mode']:<9} {row['cpu_pct']:>11.2f} {delta_text:>10} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['max_ms']:>8.2f} {row['detections']:>6}")
+
+
+# --- Runtime config comparison ---
+def parse_runtime_config(text: str) -> Dict:
+    """"int8:1:1:all" -> {"label", "variant", "onnx_options"}; omitted fields default to 1 thread / "all"."""
+    fields = text.split(":")
+    variant = fields[0] or "fp32"
+    intra = int(fields[1]) if len(fields) > 1 and fields[1] else 1
+    inter = int(fields[2]) if len(fields) > 2 and fields[2] else 1
+    graph_opt = fields[3] if len(fields) > 3 and fields[3] else "all"
+    if graph_opt not in ORT_GRAPH_OPT_LEVELS:
+        raise ValueError(f"Unknown graph optimization '{graph_opt}' ({', '.join(ORT_GRAPH_OPT_LEVELS)})")
+    return {"label": f"{variant}:{intra}:{inter}:{graph_opt}", "variant": variant,
+            "onnx_options": {"intra_op_threads": intra, "inter_op_threads": inter, "graph_optimization": graph_opt}}
+
+
+def load_labeled_clips(clips_dir: str) -> List[Dict]:
+    clips = []
+    for label in ("positive", "negative"):
+        for path in sorted(glob.glob(os.path.join(clips_dir, label, "*.wav"))):
+            clips.append({"path": path, "positive": label == "positive", "audio": load_audio_16k(path, _wav_seconds(path))})
+    if not clips:
+        raise SystemExit(f"No clips in {clips_dir}/positive or {clips_dir}/negative.")
+    return clips
+
+
+def _wav_seconds(path: str) -> float:
+    with wave.open(path, "rb") as wav_file:
+        return wav_file.getnframes() / float(wav_file.getframerate())
+
+
+def run_clip_set(detector: WakeWordDetector, clips: List[Dict], frame_ms: int = FRAME_MS) -> Dict:
+    """Per-clip fired / max score, plus latency and CPU over the whole set. The detector is reset between clips."""
+    frame_len = int(PROCESS_RATE * frame_ms / 1000)
+    per_clip, latencies_ms, audio_s = [], [], 0.0
+    cpu_start = time.process_time()
+    for clip in clips:
+        detector.reset()
+        fired, max_score = False, 0.0
+        audio = clip["audio"]
+        for i in range(0, len(audio) - frame_len + 1, frame_len):
+            started = time.perf_counter()
+            fired = bool(detector.process_keywords(audio[i:i + frame_len].tobytes())) or fired
+            latencies_ms.append((time.perf_counter() - started) * 1000.0)
+            max_score = max([max_score] + list(detector.last_scores.values()))
+        audio_s += len(audio) / PROCESS_RATE
+        per_clip.append({"fired": fired, "max_score": max_score, "positive": clip["positive"]})
+    cpu_s = time.process_time() - cpu_start
+    latencies_ms.sort()
+    positives = [c for c in per_clip if c["positive"]]
+    negatives = [c for c in per_clip if not c["positive"]]
+    return {"per_clip": per_clip, "cpu_pct": 100.0 * cpu_s / max(audio_s, 1e-9),
+            "p50_ms": latencies_ms[len(latencies_ms) // 2], "p95_ms": latencies_ms[int(len(latencies_ms) * 0.95)],
+            "recall": sum(c["fired"] for c in positives) / len(positives) if positives else None,
+            "false_accepts": sum(c["fired"] for c in negatives), "negatives": len(negatives)}
+
+
+def compare_configs(names: List[str], clips: List[Dict], configs: List[Dict], threshold: float = 0.5) -> List[Dict]:
+    results = []
+    for config in configs:
+        detector = _make_detector(names, config["variant"], config["onnx_options"], threshold)
+        results.append({**config, "load_ms": detector.load_ms, **run_clip_set(detector, clips)})
+    baseline = results[0]["per_clip"]
+    for result in results:
+        pairs = list(zip(baseline, result["per_clip"]))
+        result["decision_parity"] = sum(a["fired"] == b["fired"] for a, b in pairs) / len(pairs)
+        score_deltas = [abs(a["max_score"] - b["max_score"]) for a, b in pairs]
+        result["mean_score_delta"] = sum(score_deltas) / len(score_deltas)
+        result["max_score_delta"] = max(score_deltas)
+    return results
+
+
+def print_compare(results: List[Dict], clips: List[Dict]):
+    positives = sum(c["positive"] for c in clips)
+    print(f"\nWake-word runtime configs on {len(clips)} clips ({positives} positive, {len(clips) - positives} negative). "
+          f"Parity is against {results[0]['label']}.")
+    print(f"  {'config (variant:intra:inter:opt)':<34} {'load ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'cpu %':>6} {'recall':>7} "
+          f"{'FA':>6} {'parity':>7} {'mean dS':>8} {'max dS':>7}")
+    for r in results:
+        recall = f"{r['recall']:.0%}" if r["recall"] is not None else "-"
+        print(f"  {r['label']:<34} {r['load_ms']:>8.0f} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} {r['cpu_pct']:>6.2f} {recall:>7} "
+              f"{r['false_accepts']:>2}/{r['negatives']:<3} {r['decision_parity']:>7.0%} {r['mean_score_delta']:>8.4f} {r['max_score_delta']:>7.4f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Wake-word detector CPU benchmarks.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    keywords_parser = commands.add_parser("keywords", help="CPU as keyword heads are added to one detector.")
+    keywords_parser.add_argument("names", nargs="+", help="Keywords in the model store, added in this order.")
+    keywords_parser.add_argument("--wav", default=None, help="Audio to feed (default: 16 kHz noise).")
+    keywords_parser.add_argument("--seconds", type=float, default=60.0)
+    keywords_parser.add_argument("--separate", action="store_true", help="Also run one detector per keyword.")
+    compare_parser = commands.add_parser("compare", help="Latency, CPU and detection parity of runtime configs on labeled clips.")
+    compare_parser.add_argument("clips_dir", help="Directory with positive/ and negative/ WAV clips.")
+    compare_parser.add_argument("--keywords", nargs="+", default=[os.getenv("WAKE_WORD_MODEL", "hey_jarvis")])
+    compare_parser.add_argument("--config", action="append", default=None,
+                                help="variant:intra:inter:opt, repeatable; the first is the baseline (default fp32:1:1:all vs int8:1:1:all).")
+    compare_parser.add_argument("--threshold", type=float, default=float(os.getenv("WAKE_WORD_THRESHOLD", "0.5")))
+    cli_args = arg_parser.parse_args()
+
+    if cli_args.command == "keywords":
+        bench_audio = load_audio_16k(cli_args.wav, cli_args.seconds)
+        print_keyword_rows(cli_args.names, bench_keywords(cli_args.names, bench_audio, cli_args.separate), cli_args.seconds)
+    elif cli_args.command == "compare":
+        labeled_clips = load_labeled_clips(cli_args.clips_dir)
+        runtime_configs = [parse_runtime_config(text) for text in (cli_args.config or ["fp32:1:1:all", "int8:1:1:all"])]
+        print_compare(compare_configs(cli_args.keywords, labeled_clips, runtime_configs, cli_args.threshold), labeled_clips)
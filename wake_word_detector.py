@@ -6,16 +6,21 @@ This module handles wake word detection using the openWakeWord library.
 It processes audio chunks and detects when the wake word is spoken.
 """
 
+import copy
+import functools
 import os
+import threading
+import time
 import numpy as np
 import random
-from typing import Dict, Any, Optional, Tuple # Not strictly needed for this file to run
-# Python 3.9+ has built-in types for these, or they are not used complexly here
+from typing import Dict, Any, List, Optional, Tuple
 
 # Load environment variables from .env file if not already loaded
 from dotenv import load_dotenv
 load_dotenv() # Ensures .env is loaded when this module is imported or run
 
+from wake_word_model_store import ModelStoreError, resolve_keyword_paths, seconds_since_process_start, FEATURE_MELSPEC, FEATURE_EMBEDDING, VARIANT_FP32
+
 # Print Python path to help with debugging - only when run directly
 if __name__ == "__main__":
     import sys
@@ -23,21 +28,6 @@ if __name__ == "__main__":
     print("Python path:", sys.path)
     print("Python executable:", sys.executable)
 
-# Function to download models using the correct method
-def download_openwakeword_models_internal(): # Renamed to avoid conflict if this file name was 'download_models'
-    """
-    Download openwakeword models using the utils.download_models function.
-    """
-    try:
-        from openwakeword.utils import download_models
-        print("wake_word_detector.py: Downloading openWakeWord models if missing...")
-        download_models() # This will download all default models if not present
-        print("wake_word_detector.py: Models are ready!")
-        return True
-    except Exception as e:
-        print(f"wake_word_detector.py: Failed to download models: {e}")
-        return False
-
 # Try to find openwakeword in installed packages - only when run directly
 if __name__ == "__main__":
     try:
@@ -50,10 +40,19 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"wake_word_detector.py: Error checking installed packages: {e}")
 
+# Dummy model for graceful degradation if openwakeword is not available
+class DummyOpenWakeWordModel: # Renamed to avoid conflict
+    def __init__(self, *args, **kwargs):
+        print("wake_word_detector.py: Using dummy OpenWakeWordModel - wake word detection disabled")
+
+    def predict(self, *args, **kwargs):
+        return {} # Return empty dict (no wake word detected)
+    def reset(self): # Add reset method to dummy
+        pass
+
 # Import openWakeWord - we'll handle import errors gracefully
 OPENWAKEWORD_AVAILABLE = False
 OpenWakeWordModel = None
-download_models_func = None
 
 try:
     print("wake_word_detector.py: Attempting to import openwakeword...")
@@ -64,98 +63,173 @@ try:
     from openwakeword.model import Model as OWWModel # Alias to avoid confusion
     OpenWakeWordModel = OWWModel # Assign to the expected name
 
-    try:
-        from openwakeword.utils import download_models
-        if __name__ == "__main__":
-            print("wake_word_detector.py: Successfully imported openwakeword.utils.download_models")
-        download_models_func = download_models
-    except ImportError: # Changed from Exception to ImportError for specificity
-        if __name__ == "__main__":
-            print(f"wake_word_detector.py: Warning: Could not import openwakeword.utils.download_models.")
-            print("wake_word_detector.py: Using custom download function instead.")
-        download_models_func = download_openwakeword_models_internal
-    
     OPENWAKEWORD_AVAILABLE = True
     print("wake_word_detector.py: Successfully imported and configured openwakeword components.")
 except ImportError as e:
     print(f"wake_word_detector.py: ImportError: {e}")
     print("wake_word_detector.py: Warning: openWakeWord not installed or found. Wake word detection will not function.")
     print("wake_word_detector.py: To install openWakeWord, try: pip install openwakeword")
-    
-    # Create dummy classes for graceful degradation if openwakeword is not available
-    class DummyOpenWakeWordModel: # Renamed to avoid conflict
-        def __init__(self, *args, **kwargs):
-            print("wake_word_detector.py: Using dummy OpenWakeWordModel - wake word detection disabled")
-        
-        def predict(self, *args, **kwargs):
-            return {} # Return empty dict (no wake word detected)
-        def reset(self): # Add reset method to dummy
-            pass
-    
     OpenWakeWordModel = DummyOpenWakeWordModel # Assign dummy to the expected name
 
-    def dummy_download_models_func(*args, **kwargs):
-        print("wake_word_detector.py: Cannot download models - openwakeword not installed properly")
-        return False
-    download_models_func = dummy_download_models_func
+
+def clone_model_for_stream(model):
+    """
+    Per-stream copy of a loaded openWakeWord Model for another audio stream (device).
+    The copy shares the ONNX inference sessions (read-only, safe to run from several threads)
+    and gets its own audio-feature and prediction buffers. TFLite interpreters are not
+    thread-safe, so only clone ONNX models.
+    """
+    clone = copy.copy(model)
+    if hasattr(model, "preprocessor"):
+        clone.preprocessor = copy.copy(model.preprocessor)
+        if hasattr(clone.preprocessor, "reset"):
+            clone.preprocessor.reset() # Fresh raw-audio / melspectrogram / embedding buffers
+    if hasattr(clone, "reset"):
+        clone.reset() # Rebinds prediction_buffer on the copy
+    return clone
+
+
+# Keyword actions: what a detection should do to the assistant (routed by the caller / callbacks)
+ACTION_WAKE = "wake" # Start a conversation (LISTENING_FOR_WAKEWORD -> SENDING_TO_OPENAI)
+ACTION_CANCEL = "cancel" # During a conversation: stop the assistant's current answer
+ACTION_STOP = "stop" # During a conversation: end it and go back to wake-word listening
+KEYWORD_ACTIONS = (ACTION_WAKE, ACTION_CANCEL, ACTION_STOP)
+COMMAND_ACTIONS = (ACTION_CANCEL, ACTION_STOP)
+
+
+def parse_keyword_spec(spec: str, default_threshold: float = 0.5) -> Dict[str, Dict[str, Any]]:
+    """
+    WAKE_WORD_KEYWORDS format: "name[:threshold[:action]],..." e.g. "hey_jarvis:0.5:wake,stop_now:0.6:stop".
+    Returns {name: {"threshold": float, "action": str}} in the given order.
+    """
+    keywords = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, *rest = [field.strip() for field in item.split(":")]
+        threshold = float(rest[0]) if rest and rest[0] else default_threshold
+        action = rest[1] if len(rest) > 1 and rest[1] else ACTION_WAKE
+        if action not in KEYWORD_ACTIONS:
+            raise ValueError(f"Unknown action '{action}' for keyword '{name}' (expected one of {', '.join(KEYWORD_ACTIONS)})")
+        keywords[name] = {"threshold": threshold, "action": action}
+    return keywords
+
+
+# ONNX Runtime graph optimization levels by config name
+ORT_GRAPH_OPT_LEVELS = {"disable": "ORT_DISABLE_ALL", "basic": "ORT_ENABLE_BASIC", "extended": "ORT_ENABLE_EXTENDED", "all": "ORT_ENABLE_ALL"}
+
+
+def onnx_options_from_env() -> Dict[str, Any]:
+    """WAKE_WORD_ORT_* settings. 0 threads means ONNX Runtime's default (a pool sized to the machine)."""
+    return {"intra_op_threads": int(os.environ.get("WAKE_WORD_ORT_INTRA_OP_THREADS", "1")),
+            "inter_op_threads": int(os.environ.get("WAKE_WORD_ORT_INTER_OP_THREADS", "1")),
+            "graph_optimization": os.environ.get("WAKE_WORD_ORT_GRAPH_OPT", "all").lower()}
+
+
+def build_onnx_session_options(intra_op_threads: int = 1, inter_op_threads: int = 1, graph_optimization: str = "all"):
+    import onnxruntime as ort
+    session_options = ort.SessionOptions()
+    if intra_op_threads:
+        session_options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        session_options.inter_op_num_threads = inter_op_threads
+    session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL # Small graphs: no parallel branches worth a pool
+    session_options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, ORT_GRAPH_OPT_LEVELS[graph_optimization])
+    return session_options
+
+
+def _onnx_predict(session, x):
+    return session.run(None, {session.get_inputs()[0].name: x})
+
+
+def apply_onnx_session_options(model, keyword_paths: Dict[str, str], feature_paths: Dict[str, str], session_options):
+    """
+    Recreates the ONNX sessions of a loaded openWakeWord Model (keyword heads, melspectrogram,
+    embedding) with our SessionOptions; openWakeWord builds its own with fixed settings.
+    """
+    import onnxruntime as ort
+    providers = ["CPUExecutionProvider"]
+    for keyword_path in keyword_paths.values():
+        key = os.path.splitext(os.path.basename(keyword_path))[0] # Same key openWakeWord uses for a model loaded by path
+        session = ort.InferenceSession(keyword_path, sess_options=session_options, providers=providers)
+        model.models[key] = session
+        model.model_prediction_function[key] = functools.partial(_onnx_predict, session)
+    # The preprocessor's predict lambdas look these attributes up on every call
+    model.preprocessor.melspec_model = ort.InferenceSession(feature_paths[FEATURE_MELSPEC], sess_options=session_options, providers=providers)
+    model.preprocessor.embedding_model = ort.InferenceSession(feature_paths[FEATURE_EMBEDDING], sess_options=session_options, providers=providers)
 
 
 class WakeWordDetector:
     """
     Handles wake word detection using openWakeWord.
+
+    Several keyword heads (e.g. per-site wake words plus a "stop" command) load into one
+    openWakeWord Model, so the melspectrogram / embedding front end runs once per frame
+    however many keywords there are. Each keyword has its own threshold and action.
     """
     
     def __init__(self,
                  wake_word_model: Optional[str] = None,
                  threshold: Optional[float] = None,
-                 sample_rate: int = 16000):
+                 sample_rate: int = 16000,
+                 shared_model=None,
+                 keywords: Optional[Dict[str, Dict[str, Any]]] = None,
+                 model_variant: Optional[str] = None,
+                 onnx_options: Optional[Dict[str, Any]] = None):
+        """
+        shared_model: an already loaded (ONNX) Model with the same keywords to share sessions with, see clone_model_for_stream().
+        keywords: {name: {"threshold", "action"}}; defaults to WAKE_WORD_KEYWORDS, else the single wake_word_model.
+        model_variant: "fp32" or "int8" store entries (WAKE_WORD_MODEL_VARIANT); onnx_options: see onnx_options_from_env().
+        """
         print(f"WakeWordDetector: Initializing... OPENWAKEWORD_AVAILABLE is {OPENWAKEWORD_AVAILABLE}")
         self.wake_word_model_name = wake_word_model or os.environ.get("WAKE_WORD_MODEL", "hey_jarvis") # Use a default like hey_jarvis
         
         threshold_str = os.environ.get("WAKE_WORD_THRESHOLD", "0.5")
         self.threshold = threshold if threshold is not None else float(threshold_str)
+
+        if keywords is None:
+            keywords = parse_keyword_spec(os.environ.get("WAKE_WORD_KEYWORDS", ""), self.threshold) \
+                or {self.wake_word_model_name: {"threshold": self.threshold, "action": ACTION_WAKE}}
+        self.keywords = {name: dict(settings) for name, settings in keywords.items()}
+        wake_keywords = [name for name, settings in self.keywords.items() if settings["action"] == ACTION_WAKE]
+        if wake_keywords and self.wake_word_model_name not in wake_keywords:
+            self.wake_word_model_name = wake_keywords[0] # Name shown in logs / "listening for" messages
+            self.threshold = self.keywords[self.wake_word_model_name]["threshold"]
+        self.refractory_s = float(os.environ.get("WAKE_WORD_REFRACTORY_S", "1.5")) # A keyword doesn't fire again within this window
+        self._last_fired: Dict[str, float] = {}
+        self._callbacks: Dict[str, List] = {} # keyword name or action -> [fn(keyword, score)]
+        self._score_callbacks: List = [] # fn(scores, wake_score) after every scored chunk
+        self.last_detected_keyword = None
+        self.last_scores: Dict[str, float] = {}
         
         self.model_type = os.environ.get("WAKE_WORD_MODEL_TYPE", "onnx").lower()
+        self.model_variant = (model_variant or os.environ.get("WAKE_WORD_MODEL_VARIANT", VARIANT_FP32)).lower()
+        self.onnx_options = onnx_options or onnx_options_from_env()
         self.sample_rate = sample_rate # This is the rate of audio coming IN to process_audio
         self.oww_expected_rate = 16000 # openWakeWord models expect 16kHz
 
         self.model = None # Initialize model attribute
         
-        if OPENWAKEWORD_AVAILABLE and OpenWakeWordModel is not None and download_models_func is not None:
+        self.model_paths = None # From the local model store (wake_word_model_store.py), resolved at init, loaded by load()
+        self.load_ms = None
+        self.ready_after_start_s = None # Seconds from process start until the model was loaded
+        self._load_lock = threading.Lock()
+
+        if OPENWAKEWORD_AVAILABLE and OpenWakeWordModel is not None:
             try:
-                print(f"WakeWordDetector: Ensuring wake word models are downloaded using: {download_models_func.__name__}")
-                # Ensure the specific model is available or attempt download
-                # download_models_func(model_names=[self.wake_word_model_name]) # More targeted download
-                download_models_func() # General download for simplicity now
-
-                model_file_name_to_load = f"{self.wake_word_model_name}.{self.model_type}"
-                if self.model_type == "tflite" and not model_file_name_to_load.endswith(".tflite"): # openwakeword v0.5+ uses .tflite
-                    model_file_name_to_load = f"{self.wake_word_model_name}.tflite"
-                elif self.model_type == "onnx" and not model_file_name_to_load.endswith(".onnx"):
-                     model_file_name_to_load = f"{self.wake_word_model_name}.onnx"
-
-
-                print(f"WakeWordDetector: Attempting to load model: '{model_file_name_to_load}' with inference_framework='{self.model_type}'")
-                
-                # For openwakeword >0.5, wakeword_models should be list of base names, not filenames
-                self.model = OpenWakeWordModel(
-                    wakeword_models=[self.wake_word_model_name], # Pass base name like "hey_jarvis"
-                    inference_framework=self.model_type
-                )
-                
-                # Verify model loaded
-                if not self.model.models: # .models is the dict of loaded models
-                    print(f"WakeWordDetector: ERROR - Model list is empty after initialization for '{self.wake_word_model_name}'.")
-                    self.model = None # Failed to load
-                else:
-                    print(f"WakeWordDetector: Successfully initialized with model: {self.wake_word_model_name} (using {self.model_type}). Loaded models: {list(self.model.models.keys())}")
-
-            except Exception as e:
-                print(f"WakeWordDetector: Error initializing openWakeWord model '{self.wake_word_model_name}': {e}")
-                self.model = None # Ensure model is None on failure
+                # Only the configured keywords, from disk; no download (provision with wake_word_model_store.py prefetch)
+                self.model_paths = resolve_keyword_paths(list(self.keywords), self.model_type, verify=False, variant=self.model_variant)
+                print(f"WakeWordDetector: {', '.join(self.keywords)} ({self.model_type}) found in model store; load() loads them.")
+            except ModelStoreError as e:
+                print(f"WakeWordDetector: ERROR - {e}")
         else:
             print("WakeWordDetector: openWakeWord not available or core components not imported. Using dummy model.")
             self.model = OpenWakeWordModel() # This will be DummyOpenWakeWordModel if import failed
+        # Models loaded by path are keyed by file stem in predict() results (e.g. "hey_jarvis_v0.1")
+        for name, settings in self.keywords.items():
+            keyword_path = self.model_paths[0][name] if self.model_paths else None
+            settings["prediction_key"] = os.path.splitext(os.path.basename(keyword_path))[0] if keyword_path else name
+        if shared_model is not None and self.model_paths is not None:
+            self.model = clone_model_for_stream(shared_model)
+            print(f"WakeWordDetector: Sharing loaded {', '.join(self.keywords)} model sessions (no load).")
 
         self.buffer = np.array([], dtype=np.int16) # Store as int16, convert to float32 for predict
         self._config_printed = False
@@ -164,6 +238,69 @@ class WakeWordDetector:
         self._scipy_checked = False
         self._scipy_available = False
 
+    @property
+    def available(self) -> bool:
+        """True if a real model is loaded or can be loaded from the store."""
+        return self.model_paths is not None or (self.model is not None and not isinstance(self.model, DummyOpenWakeWordModel))
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None and not isinstance(self.model, DummyOpenWakeWordModel)
+
+    def has_action(self, action: str) -> bool:
+        return any(settings["action"] == action for settings in self.keywords.values())
+
+    def add_callback(self, keyword_or_action: str, callback):
+        """callback(keyword, score) runs on the audio thread for each detection of that keyword (or of any keyword with that action)."""
+        self._callbacks.setdefault(keyword_or_action, []).append(callback)
+
+    def add_score_callback(self, callback):
+        """
+        callback(scores, wake_score) runs on the audio thread after every scored chunk, detection or
+        not: every keyword's score and the highest score among wake keywords. For acting on a rising
+        score before it reaches the threshold (see session_policy.py).
+        """
+        self._score_callbacks.append(callback)
+
+    def wake_score(self) -> float:
+        """Highest last score among keywords with the wake action."""
+        return max((score for name, score in self.last_scores.items() if self.keywords[name]["action"] == ACTION_WAKE), default=0.0)
+
+    def load(self) -> bool:
+        """
+        Verifies the stored files against their manifest checksums and loads all keyword heads
+        into one model. Safe to call from a background thread; process_audio() reports no
+        detection until it is done.
+        """
+        with self._load_lock:
+            if self.ready:
+                return True
+            if self.model_paths is None:
+                return False
+            started = time.perf_counter()
+            try:
+                keyword_paths, feature_paths = resolve_keyword_paths(list(self.keywords), self.model_type, verify=True, variant=self.model_variant)
+                model = OpenWakeWordModel(
+                    wakeword_models=list(keyword_paths.values()), inference_framework=self.model_type,
+                    melspec_model_path=feature_paths[FEATURE_MELSPEC], embedding_model_path=feature_paths[FEATURE_EMBEDDING])
+                if self.model_type == "onnx":
+                    apply_onnx_session_options(model, keyword_paths, feature_paths, build_onnx_session_options(**self.onnx_options))
+                if not model.models: # .models is the dict of loaded models
+                    print(f"WakeWordDetector: ERROR - Model list is empty after loading {', '.join(self.keywords)}.")
+                    return False
+            except Exception as e: # ModelStoreError (missing file / checksum) or an openWakeWord load error
+                print(f"WakeWordDetector: Error loading openWakeWord models {', '.join(self.keywords)}: {e}")
+                self.model_paths = None # Not available; don't retry on every frame
+                return False
+            self.model = model
+            self.load_ms = (time.perf_counter() - started) * 1000.0
+            self.ready_after_start_s = seconds_since_process_start()
+            loaded = ", ".join(f"{name} ({settings['action']}, thr {settings['threshold']})" for name, settings in self.keywords.items())
+            runtime = f"{self.model_type}, {self.model_variant}" + (f", {self.onnx_options}" if self.model_type == "onnx" else "")
+            print(f"WakeWordDetector: Loaded {loaded} [{runtime}] in {self.load_ms:.0f} ms, "
+                  f"wake word ready {self.ready_after_start_s:.2f} s after process start.")
+            return True
+
     def _check_scipy(self):
         if not self._scipy_checked:
             try:
@@ -177,15 +314,26 @@ class WakeWordDetector:
         return self._scipy_available
 
     def process_audio(self, audio_chunk_bytes: bytes) -> bool:
+        """True if a wake keyword fired on this chunk (last_detected_keyword says which)."""
+        return bool(self.process_keywords(audio_chunk_bytes, actions=(ACTION_WAKE,)))
+
+    def process_keywords(self, audio_chunk_bytes: bytes, actions: Optional[Tuple[str, ...]] = None) -> List[Tuple[str, float]]:
+        """
+        Runs the shared front end and every keyword head once on the chunk. Returns [(keyword, score)]
+        for keywords whose action is in `actions` (None = all) that crossed their threshold, and runs
+        their callbacks. Scores of all keywords are kept in last_scores.
+        """
         if not self._config_printed:
-            print(f"WakeWordDetector.process_audio: Config: model={self.wake_word_model_name}, threshold={self.threshold}, input_rate={self.sample_rate}Hz")
+            print(f"WakeWordDetector.process_audio: Config: keywords={ {n: s['threshold'] for n, s in self.keywords.items()} }, input_rate={self.sample_rate}Hz")
             self._config_printed = True
             
+        if self.model is None and self.model_paths is not None:
+            return [] # Still loading (see load())
         if self.model is None or not hasattr(self.model, 'predict'): # Check if it's a valid model object
             # This also handles the case where self.model became DummyOpenWakeWordModel and predict is a dummy
             if not isinstance(self.model, DummyOpenWakeWordModel): # Avoid double printing for dummy
                  print("WakeWordDetector.process_audio: No valid model loaded, cannot process audio.")
-            return False
+            return []
         
         audio_data_int16 = np.frombuffer(audio_chunk_bytes, dtype=np.int16)
 
@@ -213,26 +361,42 @@ class WakeWordDetector:
         # openWakeWord expects int16 numpy array
         # For versions like 0.5.x, it seems to handle internal buffering well,
         # so we can feed it chunks directly.
-        prediction = self.model.predict(audio_data_int16) # Pass the int16 numpy array
+        prediction = self.model.predict(audio_data_int16) # One front-end pass, every keyword head scored
 
-        # The key in the prediction dictionary should be the base model name, e.g., "hey_jarvis"
-        # (not "hey_jarvis.onnx") for openwakeword versions >= 0.5.0
-        score = prediction.get(self.wake_word_model_name, 0.0) 
-        
-        if score > self.threshold:
-            print(f"WakeWordDetector: DETECTED '{self.wake_word_model_name}' with score {score:.4f} (threshold {self.threshold})")
-            return True
-        
-        # Optional: print scores if they are close to threshold for debugging
-        # elif score > self.threshold * 0.5: # e.g. if score is more than half the threshold
-        #    print(f"WakeWordDetector: Near miss for '{self.wake_word_model_name}', score: {score:.4f}")
-
-        return False
+        detections = []
+        now = time.monotonic()
+        for name, settings in self.keywords.items():
+            score = float(prediction.get(settings["prediction_key"], 0.0))
+            self.last_scores[name] = score
+            if score <= settings["threshold"] or (actions is not None and settings["action"] not in actions):
+                continue
+            if now - self._last_fired.get(name, -1e9) < self.refractory_s:
+                continue
+            self._last_fired[name] = now
+            print(f"WakeWordDetector: DETECTED '{name}' ({settings['action']}) with score {score:.4f} (threshold {settings['threshold']})")
+            detections.append((name, score))
+        if self._score_callbacks:
+            wake_score = self.wake_score()
+            for callback in self._score_callbacks:
+                try:
+                    callback(self.last_scores, wake_score)
+                except Exception as e:
+                    print(f"WakeWordDetector: Score callback failed: {e}")
+        if detections:
+            self.last_detected_keyword = max(detections, key=lambda d: d[1])[0]
+            for name, score in detections:
+                for callback in self._callbacks.get(name, []) + self._callbacks.get(self.keywords[name]["action"], []):
+                    try:
+                        callback(name, score)
+                    except Exception as e:
+                        print(f"WakeWordDetector: Callback for '{name}' failed: {e}")
+        return detections
     
     def reset(self):
         if self.model and hasattr(self.model, 'reset'):
             self.model.reset()
         self.buffer = np.array([], dtype=np.int16) # Reset buffer
+        self._last_fired.clear()
         print("WakeWordDetector: Reset complete.")
 
 # Example usage when run directly
@@ -247,6 +411,7 @@ if __name__ == "__main__":
         print("\nTest: Creating WakeWordDetector instance...")
         try:
             test_detector = WakeWordDetector(sample_rate=16000) # Assume 16kHz for direct test
+            test_detector.load()
             if test_detector.model and not isinstance(test_detector.model, DummyOpenWakeWordModel):
                 print("Test: WakeWordDetector instance created successfully with a real model.")
                 print(f"Test: Detector configured for model: {test_detector.wake_word_model_name}, threshold: {test_detector.threshold}")
@@ -0,0 +1,185 @@
+# wake_word_eval.py
+# Offline accuracy / cost evaluation of the wake word over a labeled WAV corpus.
+#
+#   python wake_word_eval.py corpus/ [--keyword hey_jarvis] [--thresholds 0.3,0.4,0.5,0.6,0.7] [--workers 4]
+#
+#   corpus/positive/*.wav    one utterance of the keyword each (should fire)
+#   corpus/negative/*.wav    speech without the keyword, near-misses (should not fire)
+#   corpus/background/*.wav  long recordings of TV, office, car noise (should not fire)
+#
+# Every file is streamed once, as fast as possible, through WakeWordDetector in 30 ms frames
+# (read with wav_corpus.read_vad_frames, the frames main.py feeds it), one worker process per core across files. Workers keep the
+# keyword score of every frame; the threshold sweep is then applied offline with the
+# detector's refractory window in audio time, so N thresholds cost one pass. Per threshold:
+#   - miss rate on positives
+#   - false accepts per hour over negative + background audio
+#   - detection latency: first detection minus the end of the keyword, taken from
+#     positive/labels.csv ("file,end_s") when present, else the last WebRTC-voiced frame
+# plus CPU-seconds per audio-hour of the detector itself (process time, all workers).
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from local_vad import LocalEndpointer, VAD_SAMPLE_RATE
+from wake_word_detector import WakeWordDetector, ACTION_WAKE
+from wav_corpus import (find_corpus_files, read_vad_frames, fmt_optional, add_json_argument, write_json_report,
+                        FRAME_MS, FRAME_S)
+
+LABELS = ("positive", "negative", "background")
+DEFAULT_THRESHOLDS = "0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9"
+
+_worker_detector: Optional[WakeWordDetector] = None
+_worker_vad: Optional[LocalEndpointer] = None
+
+
+def _eval_log(message, level="INFO"):
+    print(f"[{level}] [WW_EVAL] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def load_keyword_end_labels(corpus_dir: str) -> Dict[str, float]:
+    """positive/labels.csv: file name (as in positive/) -> end of the keyword in seconds."""
+    labels_path = os.path.join(corpus_dir, "positive", "labels.csv")
+    if not os.path.exists(labels_path):
+        return {}
+    with open(labels_path, newline="") as labels_file:
+        return {row["file"]: float(row["end_s"]) for row in csv.DictReader(labels_file)}
+
+
+def _init_worker(keyword: str):
+    """One detector (and model load) per worker process, reused for every file it gets."""
+    global _worker_detector, _worker_vad
+    _worker_detector = WakeWordDetector(sample_rate=VAD_SAMPLE_RATE, keywords={keyword: {"threshold": 0.5, "action": ACTION_WAKE}})
+    if not _worker_detector.load():
+        raise RuntimeError(f"Could not load '{keyword}' from the model store (see wake_word_model_store.py).")
+    _worker_vad = LocalEndpointer(frame_ms=FRAME_MS, input_rate=VAD_SAMPLE_RATE)
+
+
+def score_file(file_info: Dict) -> Dict:
+    """
+    Streams one WAV through the worker's detector. Returns the keyword score per frame and the
+    process time spent in the detector; for positives also the last voiced frame (keyword end).
+    """
+    detector, keyword = _worker_detector, next(iter(_worker_detector.keywords))
+    detector.reset()
+    scores, cpu_s, last_voiced_frame = [], 0.0, None
+    for frames in read_vad_frames(file_info["path"], FRAME_MS):
+        started = time.process_time()
+        for frame in frames:
+            detector.process_keywords(frame, actions=()) # Scores only; the sweep decides what fires
+            scores.append(detector.last_scores.get(keyword, 0.0))
+        cpu_s += time.process_time() - started
+        if file_info["label"] == "positive" and _worker_vad.available:
+            first_index = len(scores) - len(frames)
+            for offset, frame in enumerate(frames):
+                if _worker_vad.is_speech(frame):
+                    last_voiced_frame = first_index + offset
+    return {**file_info, "scores": np.asarray(scores, dtype=np.float32), "cpu_s": cpu_s,
+            "duration_s": len(scores) * FRAME_S, "last_voiced_frame": last_voiced_frame}
+
+
+def detection_times(scores: np.ndarray, threshold: float, refractory_s: float) -> List[float]:
+    """Frame-end times (s) at which the detector would fire, with its refractory window in audio time."""
+    times, last = [], -1e9
+    for index in np.flatnonzero(scores > threshold): # Same comparison as process_keywords
+        at = (index + 1) * FRAME_S
+        if at - last >= refractory_s:
+            times.append(at)
+            last = at
+    return times
+
+
+def sweep_thresholds(results: List[Dict], thresholds: List[float], refractory_s: float,
+                     keyword_ends: Dict[str, float]) -> List[Dict]:
+    positives = [r for r in results if r["label"] == "positive"]
+    negative_s = sum(r["duration_s"] for r in results if r["label"] == "negative")
+    background_s = sum(r["duration_s"] for r in results if r["label"] == "background")
+    rows = []
+    for threshold in thresholds:
+        false_accepts = {"negative": 0, "background": 0}
+        for r in results:
+            if r["label"] in false_accepts:
+                false_accepts[r["label"]] += len(detection_times(r["scores"], threshold, refractory_s))
+        misses, latencies_ms = 0, []
+        for r in positives:
+            fired = detection_times(r["scores"], threshold, refractory_s)
+            if not fired:
+                misses += 1
+                continue
+            keyword_end = keyword_ends.get(os.path.basename(r["path"]))
+            if keyword_end is None and r["last_voiced_frame"] is not None:
+                keyword_end = (r["last_voiced_frame"] + 1) * FRAME_S
+            if keyword_end is not None:
+                latencies_ms.append((fired[0] - keyword_end) * 1000.0)
+        latencies_ms.sort()
+        fa_hours = (negative_s + background_s) / 3600.0
+        rows.append({
+            "threshold": threshold,
+            "miss_rate": misses / len(positives) if positives else None,
+            "fa_per_hour": sum(false_accepts.values()) / fa_hours if fa_hours else None,
+            "fa_negative": false_accepts["negative"], "fa_background": false_accepts["background"],
+            "latency_p50_ms": latencies_ms[len(latencies_ms) // 2] if latencies_ms else None,
+            "latency_p95_ms": latencies_ms[int(len(latencies_ms) * 0.95)] if latencies_ms else None,
+        })
+    return rows
+
+
+def evaluate_corpus(corpus_dir: str, keyword: str, thresholds: List[float], workers: int) -> Dict:
+    files = find_corpus_files(corpus_dir, LABELS)
+    if not files:
+        raise SystemExit(f"No WAVs in {corpus_dir}/{{{','.join(LABELS)}}}/.")
+    _eval_log(f"Scoring {len(files)} files for '{keyword}' with {workers} worker process(es)...")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(keyword,)) as pool:
+        results = list(pool.map(score_file, files))
+    wall_s = time.perf_counter() - started
+    audio_s = sum(r["duration_s"] for r in results)
+    cpu_s = sum(r["cpu_s"] for r in results)
+    refractory_s = float(os.environ.get("WAKE_WORD_REFRACTORY_S", "1.5"))
+    return {
+        "keyword": keyword, "workers": workers, "wall_s": wall_s, "audio_s": audio_s, "cpu_s": cpu_s,
+        "cpu_s_per_audio_hour": cpu_s / (audio_s / 3600.0) if audio_s else None,
+        "files": {label: sum(r["label"] == label for r in results) for label in LABELS},
+        "audio_s_by_label": {label: sum(r["duration_s"] for r in results if r["label"] == label) for label in LABELS},
+        "rows": sweep_thresholds(results, thresholds, refractory_s, load_keyword_end_labels(corpus_dir)),
+    }
+
+
+def print_report(report: Dict, current_threshold: float):
+    files, audio = report["files"], report["audio_s_by_label"]
+    print(f"\nWake word '{report['keyword']}': {files['positive']} positive ({audio['positive'] / 60:.1f} min), "
+          f"{files['negative']} negative ({audio['negative'] / 60:.1f} min), "
+          f"{files['background']} background ({audio['background'] / 3600:.2f} h)")
+    print(f"  {report['audio_s'] / 3600:.2f} h of audio in {report['wall_s']:.1f} s wall with {report['workers']} workers "
+          f"({report['audio_s'] / max(report['wall_s'], 1e-9):.0f}x real time)")
+    cpu_per_hour = report["cpu_s_per_audio_hour"]
+    core_pct = None if cpu_per_hour is None else cpu_per_hour / 36.0 # 3600 CPU-s per audio-hour = 100% of one core
+    print(f"  Detector CPU: {fmt_optional(cpu_per_hour, '.1f')} CPU-s per audio-hour ({fmt_optional(core_pct, '.2f')}% of one core)")
+    print(f"\n  {'threshold':>10} {'miss %':>7} {'FA/hr':>8} {'FA neg':>7} {'FA bg':>6} {'lat p50 ms':>11} {'lat p95 ms':>11}")
+    for row in report["rows"]:
+        marker = "*" if abs(row["threshold"] - current_threshold) < 1e-9 else " "
+        miss = fmt_optional(None if row["miss_rate"] is None else row["miss_rate"] * 100.0, ".1f")
+        print(f"  {marker}{row['threshold']:>9.2f} {miss:>7} {fmt_optional(row['fa_per_hour'], '.2f'):>8} {row['fa_negative']:>7} "
+              f"{row['fa_background']:>6} {fmt_optional(row['latency_p50_ms'], '.0f'):>11} {fmt_optional(row['latency_p95_ms'], '.0f'):>11}")
+    print("  (* = current WAKE_WORD_THRESHOLD)")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Wake-word miss rate, false accepts/hour, latency and CPU over a labeled WAV corpus.")
+    arg_parser.add_argument("corpus_dir", help="Directory with positive/, negative/ and background/ WAVs.")
+    arg_parser.add_argument("--keyword", default=os.getenv("WAKE_WORD_MODEL", "hey_jarvis"))
+    arg_parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help=f"Comma-separated (default {DEFAULT_THRESHOLDS}).")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    add_json_argument(arg_parser)
+    cli_args = arg_parser.parse_args()
+
+    sweep = sorted(float(t) for t in cli_args.thresholds.split(",") if t.strip())
+    eval_report = evaluate_corpus(cli_args.corpus_dir, cli_args.keyword, sweep, max(1, cli_args.workers))
+    print_report(eval_report, float(os.getenv("WAKE_WORD_THRESHOLD", "0.5")))
+    if cli_args.json_path:
+        write_json_report(cli_args.json_path, eval_report, _eval_log)
@@ -0,0 +1,314 @@
+# wake_word_model_store.py
+# Local, offline store for openWakeWord model files.
+#
+# The assistant never downloads wake-word models at startup. Models are provisioned ahead of
+# time into WAKE_WORD_MODEL_DIR (default models/wake_word next to this file) with
+#   python wake_word_model_store.py prefetch hey_jarvis [--framework onnx]
+#   python wake_word_model_store.py add my_word.onnx --name my_word --version 2024-05
+# and recorded in manifest.json (name, kind, framework, file, sha256, version, source).
+# At runtime WakeWordDetector resolves only the configured WAKE_WORD_MODEL (plus the shared
+# melspectrogram / embedding feature models) from the manifest and checks each file's
+# sha256 before loading it. No network is touched unless prefetch is run explicitly.
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+MODEL_STORE_DIR = os.getenv("WAKE_WORD_MODEL_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "wake_word")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT = 1
+
+KIND_WAKEWORD = "wakeword"
+KIND_FEATURE = "feature"
+FEATURE_MELSPEC = "melspectrogram"
+FEATURE_EMBEDDING = "embedding"
+
+# openWakeWord release assets (same URLs openwakeword.utils.download_models uses)
+RELEASE_VERSION = "v0.5.1"
+RELEASE_BASE_URL = f"https://github.com/dscripka/openWakeWord/releases/download/{RELEASE_VERSION}/"
+PRETRAINED_FILE_STEMS = {
+    "alexa": "alexa_v0.1",
+    "hey_mycroft": "hey_mycroft_v0.1",
+    "hey_jarvis": "hey_jarvis_v0.1",
+    "hey_rhasspy": "hey_rhasspy_v0.1",
+    "timer": "timer_v0.1",
+    "weather": "weather_v0.1",
+}
+FEATURE_FILE_STEMS = {FEATURE_MELSPEC: "melspectrogram", FEATURE_EMBEDDING: "embedding_model"}
+VARIANT_FP32 = "fp32" # As published (entries without a variant field are fp32)
+VARIANT_INT8 = "int8" # Dynamic int8 quantization of an fp32 ONNX entry, see quantize_model()
+
+# Process start reference for the "wake word ready" measurement when /proc is unavailable
+_MODULE_IMPORTED_AT = time.time()
+
+
+class ModelStoreError(Exception):
+    """A model is missing from the store, its file is gone, or its checksum does not match."""
+
+
+def _store_log(message, level="INFO"):
+    print(f"[{level}] [WW_MODEL_STORE] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as model_file:
+        for block in iter(lambda: model_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def seconds_since_process_start() -> float:
+    """Wall seconds since this process was started (from /proc), else since this module was imported."""
+    try:
+        with open("/proc/self/stat") as stat_file:
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19]) # Field 22, counted after "pid (comm)"
+        with open("/proc/stat") as boot_file:
+            boot_time = next(int(line.split()[1]) for line in boot_file if line.startswith("btime"))
+        return time.time() - (boot_time + start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time() - _MODULE_IMPORTED_AT
+
+
+# --- Manifest ---
+def load_manifest(store_dir: str = MODEL_STORE_DIR) -> Dict:
+    path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"format": MANIFEST_FORMAT, "models": []}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest: Dict, store_dir: str = MODEL_STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, MANIFEST_NAME)
+    manifest["models"].sort(key=_entry_key)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _entry_key(entry: Dict) -> tuple:
+    return entry["name"], entry["framework"], entry["kind"], entry.get("variant", VARIANT_FP32)
+
+
+def find_entry(manifest: Dict, name: str, framework: str, kind: str = KIND_WAKEWORD, variant: str = VARIANT_FP32) -> Optional[Dict]:
+    for entry in manifest.get("models", []):
+        if _entry_key(entry) == (name, framework, kind, variant):
+            return entry
+    return None
+
+
+def _upsert_entry(manifest: Dict, entry: Dict):
+    manifest["models"] = [e for e in manifest["models"] if _entry_key(e) != _entry_key(entry)]
+    manifest["models"].append(entry)
+
+
+# --- Runtime lookup ---
+def entry_path(entry: Dict, store_dir: str = MODEL_STORE_DIR, verify: bool = True) -> str:
+    path = os.path.join(store_dir, entry["file"])
+    if not os.path.exists(path):
+        raise ModelStoreError(f"'{entry['name']}' ({entry['framework']}) is in the manifest but {path} is missing.")
+    if verify:
+        actual = sha256_file(path)
+        if actual != entry["sha256"]:
+            raise ModelStoreError(f"Checksum mismatch for {path}: manifest {entry['sha256'][:12]}..., file {actual[:12]}...")
+    return path
+
+
+def resolve_model_paths(name: str, framework: str = "onnx", store_dir: str = MODEL_STORE_DIR, verify: bool = True,
+                        variant: str = VARIANT_FP32) -> Dict[str, str]:
+    """
+    Paths of the wake-word model and both feature models for one wake word, from the manifest.
+    verify=True hashes each file against the manifest. Raises ModelStoreError (never downloads).
+    """
+    keyword_paths, feature_paths = resolve_keyword_paths([name], framework, store_dir, verify, variant)
+    return {KIND_WAKEWORD: keyword_paths[name], **feature_paths}
+
+
+def resolve_keyword_paths(names: List[str], framework: str = "onnx", store_dir: str = MODEL_STORE_DIR,
+                          verify: bool = True, variant: str = VARIANT_FP32) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    ({keyword: model path}, {feature: model path}) for several keyword heads that share one
+    melspectrogram / embedding front end. Same checks as resolve_model_paths(). With
+    variant="int8", each file uses its int8 entry if there is one and its fp32 entry otherwise.
+    """
+    manifest = load_manifest(store_dir)
+
+    def lookup(name, kind):
+        return (variant != VARIANT_FP32 and find_entry(manifest, name, framework, kind, variant)) or find_entry(manifest, name, framework, kind)
+    keyword_entries = {name: lookup(name, KIND_WAKEWORD) for name in names}
+    feature_entries = {feature: lookup(feature, KIND_FEATURE) for feature in FEATURE_FILE_STEMS}
+    missing = [name for name, entry in {**keyword_entries, **feature_entries}.items() if entry is None]
+    if missing:
+        raise ModelStoreError(f"Not in {os.path.join(store_dir, MANIFEST_NAME)} for framework '{framework}': {', '.join(missing)}. "
+                              f"Run: python wake_word_model_store.py prefetch {' '.join(names)} --framework {framework}")
+    return ({name: entry_path(entry, store_dir, verify) for name, entry in keyword_entries.items()},
+            {feature: entry_path(entry, store_dir, verify) for feature, entry in feature_entries.items()})
+
+
+# --- Provisioning ---
+def _download(url: str, target_path: str, timeout_s: float = 60.0):
+    with requests.get(url, stream=True, timeout=timeout_s) as response:
+        response.raise_for_status()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                for block in response.iter_content(1 << 16):
+                    tmp_file.write(block)
+            os.replace(tmp_path, target_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _store_file(name: str, kind: str, framework: str, file_name: str, version: str, source: str,
+                manifest: Dict, store_dir: str, fetch, force: bool, variant: str = VARIANT_FP32) -> Dict:
+    existing = find_entry(manifest, name, framework, kind, variant)
+    if existing and not force:
+        try:
+            entry_path(existing, store_dir, verify=True)
+            _store_log(f"{name} ({framework}) already in store, checksum OK.")
+            return existing
+        except ModelStoreError as e:
+            _store_log(f"{e} Fetching again.", "WARN")
+    target_path = os.path.join(store_dir, file_name)
+    fetch(target_path)
+    entry = {"name": name, "kind": kind, "framework": framework, "file": file_name, "sha256": sha256_file(target_path),
+             "version": version, "source": source, "size_bytes": os.path.getsize(target_path),
+             "added_at": datetime.utcnow().isoformat(timespec="seconds") + "Z"}
+    if variant != VARIANT_FP32:
+        entry["variant"] = variant
+    _upsert_entry(manifest, entry)
+    _store_log(f"Stored {name} ({framework}, {variant}) -> {file_name}, sha256 {entry['sha256'][:12]}...")
+    return entry
+
+
+def prefetch(names: List[str], framework: str = "onnx", store_dir: str = MODEL_STORE_DIR, force: bool = False) -> List[Dict]:
+    """Downloads the feature models and the named pretrained wake-word models into the store and records them."""
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = load_manifest(store_dir)
+    jobs = [(feature, KIND_FEATURE, stem) for feature, stem in FEATURE_FILE_STEMS.items()]
+    for name in names:
+        if name not in PRETRAINED_FILE_STEMS:
+            raise ModelStoreError(f"'{name}' is not a pretrained openWakeWord model ({', '.join(PRETRAINED_FILE_STEMS)}). "
+                                  f"Use 'add' for a custom model file.")
+        jobs.append((name, KIND_WAKEWORD, PRETRAINED_FILE_STEMS[name]))
+    stored = []
+    try:
+        for name, kind, stem in jobs:
+            file_name = f"{stem}.{framework}"
+            url = RELEASE_BASE_URL + file_name
+            stored.append(_store_file(name, kind, framework, file_name, f"{RELEASE_VERSION}/{stem}", url, manifest, store_dir,
+                                      lambda target_path, url=url: _download(url, target_path), force))
+    finally:
+        save_manifest(manifest, store_dir) # Keep whatever was fetched before a failure
+    return stored
+
+
+def add_local_model(path: str, name: str, framework: Optional[str] = None, version: str = "custom",
+                    kind: str = KIND_WAKEWORD, store_dir: str = MODEL_STORE_DIR) -> Dict:
+    """Copies a model file (e.g. a custom-trained wake word) into the store and records it."""
+    os.makedirs(store_dir, exist_ok=True)
+    framework = framework or os.path.splitext(path)[1].lstrip(".").lower()
+    manifest = load_manifest(store_dir)
+    entry = _store_file(name, kind, framework, os.path.basename(path), version, os.path.abspath(path), manifest, store_dir,
+                        lambda target_path: os.path.abspath(path) != os.path.abspath(target_path) and shutil.copyfile(path, target_path),
+                        force=True)
+    save_manifest(manifest, store_dir)
+    return entry
+
+
+def quantize_model(name: str, kind: str = KIND_WAKEWORD, store_dir: str = MODEL_STORE_DIR, per_channel: bool = False) -> Dict:
+    """
+    Adds an int8 variant of a stored fp32 ONNX model (onnxruntime dynamic quantization: int8
+    weights, activations quantized at run time). Needs the onnx package, at provisioning time only.
+    """
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError as e:
+        raise ModelStoreError(f"Quantization needs onnxruntime and onnx ({e}). pip install onnx")
+    manifest = load_manifest(store_dir)
+    source = find_entry(manifest, name, "onnx", kind)
+    if source is None:
+        raise ModelStoreError(f"No fp32 ONNX entry for {kind} '{name}' to quantize. Prefetch or add it first.")
+    source_path = entry_path(source, store_dir, verify=True)
+    file_name = f"{os.path.splitext(source['file'])[0]}.{VARIANT_INT8}.onnx"
+    entry = _store_file(name, kind, "onnx", file_name, f"{source['version']}+{VARIANT_INT8}",
+                        f"quantize_dynamic({source['file']} sha256 {source['sha256'][:12]}, per_channel={per_channel})",
+                        manifest, store_dir,
+                        lambda target_path: quantize_dynamic(source_path, target_path, weight_type=QuantType.QInt8, per_channel=per_channel),
+                        force=True, variant=VARIANT_INT8)
+    save_manifest(manifest, store_dir)
+    return entry
+
+
+def verify_store(store_dir: str = MODEL_STORE_DIR) -> List[str]:
+    """Checks every manifest entry; returns a list of problems (empty if all files are present and match)."""
+    problems = []
+    for entry in load_manifest(store_dir).get("models", []):
+        try:
+            entry_path(entry, store_dir, verify=True)
+        except ModelStoreError as e:
+            problems.append(str(e))
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    arg_parser = argparse.ArgumentParser(description="Provision and check the offline wake-word model store.")
+    arg_parser.add_argument("--dir", default=MODEL_STORE_DIR, help="Store directory (default: WAKE_WORD_MODEL_DIR or models/wake_word).")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    prefetch_parser = commands.add_parser("prefetch", help="Download pretrained models (and the feature models) into the store.")
+    prefetch_parser.add_argument("names", nargs="*", help="Wake words; defaults to WAKE_WORD_MODEL (or hey_jarvis).")
+    prefetch_parser.add_argument("--framework", default=os.getenv("WAKE_WORD_MODEL_TYPE", "onnx"), choices=["onnx", "tflite"])
+    prefetch_parser.add_argument("--force", action="store_true", help="Download again even if the stored file verifies.")
+    add_parser = commands.add_parser("add", help="Add a local model file to the store.")
+    add_parser.add_argument("path")
+    add_parser.add_argument("--name", required=True)
+    add_parser.add_argument("--version", default="custom")
+    add_parser.add_argument("--kind", default=KIND_WAKEWORD, choices=[KIND_WAKEWORD, KIND_FEATURE])
+    quantize_parser = commands.add_parser("quantize", help="Add int8 variants of stored fp32 ONNX models.")
+    quantize_parser.add_argument("names", nargs="*", help="Wake words to quantize; defaults to WAKE_WORD_MODEL (or hey_jarvis).")
+    quantize_parser.add_argument("--features", action="store_true", help="Also quantize the melspectrogram / embedding models.")
+    quantize_parser.add_argument("--per-channel", action="store_true")
+    commands.add_parser("list", help="Show the manifest.")
+    commands.add_parser("verify", help="Check every stored file against its checksum.")
+    cli_args = arg_parser.parse_args()
+
+    if cli_args.command == "prefetch":
+        from dotenv import load_dotenv
+        load_dotenv()
+        try:
+            prefetch(cli_args.names or [os.getenv("WAKE_WORD_MODEL", "hey_jarvis")], cli_args.framework, cli_args.dir, cli_args.force)
+        except (ModelStoreError, requests.RequestException) as e:
+            sys.exit(f"Prefetch failed: {e}")
+    elif cli_args.command == "add":
+        add_local_model(cli_args.path, cli_args.name, version=cli_args.version, kind=cli_args.kind, store_dir=cli_args.dir)
+    elif cli_args.command == "quantize":
+        quantize_jobs = [(name, KIND_WAKEWORD) for name in (cli_args.names or [os.getenv("WAKE_WORD_MODEL", "hey_jarvis")])]
+        if cli_args.features:
+            quantize_jobs += [(feature, KIND_FEATURE) for feature in FEATURE_FILE_STEMS]
+        try:
+            for job_name, job_kind in quantize_jobs:
+                quantize_model(job_name, job_kind, cli_args.dir, cli_args.per_channel)
+        except ModelStoreError as e:
+            sys.exit(f"Quantize failed: {e}")
+    elif cli_args.command == "list":
+        for model_entry in load_manifest(cli_args.dir).get("models", []):
+            print(f"  {model_entry['kind']:<9} {model_entry['name']:<16} {model_entry['framework']:<7} {model_entry.get('variant', VARIANT_FP32):<5} "
+                  f"{model_entry['version']:<22} {model_entry['sha256'][:12]}  {model_entry['file']}")
+    elif cli_args.command == "verify":
+        store_problems = verify_store(cli_args.dir)
+        for problem in store_problems:
+            print(f"  FAIL {problem}")
+        print("Store OK." if not store_problems else f"{len(store_problems)} problem(s).")
+        sys.exit(1 if store_problems else 0)
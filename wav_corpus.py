@@ -0,0 +1,74 @@
+# wav_corpus.py
+# Shared plumbing of the offline corpus tools (wake_word_eval.py, barge_in_simulator.py):
+# finding the labeled WAVs, reading them the way the live pipeline hears the mic, and the
+# report helpers both print / write.
+import glob
+import json
+import os
+import wave
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from local_vad import pcm16_to_vad_rate, VAD_SAMPLE_RATE
+
+FRAME_MS = 30 # main.py's mic frames
+FRAME_S = FRAME_MS / 1000.0
+BLOCK_S = 10.0 # Background / echo files can be hours long; read them in blocks
+
+
+def find_corpus_files(corpus_dir: str, labels: Sequence[str]) -> List[Dict]:
+    """
+    corpus_dir/<label>/*.wav for every label, as {"path", "label"}. Biggest files first, so one
+    long recording doesn't end up last on a single worker process.
+    """
+    files = []
+    for label in labels:
+        for path in sorted(glob.glob(os.path.join(corpus_dir, label, "*.wav"))):
+            files.append({"path": path, "label": label})
+    files.sort(key=lambda f: os.path.getsize(f["path"]), reverse=True)
+    return files
+
+
+def read_vad_frames(path: str, frame_ms: int = FRAME_MS, block_s: float = BLOCK_S) -> Iterator[List[bytes]]:
+    """
+    Yields the file block by block, as lists of frame_ms frames of 16 kHz mono PCM16. Every frame
+    is resampled on its own with pcm16_to_vad_rate, as the live path does with each mic frame, so
+    the detectors see the same audio offline. A trailing partial frame is dropped.
+    """
+    frame_len = int(VAD_SAMPLE_RATE * frame_ms / 1000)
+    with wave.open(path, "rb") as wav_file:
+        channels, rate = wav_file.getnchannels(), wav_file.getframerate()
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAVs are supported")
+        source_frame_len = int(rate * frame_ms / 1000)
+        block_frames = source_frame_len * max(1, int(block_s * 1000 / frame_ms))
+        while True:
+            raw = wav_file.readframes(block_frames)
+            if not raw:
+                break
+            samples = np.frombuffer(raw, dtype=np.int16)
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+            frames = []
+            for start in range(0, len(samples) - source_frame_len + 1, source_frame_len):
+                frame = np.frombuffer(pcm16_to_vad_rate(samples[start:start + source_frame_len].tobytes(), rate), dtype=np.int16)
+                if len(frame) != frame_len: # Rates that don't divide into whole 16 kHz frames
+                    frame = np.pad(frame[:frame_len], (0, max(0, frame_len - len(frame))))
+                frames.append(frame.tobytes())
+            if frames:
+                yield frames
+
+
+def fmt_optional(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def add_json_argument(arg_parser):
+    arg_parser.add_argument("--json", dest="json_path", help="Also write the report as JSON, to diff runs before/after a change.")
+
+
+def write_json_report(path: str, report: Dict, log_fn):
+    with open(path, "w") as json_file:
+        json.dump(report, json_file, indent=2)
+    log_fn(f"Report written to {path}")